@@ -10,11 +10,60 @@ from .invalidable import (
     get_cache_tags,
     get_cache_expiration
 )
-from .scope import whole_cache, normalize_scope, resolve_selector
+from .scope import (
+    whole_cache,
+    normalize_scope,
+    resolve_selector,
+    export_scope,
+    import_scope
+)
+from .singleflight import (
+    GracedValue,
+    FlightLocks,
+    ThreadFlightLocks,
+    FileFlightLocks
+)
+from .cachestats import (
+    CacheStats,
+    CacheCounters,
+    format_prometheus_metrics
+)
 from .cache import Cache
+from .warmup import (
+    CacheWarmer,
+    WarmUpRecord,
+    replayer,
+    replaying,
+    is_replaying
+)
 from .cachestorage import CacheStorage
 from .cacheserializer import CacheSerializer
 from .picklecacheserializer import PickleCacheSerializer
+from .evictionpolicies import (
+    EvictionPolicy,
+    LRUPolicy,
+    SegmentedLRUPolicy,
+    ARCPolicy,
+    WTinyLFUPolicy,
+    CostAwarePolicy
+)
+from .sizers import (
+    Sizer,
+    ShallowSizer,
+    DeepSizer,
+    SampledSizer,
+    SerializedSizer,
+    SHARED
+)
+from .invalidationlog import (
+    InvalidationLog,
+    MemoryInvalidationLog,
+    FileInvalidationLog
+)
 from .memorycachestorage import MemoryCacheStorage
-from .restcachestorage import RESTCacheStorage
+from .shardedmemorycachestorage import ShardedMemoryCacheStorage
+from .sharedmemorycachestorage import SharedMemoryCacheStorage
+from .diskcachestorage import DiskCacheStorage
+from .tieredcachestorage import TieredCacheStorage
+from .restcachestorage import RESTCacheStorage, RESTInvalidationLog
 
@@ -2,7 +2,17 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Any, Optional, Set, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    Optional,
+    Set,
+    Tuple
+)
+from time import monotonic
 
 from cocktail.styled import styled
 from cocktail.modeling import OrderedSet, SetWrapper, ListWrapper, DictWrapper
@@ -11,6 +21,8 @@ from .cachestorage import CacheStorage
 from .utils import normalize_expiration
 from .scope import whole_cache, normalize_scope, Scope
 from .exceptions import CacheKeyError
+from .singleflight import FlightLocks, ThreadFlightLocks, GracedValue
+from .cachestats import CacheStats
 
 TRANSACTION_KEY = "cocktail.cache.invalidation"
 
@@ -34,17 +46,138 @@ class Cache:
         Set to ``True`` to print debugging information for each operation on
         the cache.
 
+    .. attribute:: grace_period
+
+        If set, entries stored with an expiration are kept in the storage for
+        this many additional seconds after they expire. Stale entries are
+        treated as missing by `.exists`, `.retrieve` and the rest of the
+        cache's methods, but `.retrieve_or_produce` keeps serving them while
+        a single thread or process produces their replacement
+        (stale-while-revalidate). Expirations reported by the storage itself
+        include the grace period.
+
+    .. attribute:: flight_locks
+
+        The `~cocktail.caching.singleflight.FlightLocks` used by
+        `.retrieve_or_produce` to ensure each missing entry is produced only
+        once at a time. Defaults to locks shared by the threads of the
+        current process; use
+        `~cocktail.caching.singleflight.FileFlightLocks` to coordinate
+        several processes.
+
+    .. attribute:: flight_timeout
+
+        The maximum number of seconds `.retrieve_or_produce` waits for
+        another thread or process to produce an entry, before producing it
+        on its own.
+
+    .. attribute:: warmer
+
+        An optional `~cocktail.caching.warmup.CacheWarmer` that keeps track
+        of the most requested entries and rebuilds them after they are
+        cleared.
+
+    .. attribute:: collect_stats
+
+        Indicates if the cache should keep the usage statistics reported by
+        `.stats`. True by default.
     """
-    storage: Optional[CacheStorage]
     enabled: bool = True
     verbose: bool = False
+    grace_period: Optional[int] = None
+    flight_locks: FlightLocks
+    flight_timeout: Optional[float] = 30
+    warmer: Optional["cocktail.caching.warmup.CacheWarmer"] = None
+    collect_stats: bool = True
 
     def __init__(self, storage: Optional[CacheStorage] = None):
         """Initializes the cache.
 
         :param storage: Sets the `.storage` to be used by the cache.
         """
+        self.__storage = None
+        self.__stats = CacheStats()
         self.storage = storage
+        self.flight_locks = ThreadFlightLocks()
+
+    def _get_storage(self) -> Optional[CacheStorage]:
+        return self.__storage
+
+    def _set_storage(self, storage: Optional[CacheStorage]):
+
+        # Storages that drop entries on their own report them, so that
+        # evictions can be counted by key prefix and tag. Storages that
+        # measure their entries report their size, so that stored values
+        # don't need to be measured twice.
+        previous_storage = self.__storage
+        if previous_storage is not None:
+            if hasattr(previous_storage, "remove_eviction_listener"):
+                previous_storage.remove_eviction_listener(
+                    self.__stats.evicted
+                )
+            if hasattr(previous_storage, "remove_store_listener"):
+                previous_storage.remove_store_listener(self.__entry_measured)
+
+        self.__storage = storage
+
+        if storage is not None:
+            if hasattr(storage, "add_eviction_listener"):
+                storage.add_eviction_listener(self.__stats.evicted)
+            if hasattr(storage, "add_store_listener"):
+                storage.add_store_listener(self.__entry_measured)
+
+    def __entry_measured(
+            self,
+            norm_key: CacheKey,
+            tags: Optional[Set[str]],
+            size: int):
+        if self.collect_stats:
+            self.__stats.measured(norm_key, tags, size)
+
+    storage = property(
+        _get_storage,
+        _set_storage,
+        doc = """
+        Gets or sets the storage backend, implementing all the IO operations
+        required by the cache.
+        """
+    )
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports the usage statistics of the cache.
+
+        The counters are kept by a
+        `~cocktail.caching.cachestats.CacheStats` instance, and are broken
+        down by key prefix and by tag. Sizes and saved times are estimates.
+
+        :return: A dictionary with the ``totals``, ``prefixes`` and ``tags``
+            counters, plus a ``storage`` entry with the entry count, memory
+            usage and policy counters of the `.storage`, when it provides
+            them.
+        """
+        stats = self.__stats.snapshot()
+        storage_stats = {}
+        storage = self.__storage
+
+        if storage is not None:
+            for name in ("entry_count", "memory_usage", "memory_limit"):
+                value = getattr(storage, name, None)
+                if value is not None:
+                    storage_stats[name] = value
+
+            if hasattr(storage, "get_counters"):
+                storage_stats["counters"] = storage.get_counters()
+            else:
+                eviction_policy = getattr(storage, "eviction_policy", None)
+                if eviction_policy is not None:
+                    storage_stats["counters"] = eviction_policy.get_counters()
+
+        stats["storage"] = storage_stats
+        return stats
+
+    def reset_stats(self):
+        """Sets the counters reported by `.stats` back to zero."""
+        self.__stats.reset()
 
     def exists(self, key: CacheKey) -> bool:
         """Indicates if the given key is defined and current.
@@ -60,7 +193,13 @@ class Cache:
             return False
 
         norm_key = self.normalize_key(key)
-        return self.storage.has_key(norm_key)
+
+        # Entries kept during their grace period are stored, but stale
+        if self.grace_period:
+            entry = self.__retrieve_graced_entry(norm_key)
+            return entry is not None and not entry[3]
+
+        return self.storage.exists(norm_key)
 
     def retrieve(self, key: CacheKey) -> Any:
         """Obtains the value stored for the given key.
@@ -75,27 +214,35 @@ class Cache:
 
         norm_key = self.normalize_key(key)
 
-        if self.verbose:
-            try:
-                value = self.storage.retrieve(norm_key)
-            except CacheKeyError:
+        try:
+            value = self._fresh_value(
+                norm_key,
+                self.storage.retrieve(norm_key)
+            )
+        except CacheKeyError:
+            if self.collect_stats:
+                self.__stats.miss(norm_key)
+            if self.verbose:
                 print((
                     styled("CACHE", "white", "dark_gray")
                     + " " + styled("Miss", "red", style="bold") + "\n"
                     + styled("  Key:", "light_gray", style="bold")
                     + " " + norm_key + "\n"
                 ))
-                raise
-            else:
-                print((
-                    styled("CACHE", "white", "dark_gray")
-                    + " " + styled("Hit", "bright_green", style="bold") + "\n"
-                    + styled("  Key:", "light_gray", style="bold")
-                    + " " + norm_key + "\n"
-                ))
-                return value
-        else:
-            return self.storage.retrieve(norm_key)
+            raise
+
+        if self.collect_stats:
+            self.__stats.hit(norm_key)
+
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Hit", "bright_green", style="bold") + "\n"
+                + styled("  Key:", "light_gray", style="bold")
+                + " " + norm_key + "\n"
+            ))
+
+        return value
 
     def retrieve_with_metadata(
             self,
@@ -113,27 +260,160 @@ class Cache:
 
         norm_key = self.normalize_key(key)
 
-        if self.verbose:
-            try:
-                value = self.storage.retrieve_with_metadata(norm_key)
-            except CacheKeyError:
+        try:
+            value = self._fresh_entry(
+                norm_key,
+                self.storage.retrieve_with_metadata(norm_key)
+            )
+        except CacheKeyError:
+            if self.collect_stats:
+                self.__stats.miss(norm_key)
+            if self.verbose:
                 print((
                     styled("CACHE", "white", "dark_gray")
                     + " " + styled("Miss", "red", style="bold") + "\n"
                     + styled("  Key:", "light_gray", style="bold")
                     + " " + norm_key + "\n"
                 ))
-                raise
-            else:
-                print((
-                    styled("CACHE", "white", "dark_gray")
-                    + " " + styled("Hit", "bright_green", style="bold") + "\n"
-                    + styled("  Key:", "light_gray", style="bold")
-                    + " " + norm_key + "\n"
-                ))
-                return value
-        else:
-            return self.storage.retrieve_with_metadata(norm_key)
+            raise
+
+        if self.collect_stats:
+            self.__stats.hit(norm_key, value[2])
+
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Hit", "bright_green", style="bold") + "\n"
+                + styled("  Key:", "light_gray", style="bold")
+                + " " + norm_key + "\n"
+            ))
+
+        return value
+
+    def _fresh_value(self, key: CacheKey, value: Any) -> Any:
+
+        if isinstance(value, GracedValue):
+            if value.stale:
+                raise CacheKeyError(key)
+            return value.value
+
+        return value
+
+    def _fresh_entry(
+            self,
+            key: CacheKey,
+            entry: Tuple[Any, int, Set[str]]) -> Tuple[Any, int, Set[str]]:
+
+        value, expiration, tags = entry
+
+        if isinstance(value, GracedValue):
+            if value.stale:
+                raise CacheKeyError(key)
+            return value.value, value.fresh_until, tags
+
+        return entry
+
+    def retrieve_or_produce(
+            self,
+            key: CacheKey,
+            producer: Callable[[], Tuple[Any, Any, Optional[Set[str]]]],
+            timeout: Optional[float] = None) -> Tuple[Any, int, Set[str]]:
+        """Obtains the value for the given key, producing and storing it if
+        it's missing.
+
+        Concurrent calls for the same missing key are coalesced: a single
+        thread or process (see `.flight_locks`) invokes the producer, while
+        the rest wait for it to store the value, and retrieve it from the
+        storage. If the cache has a `.grace_period` and the entry is stale,
+        a single caller revalidates it while the rest obtain the stale value
+        without waiting.
+
+        :param key: The key to retrieve.
+        :param producer: A callable that takes no arguments and returns a
+            tuple containing the value, expiration and tags for the entry. If
+            it raises an exception, nothing is stored and the exception is
+            propagated.
+        :param timeout: The maximum number of seconds to wait for another
+            producer. Defaults to `.flight_timeout`. When exceeded, the value
+            is produced without waiting any further.
+        :return: A tuple containing the value, expiration and tags for the
+            key.
+        """
+        if not self.enabled or self.storage is None:
+            value, expiration, tags = producer()
+            if expiration is not None:
+                expiration = normalize_expiration(expiration)
+            return value, expiration, tags
+
+        norm_key = self.normalize_key(key)
+        entry = self.__retrieve_graced_entry(norm_key)
+
+        if entry is not None:
+            value, expiration, tags, stale = entry
+            if not stale:
+                if self.collect_stats:
+                    self.__stats.hit(norm_key, tags)
+                return value, expiration, tags
+
+            # Serve the stale value while another caller revalidates it
+            if not self.flight_locks.acquire(norm_key, blocking = False):
+                if self.collect_stats:
+                    self.__stats.hit(norm_key, tags, stale = True)
+                return value, expiration, tags
+        elif not self.flight_locks.acquire(
+            norm_key,
+            timeout = self.flight_timeout if timeout is None else timeout
+        ):
+            if self.collect_stats:
+                self.__stats.miss(norm_key)
+            return self.__produce(norm_key, producer)
+
+        try:
+            # The entry may have been produced while waiting for the lock
+            entry = self.__retrieve_graced_entry(norm_key)
+            if entry is not None and not entry[3]:
+                if self.collect_stats:
+                    self.__stats.hit(norm_key, entry[2])
+                return entry[:3]
+
+            if self.collect_stats:
+                self.__stats.miss(norm_key)
+
+            return self.__produce(norm_key, producer)
+        finally:
+            self.flight_locks.release(norm_key)
+
+    def __retrieve_graced_entry(
+            self,
+            norm_key: CacheKey) -> Optional[Tuple[Any, int, Set[str], bool]]:
+        try:
+            value, expiration, tags = \
+                self.storage.retrieve_with_metadata(norm_key)
+        except CacheKeyError:
+            return None
+
+        if isinstance(value, GracedValue):
+            return value.value, value.fresh_until, tags, value.stale
+
+        return value, expiration, tags, False
+
+    def __produce(
+            self,
+            norm_key: CacheKey,
+            producer: Callable[[], Tuple[Any, Any, Optional[Set[str]]]]
+    ) -> Tuple[Any, int, Set[str]]:
+
+        start = monotonic()
+        value, expiration, tags = producer()
+
+        if self.collect_stats:
+            self.__stats.produced(norm_key, tags, monotonic() - start)
+
+        if expiration is not None:
+            expiration = normalize_expiration(expiration)
+
+        self.store(norm_key, value, expiration = expiration, tags = tags)
+        return value, expiration, tags
 
     def store(
             self,
@@ -181,8 +461,14 @@ class Cache:
             lines.append("")
             print("\n".join(lines))
 
+        if self.collect_stats:
+            self.__stats.stored(norm_key, value, tags)
+
         if expiration is not None:
             expiration = normalize_expiration(expiration)
+            if self.grace_period:
+                value = GracedValue(value, expiration)
+                expiration += self.grace_period
 
         self.storage.store(
             norm_key,
@@ -191,6 +477,98 @@ class Cache:
             tags=tags
         )
 
+    def retrieve_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, Any]:
+        """Obtains the values stored for several keys at once.
+
+        :param keys: The keys to retrieve.
+        :return: A dictionary mapping each of the given keys that is present
+            in the `.storage` to its value. Missing or expired keys are left
+            out.
+        """
+        if not self.enabled or self.storage is None:
+            return {}
+
+        norm_keys = {}
+        for key in keys:
+            norm_keys[self.normalize_key(key)] = key
+
+        values = {}
+        for norm_key, value in self.storage.retrieve_many(
+            list(norm_keys)
+        ).items():
+            if isinstance(value, GracedValue):
+                if value.stale:
+                    continue
+                value = value.value
+            values[norm_key] = value
+
+        if self.collect_stats:
+            for norm_key in norm_keys:
+                if norm_key in values:
+                    self.__stats.hit(norm_key)
+                else:
+                    self.__stats.miss(norm_key)
+
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Retrieve many", "bright_green", style="bold")
+                + "\n"
+                + styled("  Hits:", "light_gray", style="bold")
+                + " %d/%d\n" % (len(values), len(norm_keys))
+            ))
+
+        return dict(
+            (norm_keys[norm_key], value)
+            for norm_key, value in values.items()
+        )
+
+    def store_many(
+            self,
+            values: Mapping[CacheKey, Any],
+            expiration: Optional[int] = None,
+            tags: Optional[Set[str]] = None):
+        """Inserts or updates several values in the storage at once.
+
+        :param values: A mapping of keys to the values to store for them.
+        :param expiration: An optional expiration applied to all the given
+            keys. See `.store` for details.
+        :param tags: An optional set of tags attached to all the given keys.
+        """
+        if not self.enabled or self.storage is None:
+            return
+
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Storing many", "slate_blue", style="bold")
+                + "\n"
+                + styled("  Keys:", "light_gray", style="bold")
+                + " %d\n" % len(values)
+            ))
+
+        if self.collect_stats:
+            for key, value in values.items():
+                self.__stats.stored(self.normalize_key(key), value, tags)
+
+        if expiration is not None:
+            expiration = normalize_expiration(expiration)
+            if self.grace_period:
+                values = dict(
+                    (key, GracedValue(value, expiration))
+                    for key, value in values.items()
+                )
+                expiration += self.grace_period
+
+        self.storage.store_many(
+            dict(
+                (self.normalize_key(key), value)
+                for key, value in values.items()
+            ),
+            expiration=expiration,
+            tags=tags
+        )
+
     def get_expiration(self, key: CacheKey) -> Optional[int]:
         """Determines the expiration assigned to the given key.
 
@@ -204,6 +582,13 @@ class Cache:
             raise CacheKeyError(key)
 
         norm_key = self.normalize_key(key)
+
+        if self.grace_period:
+            entry = self.__retrieve_graced_entry(norm_key)
+            if entry is None or entry[3]:
+                raise CacheKeyError(key)
+            return entry[1]
+
         return self.storage.get_expiration(norm_key)
 
     def set_expiration(self, key: CacheKey, expiration: Optional[int]):
@@ -237,6 +622,24 @@ class Cache:
         if expiration is not None:
             expiration = normalize_expiration(expiration)
 
+        # The freshness of graced entries is kept with their value, so they
+        # must be stored again
+        if self.grace_period:
+            entry = self.__retrieve_graced_entry(norm_key)
+            if entry is None or entry[3]:
+                raise CacheKeyError(key)
+            value, prev_expiration, tags, stale = entry
+            if expiration is not None:
+                value = GracedValue(value, expiration)
+                expiration += self.grace_period
+            self.storage.store(
+                norm_key,
+                value,
+                expiration=expiration,
+                tags=tags
+            )
+            return
+
         self.storage.set_expiration(norm_key, expiration)
 
     def remove(self, key: CacheKey):
@@ -319,7 +722,11 @@ class Cache:
                     ) + "\n"
                 ))
 
-            self.storage.clear(scope = normalize_scope(scope))
+            scope = normalize_scope(scope)
+            self.storage.clear(scope = scope)
+
+            if self.warmer is not None:
+                self.warmer.invalidated(scope)
 
     def clear_after_commit(self, scope: Scope = whole_cache):
         """Schedules a cache invalidation operation after the current ZODB
@@ -347,7 +754,7 @@ class Cache:
             return
         elif transaction_invalidation_scope is None:
             datastore.unique_after_commit_hook(
-                TRANSACTION_KEY,
+                key,
                 _cache_invalidation_commit_handler,
                 self
             )
@@ -372,6 +779,17 @@ class Cache:
                 ) + "\n"
             ))
 
+    def get_clear_after_commit_scope(self) -> Optional[Scope]:
+        """Obtains the scope that will be cleared once the current ZODB
+        transaction is committed.
+
+        :return: The scope accumulated by calls to `.clear_after_commit`
+            during the current transaction, or None if no invalidation has
+            been scheduled.
+        """
+        from cocktail.persistence import datastore
+        return datastore.get_transaction_value((TRANSACTION_KEY, id(self)))
+
     def drop_weight(self) -> Optional[CacheKey]:
         """Removes an entry from the cache, in order to free resources.
 
@@ -0,0 +1,380 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+from threading import Lock
+import re
+
+from .cachekey import CacheKey
+from .sizers import Sizer
+
+OTHER_LABEL = "(other)"
+
+
+class CacheCounters:
+    """The counters of a `CacheStats` collector for a group of entries.
+
+    .. attribute:: hits
+
+        The number of lookups that found a current entry.
+
+    .. attribute:: stale_hits
+
+        The number of lookups served with an entry within its grace period
+        (these are also counted as `.hits`).
+
+    .. attribute:: misses
+
+        The number of lookups that didn't find a current entry.
+
+    .. attribute:: stores
+
+        The number of entries written to the cache.
+
+    .. attribute:: evictions
+
+        The number of entries dropped by the storage to free memory.
+
+    .. attribute:: bytes_stored
+
+        The estimated size of the values written to the cache.
+
+    .. attribute:: bytes_evicted
+
+        The size of the entries dropped by the storage to free memory.
+
+    .. attribute:: productions
+
+        The number of values produced by
+        `~cocktail.caching.Cache.retrieve_or_produce`.
+
+    .. attribute:: compute_time
+
+        The number of seconds spent producing values.
+
+    .. attribute:: saved_time
+
+        The estimated number of seconds saved by cache hits, based on the
+        average time spent producing values of the same group.
+    """
+
+    __slots__ = (
+        "hits",
+        "stale_hits",
+        "misses",
+        "stores",
+        "evictions",
+        "bytes_stored",
+        "bytes_evicted",
+        "productions",
+        "compute_time",
+        "saved_time"
+    )
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    @property
+    def hit_ratio(self) -> float:
+        """The proportion of lookups that found a current entry."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def average_compute_time(self) -> float:
+        """The average number of seconds spent producing each value."""
+        return (
+            self.compute_time / self.productions
+            if self.productions
+            else 0.0
+        )
+
+    def add(self, other: "CacheCounters"):
+        """Adds the counters of another instance to this one."""
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Exports the counters as a dictionary."""
+        data = dict((name, getattr(self, name)) for name in self.__slots__)
+        data["hit_ratio"] = self.hit_ratio
+        return data
+
+
+class CacheStats:
+    """Collects usage statistics for a `~cocktail.caching.Cache`.
+
+    Counters are kept for each key prefix (see `.get_key_prefix`) and for
+    each tag. Entries are only counted under their tags when they are known:
+    lookups through `~cocktail.caching.Cache.retrieve` don't fetch them. To
+    bound memory usage, prefixes and tags past the first `.max_labels` are
+    aggregated under a single ``"(other)"`` label.
+
+    .. attribute:: sizer
+
+        An optional `~cocktail.caching.sizers.Sizer` used to measure stored
+        values. None by default: storages that already measure their entries
+        (like `~cocktail.caching.MemoryCacheStorage`) report their size to
+        `.measured`, so a sizer is only worth setting for storages that
+        don't.
+    """
+
+    max_labels: int = 500
+    prefix_depth: int = 2
+    prefix_separator: str = ":"
+    key_separators = re.compile(r"[\s:/?#&=,()\[\]'\"]+")
+    sizer: Optional[Sizer] = None
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Sets all counters back to zero."""
+        with self.__lock:
+            self.__prefixes = {}
+            self.__tags = {}
+
+    def get_key_prefix(self, key: CacheKey) -> str:
+        """Determines the group a key is counted under.
+
+        The default implementation splits the key on punctuation and keeps
+        its first `.prefix_depth` parts. F. ex. a rendering cache key like
+        ``"('HTML5Renderer', ('foo.Bar', 3))"`` is grouped under
+        ``HTML5Renderer:foo.Bar``.
+        """
+        parts = []
+
+        for part in self.key_separators.split(key):
+            if part:
+                parts.append(part)
+                if len(parts) == self.prefix_depth:
+                    break
+
+        return self.prefix_separator.join(parts)
+
+    def __counters(self, table: Dict[str, CacheCounters], label: str):
+        counters = table.get(label)
+        if counters is None:
+            if len(table) >= self.max_labels:
+                label = OTHER_LABEL
+                counters = table.get(label)
+            if counters is None:
+                counters = table[label] = CacheCounters()
+        return counters
+
+    def __groups(self, key: CacheKey, tags: Optional[Iterable[str]]):
+        yield self.__counters(self.__prefixes, self.get_key_prefix(key))
+        if tags:
+            for tag in tags:
+                yield self.__counters(self.__tags, tag)
+
+    def hit(
+            self,
+            key: CacheKey,
+            tags: Optional[Iterable[str]] = None,
+            stale: bool = False):
+        """Records a lookup that found an entry."""
+        with self.__lock:
+            for counters in self.__groups(key, tags):
+                counters.hits += 1
+                counters.saved_time += counters.average_compute_time
+                if stale:
+                    counters.stale_hits += 1
+
+    def miss(self, key: CacheKey):
+        """Records a lookup that didn't find an entry."""
+        with self.__lock:
+            self.__counters(
+                self.__prefixes,
+                self.get_key_prefix(key)
+            ).misses += 1
+
+    def stored(
+            self,
+            key: CacheKey,
+            value: Any,
+            tags: Optional[Iterable[str]] = None):
+        """Records a value written to the cache."""
+        size = self.sizer.get_size(value) if self.sizer else 0
+        with self.__lock:
+            for counters in self.__groups(key, tags):
+                counters.stores += 1
+                counters.bytes_stored += size
+
+    def measured(
+            self,
+            key: CacheKey,
+            tags: Optional[Iterable[str]],
+            size: int):
+        """Records the size of an entry written to the cache, as reported by
+        its storage.
+        """
+        with self.__lock:
+            for counters in self.__groups(key, tags):
+                counters.bytes_stored += size
+
+    def evicted(
+            self,
+            key: CacheKey,
+            tags: Optional[Iterable[str]] = None,
+            size: int = 0):
+        """Records an entry dropped by the storage to free memory."""
+        with self.__lock:
+            for counters in self.__groups(key, tags):
+                counters.evictions += 1
+                counters.bytes_evicted += size
+
+    def produced(
+            self,
+            key: CacheKey,
+            tags: Optional[Iterable[str]],
+            duration: float):
+        """Records a value produced by
+        `~cocktail.caching.Cache.retrieve_or_produce`.
+        """
+        with self.__lock:
+            for counters in self.__groups(key, tags):
+                counters.productions += 1
+                counters.compute_time += duration
+
+    def get_totals(self) -> CacheCounters:
+        """Adds up the counters of all the prefixes."""
+        totals = CacheCounters()
+        with self.__lock:
+            for counters in self.__prefixes.values():
+                totals.add(counters)
+        return totals
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Exports the current value of all counters.
+
+        :return: A dictionary with the ``totals``, as well as the counters
+            for each key ``prefixes`` and ``tags``.
+        """
+        totals = self.get_totals()
+        with self.__lock:
+            return {
+                "totals": totals.to_dict(),
+                "prefixes": dict(
+                    (label, counters.to_dict())
+                    for label, counters in self.__prefixes.items()
+                ),
+                "tags": dict(
+                    (label, counters.to_dict())
+                    for label, counters in self.__tags.items()
+                )
+            }
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+prometheus_counters = [
+    ("hits", "Lookups that found a current entry"),
+    ("stale_hits", "Lookups served with an entry within its grace period"),
+    ("misses", "Lookups that didn't find a current entry"),
+    ("stores", "Entries written to the cache"),
+    ("evictions", "Entries dropped to free memory"),
+    ("bytes_stored", "Estimated size of the values written to the cache"),
+    ("bytes_evicted", "Size of the entries dropped to free memory"),
+    ("productions", "Values produced on a cache miss"),
+    ("compute_time", "Seconds spent producing values"),
+    ("saved_time", "Estimated seconds saved by cache hits")
+]
+
+prometheus_counter_names = {
+    "bytes_stored": "stored_bytes",
+    "bytes_evicted": "evicted_bytes",
+    "compute_time": "compute_seconds",
+    "saved_time": "saved_seconds"
+}
+
+
+def _escape_label(value: str) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, _escape_label(value))
+        for name, value in labels
+    )
+
+
+def format_prometheus_metrics(
+        caches: Mapping[str, "cocktail.caching.Cache"],
+        prefix: str = "cocktail_cache") -> str:
+    """Exports the `~cocktail.caching.Cache.stats` of several caches using
+    the Prometheus text exposition format.
+
+    Counters are reported by key prefix (``<prefix>_<counter>_total``) and
+    by tag (``<prefix>_tag_<counter>_total``). The entry count and memory
+    usage of each storage are reported as gauges.
+
+    :param caches: A mapping of names to caches. Names are exported as the
+        ``cache`` label.
+    :param prefix: The prefix for metric names.
+    :return: The metrics, as a string.
+    """
+    stats = [(name, cache.stats()) for name, cache in caches.items()]
+    lines = []
+
+    for group, group_infix in (("prefixes", "_"), ("tags", "_tag_")):
+        label = "prefix" if group == "prefixes" else "tag"
+
+        for counter, description in prometheus_counters:
+            metric = "%s%s%s_total" % (
+                prefix,
+                group_infix,
+                prometheus_counter_names.get(counter, counter)
+            )
+            lines.append("# HELP %s %s, by %s." % (metric, description, label))
+            lines.append("# TYPE %s counter" % metric)
+
+            for cache_name, cache_stats in stats:
+                for group_label, counters in sorted(
+                    cache_stats[group].items()
+                ):
+                    lines.append("%s%s %s" % (
+                        metric,
+                        _format_labels([
+                            ("cache", cache_name),
+                            (label, group_label)
+                        ]),
+                        repr(counters[counter])
+                    ))
+
+    for gauge, metric_name, description in (
+        ("entry_count", "entries", "Entries in the cache storage."),
+        ("memory_usage", "memory_bytes", "Bytes used by the cache storage."),
+        (
+            "memory_limit",
+            "memory_limit_bytes",
+            "Maximum bytes for the cache storage."
+        )
+    ):
+        metric = "%s_%s" % (prefix, metric_name)
+        samples = [
+            (cache_name, cache_stats["storage"][gauge])
+            for cache_name, cache_stats in stats
+            if cache_stats["storage"].get(gauge) is not None
+        ]
+        if samples:
+            lines.append("# HELP %s %s" % (metric, description))
+            lines.append("# TYPE %s gauge" % metric)
+            for cache_name, value in samples:
+                lines.append("%s%s %s" % (
+                    metric,
+                    _format_labels([("cache", cache_name)]),
+                    repr(value)
+                ))
+
+    lines.append("")
+    return "\n".join(lines)
@@ -2,7 +2,7 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Any, Iterable, Optional, Set, Tuple
+from typing import Any, Dict, Iterable, Mapping, Optional, Set, Tuple
 
 from .cachekey import CacheKey
 from .scope import whole_cache, Scope
@@ -80,6 +80,66 @@ class CacheStorage:
             "%s doesn't implement the store() method" % self
         )
 
+    def retrieve_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, Any]:
+        """Obtains the values stored for several keys at once.
+
+        The default implementation retrieves each key in turn; backends that
+        can fetch several entries in a single operation should override it.
+
+        :param keys: The keys to retrieve.
+        :return: A dictionary mapping each key present in the storage to its
+            value. Missing or expired keys are left out.
+        """
+        values = {}
+
+        for key in keys:
+            try:
+                values[key] = self.retrieve(key)
+            except CacheKeyError:
+                pass
+
+        return values
+
+    def retrieve_many_with_metadata(
+            self,
+            keys: Iterable[CacheKey]
+    ) -> Dict[CacheKey, Tuple[Any, int, Set[str]]]:
+        """Obtains the value, expiration and tags for several keys at once.
+
+        :param keys: The keys to retrieve.
+        :return: A dictionary mapping each key present in the storage to a
+            tuple containing its value, expiration and tags. Missing or
+            expired keys are left out.
+        """
+        entries = {}
+
+        for key in keys:
+            try:
+                entries[key] = self.retrieve_with_metadata(key)
+            except CacheKeyError:
+                pass
+
+        return entries
+
+    def store_many(
+            self,
+            values: Mapping[CacheKey, Any],
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+        """Inserts or updates several values in the storage at once.
+
+        The default implementation stores each value in turn; backends that
+        can write several entries in a single operation should override it.
+
+        :param values: A mapping of keys to the values to store for them.
+        :param expiration: An optional expiration applied to all the given
+            keys. See `.store` for details.
+        :param tags: An optional set of tags attached to all the given keys.
+            See `.store` for details.
+        """
+        for key, value in values.items():
+            self.store(key, value, expiration = expiration, tags = tags)
+
     def get_expiration(self, key: CacheKey) -> Optional[int]:
         """Determines the expiration assigned to the given key.
 
@@ -0,0 +1,713 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Iterable, Mapping, Optional, Set, Tuple, Union
+import os
+import fcntl
+from collections import OrderedDict
+from struct import Struct
+from threading import Lock, RLock, Thread
+from time import time
+from zlib import crc32
+
+from cocktail.modeling import overrides
+from cocktail.memoryutils import parse_bytes
+from .scope import whole_cache, Scope
+from .cachekey import CacheKey
+from .cachestorage import CacheStorage
+from .cacheserializer import CacheSerializer
+from .picklecacheserializer import PickleCacheSerializer
+from .exceptions import CacheKeyError
+
+MAGIC = b"CKTDSKC1"
+
+# record kind, checksum
+prefix_struct = Struct("<BI")
+
+# expiration, key length, tags length, value length
+fields_struct = Struct("<qIII")
+
+HEADER_SIZE = prefix_struct.size + fields_struct.size
+
+STORE = 1
+DISCARD = 2
+EXPIRE = 3
+
+NO_EXPIRATION = -1
+TAG_SEPARATOR = b"\0"
+ENCODING = "utf-8"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class DiskCacheStorage(CacheStorage):
+    """A cache backend that persists its entries to a file, so that they
+    survive process restarts.
+
+    The file is an append-only log of records: storing an entry appends a
+    record with its key, tags, expiration and serialized value, while
+    discarding an entry or changing its expiration appends a small record
+    that supersedes the previous one. Each record carries a checksum, so a
+    record left incomplete by a crash is detected and dropped.
+
+    The storage keeps an index of all the live entries in memory (their
+    position in the file, expiration and tags); it is rebuilt from the file
+    when the storage is opened, so a restarted process finds the entries
+    stored by its previous incarnation. Values are read from the file on
+    demand. To keep the most used values in memory, put the storage behind
+    a `~cocktail.caching.TieredCacheStorage`.
+
+    Superseded records waste space until the file is compacted: once the
+    wasted space exceeds `.compaction_ratio` of the file (and the file is
+    larger than `.min_compaction_size`), live entries are copied to a new
+    file that replaces the current one. Compaction runs on a background
+    thread (see `.background_compaction`); reads and writes can proceed
+    while it copies the data.
+
+    The file is locked while open: it can only be used by a single process
+    at a time. Processes that fork should open a separate storage after
+    forking.
+
+    .. attribute:: max_size
+
+        The maximum number of bytes of live entries in the file. When
+        exceeded, the least recently used entries are discarded. None
+        disables the limit.
+
+    .. attribute:: sync_writes
+
+        If set to True, each write is flushed to disk before returning.
+    """
+
+    max_size: Optional[int] = None
+    compaction_ratio: float = 0.5
+    min_compaction_size: int = 1024 * 1024
+    background_compaction: bool = True
+    sync_writes: bool = False
+
+    def __init__(
+            self,
+            path: str,
+            max_size: Optional[Union[int, str]] = None,
+            serializer: Optional[CacheSerializer] = None):
+        """Opens the storage, creating its file if it doesn't exist yet.
+
+        :param path: The path of the file that backs the storage.
+        :param max_size: Overrides the `.max_size` of the storage. Accepts
+            byte counts or strings like ``"500M"``.
+        :param serializer: The serializer used to store values. Defaults to
+            a `~cocktail.caching.PickleCacheSerializer`.
+        :raise IOError: Raised if the file is being used by another process,
+            or if it isn't a cache file.
+        """
+        if isinstance(max_size, str):
+            max_size = int(parse_bytes(max_size))
+
+        if max_size is not None:
+            self.max_size = max_size
+
+        self.__path = path
+        self.__serializer = serializer or PickleCacheSerializer()
+        self.__lock = RLock()
+        self.__compaction_lock = Lock()
+        self.__compaction_thread = None
+        self.__index = OrderedDict()
+        self.__keys_by_tag = {}
+        self.__end = 0
+        self.__garbage = 0
+        self.__live_size = 0
+        self.__generation = 0
+        self.__fd = None
+        self.__open()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def serializer(self) -> CacheSerializer:
+        return self.__serializer
+
+    @property
+    def entry_count(self) -> int:
+        """The number of entries in the storage, including expired entries
+        that haven't been removed yet.
+        """
+        return len(self.__index)
+
+    @property
+    def file_size(self) -> int:
+        """The size of the file backing the storage, in bytes."""
+        return self.__end
+
+    @property
+    def garbage_size(self) -> int:
+        """The number of bytes in the file taken by superseded records."""
+        return self.__garbage
+
+    def close(self):
+        """Waits for any pending compaction and closes the file."""
+        thread = self.__compaction_thread
+        if thread is not None:
+            thread.join()
+
+        with self.__lock:
+            if self.__fd is not None:
+                os.close(self.__fd)
+                self.__fd = None
+
+    # File management
+    #--------------------------------------------------------------------------
+    def __open(self):
+
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise IOError(
+                    "%s is in use by another process" % self.__path
+                )
+
+            if os.fstat(fd).st_size < len(MAGIC):
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, MAGIC, 0)
+            elif os.pread(fd, len(MAGIC), 0) != MAGIC:
+                raise IOError("%s is not a cache file" % self.__path)
+
+            self.__fd = fd
+            self.__load()
+        except:
+            os.close(fd)
+            self.__fd = None
+            raise
+
+    def __load(self):
+
+        index = self.__index
+        offset = len(MAGIC)
+
+        with open(self.__path, "rb") as file:
+            file.seek(offset)
+
+            while True:
+                header = file.read(HEADER_SIZE)
+                if len(header) < HEADER_SIZE:
+                    break
+
+                kind, checksum = prefix_struct.unpack_from(header)
+                expiration, key_length, tags_length, value_length = \
+                    fields_struct.unpack_from(header, prefix_struct.size)
+                body_length = key_length + tags_length + value_length
+                body = file.read(body_length)
+
+                if (
+                    len(body) < body_length
+                    or kind not in (STORE, DISCARD, EXPIRE)
+                    or crc32(body, crc32(header[prefix_struct.size:]))
+                       != checksum
+                ):
+                    break
+
+                size = HEADER_SIZE + body_length
+                key = body[:key_length].decode(ENCODING)
+                previous = index.get(key)
+
+                if kind == STORE:
+                    if previous is not None:
+                        self.__garbage += previous.size
+                        self.__live_size -= previous.size
+                    tags_data = body[key_length:key_length + tags_length]
+                    index[key] = entry = Entry(
+                        offset,
+                        size,
+                        HEADER_SIZE + key_length + tags_length,
+                        value_length,
+                        None if expiration == NO_EXPIRATION else expiration,
+                        set(
+                            tag.decode(ENCODING)
+                            for tag in tags_data.split(TAG_SEPARATOR)
+                        ) if tags_data else None
+                    )
+                    index.move_to_end(key)
+                    self.__live_size += size
+                else:
+                    self.__garbage += size
+                    if previous is not None:
+                        if kind == DISCARD:
+                            del index[key]
+                            self.__garbage += previous.size
+                            self.__live_size -= previous.size
+                        else:
+                            previous.expiration = (
+                                None if expiration == NO_EXPIRATION
+                                else expiration
+                            )
+
+                offset += size
+
+        # Drop the incomplete or corrupted records at the end of the file
+        if offset < os.fstat(self.__fd).st_size:
+            os.ftruncate(self.__fd, offset)
+
+        self.__end = offset
+
+        now = time()
+        for key, entry in list(index.items()):
+            if entry.expiration is not None and entry.expiration <= now:
+                self.__forget(key, entry)
+            elif entry.tags:
+                self.__index_tags(key, entry.tags)
+
+    def __encode_record(
+            self,
+            kind: int,
+            key_bytes: bytes,
+            expiration: Optional[int] = None,
+            tags_data: bytes = b"",
+            value_data: bytes = b"") -> bytes:
+
+        fields = fields_struct.pack(
+            NO_EXPIRATION if expiration is None else expiration,
+            len(key_bytes),
+            len(tags_data),
+            len(value_data)
+        )
+        body = key_bytes + tags_data + value_data
+        return (
+            prefix_struct.pack(kind, crc32(body, crc32(fields)))
+            + fields
+            + body
+        )
+
+    def __append(self, data: bytes) -> int:
+        offset = self.__end
+        os.pwrite(self.__fd, data, offset)
+        if self.sync_writes:
+            os.fsync(self.__fd)
+        self.__end += len(data)
+        return offset
+
+    def __index_tags(self, key: CacheKey, tags: Set[str]):
+        for tag in tags:
+            keys = self.__keys_by_tag.get(tag)
+            if keys is None:
+                self.__keys_by_tag[tag] = keys = set()
+            keys.add(key)
+
+    def __forget(self, key: CacheKey, entry: "Entry"):
+
+        del self.__index[key]
+        self.__garbage += entry.size
+        self.__live_size -= entry.size
+
+        if entry.tags:
+            for tag in entry.tags:
+                keys = self.__keys_by_tag.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.__keys_by_tag[tag]
+
+    def __discard_keys(self, keys: Iterable[CacheKey]):
+
+        records = []
+
+        for key in keys:
+            entry = self.__index.get(key)
+            if entry is not None:
+                self.__forget(key, entry)
+                records.append(
+                    self.__encode_record(DISCARD, key.encode(ENCODING))
+                )
+
+        if records:
+            data = b"".join(records)
+            self.__append(data)
+            self.__garbage += len(data)
+            self.__compact_if_due()
+
+    def __require_entry(self, key: CacheKey) -> "Entry":
+
+        entry = self.__index.get(key)
+
+        if entry is None:
+            raise CacheKeyError(key)
+
+        if entry.expiration is not None and entry.expiration <= time():
+            self.__forget(key, entry)
+            raise CacheKeyError(key)
+
+        return entry
+
+    def __read_value(self, key: CacheKey) -> Tuple[bytes, "Entry"]:
+        with self.__lock:
+            entry = self.__require_entry(key)
+            self.__index.move_to_end(key)
+            data = os.pread(
+                self.__fd,
+                entry.value_length,
+                entry.offset + entry.value_start
+            )
+        return data, entry
+
+    def __apply_size_limit(self):
+        if self.max_size is not None:
+            while self.__live_size > self.max_size and self.__index:
+                self.__discard_keys([next(iter(self.__index))])
+
+    # Compaction
+    #--------------------------------------------------------------------------
+    def __compact_if_due(self):
+
+        if (
+            self.__end < self.min_compaction_size
+            or self.__garbage < self.__end * self.compaction_ratio
+        ):
+            return
+
+        if not self.background_compaction:
+            self.compact()
+            return
+
+        thread = self.__compaction_thread
+        if thread is None or not thread.is_alive():
+            self.__compaction_thread = Thread(
+                target = self.compact,
+                name = "DiskCacheStorage compaction",
+                daemon = True
+            )
+            self.__compaction_thread.start()
+
+    def compact(self):
+        """Rewrites the file to include only its live entries."""
+
+        if not self.__compaction_lock.acquire(False):
+            return
+
+        try:
+            self.__compact()
+        finally:
+            self.__compaction_lock.release()
+
+    def __compact(self):
+
+        # Take a snapshot of the live entries; records appended to the file
+        # from now on will be copied verbatim once the snapshot is copied
+        with self.__lock:
+            if self.__fd is None:
+                return
+            fd = self.__fd
+            generation = self.__generation
+            snapshot = list(self.__index.items())
+            snapshot_end = self.__end
+            snapshot_garbage = self.__garbage
+
+        temp_path = self.__path + ".compacting"
+        new_fd = os.open(
+            temp_path,
+            os.O_RDWR | os.O_CREAT | os.O_TRUNC,
+            0o600
+        )
+
+        try:
+            fcntl.flock(new_fd, fcntl.LOCK_EX)
+            os.pwrite(new_fd, MAGIC, 0)
+            offset = len(MAGIC)
+            moved = {}
+            now = time()
+
+            for key, entry in snapshot:
+
+                if entry.expiration is not None and entry.expiration <= now:
+                    continue
+
+                data = os.pread(fd, entry.size, entry.offset)
+                if len(data) < entry.size:
+                    break
+
+                # Rewrite the record, since its expiration may have been
+                # changed by a later record
+                expiration, key_length, tags_length, value_length = \
+                    fields_struct.unpack_from(data, prefix_struct.size)
+                body = data[HEADER_SIZE:]
+                record = self.__encode_record(
+                    STORE,
+                    body[:key_length],
+                    entry.expiration,
+                    body[key_length:key_length + tags_length],
+                    body[key_length + tags_length:]
+                )
+                os.pwrite(new_fd, record, offset)
+                moved[key] = (entry, offset)
+                offset += len(record)
+
+            with self.__lock:
+
+                # The cache was cleared or closed while compacting
+                if self.__generation != generation or self.__fd != fd:
+                    raise _CompactionAborted()
+
+                # Copy the records appended after the snapshot
+                tail_offset = offset
+                position = snapshot_end
+                while position < self.__end:
+                    chunk = os.pread(
+                        fd,
+                        min(COPY_CHUNK_SIZE, self.__end - position),
+                        position
+                    )
+                    os.pwrite(new_fd, chunk, offset)
+                    position += len(chunk)
+                    offset += len(chunk)
+
+                if self.sync_writes:
+                    os.fsync(new_fd)
+
+                os.replace(temp_path, self.__path)
+
+                dropped = 0
+
+                for key, entry in list(self.__index.items()):
+                    if entry.offset >= snapshot_end:
+                        entry.offset += tail_offset - snapshot_end
+                    else:
+                        move = moved.get(key)
+                        if move is not None and move[0] is entry:
+                            entry.offset = move[1]
+                        else:
+                            # Expired before being copied
+                            self.__forget(key, entry)
+                            dropped += entry.size
+
+                self.__fd = new_fd
+                self.__end = offset
+                self.__garbage -= snapshot_garbage + dropped
+                os.close(fd)
+        except _CompactionAborted:
+            self.__discard_compaction_file(new_fd, temp_path)
+        except:
+            self.__discard_compaction_file(new_fd, temp_path)
+            raise
+
+    def __discard_compaction_file(self, fd: int, path: str):
+        os.close(fd)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    # CacheStorage interface
+    #--------------------------------------------------------------------------
+    @overrides(CacheStorage.exists)
+    def exists(self, key: CacheKey) -> bool:
+        with self.__lock:
+            try:
+                self.__require_entry(key)
+            except CacheKeyError:
+                return False
+            else:
+                return True
+
+    @overrides(CacheStorage.retrieve)
+    def retrieve(self, key: CacheKey) -> Any:
+        data, entry = self.__read_value(key)
+        return self.__serializer.unserialize(data)
+
+    @overrides(CacheStorage.retrieve_with_metadata)
+    def retrieve_with_metadata(
+            self,
+            key: CacheKey) -> Tuple[Any, int, Set[str]]:
+
+        data, entry = self.__read_value(key)
+        return (
+            self.__serializer.unserialize(data),
+            entry.expiration,
+            set(entry.tags) if entry.tags else None
+        )
+
+    @overrides(CacheStorage.store)
+    def store(
+            self,
+            key: CacheKey,
+            value: Any,
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+
+        self.store_many({key: value}, expiration = expiration, tags = tags)
+
+    @overrides(CacheStorage.store_many)
+    def store_many(
+            self,
+            values: Mapping[CacheKey, Any],
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+
+        tags = set(tags) if tags else None
+        tags_data = TAG_SEPARATOR.join(
+            tag.encode(ENCODING) for tag in sorted(tags)
+        ) if tags else b""
+
+        records = []
+        for key, value in values.items():
+            key_bytes = key.encode(ENCODING)
+            records.append((
+                key,
+                len(key_bytes),
+                self.__encode_record(
+                    STORE,
+                    key_bytes,
+                    expiration,
+                    tags_data,
+                    self.__serializer.serialize(value)
+                )
+            ))
+
+        if not records:
+            return
+
+        with self.__lock:
+            offset = self.__append(b"".join(record for k, l, record in records))
+
+            for key, key_length, record in records:
+                previous = self.__index.get(key)
+                if previous is not None:
+                    self.__forget(key, previous)
+
+                self.__index[key] = Entry(
+                    offset,
+                    len(record),
+                    HEADER_SIZE + key_length + len(tags_data),
+                    len(record) - HEADER_SIZE - key_length - len(tags_data),
+                    expiration,
+                    tags
+                )
+                self.__live_size += len(record)
+
+                if tags:
+                    self.__index_tags(key, tags)
+
+                offset += len(record)
+
+            self.__apply_size_limit()
+            self.__compact_if_due()
+
+    @overrides(CacheStorage.get_expiration)
+    def get_expiration(self, key: CacheKey) -> Optional[int]:
+        with self.__lock:
+            return self.__require_entry(key).expiration
+
+    @overrides(CacheStorage.set_expiration)
+    def set_expiration(self, key: CacheKey, expiration: Optional[int]):
+        with self.__lock:
+            entry = self.__require_entry(key)
+            record = self.__encode_record(
+                EXPIRE,
+                key.encode(ENCODING),
+                expiration
+            )
+            self.__append(record)
+            self.__garbage += len(record)
+            entry.expiration = expiration
+            self.__compact_if_due()
+
+    @overrides(CacheStorage.discard)
+    def discard(self, key: CacheKey) -> bool:
+        with self.__lock:
+            try:
+                self.__require_entry(key)
+            except CacheKeyError:
+                return False
+            self.__discard_keys([key])
+            return True
+
+    @overrides(CacheStorage.clear)
+    def clear(self, scope: Scope = whole_cache):
+
+        with self.__lock:
+
+            # Clear the whole cache
+            if scope is whole_cache:
+                os.ftruncate(self.__fd, len(MAGIC))
+                if self.sync_writes:
+                    os.fsync(self.__fd)
+                self.__index.clear()
+                self.__keys_by_tag.clear()
+                self.__end = len(MAGIC)
+                self.__garbage = 0
+                self.__live_size = 0
+                self.__generation += 1
+                return
+
+            keys_to_remove = set()
+
+            for selector in scope:
+
+                # Strings select a single tag
+                if isinstance(selector, str):
+                    selector_keys = self.__keys_by_tag.get(selector)
+
+                # Tuples of strings select the intersection of multiple tags
+                elif isinstance(selector, tuple):
+                    selector_keys = None
+                    for tag in selector:
+                        tag_keys = self.__keys_by_tag.get(tag)
+                        if not tag_keys:
+                            selector_keys = None
+                            break
+                        elif selector_keys is None:
+                            selector_keys = set(tag_keys)
+                        else:
+                            selector_keys.intersection_update(tag_keys)
+                else:
+                    raise TypeError(
+                        "Scope selectors should be strings or tuples of "
+                        "strings; got %r instead" % selector
+                    )
+
+                if selector_keys:
+                    keys_to_remove.update(selector_keys)
+
+            self.__discard_keys(keys_to_remove)
+
+    @overrides(CacheStorage.drop_weight)
+    def drop_weight(self) -> Optional[CacheKey]:
+        with self.__lock:
+            if not self.__index:
+                return None
+            key = next(iter(self.__index))
+            self.__discard_keys([key])
+            return key
+
+
+class Entry:
+
+    __slots__ = (
+        "offset",
+        "size",
+        "value_start",
+        "value_length",
+        "expiration",
+        "tags"
+    )
+
+    def __init__(
+            self,
+            offset: int,
+            size: int,
+            value_start: int,
+            value_length: int,
+            expiration: Optional[int],
+            tags: Optional[Set[str]]):
+
+        self.offset = offset
+        self.size = size
+        self.value_start = value_start
+        self.value_length = value_length
+        self.expiration = expiration
+        self.tags = tags
+
+
+class _CompactionAborted(Exception):
+    pass
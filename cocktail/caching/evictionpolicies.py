@@ -0,0 +1,669 @@
+"""Eviction policies for `~cocktail.caching.MemoryCacheStorage`.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Dict, Optional
+from collections import OrderedDict
+from heapq import heappush, heappop
+from itertools import count
+from time import time
+
+from cocktail.modeling import overrides
+from .cachekey import CacheKey
+
+
+class EvictionPolicy:
+    """Decides which entries a `~cocktail.caching.MemoryCacheStorage` should
+    drop in order to free memory.
+
+    The storage notifies the policy of each entry that is added, accessed or
+    removed, and of each failed lookup. When the storage needs to free memory
+    it asks the policy to `.select_victim`.
+
+    Policies keep track of the number of hits, misses and evictions in the
+    storage they are attached to. Each policy instance should be used by a
+    single storage.
+
+    .. attribute:: hits
+
+        The number of successful lookups in the storage.
+
+    .. attribute:: misses
+
+        The number of failed lookups in the storage.
+
+    .. attribute:: evictions
+
+        The number of entries dropped by the storage to free memory.
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __init__(self):
+        self.reset_counters()
+
+    def reset_counters(self):
+        """Sets the hit, miss and eviction counters back to zero."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """The proportion of lookups that found the requested key."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get_counters(self) -> Dict[str, int]:
+        """Obtains the value of the policy's counters.
+
+        :return: A dictionary with the number of hits, misses and evictions.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def hit(self, entry: "Entry"):
+        """Records a successful lookup for the given entry."""
+        self.hits += 1
+        self.accessed(entry)
+
+    def miss(self, key: CacheKey):
+        """Records a failed lookup for the given key."""
+        self.misses += 1
+        self.missed(key)
+
+    def evicting(self, entry: "Entry"):
+        """Notifies the policy that the storage is about to drop the given
+        entry to free memory. The entry will be `.removed` afterwards.
+        """
+        self.evictions += 1
+
+    def added(self, entry: "Entry"):
+        """Notifies the policy that an entry has been added to the storage."""
+        raise TypeError("%s doesn't implement the added() method" % self)
+
+    def accessed(self, entry: "Entry"):
+        """Notifies the policy that an entry has been used."""
+        raise TypeError("%s doesn't implement the accessed() method" % self)
+
+    def missed(self, key: CacheKey):
+        """Notifies the policy that the storage didn't contain the given
+        key.
+        """
+
+    def removed(self, entry: "Entry"):
+        """Notifies the policy that an entry has been removed from the
+        storage, be it explicitly, because it expired or because it was
+        evicted.
+        """
+        raise TypeError("%s doesn't implement the removed() method" % self)
+
+    def clear(self):
+        """Notifies the policy that all entries have been removed from the
+        storage.
+        """
+        raise TypeError("%s doesn't implement the clear() method" % self)
+
+    def select_victim(self) -> Optional["Entry"]:
+        """Chooses the next entry that should be evicted.
+
+        :return: The entry to evict, or None if the storage is empty.
+        """
+        raise TypeError(
+            "%s doesn't implement the select_victim() method" % self
+        )
+
+
+class EntryList:
+    """A doubly linked list of cache entries, ordered by their last access.
+
+    Each entry can belong to a single list at a time; the list it belongs to
+    is stored in its `segment` attribute.
+    """
+
+    __slots__ = ("oldest", "newest", "length")
+
+    def __init__(self):
+        self.oldest = None
+        self.newest = None
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, entry: "Entry"):
+
+        entry.segment = self
+        entry.prev_entry = self.newest
+        entry.next_entry = None
+
+        if self.newest is None:
+            self.oldest = entry
+        else:
+            self.newest.next_entry = entry
+
+        self.newest = entry
+        self.length += 1
+
+    def remove(self, entry: "Entry"):
+
+        if entry is self.oldest:
+            self.oldest = entry.next_entry
+
+        if entry is self.newest:
+            self.newest = entry.prev_entry
+
+        if entry.prev_entry:
+            entry.prev_entry.next_entry = entry.next_entry
+
+        if entry.next_entry:
+            entry.next_entry.prev_entry = entry.prev_entry
+
+        entry.prev_entry = None
+        entry.next_entry = None
+        entry.segment = None
+        self.length -= 1
+
+    def move_to_end(self, entry: "Entry"):
+        if entry is not self.newest:
+            self.remove(entry)
+            self.append(entry)
+
+
+class LRUPolicy(EvictionPolicy):
+    """Evicts the least recently used entry."""
+
+    def __init__(self):
+        EvictionPolicy.__init__(self)
+        self._entries = EntryList()
+
+    @overrides(EvictionPolicy.added)
+    def added(self, entry: "Entry"):
+        self._entries.append(entry)
+
+    @overrides(EvictionPolicy.accessed)
+    def accessed(self, entry: "Entry"):
+        self._entries.move_to_end(entry)
+
+    @overrides(EvictionPolicy.removed)
+    def removed(self, entry: "Entry"):
+        if entry.segment is not None:
+            entry.segment.remove(entry)
+
+    @overrides(EvictionPolicy.clear)
+    def clear(self):
+        self._entries = EntryList()
+
+    @overrides(EvictionPolicy.select_victim)
+    def select_victim(self) -> Optional["Entry"]:
+        return self._entries.oldest
+
+
+class SegmentedLRUPolicy(EvictionPolicy):
+    """A scan resistant variant of the LRU policy.
+
+    New entries are placed on a *probation* segment; entries that are
+    accessed again are promoted to a *protected* segment. Entries are evicted
+    from the probation segment first, so entries that are only used once
+    (ie. by a crawler walking the whole site) can't displace frequently used
+    ones.
+
+    .. attribute:: protected_ratio
+
+        The maximum proportion of entries that can be on the protected
+        segment. When it is exceeded at the time of evicting an entry, the
+        least recently used protected entries are moved back to the probation
+        segment.
+    """
+    protected_ratio: float = 0.8
+
+    def __init__(self, protected_ratio: Optional[float] = None):
+        EvictionPolicy.__init__(self)
+        if protected_ratio is not None:
+            self.protected_ratio = protected_ratio
+        self.clear()
+
+    @overrides(EvictionPolicy.added)
+    def added(self, entry: "Entry"):
+        self._probation.append(entry)
+
+    @overrides(EvictionPolicy.accessed)
+    def accessed(self, entry: "Entry"):
+        if entry.segment is self._probation:
+            self._probation.remove(entry)
+            self._protected.append(entry)
+        elif entry.segment is not None:
+            entry.segment.move_to_end(entry)
+
+    def _apply_protected_limit(self):
+        # Applied when evicting entries, once the storage has reached its
+        # capacity
+        limit = max(
+            1,
+            int(
+                (len(self._probation) + len(self._protected))
+                * self.protected_ratio
+            )
+        )
+        while len(self._protected) > limit:
+            demoted = self._protected.oldest
+            self._protected.remove(demoted)
+            self._probation.append(demoted)
+
+    @overrides(EvictionPolicy.removed)
+    def removed(self, entry: "Entry"):
+        if entry.segment is not None:
+            entry.segment.remove(entry)
+
+    @overrides(EvictionPolicy.clear)
+    def clear(self):
+        self._probation = EntryList()
+        self._protected = EntryList()
+
+    @overrides(EvictionPolicy.select_victim)
+    def select_victim(self) -> Optional["Entry"]:
+        self._apply_protected_limit()
+        return self._probation.oldest or self._protected.oldest
+
+
+class ARCPolicy(EvictionPolicy):
+    """An implementation of the Adaptive Replacement Cache algorithm.
+
+    The policy splits entries between those that have been used once and
+    those that have been used more than once, and keeps track of the keys
+    recently evicted from each group. Misses on recently evicted keys are used
+    to adapt the share of the cache given to each group, balancing recency
+    and frequency depending on the workload.
+
+    Since the storage is bounded by memory, rather than by a number of
+    entries, the capacity used by the algorithm is the current number of
+    entries in the storage.
+    """
+
+    def __init__(self):
+        EvictionPolicy.__init__(self)
+        self.clear()
+
+    @property
+    def _capacity(self) -> int:
+        return max(1, len(self._recent) + len(self._frequent))
+
+    @overrides(EvictionPolicy.added)
+    def added(self, entry: "Entry"):
+
+        key = entry.key
+
+        # A key evicted from the 'recent' list comes back: favor recency
+        if key in self._recent_ghosts:
+            delta = max(
+                len(self._frequent_ghosts) / len(self._recent_ghosts),
+                1
+            )
+            self._target = min(self._target + delta, self._capacity)
+            del self._recent_ghosts[key]
+            self._frequent.append(entry)
+
+        # A key evicted from the 'frequent' list comes back: favor frequency
+        elif key in self._frequent_ghosts:
+            delta = max(
+                len(self._recent_ghosts) / len(self._frequent_ghosts),
+                1
+            )
+            self._target = max(self._target - delta, 0)
+            del self._frequent_ghosts[key]
+            self._frequent.append(entry)
+
+        else:
+            self._recent.append(entry)
+
+    @overrides(EvictionPolicy.accessed)
+    def accessed(self, entry: "Entry"):
+        if entry.segment is self._recent:
+            self._recent.remove(entry)
+            self._frequent.append(entry)
+        elif entry.segment is not None:
+            entry.segment.move_to_end(entry)
+
+    @overrides(EvictionPolicy.evicting)
+    def evicting(self, entry: "Entry"):
+
+        EvictionPolicy.evicting(self, entry)
+
+        if entry.segment is self._recent:
+            ghosts = self._recent_ghosts
+        else:
+            ghosts = self._frequent_ghosts
+
+        ghosts[entry.key] = None
+        capacity = self._capacity
+
+        while len(ghosts) > capacity:
+            ghosts.popitem(last = False)
+
+    @overrides(EvictionPolicy.removed)
+    def removed(self, entry: "Entry"):
+        if entry.segment is not None:
+            entry.segment.remove(entry)
+
+    @overrides(EvictionPolicy.clear)
+    def clear(self):
+        self._recent = EntryList()
+        self._frequent = EntryList()
+        self._recent_ghosts = OrderedDict()
+        self._frequent_ghosts = OrderedDict()
+        self._target = 0
+
+    @overrides(EvictionPolicy.select_victim)
+    def select_victim(self) -> Optional["Entry"]:
+        if self._recent.oldest is not None and (
+            len(self._recent) > self._target
+            or self._frequent.oldest is None
+        ):
+            return self._recent.oldest
+        else:
+            return self._frequent.oldest
+
+
+class FrequencySketch:
+    """Estimates how often keys are accessed, using a fixed amount of memory.
+
+    Implements a count-min sketch with 4 bit counters. Counters are halved
+    periodically, so that the estimations reflect recent activity.
+    """
+
+    depth: int = 4
+    max_count: int = 15
+
+    def __init__(self, width: int = 4096, sample_size: Optional[int] = None):
+        self.width = 1 << max(0, width - 1).bit_length()
+        self.sample_size = sample_size or self.width * 10
+        self.reset()
+
+    def reset(self):
+        self._rows = [[0] * self.width for i in range(self.depth)]
+        self._additions = 0
+
+    def _iter_positions(self, key: CacheKey):
+        h = hash(key)
+        mask = self.width - 1
+        for i in range(self.depth):
+            h = (h * 0x9E3779B1 + i + 1) & 0xFFFFFFFFFFFF
+            yield i, (h >> 16) & mask
+
+    def increment(self, key: CacheKey):
+
+        rows = self._rows
+        max_count = self.max_count
+
+        for row, position in self._iter_positions(key):
+            value = rows[row][position]
+            if value < max_count:
+                rows[row][position] = value + 1
+
+        self._additions += 1
+
+        if self._additions >= self.sample_size:
+            self._age()
+
+    def estimate(self, key: CacheKey) -> int:
+        rows = self._rows
+        return min(
+            rows[row][position]
+            for row, position in self._iter_positions(key)
+        )
+
+    def _age(self):
+        for row in self._rows:
+            for i, value in enumerate(row):
+                row[i] = value >> 1
+        self._additions //= 2
+
+
+class WTinyLFUPolicy(EvictionPolicy):
+    """An implementation of the W-TinyLFU admission and eviction policy.
+
+    New entries are placed in a small LRU *window*. Entries leaving the window
+    move to the main area of the cache (a segmented LRU), but when memory is
+    needed they are only kept if they have been requested more often than
+    the entry they would displace, as estimated by a `FrequencySketch` that
+    records every lookup. This makes
+    the cache highly resistant to scans, while the window still gives
+    bursts of new entries a chance to prove themselves.
+
+    .. attribute:: window_ratio
+
+        The proportion of entries that can stay on the admission window.
+
+    .. attribute:: protected_ratio
+
+        The maximum proportion of entries in the main area that can be on its
+        protected segment.
+    """
+    window_ratio: float = 0.01
+    protected_ratio: float = 0.8
+
+    def __init__(
+            self,
+            window_ratio: Optional[float] = None,
+            protected_ratio: Optional[float] = None,
+            sketch: Optional[FrequencySketch] = None):
+
+        EvictionPolicy.__init__(self)
+
+        if window_ratio is not None:
+            self.window_ratio = window_ratio
+
+        if protected_ratio is not None:
+            self.protected_ratio = protected_ratio
+
+        self.sketch = sketch or FrequencySketch()
+        self.clear()
+
+    @overrides(EvictionPolicy.added)
+    def added(self, entry: "Entry"):
+
+        self.sketch.increment(entry.key)
+        window = self._window
+        window.append(entry)
+
+        # Entries leaving the window become candidates for admission into
+        # the main area (see select_victim)
+        total = len(window) + len(self._probation) + len(self._protected)
+        window_limit = max(1, int(total * self.window_ratio))
+
+        while len(window) > window_limit:
+            candidate = window.oldest
+            window.remove(candidate)
+            self._probation.append(candidate)
+
+    @overrides(EvictionPolicy.accessed)
+    def accessed(self, entry: "Entry"):
+
+        self.sketch.increment(entry.key)
+
+        if entry.segment is self._probation:
+            self._probation.remove(entry)
+            self._protected.append(entry)
+        elif entry.segment is not None:
+            entry.segment.move_to_end(entry)
+
+    @overrides(EvictionPolicy.missed)
+    def missed(self, key: CacheKey):
+        self.sketch.increment(key)
+
+    def _apply_protected_limit(self):
+        # Applied when evicting entries, once the storage has reached its
+        # capacity
+        limit = max(
+            1,
+            int(
+                (len(self._probation) + len(self._protected))
+                * self.protected_ratio
+            )
+        )
+        while len(self._protected) > limit:
+            demoted = self._protected.oldest
+            self._protected.remove(demoted)
+            self._probation.append(demoted)
+
+    @overrides(EvictionPolicy.removed)
+    def removed(self, entry: "Entry"):
+        if entry.segment is not None:
+            entry.segment.remove(entry)
+
+    @overrides(EvictionPolicy.clear)
+    def clear(self):
+        self._window = EntryList()
+        self._probation = EntryList()
+        self._protected = EntryList()
+
+    @overrides(EvictionPolicy.select_victim)
+    def select_victim(self) -> Optional["Entry"]:
+
+        self._apply_protected_limit()
+        probation = self._probation
+        victim = probation.oldest
+
+        if victim is None:
+            return self._protected.oldest or self._window.oldest
+
+        # The last entry to leave the window must be more popular than the
+        # entry it would displace in order to be admitted
+        candidate = probation.newest
+        sketch = self.sketch
+
+        if candidate is not victim and (
+            sketch.estimate(candidate.key) <= sketch.estimate(victim.key)
+        ):
+            return candidate
+
+        return victim
+
+
+class CostAwarePolicy(EvictionPolicy):
+    """A policy that weighs the size of entries against the cost of
+    recomputing them, using the GreedyDual-Size-Frequency algorithm.
+
+    Each entry is given a priority of ``clock + frequency * cost / size``;
+    the entry with the lowest priority is evicted, and the global clock
+    advances to its priority, so that entries that are not accessed anymore
+    eventually age out.
+
+    The cost of an entry is the time elapsed between the lookup that missed
+    its key and the moment it was stored, which for the usual
+    retrieve / produce / store cycle is the time it took to produce its
+    value. Entries stored without a preceding miss are given the
+    `.default_cost`.
+
+    .. attribute:: default_cost
+
+        The cost, in seconds, assigned to entries with an unknown recompute
+        time.
+
+    .. attribute:: max_pending_misses
+
+        The maximum number of failed lookups to remember while waiting for
+        their keys to be stored.
+    """
+    default_cost: float = 0.001
+    max_pending_misses: int = 10000
+
+    def __init__(
+            self,
+            default_cost: Optional[float] = None,
+            max_pending_misses: Optional[int] = None):
+
+        EvictionPolicy.__init__(self)
+
+        if default_cost is not None:
+            self.default_cost = default_cost
+
+        if max_pending_misses is not None:
+            self.max_pending_misses = max_pending_misses
+
+        self._pending_misses = OrderedDict()
+        self._sequence = count()
+        self.clear()
+
+    def get_priority(self, entry: "Entry") -> float:
+        return (
+            self._clock
+            + entry.frequency * entry.cost / max(1, entry.size or 0)
+        )
+
+    def _push(self, entry: "Entry"):
+        entry.priority = self.get_priority(entry)
+        heappush(self._heap, (entry.priority, next(self._sequence), entry))
+
+        # Discard outdated heap items when they start to pile up
+        if len(self._heap) > 2 * self._length + 100:
+            self._heap = [
+                item
+                for item in self._heap
+                if item[2].segment is self and item[0] == item[2].priority
+            ]
+            self._heap.sort()
+
+    @overrides(EvictionPolicy.missed)
+    def missed(self, key: CacheKey):
+        pending = self._pending_misses
+        pending.pop(key, None)
+        pending[key] = time()
+        while len(pending) > self.max_pending_misses:
+            pending.popitem(last = False)
+
+    @overrides(EvictionPolicy.added)
+    def added(self, entry: "Entry"):
+
+        miss_time = self._pending_misses.pop(entry.key, None)
+
+        if entry.cost is None:
+            entry.cost = (
+                self.default_cost
+                if miss_time is None
+                else time() - miss_time
+            )
+
+        entry.frequency = 1
+        entry.segment = self
+        self._length += 1
+        self._push(entry)
+
+    @overrides(EvictionPolicy.accessed)
+    def accessed(self, entry: "Entry"):
+        entry.frequency += 1
+        self._push(entry)
+
+    @overrides(EvictionPolicy.removed)
+    def removed(self, entry: "Entry"):
+        if entry.segment is self:
+            entry.segment = None
+            self._length -= 1
+
+    @overrides(EvictionPolicy.evicting)
+    def evicting(self, entry: "Entry"):
+        EvictionPolicy.evicting(self, entry)
+        self._clock = entry.priority
+
+    @overrides(EvictionPolicy.clear)
+    def clear(self):
+        self._heap = []
+        self._length = 0
+        self._clock = 0.0
+
+    @overrides(EvictionPolicy.select_victim)
+    def select_victim(self) -> Optional["Entry"]:
+
+        heap = self._heap
+
+        while heap:
+            priority, seq, entry = heap[0]
+            if entry.segment is self and priority == entry.priority:
+                return entry
+            heappop(heap)
+
+        return None
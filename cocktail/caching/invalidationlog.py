@@ -0,0 +1,244 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Callable, List, Optional, Tuple
+from collections import deque
+from threading import Lock
+from uuid import uuid4
+from json import loads, dumps
+import os
+import fcntl
+
+from cocktail.modeling import overrides
+from .scope import whole_cache, Scope, export_scope, import_scope
+
+Position = Tuple[str, int]
+
+ENCODING = "utf-8"
+
+
+class InvalidationLog:
+    """A sequence of cache invalidations, shared by several cache nodes.
+
+    Each node (usually a `~cocktail.caching.TieredCacheStorage`) publishes
+    the scopes it clears to the log, and periodically reads the scopes
+    published by other nodes since its last visit, so it can apply them to
+    its local copies of cached entries.
+
+    Positions in the log are opaque values, obtained from `.get_position`
+    and `.read`. They include an epoch identifier: if the log is reset (f.
+    ex. because it has been truncated, or the process holding it has been
+    restarted) positions from the previous epoch become invalid, and reading
+    from them yields a `~cocktail.caching.whole_cache` invalidation.
+
+    Logs can also notify in-process subscribers as soon as an invalidation is
+    published (see `.subscribe`).
+    """
+
+    def __init__(self):
+        self.__subscribers = []
+
+    def subscribe(self, callback: Callable[[Scope], Any]):
+        """Registers a callback to invoke when an invalidation is published
+        in the current process.
+
+        :param callback: A callable that will receive the published scope.
+        """
+        self.__subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Scope], Any]):
+        """Removes a callback registered with `.subscribe`."""
+        self.__subscribers.remove(callback)
+
+    def publish(self, scope: Scope):
+        """Appends an invalidation to the log.
+
+        :param scope: The scope that has been cleared.
+        """
+        self._append(scope)
+        for callback in list(self.__subscribers):
+            callback(scope)
+
+    def _append(self, scope: Scope):
+        raise TypeError(
+            "%s doesn't implement the _append() method" % self
+        )
+
+    def get_position(self) -> Position:
+        """Obtains the position at the end of the log.
+
+        :return: A position that will cause `.read` to return only
+            invalidations published after this call.
+        """
+        raise TypeError(
+            "%s doesn't implement the get_position() method" % self
+        )
+
+    def read(self, position: Position) -> Tuple[Position, List[Scope]]:
+        """Obtains the invalidations published after the given position.
+
+        :param position: The position to read from.
+        :return: A tuple containing the new position at the end of the log,
+            and the list of scopes published since the given position. If the
+            given position can't be resolved, the list contains a single
+            `~cocktail.caching.whole_cache` invalidation.
+        """
+        raise TypeError(
+            "%s doesn't implement the read() method" % self
+        )
+
+
+class MemoryInvalidationLog(InvalidationLog):
+    """An invalidation log held in memory, for nodes within a single process.
+
+    The log keeps up to `.max_size` invalidations; nodes falling further
+    behind will clear their whole cache.
+    """
+
+    max_size: int = 1000
+
+    def __init__(self, max_size: Optional[int] = None):
+        InvalidationLog.__init__(self)
+
+        if max_size is not None:
+            self.max_size = max_size
+
+        self.__lock = Lock()
+        self.__epoch = uuid4().hex
+        self.__sequence = 0
+        self.__entries = deque(maxlen = self.max_size)
+
+    @overrides(InvalidationLog._append)
+    def _append(self, scope: Scope):
+        with self.__lock:
+            self.__sequence += 1
+            self.__entries.append((self.__sequence, scope))
+
+    @overrides(InvalidationLog.get_position)
+    def get_position(self) -> Position:
+        return (self.__epoch, self.__sequence)
+
+    @overrides(InvalidationLog.read)
+    def read(self, position: Position) -> Tuple[Position, List[Scope]]:
+
+        with self.__lock:
+            end = (self.__epoch, self.__sequence)
+            epoch, sequence = position
+
+            if epoch != self.__epoch or sequence > self.__sequence:
+                return end, [whole_cache]
+
+            if sequence == self.__sequence:
+                return end, []
+
+            first = self.__sequence - len(self.__entries) + 1
+            if sequence + 1 < first:
+                return end, [whole_cache]
+
+            return end, [
+                scope
+                for entry_sequence, scope in self.__entries
+                if entry_sequence > sequence
+            ]
+
+
+class FileInvalidationLog(InvalidationLog):
+    """An invalidation log stored in a file, for nodes running in different
+    processes on the same host.
+
+    The file starts with a line holding its epoch, followed by one JSON line
+    per invalidation. Writers take an exclusive lock on the file to append
+    to it. When the file grows past `.max_size` bytes, it is replaced by an
+    empty log with a new epoch.
+    """
+
+    max_size: int = 1024 * 1024
+
+    def __init__(self, path: str, max_size: Optional[int] = None):
+        InvalidationLog.__init__(self)
+        self.__path = path
+
+        if max_size is not None:
+            self.max_size = max_size
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def __open(self):
+        return open(
+            os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600),
+            "r+b"
+        )
+
+    def __read_epoch(self, file) -> Optional[str]:
+        file.seek(0)
+        line = file.readline()
+        if line.endswith(b"\n"):
+            return line[:-1].decode(ENCODING)
+        return None
+
+    def __reset(self, file) -> str:
+        epoch = uuid4().hex
+        file.seek(0)
+        file.truncate()
+        file.write(epoch.encode(ENCODING) + b"\n")
+        return epoch
+
+    @overrides(InvalidationLog._append)
+    def _append(self, scope: Scope):
+        with self.__open() as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                epoch = self.__read_epoch(file)
+                file.seek(0, os.SEEK_END)
+                if epoch is None or file.tell() > self.max_size:
+                    self.__reset(file)
+                file.write(
+                    dumps(export_scope(scope)).encode(ENCODING) + b"\n"
+                )
+            finally:
+                file.flush()
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def __end(self, file) -> Position:
+        epoch = self.__read_epoch(file)
+        if epoch is None:
+            epoch = self.__reset(file)
+        file.seek(0, os.SEEK_END)
+        return (epoch, file.tell())
+
+    @overrides(InvalidationLog.get_position)
+    def get_position(self) -> Position:
+        with self.__open() as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                return self.__end(file)
+            finally:
+                file.flush()
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    @overrides(InvalidationLog.read)
+    def read(self, position: Position) -> Tuple[Position, List[Scope]]:
+
+        with self.__open() as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                end = self.__end(file)
+                epoch, offset = position
+
+                if epoch != end[0] or offset > end[1]:
+                    return end, [whole_cache]
+
+                file.seek(offset)
+                data = file.read(end[1] - offset)
+            finally:
+                file.flush()
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+        return end, [
+            import_scope(loads(line.decode(ENCODING)))
+            for line in data.splitlines()
+            if line
+        ]
@@ -2,7 +2,7 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Any, Optional, Sequence, Set, Tuple, Union
+from typing import Any, Callable, Optional, Sequence, Set, Tuple, Union
 from sys import getsizeof
 from time import time
 from threading import RLock
@@ -10,14 +10,37 @@ from threading import RLock
 from cocktail.modeling import overrides
 from cocktail.styled import styled
 from cocktail.memoryutils import parse_bytes, format_bytes
+from cocktail.typemapping import TypeMapping
 from .scope import whole_cache, Scope
 from .cachekey import CacheKey
 from .cachestorage import CacheStorage
 from .exceptions import CacheKeyError
+from .evictionpolicies import EvictionPolicy, LRUPolicy
+from .sizers import SampledSizer
 
 
 class MemoryCacheStorage(CacheStorage):
-    """A cache backend that stores data on a Python dictionary."""
+    """A cache backend that stores data on a Python dictionary.
+
+    .. attribute:: eviction_policy
+
+        The `~cocktail.caching.evictionpolicies.EvictionPolicy` that decides
+        which entries to drop when the storage exceeds its `.memory_limit`.
+        Defaults to a `~cocktail.caching.evictionpolicies.LRUPolicy`. The
+        policy also keeps count of the hits, misses and evictions in the
+        storage.
+
+    .. attribute:: sizers
+
+        A `~cocktail.typemapping.TypeMapping` that assigns a
+        `~cocktail.caching.sizers.Sizer` to each type of cached value, used
+        to measure entries against the `.memory_limit`. Defaults to a
+        `~cocktail.caching.sizers.SampledSizer` for all values. Storages
+        share the mapping of their class unless given their own.
+    """
+
+    EvictionListener = Callable[[CacheKey, Optional[Set[str]], int], None]
+    StoreListener = Callable[[CacheKey, Optional[Set[str]], int], None]
 
     __memory_limit: Optional[int] = None
     __memory_usage: int = 0
@@ -25,14 +48,93 @@ class MemoryCacheStorage(CacheStorage):
     verbose_invalidation: bool = False
     verbose_memory_usage: bool = False
 
-    def __init__(self, memory_limit: Optional[int] = None):
+    sizers: TypeMapping = TypeMapping((
+        (object, SampledSizer()),
+    ))
+
+    def __init__(
+            self,
+            memory_limit: Optional[int] = None,
+            eviction_policy: Optional[EvictionPolicy] = None,
+            sizers: Optional[TypeMapping] = None):
+
+        if sizers is not None:
+            self.sizers = sizers
+
         self.__lock = RLock()
         self.__dict = {}
-        self.__oldest_entry = None
-        self.__newest_entry = None
         self.__entries_by_tag = {}
+        self.__eviction_policy = eviction_policy or LRUPolicy()
+        self.__eviction_listeners = []
+        self.__store_listeners = []
         self.memory_limit = memory_limit
 
+    def _get_eviction_policy(self) -> EvictionPolicy:
+        return self.__eviction_policy
+
+    def _set_eviction_policy(self, eviction_policy: EvictionPolicy):
+        with self.__lock:
+            self.__eviction_policy = eviction_policy
+            for entry in self.__dict.values():
+                entry.segment = None
+                eviction_policy.added(entry)
+
+    eviction_policy = property(
+        _get_eviction_policy,
+        _set_eviction_policy,
+        doc = """
+        Gets or sets the policy used to choose the entries to evict.
+        """
+    )
+
+    def add_eviction_listener(self, listener: EvictionListener):
+        """Registers a callable to invoke whenever the storage drops an
+        entry to free memory.
+
+        :param listener: A callable that will receive the key, tags and size
+            of each evicted entry. It is invoked while the storage is locked,
+            so it shouldn't access the storage.
+        """
+        with self.__lock:
+            self.__eviction_listeners = self.__eviction_listeners + [listener]
+
+    def remove_eviction_listener(self, listener: EvictionListener):
+        """Unregisters a callable added by `.add_eviction_listener`."""
+        with self.__lock:
+            self.__eviction_listeners = [
+                registered
+                for registered in self.__eviction_listeners
+                if registered != listener
+            ]
+
+    def add_store_listener(self, listener: StoreListener):
+        """Registers a callable to invoke whenever an entry is written to the
+        storage.
+
+        :param listener: A callable that will receive the key, tags and size
+            of each stored entry, as measured by `._get_entry_memory_usage`.
+            It is invoked while the storage is locked, so it shouldn't access
+            the storage.
+        """
+        with self.__lock:
+            self.__store_listeners = self.__store_listeners + [listener]
+
+    def remove_store_listener(self, listener: StoreListener):
+        """Unregisters a callable added by `.add_store_listener`."""
+        with self.__lock:
+            self.__store_listeners = [
+                registered
+                for registered in self.__store_listeners
+                if registered != listener
+            ]
+
+    @property
+    def entry_count(self) -> int:
+        """The number of entries in the storage, including expired entries
+        that haven't been removed yet.
+        """
+        return len(self.__dict)
+
     @property
     def memory_usage(self) -> int:
         return (
@@ -91,7 +193,10 @@ class MemoryCacheStorage(CacheStorage):
         )
 
     def _get_value_memory_usage(self, value: Any) -> int:
-        return getsizeof(value)
+        sizer = self.sizers.get(value.__class__)
+        if sizer is None:
+            return getsizeof(value)
+        return sizer.get_size(value)
 
     memory_usage_bar_width: int = 50
 
@@ -148,6 +253,15 @@ class MemoryCacheStorage(CacheStorage):
 
             return entry
 
+    def __require_accessed_entry(self, key: CacheKey) -> "Entry":
+        try:
+            entry = self.__require_entry(key)
+        except CacheKeyError:
+            self.__eviction_policy.miss(key)
+            raise
+        self.__eviction_policy.hit(entry)
+        return entry
+
     def __remove_entry(self, entry: "Entry"):
 
         if self.verbose_invalidation:
@@ -159,7 +273,7 @@ class MemoryCacheStorage(CacheStorage):
             self.print_memory_usage()
 
         del self.__dict[entry.key]
-        self.__release(entry)
+        self.__eviction_policy.removed(entry)
 
         if entry.tags:
             for tag in entry.tags:
@@ -172,50 +286,20 @@ class MemoryCacheStorage(CacheStorage):
         entry.tags = None
         entry.size = None
 
-    def __release(self, entry: "Entry"):
-
-        if entry is self.__oldest_entry:
-            self.__oldest_entry = entry.next_entry
-
-        if entry is self.__newest_entry:
-            self.__newest_entry = entry.prev_entry
-
-        if entry.prev_entry:
-            entry.prev_entry.next_entry = entry.next_entry
-
-        if entry.next_entry:
-            entry.next_entry.prev_entry = entry.prev_entry
-
-        entry.prev_entry = None
-        entry.next_entry = None
-
-    def __update_last_access(self, entry: "Entry"):
-
-        if entry is self.__newest_entry:
-            return
-
-        self.__release(entry)
-
-        if self.__oldest_entry is None:
-            self.__oldest_entry = entry
-
-        if self.__newest_entry:
-            self.__newest_entry.next_entry = entry
-            entry.prev_entry = self.__newest_entry
-
-        self.__newest_entry = entry
-
     @overrides(CacheStorage.exists)
     def exists(self, key: CacheKey) -> bool:
         with self.__lock:
-            return self.__require_entry(key) is not None
+            try:
+                self.__require_entry(key)
+            except CacheKeyError:
+                return False
+            else:
+                return True
 
     @overrides(CacheStorage.retrieve)
     def retrieve(self, key: CacheKey) -> Any:
         with self.__lock:
-            entry = self.__require_entry(key)
-            self.__update_last_access(entry)
-            return entry.value
+            return self.__require_accessed_entry(key).value
 
     @overrides(CacheStorage.retrieve_with_metadata)
     def retrieve_with_metadata(
@@ -223,8 +307,7 @@ class MemoryCacheStorage(CacheStorage):
             key: CacheKey) -> Tuple[Any, int, Set[str]]:
 
         with self.__lock:
-            entry = self.__require_entry(key)
-            self.__update_last_access(entry)
+            entry = self.__require_accessed_entry(key)
             return (entry.value, entry.expiration, entry.tags)
 
     @overrides(CacheStorage.store)
@@ -245,7 +328,7 @@ class MemoryCacheStorage(CacheStorage):
             entry.size = self._get_entry_memory_usage(entry)
             self.__memory_usage += entry.size
             self.__dict[key] = entry
-            self.__update_last_access(entry)
+            self.__eviction_policy.added(entry)
 
             if tags is not None:
                 for tag in tags:
@@ -254,6 +337,9 @@ class MemoryCacheStorage(CacheStorage):
                         self.__entries_by_tag[tag] = tag_entries = set()
                     tag_entries.add(entry)
 
+            for listener in self.__store_listeners:
+                listener(key, tags, entry.size)
+
             if self.verbose_memory_usage:
                 self.print_memory_usage()
 
@@ -268,7 +354,7 @@ class MemoryCacheStorage(CacheStorage):
         with self.__lock:
             entry = self.__require_entry(key)
             entry.expiration = expiration
-            self.__update_last_access(entry)
+            self.__eviction_policy.accessed(entry)
 
     @overrides(CacheStorage.discard)
     def discard(self, key: CacheKey) -> bool:
@@ -292,6 +378,8 @@ class MemoryCacheStorage(CacheStorage):
             if scope is whole_cache:
                 self.__dict.clear()
                 self.__entries_by_tag.clear()
+                self.__memory_usage = 0
+                self.__eviction_policy.clear()
 
             # Clear parts of the cache
             else:
@@ -330,9 +418,15 @@ class MemoryCacheStorage(CacheStorage):
 
     def drop_weight(self):
         with self.__lock:
-            if self.__oldest_entry:
-                key = self.__oldest_entry.key
-                self.__remove_entry(self.__oldest_entry)
+            entry = self.__eviction_policy.select_victim()
+            if entry is not None:
+                key = entry.key
+                tags = entry.tags
+                size = entry.size
+                self.__eviction_policy.evicting(entry)
+                self.__remove_entry(entry)
+                for listener in self.__eviction_listeners:
+                    listener(key, tags, size)
                 return key
 
 
@@ -345,6 +439,10 @@ class Entry(object):
     size: int = 0
     prev_entry: Optional["Entry"]
     next_entry: Optional["Entry"]
+    segment: Any = None
+    cost: Optional[float] = None
+    frequency: int = 0
+    priority: float = 0.0
 
     def __init__(
             self,
@@ -0,0 +1,187 @@
+"""Binary encoding for the batch endpoints of the REST cache server.
+
+`~cocktail.caching.RESTCacheStorage` and
+`~cocktail.caching.restcacheserver.CacheController` exchange batches of cache
+entries as a sequence of length prefixed records, instead of JSON documents.
+Values travel as the raw bytes produced by the client's
+`~cocktail.caching.CacheSerializer`, which avoids the size and CPU overhead of
+encoding them in base64.
+
+A message starts with a fixed header:
+
+    - A 4 byte signature (``MAGIC``)
+    - A flags byte (see ``COMPRESSED`` and ``ACCEPTS_COMPRESSION``)
+
+The header is followed by the records, optionally compressed with zlib as a
+whole. Each record holds:
+
+    - A flags byte, indicating which of the optional fields are present
+      (``HAS_VALUE``, ``HAS_EXPIRATION``, ``HAS_TAGS``)
+    - The key, as a length prefixed UTF-8 string
+    - The expiration, as a signed 64 bit integer (if present)
+    - The tags, as a count followed by length prefixed UTF-8 strings (if
+      present)
+    - The value, as a length prefixed byte string (if present)
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Iterable, List, Optional, Set, Tuple
+from struct import Struct, error as StructError
+import zlib
+
+ENCODING = "utf-8"
+MIME_TYPE = "application/x-cocktail-cache-records"
+MAGIC = b"CCR1"
+
+# Message flags
+COMPRESSED = 1
+ACCEPTS_COMPRESSION = 2
+
+# Record flags
+HAS_VALUE = 1
+HAS_EXPIRATION = 2
+HAS_TAGS = 4
+
+Record = Tuple[str, Optional[bytes], Optional[int], Optional[Set[str]]]
+
+_header = Struct("<4sB")
+_record_flags = Struct("<B")
+_length = Struct("<I")
+_expiration = Struct("<q")
+
+
+def encode_records(
+        records: Iterable[Record],
+        compression_threshold: Optional[int] = None,
+        accepts_compression: bool = False) -> bytes:
+    """Encodes a sequence of cache records.
+
+    :param records: The records to encode. Each record is a tuple containing
+        a key, a value (as bytes), an expiration and a set of tags. Values,
+        expirations and tags can be set to None to leave them out.
+
+    :param compression_threshold: If given, the body of the message will be
+        compressed if it exceeds the given number of bytes.
+
+    :param accepts_compression: Signals the receiving end that it can compress
+        its reply.
+
+    :return: The encoded message.
+    """
+    chunks = []
+    write = chunks.append
+
+    for key, value, expiration, tags in records:
+
+        flags = 0
+        if value is not None:
+            flags |= HAS_VALUE
+        if expiration is not None:
+            flags |= HAS_EXPIRATION
+        if tags is not None:
+            flags |= HAS_TAGS
+
+        write(_record_flags.pack(flags))
+
+        key = key.encode(ENCODING)
+        write(_length.pack(len(key)))
+        write(key)
+
+        if expiration is not None:
+            write(_expiration.pack(expiration))
+
+        if tags is not None:
+            write(_length.pack(len(tags)))
+            for tag in tags:
+                tag = tag.encode(ENCODING)
+                write(_length.pack(len(tag)))
+                write(tag)
+
+        if value is not None:
+            if isinstance(value, str):
+                value = value.encode(ENCODING)
+            write(_length.pack(len(value)))
+            write(value)
+
+    body = b"".join(chunks)
+    flags = 0
+
+    if accepts_compression:
+        flags |= ACCEPTS_COMPRESSION
+
+    if compression_threshold is not None and len(body) > compression_threshold:
+        body = zlib.compress(body)
+        flags |= COMPRESSED
+
+    return _header.pack(MAGIC, flags) + body
+
+
+def decode_records(data: bytes) -> Tuple[List[Record], int]:
+    """Decodes a message produced by `encode_records`.
+
+    :param data: The message to decode.
+    :return: A tuple containing the list of decoded records and the flags of
+        the message.
+    :raises ValueError: Raised if the message is malformed.
+    """
+    if len(data) < _header.size:
+        raise ValueError("Truncated cache records message")
+
+    magic, flags = _header.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError("Invalid cache records message signature")
+
+    body = data[_header.size:]
+
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+
+    body = memoryview(body)
+    records = []
+    pos = 0
+    size = len(body)
+
+    try:
+        while pos < size:
+            record_flags = body[pos]
+            pos += 1
+
+            key_length = _length.unpack_from(body, pos)[0]
+            pos += _length.size
+            key = str(body[pos:pos + key_length], ENCODING)
+            pos += key_length
+
+            if record_flags & HAS_EXPIRATION:
+                expiration = _expiration.unpack_from(body, pos)[0]
+                pos += _expiration.size
+            else:
+                expiration = None
+
+            if record_flags & HAS_TAGS:
+                tag_count = _length.unpack_from(body, pos)[0]
+                pos += _length.size
+                tags = set()
+                for i in range(tag_count):
+                    tag_length = _length.unpack_from(body, pos)[0]
+                    pos += _length.size
+                    tags.add(str(body[pos:pos + tag_length], ENCODING))
+                    pos += tag_length
+            else:
+                tags = None
+
+            if record_flags & HAS_VALUE:
+                value_length = _length.unpack_from(body, pos)[0]
+                pos += _length.size
+                value = body[pos:pos + value_length].tobytes()
+                if len(value) != value_length:
+                    raise ValueError("Truncated cache records message")
+                pos += value_length
+            else:
+                value = None
+
+            records.append((key, value, expiration, tags))
+    except (StructError, IndexError) as error:
+        raise ValueError("Truncated cache records message") from error
+
+    return records, flags
@@ -2,8 +2,8 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Optional
-from base64 import urlsafe_b64decode
+from typing import Optional, Sequence
+from base64 import urlsafe_b64decode, encodebytes
 from json import loads, dumps
 
 import cherrypy
@@ -14,17 +14,41 @@ from .cache import Cache
 from .cachestorage import CacheStorage
 from .memorycachestorage import MemoryCacheStorage
 from .cachekey import CacheKey
-from .scope import whole_cache, Scope
+from .scope import import_scope, export_scope
+from .invalidationlog import MemoryInvalidationLog
 from .exceptions import CacheKeyError
+from .restcacheprotocol import (
+    MIME_TYPE,
+    ACCEPTS_COMPRESSION,
+    Record,
+    encode_records,
+    decode_records
+)
 
 ENCODING = "utf-8"
 
 
 class CacheController(Controller):
+    """A cache server, exposing a `~cocktail.caching.Cache` over HTTP.
+
+    Clients (see `~cocktail.caching.RESTCacheStorage`) can operate on
+    individual keys using JSON requests, or fetch and store batches of
+    entries using the binary format implemented by
+    `~cocktail.caching.restcacheprotocol` (see `.retrieve_many` and
+    `.store_many`). Values are stored as the opaque byte strings produced by
+    the client's serializer.
+
+    .. attribute:: compression_threshold
+
+        Binary responses larger than this number of bytes are compressed, if
+        the client signals it accepts compressed responses. Set to None to
+        disable compression.
+    """
 
     __cache: Cache
 
     memory_limit: Optional[int] = None
+    compression_threshold: Optional[int] = 4096
 
     def __init__(self, storage: Optional[CacheStorage] = None):
 
@@ -32,11 +56,14 @@ class CacheController(Controller):
             storage = MemoryCacheStorage()
 
         self.__cache = Cache(storage)
+        self.__invalidation_log = MemoryInvalidationLog()
 
     def resolve(self, path: Dispatcher.PathProcessor) -> Controller:
         if len(path) >= 2 and path[0] == "keys":
             path.pop(0)
-            key = str(urlsafe_b64decode(path.pop(0).encode(ENCODING)))
+            key = urlsafe_b64decode(path.pop(0).encode(ENCODING)).decode(
+                ENCODING
+            )
             return KeyController(self, key)
         else:
             return self
@@ -45,20 +72,81 @@ class CacheController(Controller):
     def cache(self) -> Cache:
         return self.__cache
 
+    @property
+    def invalidation_log(self) -> MemoryInvalidationLog:
+        """The log of the scopes cleared through the server, used by
+        `~cocktail.caching.RESTInvalidationLog`.
+        """
+        return self.__invalidation_log
+
     @cherrypy.expose
     def clear(self):
-        scope = loads(cherrypy.request.body.read())
+        scope = import_scope(loads(cherrypy.request.body.read()))
+        self.__cache.clear(scope = scope)
+        self.__invalidation_log.publish(scope)
 
-        if scope is None:
-            self.__cache.clear(scope = whole_cache)
+    @cherrypy.expose
+    def invalidations(
+            self,
+            epoch: Optional[str] = None,
+            sequence: Optional[str] = None):
+
+        if epoch is None or sequence is None:
+            position = self.__invalidation_log.get_position()
+            scopes = []
         else:
-            selectors = set()
-            for selector in scope:
-                if isinstance(selector, list):
-                    selector = tuple(selector)
-                selectors.add(selector)
+            position, scopes = self.__invalidation_log.read(
+                (epoch, int(sequence))
+            )
+
+        return dumps({
+            "position": position,
+            "scopes": [export_scope(scope) for scope in scopes]
+        }).encode(ENCODING)
+
+    @cherrypy.expose
+    def retrieve_many(self):
+        records, flags = decode_records(cherrypy.request.body.read())
+        results = []
+
+        for key, value, expiration, tags in records:
+            try:
+                value, expiration, tags = \
+                    self.__cache.retrieve_with_metadata(key)
+            except CacheKeyError:
+                results.append((key, None, None, None))
+            else:
+                results.append((key, value, expiration, tags))
+
+        return self._records_response(results, flags)
+
+    @cherrypy.expose
+    def store_many(self):
+        records, flags = decode_records(cherrypy.request.body.read())
+
+        for key, value, expiration, tags in records:
+            self.__cache.store(
+                key,
+                value,
+                expiration = expiration,
+                tags = tags
+            )
+
+        return self._records_response((), flags)
+
+    def _records_response(
+            self,
+            records: Sequence[Record],
+            request_flags: int) -> bytes:
 
-            self.__cache.clear(scope = selectors)
+        cherrypy.response.headers["Content-Type"] = MIME_TYPE
+        return encode_records(
+            records,
+            compression_threshold =
+                self.compression_threshold
+                if request_flags & ACCEPTS_COMPRESSION
+                else None
+        )
 
     @event_handler
     def handle_before_request(e):
@@ -98,16 +186,21 @@ class KeyController(Controller):
 
         if method == "HEAD":
             if self.cache.exists(self.key):
-                return ""
+                return b""
             else:
-                raise CacheKeyError(key)
+                raise CacheKeyError(self.key)
 
         elif method == "GET":
             value, expiration, tags = self.cache.retrieve_with_metadata(self.key)
+
+            # Values stored using the binary endpoints are raw bytes
+            if isinstance(value, bytes):
+                value = encodebytes(value).decode(ENCODING)
+
             return dumps({
                 "value": value,
                 "expiration": expiration,
-                "tags": tags
+                "tags": None if tags is None else list(tags)
             }).encode(ENCODING)
 
         elif method == "POST":
@@ -121,25 +214,28 @@ class KeyController(Controller):
 
         elif method == "DELETE":
             if not self.cache.discard(self.key):
-                raise CacheKeyError(key)
+                raise CacheKeyError(self.key)
             else:
                 return dumps(True).encode(ENCODING)
 
     @cherrypy.expose
     def value(self):
         cherrypy.response.headers["Content-Type"] = "text/plain"
-        return self.cache.retrieve(self.key)
+        value = self.cache.retrieve(self.key)
+        if isinstance(value, str):
+            value = value.encode(ENCODING)
+        return value
 
     @cherrypy.expose
     def expiration(self):
         method = cherrypy.request.method
 
         if method == "GET":
-            return dumps(self.cache.get_expiration(self.key))
+            return dumps(self.cache.get_expiration(self.key)).encode(ENCODING)
         elif method == "POST":
             expiration = loads(cherrypy.request.body.read())
             self.cache.set_expiration(self.key, expiration)
-            return dumps(expiration)
+            return dumps(expiration).encode(ENCODING)
 
 
 if __name__ == "__main__":
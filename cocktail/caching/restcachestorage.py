@@ -2,36 +2,93 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Any, Optional, Set, Tuple
-from httplib2 import Http
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from contextlib import contextmanager
+from threading import Lock
 from base64 import urlsafe_b64encode
 from json import loads, dumps
+from urllib.parse import urlencode
+import os
+from httplib2 import Http
 
 from cocktail.modeling import overrides
 from .exceptions import CacheKeyError
 from .cachekey import CacheKey
 from .cachestorage import CacheStorage
 from .cacheserializer import CacheSerializer
-from .picklecacheserializer import Base64PickleCacheSerializer
-from .scope import whole_cache, Scope
+from .picklecacheserializer import PickleCacheSerializer
+from .scope import whole_cache, Scope, export_scope, import_scope
+from .invalidationlog import InvalidationLog, Position
+from .restcacheprotocol import (
+    MIME_TYPE,
+    encode_records,
+    decode_records
+)
 
 ENCODING = "utf-8"
 
 
 class RESTCacheStorage(CacheStorage):
+    """A cache backend that delegates to a remote
+    `~cocktail.caching.restcacheserver.CacheController`.
+
+    HTTP connections to the server are kept alive and reused between
+    requests: the storage holds a pool of idle connections, which threads
+    borrow for the duration of each request.
+
+    Values are transmitted using the binary format implemented by
+    `~cocktail.caching.restcacheprotocol`, and can be fetched and stored in
+    batches using `.retrieve_many` and `.store_many`.
+
+    .. attribute:: pool_size
+
+        The maximum number of idle connections kept by the storage.
+
+    .. attribute:: compression_threshold
+
+        Requests and responses with a body larger than this number of bytes
+        are compressed. Set to None to disable compression.
+
+    .. attribute:: timeout
+
+        The timeout for requests to the server, in seconds.
+    """
+
+    pool_size: int = 8
+    compression_threshold: Optional[int] = 4096
+    timeout: Optional[float] = None
 
     def __init__(
             self,
             address: str,
-            serializer: Optional[CacheSerializer] = None):
+            serializer: Optional[CacheSerializer] = None,
+            pool_size: Optional[int] = None,
+            timeout: Optional[float] = None):
+        """Initializes the storage.
 
+        :param address: The URL of the cache server.
+        :param serializer: The serializer used to convert values to bytes.
+            Defaults to a `~cocktail.caching.PickleCacheSerializer`.
+        :param pool_size: Overrides `.pool_size`.
+        :param timeout: Overrides `.timeout`.
+        """
         self.__address = address.rstrip("/")
 
         if serializer is None:
-            serializer = Base64PickleCacheSerializer()
+            serializer = PickleCacheSerializer()
 
         self.__serializer = serializer
 
+        if pool_size is not None:
+            self.pool_size = pool_size
+
+        if timeout is not None:
+            self.timeout = timeout
+
+        self.__pool = []
+        self.__pool_lock = Lock()
+        self.__pool_pid = os.getpid()
+
     @property
     def address(self) -> str:
         return self.__address
@@ -40,20 +97,50 @@ class RESTCacheStorage(CacheStorage):
     def serializer(self) -> CacheSerializer:
         return self.__serializer
 
-    def _key_request(self, key: str, *args, **kwargs) -> str:
+    def _create_connection(self) -> Http:
+        return Http(timeout = self.timeout)
+
+    @contextmanager
+    def _connection(self) -> Http:
+        """Borrows a connection from the pool for the duration of a request.
+
+        Connections are discarded if the request fails, and after forking
+        (sockets can't be shared between processes).
+        """
+        with self.__pool_lock:
+            if self.__pool_pid != os.getpid():
+                self.__pool = []
+                self.__pool_pid = os.getpid()
+            http = self.__pool.pop() if self.__pool else None
+
+        if http is None:
+            http = self._create_connection()
+
+        yield http
+
+        with self.__pool_lock:
+            if (
+                self.__pool_pid == os.getpid()
+                and len(self.__pool) < self.pool_size
+            ):
+                self.__pool.append(http)
 
-        url = (
-            self.__address
-            + "/keys/"
+    def _request(self, path: str, *args, **kwargs) -> Tuple[dict, bytes]:
+        with self._connection() as http:
+            return http.request(self.__address + path, *args, **kwargs)
+
+    def _key_request(self, key: str, *args, **kwargs) -> Any:
+
+        path = (
+            "/keys/"
             + urlsafe_b64encode(key.encode(ENCODING)).decode(ENCODING)
         )
 
         extra_path = kwargs.pop("extra_path", None)
         if extra_path:
-            url += "/" + extra_path
+            path += "/" + extra_path
 
-        http = Http()
-        response, content = http.request(url, *args, **kwargs)
+        response, content = self._request(path, *args, **kwargs)
 
         if (400 <= response.status < 500):
             raise CacheKeyError(key)
@@ -63,6 +150,31 @@ class RESTCacheStorage(CacheStorage):
 
         return content
 
+    def _records_request(self, path: str, records: Iterable) -> list:
+
+        compression = self.compression_threshold is not None
+
+        response, content = self._request(
+            path,
+            "POST",
+            headers = {
+                "Content-Type": MIME_TYPE
+            },
+            body = encode_records(
+                records,
+                compression_threshold = self.compression_threshold,
+                accepts_compression = compression
+            )
+        )
+
+        if response.status != 200:
+            raise IOError(
+                "Cache server request to %s failed with status %d"
+                % (path, response.status)
+            )
+
+        return decode_records(content)[0]
+
     @overrides(CacheStorage.exists)
     def exists(self, key: CacheKey) -> bool:
         try:
@@ -74,19 +186,44 @@ class RESTCacheStorage(CacheStorage):
 
     @overrides(CacheStorage.retrieve)
     def retrieve(self, key: CacheKey) -> Any:
-        value = self._key_request(key, "GET", extra_path = "value")
-        return self.serializer.unserialize(value)
+        return self.retrieve_with_metadata(key)[0]
 
     @overrides(CacheStorage.retrieve_with_metadata)
     def retrieve_with_metadata(
             self,
             key: CacheKey) -> Tuple[Any, int, Set[str]]:
 
-        data = self._key_request(key, "GET")
-        return (
-            self.serializer.unserialize(data["value"].encode(ENCODING)),
-            data["expiration"],
-            data["tags"]
+        for record_key, value, expiration, tags in self._records_request(
+            "/retrieve_many",
+            [(key, None, None, None)]
+        ):
+            if value is not None:
+                return (self.__serializer.unserialize(value), expiration, tags)
+
+        raise CacheKeyError(key)
+
+    @overrides(CacheStorage.retrieve_many)
+    def retrieve_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, Any]:
+        return dict(
+            (key, entry[0])
+            for key, entry in self.retrieve_many_with_metadata(keys).items()
+        )
+
+    @overrides(CacheStorage.retrieve_many_with_metadata)
+    def retrieve_many_with_metadata(
+            self,
+            keys: Iterable[CacheKey]
+    ) -> Dict[CacheKey, Tuple[Any, int, Set[str]]]:
+
+        records = self._records_request(
+            "/retrieve_many",
+            [(key, None, None, None) for key in keys]
+        )
+
+        return dict(
+            (key, (self.__serializer.unserialize(value), expiration, tags))
+            for key, value, expiration, tags in records
+            if value is not None
         )
 
     @overrides(CacheStorage.store)
@@ -97,17 +234,25 @@ class RESTCacheStorage(CacheStorage):
             expiration: Optional[int] = None,
             tags: Optional[Set[str]] = None):
 
-        self._key_request(
-            key,
-            "POST",
-            headers = {
-                "Content-Type": "application/json"
-            },
-            body = dumps({
-                "value": self.__serializer.serialize(value).decode(ENCODING),
-                "expiration": expiration,
-                "tags": None if tags is None else list(tags)
-            })
+        self.store_many({key: value}, expiration = expiration, tags = tags)
+
+    @overrides(CacheStorage.store_many)
+    def store_many(
+            self,
+            values: Mapping[CacheKey, Any],
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+
+        if tags is not None:
+            tags = set(tags)
+
+        serialize = self.__serializer.serialize
+        self._records_request(
+            "/store_many",
+            [
+                (key, serialize(value), expiration, tags)
+                for key, value in values.items()
+            ]
         )
 
     @overrides(CacheStorage.get_expiration)
@@ -117,8 +262,9 @@ class RESTCacheStorage(CacheStorage):
     @overrides(CacheStorage.set_expiration)
     def set_expiration(self, key: CacheKey, expiration: Optional[int]):
         self._key_request(
-            key + "/expiration",
+            key,
             "POST",
+            extra_path = "expiration",
             headers = {
                 "Content-Type": "application/json"
             },
@@ -136,17 +282,70 @@ class RESTCacheStorage(CacheStorage):
 
     @overrides(CacheStorage.clear)
     def clear(self, scope: Scope = whole_cache):
-        url = self.__address + "/clear"
-        http = Http()
-        response, content = http.request(
-            url,
+        self._request(
+            "/clear",
             "POST",
             headers = {
                 "Content-Type": "application/json"
             },
-            body = dumps(
-                None if scope is whole_cache
-                else list(scope)
-            )
+            body = dumps(export_scope(scope))
         )
 
+
+class RESTInvalidationLog(InvalidationLog):
+    """An invalidation log kept by a
+    `~cocktail.caching.restcacheserver.CacheController`.
+
+    The server records every scope cleared through it, so nodes using the
+    same server as their shared storage can use it to propagate
+    invalidations (see `~cocktail.caching.TieredCacheStorage`). Publishing
+    an invalidation only notifies local subscribers: the server will have
+    recorded it when the shared storage was cleared.
+    """
+
+    def __init__(self, storage: RESTCacheStorage):
+        """Initializes the log.
+
+        :param storage: The storage for the server holding the log.
+        """
+        InvalidationLog.__init__(self)
+        self.__storage = storage
+
+    @property
+    def storage(self) -> RESTCacheStorage:
+        return self.__storage
+
+    @overrides(InvalidationLog._append)
+    def _append(self, scope: Scope):
+        pass
+
+    def _request(self, position: Optional[Position] = None) -> dict:
+
+        path = "/invalidations"
+        if position is not None:
+            path += "?" + urlencode({
+                "epoch": position[0],
+                "sequence": position[1]
+            })
+
+        response, content = self.__storage._request(path, "GET")
+
+        if response.status != 200:
+            raise IOError(
+                "Cache server request to %s failed with status %d"
+                % (path, response.status)
+            )
+
+        return loads(content.decode(ENCODING))
+
+    @overrides(InvalidationLog.get_position)
+    def get_position(self) -> Position:
+        return tuple(self._request()["position"])
+
+    @overrides(InvalidationLog.read)
+    def read(self, position: Position) -> Tuple[Position, List[Scope]]:
+        data = self._request(position)
+        return (
+            tuple(data["position"]),
+            [import_scope(scope) for scope in data["scopes"]]
+        )
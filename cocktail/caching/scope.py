@@ -7,7 +7,7 @@
 
 .. moduleauthor:: Martí Congost <marti.congost@whads.com>
 """
-from typing import Iterable, Union
+from typing import Iterable, List, Optional, Union
 
 from cocktail.modeling import (
     OrderedSet,
@@ -55,3 +55,36 @@ def resolve_selector(selector: ScopeSelector) -> Iterable[ScopeSelector]:
             % selector
         )
 
+
+
+def export_scope(scope: Scope) -> Optional[List[Union[str, List[str]]]]:
+    """Converts a scope into a JSON compatible structure.
+
+    `~cocktail.caching.whole_cache` is exported as None, and tag
+    intersections as lists.
+
+    :param scope: The scope to export.
+    :return: The exported scope.
+    """
+    if scope is whole_cache:
+        return None
+
+    return [
+        list(selector) if isinstance(selector, tuple) else selector
+        for selector in resolve_selector(scope)
+    ]
+
+
+def import_scope(data: Optional[List[Union[str, List[str]]]]) -> Scope:
+    """Restores a scope exported by `export_scope`.
+
+    :param data: The exported scope.
+    :return: The normalized scope.
+    """
+    if data is None:
+        return whole_cache
+
+    return set(
+        tuple(selector) if isinstance(selector, list) else selector
+        for selector in data
+    )
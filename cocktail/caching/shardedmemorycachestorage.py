@@ -0,0 +1,221 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Union
+
+from cocktail.modeling import overrides
+from cocktail.memoryutils import parse_bytes
+from cocktail.typemapping import TypeMapping
+from .scope import whole_cache, Scope
+from .cachekey import CacheKey
+from .cachestorage import CacheStorage
+from .evictionpolicies import EvictionPolicy
+from .memorycachestorage import MemoryCacheStorage
+
+
+class ShardedMemoryCacheStorage(CacheStorage):
+    """An in-memory cache backend that splits its entries between several
+    independent `MemoryCacheStorage` shards.
+
+    Each shard has its own lock, tag index and eviction policy, so threads
+    operating on different keys rarely contend with each other. Keys are
+    assigned to shards by their hash.
+
+    The memory limit is divided evenly between shards, and each shard evicts
+    its own entries once it exceeds its share. This makes eviction an
+    approximation of the global policy: with keys spread uniformly across
+    shards, the least recently used entries of each shard are close to the
+    least recently used entries overall.
+
+    .. attribute:: shards
+
+        The list of `MemoryCacheStorage` instances holding the entries.
+    """
+
+    shard_count: int = 16
+
+    def __init__(
+            self,
+            memory_limit: Optional[Union[str, int]] = None,
+            shard_count: Optional[int] = None,
+            eviction_policy_factory: Optional[
+                Callable[[], EvictionPolicy]
+            ] = None,
+            sizers: Optional[TypeMapping] = None):
+        """Initializes the storage.
+
+        :param memory_limit: The maximum memory allowance for the whole
+            storage, divided evenly between shards.
+        :param shard_count: The number of shards to create.
+        :param eviction_policy_factory: A callable that produces the
+            `~cocktail.caching.evictionpolicies.EvictionPolicy` for each
+            shard. Defaults to the default policy of `MemoryCacheStorage`.
+        :param sizers: The mapping of `~cocktail.caching.sizers.Sizer`
+            instances used by shards to measure their entries. Defaults to
+            the `~MemoryCacheStorage.sizers` of `MemoryCacheStorage`.
+        """
+        if shard_count is not None:
+            self.shard_count = shard_count
+
+        self.shards = [
+            MemoryCacheStorage(
+                eviction_policy =
+                    eviction_policy_factory()
+                    if eviction_policy_factory
+                    else None,
+                sizers = sizers
+            )
+            for i in range(self.shard_count)
+        ]
+        self.__memory_limit = None
+        self.memory_limit = memory_limit
+
+    def get_shard(self, key: CacheKey) -> MemoryCacheStorage:
+        """Obtains the shard that holds the given key."""
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _get_memory_limit(self) -> Optional[int]:
+        return self.__memory_limit
+
+    def _set_memory_limit(self, memory_limit: Optional[Union[str, int]]):
+
+        if isinstance(memory_limit, str):
+            memory_limit = parse_bytes(memory_limit)
+
+        self.__memory_limit = memory_limit
+        shard_limit = (
+            max(1, memory_limit // len(self.shards))
+            if memory_limit
+            else memory_limit
+        )
+
+        for shard in self.shards:
+            shard.memory_limit = shard_limit
+
+    memory_limit = property(
+        _get_memory_limit,
+        _set_memory_limit,
+        doc = """
+        Gets or sets the maximum memory allowance for cached content.
+
+        The limit is expressed as a number of bytes, and is divided evenly
+        between shards.
+        """
+    )
+
+    def add_eviction_listener(
+            self,
+            listener: MemoryCacheStorage.EvictionListener):
+        """Registers a callable to invoke whenever any of the shards drops
+        an entry to free memory. See
+        `MemoryCacheStorage.add_eviction_listener`.
+        """
+        for shard in self.shards:
+            shard.add_eviction_listener(listener)
+
+    def remove_eviction_listener(
+            self,
+            listener: MemoryCacheStorage.EvictionListener):
+        """Unregisters a callable added by `.add_eviction_listener`."""
+        for shard in self.shards:
+            shard.remove_eviction_listener(listener)
+
+    def add_store_listener(
+            self,
+            listener: MemoryCacheStorage.StoreListener):
+        """Registers a callable to invoke whenever an entry is written to
+        any of the shards. See `MemoryCacheStorage.add_store_listener`.
+        """
+        for shard in self.shards:
+            shard.add_store_listener(listener)
+
+    def remove_store_listener(
+            self,
+            listener: MemoryCacheStorage.StoreListener):
+        """Unregisters a callable added by `.add_store_listener`."""
+        for shard in self.shards:
+            shard.remove_store_listener(listener)
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(shard.memory_usage for shard in self.shards)
+
+    @property
+    def entry_count(self) -> int:
+        return sum(shard.entry_count for shard in self.shards)
+
+    def get_counters(self) -> Dict[str, int]:
+        """Obtains the hit, miss and eviction counters of all shards
+        combined.
+        """
+        counters = {}
+        for shard in self.shards:
+            for key, value in shard.eviction_policy.get_counters().items():
+                counters[key] = counters.get(key, 0) + value
+        return counters
+
+    @overrides(CacheStorage.exists)
+    def exists(self, key: CacheKey) -> bool:
+        return self.get_shard(key).exists(key)
+
+    @overrides(CacheStorage.retrieve)
+    def retrieve(self, key: CacheKey) -> Any:
+        return self.get_shard(key).retrieve(key)
+
+    @overrides(CacheStorage.retrieve_with_metadata)
+    def retrieve_with_metadata(
+            self,
+            key: CacheKey) -> Tuple[Any, int, Set[str]]:
+        return self.get_shard(key).retrieve_with_metadata(key)
+
+    @overrides(CacheStorage.store)
+    def store(
+            self,
+            key: CacheKey,
+            value: Any,
+            expiration: Optional[int] = None,
+            tags: Optional[Set[str]] = None):
+
+        self.get_shard(key).store(
+            key,
+            value,
+            expiration = expiration,
+            tags = tags
+        )
+
+    @overrides(CacheStorage.get_expiration)
+    def get_expiration(self, key: CacheKey) -> Optional[int]:
+        return self.get_shard(key).get_expiration(key)
+
+    @overrides(CacheStorage.set_expiration)
+    def set_expiration(self, key: CacheKey, expiration: Optional[int]):
+        self.get_shard(key).set_expiration(key, expiration)
+
+    @overrides(CacheStorage.discard)
+    def discard(self, key: CacheKey) -> bool:
+        return self.get_shard(key).discard(key)
+
+    @overrides(CacheStorage.clear)
+    def clear(self, scope: Scope = whole_cache):
+        # Each shard indexes the tags of its own entries, so selectors
+        # (including tag intersections) can be resolved shard by shard
+        for shard in self.shards:
+            shard.clear(scope)
+
+    @overrides(CacheStorage.drop_weight)
+    def drop_weight(self) -> Optional[CacheKey]:
+
+        # Drop weight from the largest shard first
+        shards = sorted(
+            self.shards,
+            key = lambda shard: shard.memory_usage,
+            reverse = True
+        )
+
+        for shard in shards:
+            key = shard.drop_weight()
+            if key is not None:
+                return key
+
+        return None
@@ -0,0 +1,791 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Iterable, Optional, Set, Tuple, Union
+import os
+import mmap
+import fcntl
+from contextlib import contextmanager
+from hashlib import blake2b
+from struct import Struct
+from threading import RLock
+from time import time
+
+from cocktail.modeling import overrides
+from cocktail.memoryutils import parse_bytes
+from .scope import whole_cache, Scope
+from .cachekey import CacheKey
+from .cachestorage import CacheStorage
+from .cacheserializer import CacheSerializer
+from .picklecacheserializer import PickleCacheSerializer
+from .exceptions import CacheKeyError
+
+MAGIC = b"CKTSHMC1"
+
+# magic, bucket count, page size, page count, tag slots, class count,
+# generation, allocated pages, entry count, tombstone count
+header_struct = Struct("<8sIIIIIQIII")
+
+# chunk size, free list head, LRU head (newest), LRU tail (oldest)
+class_struct = Struct("<IQQQ")
+
+# key hash, record offset
+bucket_struct = Struct("<QQ")
+
+# tag version
+version_struct = Struct("<Q")
+
+# LRU prev, LRU next, key hash, generation, expiration, last access,
+# key length, tags length, value length, slab class, in use flag
+record_struct = Struct("<QQQQqdIIIHH")
+
+# tag slot, tag version, tag name length
+tag_struct = Struct("<IQH")
+
+EMPTY = 0
+TOMBSTONE = 1
+NO_EXPIRATION = -1
+ENCODING = "utf-8"
+
+
+class SharedMemoryCacheStorage(CacheStorage):
+    """A cache backend that keeps its entries in a memory mapped file, shared
+    by all the processes on the host that open the same file.
+
+    The file holds:
+
+    - A hash index, using open addressing, mapping key hashes to records.
+    - A slab allocator: memory is split in pages, and each page is split in
+      fixed size chunks of one of several size classes. Each record is
+      stored in the smallest chunk that can hold it. When a class runs out of
+      chunks and there are no free pages left, the least recently used
+      record of the class is evicted.
+    - A table of tag versions. Each record stores the version of its tags at
+      the time it was stored; invalidating a tag increments its version,
+      which turns all the records tagged with it stale for every process at
+      once. Selectors that combine several tags are resolved by scanning the
+      records.
+
+    Values are serialized using a `~cocktail.caching.CacheSerializer`.
+    Values too large to fit in a page are not stored.
+
+    Concurrent access is synchronized with an exclusive lock on the file
+    (plus a regular lock for threads in the same process), so the storage is
+    safe to use from multiple processes and threads. Storages opened before
+    forking a process reopen the file on the child process automatically.
+    The storage requires a POSIX system; by default, the file is created
+    under ``/dev/shm``, so that it never touches the disk.
+    """
+
+    default_path: str = "/dev/shm/cocktail-cache"
+    size_factor: float = 1.25
+    min_chunk_size: int = 128
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            size: Union[int, str] = "64M",
+            page_size: Union[int, str] = "1M",
+            bucket_count: Optional[int] = None,
+            tag_slots: int = 65536,
+            serializer: Optional[CacheSerializer] = None):
+        """Opens the storage, creating its file if it doesn't exist yet.
+
+        :param path: The path of the file that backs the storage. Processes
+            opening the same file share the same entries.
+        :param size: The memory available to store records.
+        :param page_size: The size of each slab page. It determines the
+            maximum size of a record.
+        :param bucket_count: The number of slots of the hash index. Defaults
+            to one slot for every 512 bytes of memory.
+        :param tag_slots: The number of slots in the table of tag versions.
+            Tags that share a slot are invalidated together.
+        :param serializer: The serializer used to store values. Defaults to
+            a `~cocktail.caching.PickleCacheSerializer`.
+        """
+        if isinstance(size, str):
+            size = int(parse_bytes(size))
+
+        if isinstance(page_size, str):
+            page_size = int(parse_bytes(page_size))
+
+        self.__path = path or self.default_path
+        self.__page_size = page_size
+        self.__page_count = max(1, size // page_size)
+        self.__bucket_count = bucket_count or max(64, size // 512)
+        self.__tag_slots = tag_slots
+        self.__chunk_sizes = self._get_chunk_sizes()
+        self.__serializer = serializer or PickleCacheSerializer()
+        self.__lock = RLock()
+        self.__pid = None
+        self.__open()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def serializer(self) -> CacheSerializer:
+        return self.__serializer
+
+    def _get_chunk_sizes(self):
+        sizes = []
+        size = self.min_chunk_size
+        while size < self.__page_size:
+            sizes.append(size)
+            size = max(size + 8, int(size * self.size_factor) // 8 * 8)
+        sizes.append(self.__page_size)
+        return sizes
+
+    # Layout
+    #--------------------------------------------------------------------------
+    def __compute_layout(self):
+        self.__classes_start = header_struct.size
+        self.__tags_start = (
+            self.__classes_start
+            + class_struct.size * len(self.__chunk_sizes)
+        )
+        self.__buckets_start = (
+            self.__tags_start
+            + version_struct.size * self.__tag_slots
+        )
+        self.__pages_start = (
+            self.__buckets_start
+            + bucket_struct.size * self.__bucket_count
+        )
+        self.__pages_start += -self.__pages_start % 8
+        self.__file_size = (
+            self.__pages_start
+            + self.__page_size * self.__page_count
+        )
+
+    def __open(self):
+
+        self.__compute_layout()
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                current_size = os.fstat(fd).st_size
+                initialized = False
+
+                if current_size:
+                    header = os.pread(fd, header_struct.size, 0)
+                    if len(header) == header_struct.size:
+                        (
+                            magic,
+                            bucket_count,
+                            page_size,
+                            page_count,
+                            tag_slots,
+                            class_count
+                        ) = header_struct.unpack(header)[:6]
+                        initialized = magic == MAGIC
+                        if initialized and (
+                            bucket_count != self.__bucket_count
+                            or page_size != self.__page_size
+                            or page_count != self.__page_count
+                            or tag_slots != self.__tag_slots
+                            or class_count != len(self.__chunk_sizes)
+                        ):
+                            raise ValueError(
+                                "%s was created with a different layout"
+                                % self.__path
+                            )
+
+                if current_size < self.__file_size:
+                    os.ftruncate(fd, self.__file_size)
+
+                self.__map = mmap.mmap(fd, self.__file_size)
+
+                if not initialized:
+                    self.__initialize()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        except:
+            os.close(fd)
+            raise
+
+        self.__fd = fd
+        self.__pid = os.getpid()
+
+    def close(self):
+        """Releases the file and the memory map used by the storage."""
+        with self.__lock:
+            if self.__pid is not None:
+                self.__map.close()
+                os.close(self.__fd)
+                self.__pid = None
+
+    def __initialize(self):
+
+        m = self.__map
+        m[self.__classes_start:self.__pages_start] = \
+            bytes(self.__pages_start - self.__classes_start)
+
+        for i, chunk_size in enumerate(self.__chunk_sizes):
+            class_struct.pack_into(
+                m,
+                self.__classes_start + i * class_struct.size,
+                chunk_size, 0, 0, 0
+            )
+
+        header_struct.pack_into(
+            m,
+            0,
+            MAGIC,
+            self.__bucket_count,
+            self.__page_size,
+            self.__page_count,
+            self.__tag_slots,
+            len(self.__chunk_sizes),
+            0, 0, 0, 0
+        )
+
+    @contextmanager
+    def _locked(self):
+        with self.__lock:
+
+            # File locks are shared with forked processes; reopen the file
+            if self.__pid != os.getpid():
+                self.__open()
+
+            fcntl.flock(self.__fd, fcntl.LOCK_EX)
+            try:
+                yield None
+            finally:
+                fcntl.flock(self.__fd, fcntl.LOCK_UN)
+
+    # Header fields
+    #--------------------------------------------------------------------------
+    def __read_header(self):
+        return list(header_struct.unpack_from(self.__map, 0))
+
+    def __write_header(self, header):
+        header_struct.pack_into(self.__map, 0, *header)
+
+    def __class_offset(self, class_index):
+        return self.__classes_start + class_index * class_struct.size
+
+    def __read_class(self, class_index):
+        return list(
+            class_struct.unpack_from(
+                self.__map,
+                self.__class_offset(class_index)
+            )
+        )
+
+    def __write_class(self, class_index, values):
+        class_struct.pack_into(
+            self.__map,
+            self.__class_offset(class_index),
+            *values
+        )
+
+    def __get_tag_version(self, slot):
+        return version_struct.unpack_from(
+            self.__map,
+            self.__tags_start + slot * version_struct.size
+        )[0]
+
+    def __increment_tag_version(self, slot):
+        offset = self.__tags_start + slot * version_struct.size
+        version = version_struct.unpack_from(self.__map, offset)[0]
+        version_struct.pack_into(self.__map, offset, version + 1)
+
+    # Hashing
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _hash(data: bytes) -> int:
+        # Python's hash() is randomized per process; use a stable hash
+        return int.from_bytes(blake2b(data, digest_size = 8).digest(), "little")
+
+    def __tag_slot(self, tag: str) -> int:
+        return self._hash(tag.encode(ENCODING)) % self.__tag_slots
+
+    # Records
+    #--------------------------------------------------------------------------
+    def __read_record(self, offset):
+        return list(record_struct.unpack_from(self.__map, offset))
+
+    def __write_record(self, offset, record):
+        record_struct.pack_into(self.__map, offset, *record)
+
+    def __read_key(self, offset, record):
+        start = offset + record_struct.size
+        return self.__map[start:start + record[6]]
+
+    def __read_tags(self, offset, record):
+        m = self.__map
+        position = offset + record_struct.size + record[6]
+        end = position + record[7]
+        tags = []
+        while position < end:
+            slot, version, name_length = tag_struct.unpack_from(m, position)
+            position += tag_struct.size
+            name = m[position:position + name_length].decode(ENCODING)
+            position += name_length
+            tags.append((slot, version, name))
+        return tags
+
+    def __read_value(self, offset, record):
+        start = offset + record_struct.size + record[6] + record[7]
+        return self.__map[start:start + record[8]]
+
+    def __is_current(self, offset, record, generation, now):
+
+        if record[4] != NO_EXPIRATION and record[4] <= now:
+            return False
+
+        if record[3] != generation:
+            return False
+
+        for slot, version, name in self.__read_tags(offset, record):
+            if self.__get_tag_version(slot) != version:
+                return False
+
+        return True
+
+    # Hash index
+    #--------------------------------------------------------------------------
+    def __bucket_offset(self, index):
+        return self.__buckets_start + index * bucket_struct.size
+
+    def __find(self, key_bytes, key_hash):
+        """Finds the bucket and record offset for a key.
+
+        :return: A (bucket index, record offset) tuple, with a record offset
+            of None if the key is not in the index. In that case, the bucket
+            index points to the first slot where the key could be inserted,
+            or is None if the index is full.
+        """
+        m = self.__map
+        bucket_count = self.__bucket_count
+        index = key_hash % bucket_count
+        insert_index = None
+
+        for i in range(bucket_count):
+            bucket_hash, offset = bucket_struct.unpack_from(
+                m,
+                self.__bucket_offset(index)
+            )
+            if offset == EMPTY:
+                return (index if insert_index is None else insert_index), None
+            elif offset == TOMBSTONE:
+                if insert_index is None:
+                    insert_index = index
+            elif bucket_hash == key_hash:
+                record = self.__read_record(offset)
+                if self.__read_key(offset, record) == key_bytes:
+                    return index, offset
+            index = (index + 1) % bucket_count
+
+        return insert_index, None
+
+    def __iter_records(self):
+        m = self.__map
+        for index in range(self.__bucket_count):
+            bucket_hash, offset = bucket_struct.unpack_from(
+                m,
+                self.__bucket_offset(index)
+            )
+            if offset > TOMBSTONE:
+                yield index, offset
+
+    def __rebuild_index(self):
+        live = [
+            (bucket_struct.unpack_from(
+                self.__map,
+                self.__bucket_offset(index)
+            )[0], offset)
+            for index, offset in self.__iter_records()
+        ]
+        self.__map[self.__buckets_start:self.__pages_start] = \
+            bytes(self.__pages_start - self.__buckets_start)
+
+        for key_hash, offset in live:
+            index = key_hash % self.__bucket_count
+            while bucket_struct.unpack_from(
+                self.__map,
+                self.__bucket_offset(index)
+            )[1] != EMPTY:
+                index = (index + 1) % self.__bucket_count
+            bucket_struct.pack_into(
+                self.__map,
+                self.__bucket_offset(index),
+                key_hash,
+                offset
+            )
+
+        header = self.__read_header()
+        header[9] = 0
+        self.__write_header(header)
+
+    # Slab allocation
+    #--------------------------------------------------------------------------
+    def __get_class_index(self, size):
+        for i, chunk_size in enumerate(self.__chunk_sizes):
+            if chunk_size >= size:
+                return i
+        return None
+
+    def __allocate(self, class_index):
+
+        slab_class = self.__read_class(class_index)
+
+        # Reuse a free chunk
+        if not slab_class[1]:
+
+            # Carve a new page
+            header = self.__read_header()
+            if header[7] < self.__page_count:
+                page_start = self.__pages_start + header[7] * self.__page_size
+                header[7] += 1
+                self.__write_header(header)
+                chunk_size = slab_class[0]
+                free_head = slab_class[1]
+                for i in reversed(range(self.__page_size // chunk_size)):
+                    chunk = page_start + i * chunk_size
+                    record_struct.pack_into(
+                        self.__map, chunk,
+                        free_head, 0, 0, 0, 0, 0.0, 0, 0, 0, class_index, 0
+                    )
+                    free_head = chunk
+                slab_class[1] = free_head
+                self.__write_class(class_index, slab_class)
+
+            # Evict the least recently used record of the class
+            elif slab_class[3]:
+                self.__remove_record(slab_class[3])
+                slab_class = self.__read_class(class_index)
+            else:
+                return None
+
+        chunk = slab_class[1]
+        slab_class[1] = self.__read_record(chunk)[0]
+        self.__write_class(class_index, slab_class)
+        return chunk
+
+    def __link(self, offset, record):
+        # Insert the record at the head of its class' LRU list
+        class_index = record[9]
+        slab_class = self.__read_class(class_index)
+        record[0] = 0
+        record[1] = slab_class[2]
+        self.__write_record(offset, record)
+
+        if slab_class[2]:
+            head = self.__read_record(slab_class[2])
+            head[0] = offset
+            self.__write_record(slab_class[2], head)
+        else:
+            slab_class[3] = offset
+
+        slab_class[2] = offset
+        self.__write_class(class_index, slab_class)
+
+    def __unlink(self, offset, record):
+        class_index = record[9]
+        slab_class = self.__read_class(class_index)
+        prev_offset, next_offset = record[0], record[1]
+
+        if prev_offset:
+            prev_record = self.__read_record(prev_offset)
+            prev_record[1] = next_offset
+            self.__write_record(prev_offset, prev_record)
+        else:
+            slab_class[2] = next_offset
+
+        if next_offset:
+            next_record = self.__read_record(next_offset)
+            next_record[0] = prev_offset
+            self.__write_record(next_offset, next_record)
+        else:
+            slab_class[3] = prev_offset
+
+        self.__write_class(class_index, slab_class)
+        record[0] = record[1] = 0
+
+    def __touch(self, offset, record):
+        record[5] = time()
+        self.__unlink(offset, record)
+        self.__link(offset, record)
+
+    def __remove_record(self, offset, bucket_index = None):
+
+        record = self.__read_record(offset)
+        self.__unlink(offset, record)
+
+        if bucket_index is None:
+            bucket_index = self.__find(
+                bytes(self.__read_key(offset, record)),
+                record[2]
+            )[0]
+
+        bucket_struct.pack_into(
+            self.__map,
+            self.__bucket_offset(bucket_index),
+            record[2],
+            TOMBSTONE
+        )
+
+        # Return the chunk to the free list of its class
+        class_index = record[9]
+        slab_class = self.__read_class(class_index)
+        record_struct.pack_into(
+            self.__map, offset,
+            slab_class[1], 0, 0, 0, 0, 0.0, 0, 0, 0, class_index, 0
+        )
+        slab_class[1] = offset
+        self.__write_class(class_index, slab_class)
+
+        header = self.__read_header()
+        header[8] -= 1
+        header[9] += 1
+        self.__write_header(header)
+
+    def __require_record(self, key: CacheKey):
+        key_bytes = key.encode(ENCODING)
+        bucket_index, offset = self.__find(key_bytes, self._hash(key_bytes))
+
+        if offset is None:
+            raise CacheKeyError(key)
+
+        record = self.__read_record(offset)
+        generation = self.__read_header()[6]
+
+        if not self.__is_current(offset, record, generation, time()):
+            self.__remove_record(offset, bucket_index)
+            raise CacheKeyError(key)
+
+        return offset, record
+
+    # CacheStorage interface
+    #--------------------------------------------------------------------------
+    @property
+    def entry_count(self) -> int:
+        """The number of records in the storage, including expired and
+        invalidated records that haven't been removed yet.
+        """
+        with self._locked():
+            return self.__read_header()[8]
+
+    @overrides(CacheStorage.exists)
+    def exists(self, key: CacheKey) -> bool:
+        with self._locked():
+            try:
+                self.__require_record(key)
+            except CacheKeyError:
+                return False
+            else:
+                return True
+
+    @overrides(CacheStorage.retrieve)
+    def retrieve(self, key: CacheKey) -> Any:
+        with self._locked():
+            offset, record = self.__require_record(key)
+            self.__touch(offset, record)
+            data = self.__read_value(offset, record)
+        return self.__serializer.unserialize(data)
+
+    @overrides(CacheStorage.retrieve_with_metadata)
+    def retrieve_with_metadata(
+            self,
+            key: CacheKey) -> Tuple[Any, int, Set[str]]:
+
+        with self._locked():
+            offset, record = self.__require_record(key)
+            self.__touch(offset, record)
+            data = self.__read_value(offset, record)
+            tags = [name for slot, version, name
+                    in self.__read_tags(offset, record)]
+
+        return (
+            self.__serializer.unserialize(data),
+            None if record[4] == NO_EXPIRATION else record[4],
+            set(tags) if tags else None
+        )
+
+    @overrides(CacheStorage.store)
+    def store(
+            self,
+            key: CacheKey,
+            value: Any,
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+
+        key_bytes = key.encode(ENCODING)
+        key_hash = self._hash(key_bytes)
+        data = self.__serializer.serialize(value)
+        tag_names = sorted(set(tags)) if tags else ()
+        tag_slots = [self.__tag_slot(tag) for tag in tag_names]
+        encoded_tags = [tag.encode(ENCODING) for tag in tag_names]
+
+        with self._locked():
+
+            bucket_index, offset = self.__find(key_bytes, key_hash)
+            if offset is not None:
+                self.__remove_record(offset, bucket_index)
+
+            tags_blob = b"".join(
+                tag_struct.pack(slot, self.__get_tag_version(slot), len(name))
+                + name
+                for slot, name in zip(tag_slots, encoded_tags)
+            )
+            size = (
+                record_struct.size
+                + len(key_bytes)
+                + len(tags_blob)
+                + len(data)
+            )
+            class_index = self.__get_class_index(size)
+
+            # Too large to be stored
+            if class_index is None:
+                return
+
+            header = self.__read_header()
+
+            # Keep the hash index sparse
+            if (header[8] + header[9] + 1) * 4 > self.__bucket_count * 3:
+                self.__rebuild_index()
+                header = self.__read_header()
+
+            if (header[8] + 1) * 4 > self.__bucket_count * 3:
+                self.__drop_weight()
+
+            offset = self.__allocate(class_index)
+            if offset is None:
+                return
+
+            bucket_index = self.__find(key_bytes, key_hash)[0]
+            header = self.__read_header()
+
+            record = [
+                0,
+                0,
+                key_hash,
+                header[6],
+                NO_EXPIRATION if expiration is None else expiration,
+                time(),
+                len(key_bytes),
+                len(tags_blob),
+                len(data),
+                class_index,
+                1
+            ]
+            self.__write_record(offset, record)
+            start = offset + record_struct.size
+            body = key_bytes + tags_blob + data
+            self.__map[start:start + len(body)] = body
+            self.__link(offset, record)
+
+            bucket_struct.pack_into(
+                self.__map,
+                self.__bucket_offset(bucket_index),
+                key_hash,
+                offset
+            )
+
+            header[8] += 1
+            self.__write_header(header)
+
+    @overrides(CacheStorage.get_expiration)
+    def get_expiration(self, key: CacheKey) -> Optional[int]:
+        with self._locked():
+            offset, record = self.__require_record(key)
+            return None if record[4] == NO_EXPIRATION else record[4]
+
+    @overrides(CacheStorage.set_expiration)
+    def set_expiration(self, key: CacheKey, expiration: Optional[int]):
+        with self._locked():
+            offset, record = self.__require_record(key)
+            record[4] = NO_EXPIRATION if expiration is None else expiration
+            self.__touch(offset, record)
+
+    @overrides(CacheStorage.discard)
+    def discard(self, key: CacheKey) -> bool:
+        with self._locked():
+            try:
+                offset, record = self.__require_record(key)
+            except CacheKeyError:
+                return False
+            self.__remove_record(offset)
+            return True
+
+    @overrides(CacheStorage.clear)
+    def clear(self, scope: Scope = whole_cache):
+
+        with self._locked():
+
+            # Clear the whole cache
+            if scope is whole_cache:
+                generation = self.__read_header()[6]
+                self.__initialize()
+                header = self.__read_header()
+                header[6] = generation + 1
+                self.__write_header(header)
+                return
+
+            intersections = []
+
+            for selector in scope:
+
+                # Strings select a single tag: invalidate it for all processes
+                if isinstance(selector, str):
+                    self.__increment_tag_version(self.__tag_slot(selector))
+
+                # Tuples of strings select the intersection of multiple tags
+                elif isinstance(selector, tuple):
+                    intersections.append(set(selector))
+
+                else:
+                    raise TypeError(
+                        "Scope selectors should be strings or tuples of "
+                        "strings; got %r instead" % selector
+                    )
+
+            if intersections:
+                for bucket_index, offset in list(self.__iter_records()):
+                    record = self.__read_record(offset)
+                    tags = set(
+                        name
+                        for slot, version, name
+                        in self.__read_tags(offset, record)
+                    )
+                    if any(
+                        intersection.issubset(tags)
+                        for intersection in intersections
+                    ):
+                        self.__remove_record(offset, bucket_index)
+
+    @overrides(CacheStorage.drop_weight)
+    def drop_weight(self) -> Optional[CacheKey]:
+        with self._locked():
+            return self.__drop_weight()
+
+    def __drop_weight(self):
+
+        # Evict the least recently used record among the oldest record of
+        # each slab class
+        victim = None
+        victim_access = None
+
+        for class_index in range(len(self.__chunk_sizes)):
+            tail = self.__read_class(class_index)[3]
+            if tail:
+                last_access = self.__read_record(tail)[5]
+                if victim is None or last_access < victim_access:
+                    victim = tail
+                    victim_access = last_access
+
+        if victim is None:
+            return None
+
+        key = bytes(
+            self.__read_key(victim, self.__read_record(victim))
+        ).decode(ENCODING)
+        self.__remove_record(victim)
+        return key
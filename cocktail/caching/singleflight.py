@@ -0,0 +1,244 @@
+"""Coordination primitives to compute each missing cache entry only once.
+
+When a popular entry is missing or expires, every concurrent request for it
+would compute the same value. `~cocktail.caching.Cache.retrieve_or_produce`
+uses flight locks to let a single thread (or process) produce the value,
+while the rest wait for it to be stored, or keep serving the previous value
+if it is still within its grace period (see `GracedValue`).
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Optional
+from threading import Lock, local
+from hashlib import sha1
+from time import time, sleep
+import os
+import fcntl
+
+from .cachekey import CacheKey
+
+
+class GracedValue:
+    """A wrapper for cached values stored with a grace period.
+
+    The storage keeps the entry until its freshness expires plus the grace
+    period; `~cocktail.caching.Cache` unwraps the value, and considers it stale
+    once `.fresh_until` is past.
+    """
+
+    __slots__ = ("value", "fresh_until")
+
+    def __init__(self, value: Any, fresh_until: int):
+        self.value = value
+        self.fresh_until = fresh_until
+
+    def __getstate__(self):
+        return (self.value, self.fresh_until)
+
+    def __setstate__(self, state):
+        self.value, self.fresh_until = state
+
+    @property
+    def stale(self) -> bool:
+        return time() >= self.fresh_until
+
+
+class FlightLocks:
+    """A set of locks, one per cache key, used to elect the thread or process
+    that will produce a missing entry.
+    """
+
+    def acquire(
+            self,
+            key: CacheKey,
+            blocking: bool = True,
+            timeout: Optional[float] = None) -> bool:
+        """Acquires the lock for the given key.
+
+        :param key: The key to lock.
+        :param blocking: If set to False, return immediately if the lock is
+            held by someone else.
+        :param timeout: The maximum number of seconds to wait for the lock.
+            None waits forever.
+        :return: True if the lock was acquired, False otherwise.
+        """
+        raise TypeError(
+            "%s doesn't implement the acquire() method" % self
+        )
+
+    def release(self, key: CacheKey):
+        """Releases a lock acquired with `.acquire`.
+
+        :param key: The key to unlock.
+        """
+        raise TypeError(
+            "%s doesn't implement the release() method" % self
+        )
+
+
+class ThreadFlightLocks(FlightLocks):
+    """Flight locks shared by the threads of a single process."""
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__slots = {}
+
+    def acquire(
+            self,
+            key: CacheKey,
+            blocking: bool = True,
+            timeout: Optional[float] = None) -> bool:
+
+        with self.__lock:
+            slot = self.__slots.get(key)
+            if slot is None:
+                slot = self.__slots[key] = [Lock(), 0]
+            slot[1] += 1
+
+        if not blocking:
+            acquired = slot[0].acquire(False)
+        else:
+            acquired = slot[0].acquire(True, -1 if timeout is None else timeout)
+
+        if not acquired:
+            self.__leave(key, slot)
+
+        return acquired
+
+    def release(self, key: CacheKey):
+        with self.__lock:
+            slot = self.__slots[key]
+        slot[0].release()
+        self.__leave(key, slot)
+
+    def __leave(self, key: CacheKey, slot: list):
+        with self.__lock:
+            slot[1] -= 1
+            if not slot[1]:
+                del self.__slots[key]
+
+
+class FileFlightLocks(FlightLocks):
+    """Flight locks shared by all the processes on a host.
+
+    Keys are hashed into a fixed number of lock files in the given directory,
+    locked with ``flock``. Threads within a process coordinate through a
+    `ThreadFlightLocks` before contending for the file lock.
+
+    Each lock file is locked once per process, and shared by all the keys
+    that hash into it: producing an entry while holding the lock for another
+    key in the same file (ie. a nested cached fragment) doesn't wait for the
+    process itself. A thread that already holds a lock file doesn't wait for
+    other processes to release a different one either; if the lock is taken
+    it fails right away, so that processes holding crossed lock files can't
+    deadlock each other.
+
+    .. attribute:: poll_interval
+
+        The number of seconds to sleep between attempts to acquire a file
+        lock held by another process.
+    """
+
+    slot_count: int = 1024
+    poll_interval: float = 0.01
+
+    def __init__(self, directory: str, slot_count: Optional[int] = None):
+        """Initializes the locks.
+
+        :param directory: The directory for lock files. Created if it doesn't
+            exist.
+        :param slot_count: The number of lock files to spread keys over.
+        """
+        if slot_count is not None:
+            self.slot_count = slot_count
+
+        os.makedirs(directory, exist_ok = True)
+        self.__directory = directory
+        self.__thread_locks = ThreadFlightLocks()
+        self.__thread_data = local()
+        self.__lock = Lock()
+        self.__files = {}
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    def get_lock_path(self, key: CacheKey) -> str:
+        """Determines the lock file used by the given key."""
+        digest = sha1(key.encode("utf-8")).digest()
+        slot = int.from_bytes(digest[:8], "little") % self.slot_count
+        return os.path.join(self.__directory, "%d.lock" % slot)
+
+    def acquire(
+            self,
+            key: CacheKey,
+            blocking: bool = True,
+            timeout: Optional[float] = None) -> bool:
+
+        start = time()
+
+        if not self.__thread_locks.acquire(key, blocking, timeout):
+            return False
+
+        path = self.get_lock_path(key)
+        held = getattr(self.__thread_data, "held", 0)
+
+        # Don't wait for other processes while holding a lock file, to avoid
+        # lock order deadlocks
+        if held:
+            blocking = False
+
+        try:
+            while not self.__acquire_file(path):
+                if not blocking or (
+                    timeout is not None
+                    and time() - start >= timeout
+                ):
+                    self.__thread_locks.release(key)
+                    return False
+                sleep(self.poll_interval)
+        except:
+            self.__thread_locks.release(key)
+            raise
+
+        self.__thread_data.held = held + 1
+        return True
+
+    def __acquire_file(self, path: str) -> bool:
+
+        with self.__lock:
+
+            # The process already holds the lock file
+            file_slot = self.__files.get(path)
+            if file_slot is not None:
+                file_slot[1] += 1
+                return True
+
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            except:
+                os.close(fd)
+                raise
+
+            self.__files[path] = [fd, 1]
+            return True
+
+    def release(self, key: CacheKey):
+        path = self.get_lock_path(key)
+        try:
+            with self.__lock:
+                file_slot = self.__files[path]
+                file_slot[1] -= 1
+                if not file_slot[1]:
+                    del self.__files[path]
+                    try:
+                        fcntl.flock(file_slot[0], fcntl.LOCK_UN)
+                    finally:
+                        os.close(file_slot[0])
+        finally:
+            self.__thread_data.held -= 1
+            self.__thread_locks.release(key)
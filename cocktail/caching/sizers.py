@@ -0,0 +1,302 @@
+"""Strategies to measure the memory used by cached values.
+
+`~cocktail.caching.MemoryCacheStorage` enforces its memory limit by adding
+up the size of its entries. Sizers trade accuracy for speed in different
+ways: `ShallowSizer` only measures the outermost object, `DeepSizer`
+measures the whole graph of objects referenced by the value,
+`SampledSizer` extrapolates the size of large containers from a sample of
+their items, and `SerializedSizer` measures the serialized form of the
+value.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Callable, Iterable, Optional, Tuple
+from sys import getsizeof
+from collections import deque
+from decimal import Decimal
+from enum import Enum
+from itertools import chain
+from random import Random
+from types import (
+    BuiltinFunctionType,
+    FunctionType,
+    MethodType,
+    ModuleType
+)
+
+from cocktail.modeling import overrides
+from cocktail.typemapping import TypeMapping
+from .cacheserializer import CacheSerializer
+from .picklecacheserializer import PickleCacheSerializer
+
+ReferentsFunction = Callable[[Any], Iterable[Any]]
+
+#: Marks types in `DeepSizer.referents` whose instances are shared by the
+#: whole process (classes, modules, functions...), and therefore shouldn't
+#: be accounted to any cached value.
+SHARED = object()
+
+
+class Sizer:
+    """Measures the memory used by cached values."""
+
+    def get_size(self, value: Any) -> int:
+        """Measures the memory used by the given value.
+
+        :param value: The value to measure.
+        :return: The estimated size of the value, in bytes.
+        """
+        raise TypeError("%s doesn't implement the get_size() method" % self)
+
+
+class ShallowSizer(Sizer):
+    """A sizer that only measures the outermost object of each value, using
+    `sys.getsizeof`.
+
+    This is very fast, but underestimates the size of containers and
+    objects, since their items and attributes aren't taken into account.
+    """
+
+    @overrides(Sizer.get_size)
+    def get_size(self, value: Any) -> int:
+        return getsizeof(value)
+
+
+def _object_referents(obj: Any) -> Iterable[Any]:
+
+    try:
+        yield obj.__dict__
+    except AttributeError:
+        pass
+
+    for cls in obj.__class__.__mro__:
+        slots = cls.__dict__.get("__slots__")
+        if slots:
+            if isinstance(slots, str):
+                slots = (slots,)
+            for slot in slots:
+                if slot != "__dict__" and slot != "__weakref__":
+                    try:
+                        yield getattr(obj, slot)
+                    except AttributeError:
+                        pass
+
+
+def _mapping_referents(mapping: dict) -> Iterable[Any]:
+    return chain.from_iterable(mapping.items())
+
+
+class DeepSizer(Sizer):
+    """A sizer that measures the full graph of objects referenced by each
+    value.
+
+    The graph is traversed iteratively, so deeply nested values don't hit
+    the recursion limit. Each object is measured once, so cycles are
+    supported and objects referenced from several places in the value are
+    only counted once.
+
+    .. attribute:: referents
+
+        A `~cocktail.typemapping.TypeMapping` that indicates how to find the
+        objects referenced by instances of each type. Values can be a
+        function that takes an instance and returns an iterable of its
+        referents, None for types whose instances have no referents worth
+        measuring (strings, numbers...) or `SHARED` for types whose
+        instances are not counted at all. Types not covered by the mapping
+        are traversed through their ``__dict__`` and ``__slots__``.
+
+        Sizers share the mapping of their class by default; assign a new
+        mapping (f. ex. ``DeepSizer.referents.copy()``) to customize a single
+        sizer.
+    """
+
+    referents: TypeMapping = TypeMapping((
+        (object, _object_referents),
+        (str, None),
+        (bytes, None),
+        (bytearray, None),
+        (int, None),
+        (float, None),
+        (complex, None),
+        (Decimal, None),
+        (range, None),
+        (type(None), None),
+        (tuple, iter),
+        (list, iter),
+        (set, iter),
+        (frozenset, iter),
+        (deque, iter),
+        (dict, _mapping_referents),
+        (type, SHARED),
+        (ModuleType, SHARED),
+        (FunctionType, SHARED),
+        (BuiltinFunctionType, SHARED),
+        (MethodType, SHARED),
+        (Enum, SHARED)
+    ))
+
+    def __init__(self, referents: Optional[TypeMapping] = None):
+        """Initializes the sizer.
+
+        :param referents: Overrides the `.referents` mapping for this sizer.
+        """
+        if referents is not None:
+            self.referents = referents
+
+    @overrides(Sizer.get_size)
+    def get_size(self, value: Any) -> int:
+
+        referents = self.referents
+        functions = {}
+        seen = set()
+        stack = [(value, 1.0)]
+        size = 0.0
+
+        while stack:
+            obj, weight = stack.pop()
+
+            obj_id = id(obj)
+            if obj_id in seen:
+                continue
+            seen.add(obj_id)
+
+            cls = obj.__class__
+            try:
+                function = functions[cls]
+            except KeyError:
+                function = functions[cls] = referents.get(cls)
+
+            if function is SHARED:
+                continue
+
+            size += getsizeof(obj) * weight
+
+            if function is not None:
+                children, factor = self._get_referents(obj, function)
+                child_weight = weight * factor
+                for child in children:
+                    stack.append((child, child_weight))
+
+        return int(round(size))
+
+    def _get_referents(
+            self,
+            obj: Any,
+            function: ReferentsFunction) -> Tuple[Iterable[Any], float]:
+        """Obtains the objects referenced by the given object that should be
+        measured.
+
+        :param obj: The object to expand.
+        :param function: The function from `.referents` for the object's
+            type.
+        :return: A tuple containing the referents to measure, and the factor
+            to apply to their size.
+        """
+        return function(obj), 1.0
+
+
+class SampledSizer(DeepSizer):
+    """A sizer that measures values like `DeepSizer`, but extrapolates the
+    size of large containers from a random sample of their items.
+
+    Containers with more than `.sample_threshold` items only have
+    `.sample_size` of their items measured, and the result is scaled by the
+    container's length. This keeps the cost of measuring large collections
+    (such as the chunks of a rendered document) bounded, at the expense of
+    some accuracy when their items vary widely in size.
+
+    Each container is sampled using a new generator seeded with its length,
+    so measuring the same value yields the same result, regardless of the
+    values measured before it or the threads sharing the sizer.
+    """
+
+    sample_threshold: int = 64
+    sample_size: int = 16
+    sampled_types: Tuple[type, ...] = (
+        tuple,
+        list,
+        set,
+        frozenset,
+        deque,
+        dict
+    )
+
+    def __init__(
+            self,
+            referents: Optional[TypeMapping] = None,
+            sample_threshold: Optional[int] = None,
+            sample_size: Optional[int] = None):
+        """Initializes the sizer.
+
+        :param referents: Overrides the `.referents` mapping for this sizer.
+        :param sample_threshold: The number of items above which containers
+            are sampled.
+        :param sample_size: The number of items to measure from sampled
+            containers.
+        """
+        DeepSizer.__init__(self, referents)
+
+        if sample_threshold is not None:
+            self.sample_threshold = sample_threshold
+
+        if sample_size is not None:
+            self.sample_size = sample_size
+
+    @overrides(DeepSizer._get_referents)
+    def _get_referents(
+            self,
+            obj: Any,
+            function: ReferentsFunction) -> Tuple[Iterable[Any], float]:
+
+        if (
+            isinstance(obj, self.sampled_types)
+            and len(obj) > self.sample_threshold
+        ):
+            children = list(function(obj))
+            count = len(children)
+            if count > self.sample_size:
+                return (
+                    Random(count).sample(children, self.sample_size),
+                    count / self.sample_size
+                )
+            return children, 1.0
+
+        return function(obj), 1.0
+
+
+class SerializedSizer(Sizer):
+    """A sizer that measures the length of each value once serialized.
+
+    This is a good approximation for values that will be stored in
+    serialized form anyway (f. ex. to mirror the accounting of a shared
+    storage), and for values made up mostly of strings. Values that can't be
+    serialized are measured by the `.fallback` sizer.
+
+    .. attribute:: serializer
+
+        The `~cocktail.caching.CacheSerializer` used to serialize values.
+        Defaults to a `~cocktail.caching.PickleCacheSerializer`.
+    """
+
+    fallback: Sizer = DeepSizer()
+
+    def __init__(
+            self,
+            serializer: Optional[CacheSerializer] = None,
+            fallback: Optional[Sizer] = None):
+        """Initializes the sizer.
+
+        :param serializer: The serializer used to serialize values.
+        :param fallback: The sizer used for values that can't be serialized.
+        """
+        self.serializer = serializer or PickleCacheSerializer()
+
+        if fallback is not None:
+            self.fallback = fallback
+
+    @overrides(Sizer.get_size)
+    def get_size(self, value: Any) -> int:
+        try:
+            return len(self.serializer.serialize(value))
+        except Exception:
+            return self.fallback.get_size(value)
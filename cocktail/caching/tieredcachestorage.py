@@ -0,0 +1,254 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Dict, Iterable, Mapping, Optional, Set, Tuple
+from threading import RLock
+from time import monotonic
+
+from cocktail.modeling import overrides
+from .cachekey import CacheKey
+from .cachestorage import CacheStorage
+from .exceptions import CacheKeyError
+from .invalidationlog import InvalidationLog, MemoryInvalidationLog
+from .memorycachestorage import MemoryCacheStorage
+from .scope import whole_cache, Scope
+
+
+class TieredCacheStorage(CacheStorage):
+    """A cache backend that combines a fast local storage with a slower
+    storage shared by several processes.
+
+    Reads are served from the local storage (the L1) if possible, falling
+    back to the shared storage (the L2) and copying the retrieved entry to the
+    L1. Writes go to both storages.
+
+    Each process has its own L1, so invalidations must reach all of them.
+    The storage publishes every scope it clears to an `.invalidation_log`,
+    shared by all nodes, and applies the scopes published by other nodes to
+    its L1 before serving any read. The log is polled at most once every
+    `.poll_interval` seconds, which bounds how long a node can serve entries
+    invalidated by another node. Logs that notify their subscribers directly
+    (like `~cocktail.caching.MemoryInvalidationLog`) apply invalidations
+    immediately.
+
+    Only `.clear` is propagated through the log: entries discarded or
+    updated using `.discard`, `.store` or `.set_expiration` on one node can
+    linger on the L1 of other nodes until they expire or are evicted.
+
+    .. attribute:: l1
+
+        The local storage. Defaults to a `~cocktail.caching.MemoryCacheStorage`
+        limited to `.l1_memory_limit` bytes.
+
+    .. attribute:: l2
+
+        The shared storage.
+
+    .. attribute:: invalidation_log
+
+        The `~cocktail.caching.InvalidationLog` used to propagate
+        invalidations between nodes. Defaults to a
+        `~cocktail.caching.MemoryInvalidationLog`, which is only suitable for
+        nodes within a single process.
+    """
+
+    l1_memory_limit: str = "64M"
+    poll_interval: float = 1.0
+
+    def __init__(
+            self,
+            l2: CacheStorage,
+            l1: Optional[CacheStorage] = None,
+            invalidation_log: Optional[InvalidationLog] = None,
+            poll_interval: Optional[float] = None):
+        """Initializes the storage.
+
+        :param l2: The shared storage.
+        :param l1: The local storage.
+        :param invalidation_log: The log used to propagate invalidations.
+        :param poll_interval: The maximum number of seconds between checks
+            for new invalidations in the log. If set to 0, the log is checked
+            before every read.
+        """
+        if l1 is None:
+            l1 = MemoryCacheStorage(memory_limit = self.l1_memory_limit)
+
+        if invalidation_log is None:
+            invalidation_log = MemoryInvalidationLog()
+
+        if poll_interval is not None:
+            self.poll_interval = poll_interval
+
+        self.__lock = RLock()
+        self.__l1 = l1
+        self.__l2 = l2
+        self.__invalidation_log = invalidation_log
+        self.__position = invalidation_log.get_position()
+        self.__last_poll = monotonic()
+        self.__generation = 0
+        invalidation_log.subscribe(self._apply_invalidation)
+
+    @property
+    def l1(self) -> CacheStorage:
+        return self.__l1
+
+    @property
+    def l2(self) -> CacheStorage:
+        return self.__l2
+
+    @property
+    def invalidation_log(self) -> InvalidationLog:
+        return self.__invalidation_log
+
+    def close(self):
+        """Stops receiving invalidations pushed by the log."""
+        self.__invalidation_log.unsubscribe(self._apply_invalidation)
+
+    def sync(self):
+        """Applies the invalidations published to the log by other nodes."""
+        with self.__lock:
+            self.__last_poll = monotonic()
+            self.__position, scopes = \
+                self.__invalidation_log.read(self.__position)
+
+        for scope in scopes:
+            self._apply_invalidation(scope)
+
+    def _sync_if_due(self):
+        if monotonic() - self.__last_poll >= self.poll_interval:
+            self.sync()
+
+    def _apply_invalidation(self, scope: Scope):
+        with self.__lock:
+            self.__generation += 1
+            self.__l1.clear(scope)
+
+    def __fill_l1(
+            self,
+            generation: int,
+            key: CacheKey,
+            value: Any,
+            expiration: Optional[int],
+            tags: Optional[Set[str]]):
+
+        # Don't copy entries fetched before an invalidation was applied: they
+        # may have been cleared from the L2 after being retrieved
+        with self.__lock:
+            if generation == self.__generation:
+                self.__l1.store(
+                    key,
+                    value,
+                    expiration = expiration,
+                    tags = tags
+                )
+
+    @overrides(CacheStorage.exists)
+    def exists(self, key: CacheKey) -> bool:
+        self._sync_if_due()
+        return self.__l1.exists(key) or self.__l2.exists(key)
+
+    @overrides(CacheStorage.retrieve)
+    def retrieve(self, key: CacheKey) -> Any:
+        return self.retrieve_with_metadata(key)[0]
+
+    @overrides(CacheStorage.retrieve_with_metadata)
+    def retrieve_with_metadata(
+            self,
+            key: CacheKey) -> Tuple[Any, int, Set[str]]:
+
+        self._sync_if_due()
+
+        try:
+            return self.__l1.retrieve_with_metadata(key)
+        except CacheKeyError:
+            pass
+
+        generation = self.__generation
+        value, expiration, tags = self.__l2.retrieve_with_metadata(key)
+        self.__fill_l1(generation, key, value, expiration, tags)
+        return value, expiration, tags
+
+    @overrides(CacheStorage.retrieve_many)
+    def retrieve_many(self, keys: Iterable[CacheKey]) -> Dict[CacheKey, Any]:
+        return dict(
+            (key, entry[0])
+            for key, entry in self.retrieve_many_with_metadata(keys).items()
+        )
+
+    @overrides(CacheStorage.retrieve_many_with_metadata)
+    def retrieve_many_with_metadata(
+            self,
+            keys: Iterable[CacheKey]
+    ) -> Dict[CacheKey, Tuple[Any, int, Set[str]]]:
+
+        self._sync_if_due()
+
+        keys = list(keys)
+        entries = self.__l1.retrieve_many_with_metadata(keys)
+        missing = [key for key in keys if key not in entries]
+
+        if missing:
+            generation = self.__generation
+            l2_entries = self.__l2.retrieve_many_with_metadata(missing)
+            for key, (value, expiration, tags) in l2_entries.items():
+                self.__fill_l1(generation, key, value, expiration, tags)
+            entries.update(l2_entries)
+
+        return entries
+
+    @overrides(CacheStorage.store)
+    def store(
+            self,
+            key: CacheKey,
+            value: Any,
+            expiration: Optional[int] = None,
+            tags: Optional[Set[str]] = None):
+
+        self.__l2.store(key, value, expiration = expiration, tags = tags)
+        self.__l1.store(key, value, expiration = expiration, tags = tags)
+
+    @overrides(CacheStorage.store_many)
+    def store_many(
+            self,
+            values: Mapping[CacheKey, Any],
+            expiration: Optional[int] = None,
+            tags: Optional[Iterable[str]] = None):
+
+        if tags is not None:
+            tags = set(tags)
+
+        self.__l2.store_many(values, expiration = expiration, tags = tags)
+        self.__l1.store_many(values, expiration = expiration, tags = tags)
+
+    @overrides(CacheStorage.get_expiration)
+    def get_expiration(self, key: CacheKey) -> Optional[int]:
+        self._sync_if_due()
+        try:
+            return self.__l1.get_expiration(key)
+        except CacheKeyError:
+            return self.__l2.get_expiration(key)
+
+    @overrides(CacheStorage.set_expiration)
+    def set_expiration(self, key: CacheKey, expiration: Optional[int]):
+        self.__l2.set_expiration(key, expiration)
+        try:
+            self.__l1.set_expiration(key, expiration)
+        except CacheKeyError:
+            pass
+
+    @overrides(CacheStorage.discard)
+    def discard(self, key: CacheKey) -> bool:
+        l1_discarded = self.__l1.discard(key)
+        return self.__l2.discard(key) or l1_discarded
+
+    @overrides(CacheStorage.clear)
+    def clear(self, scope: Scope = whole_cache):
+        self.__l2.clear(scope)
+        self.__invalidation_log.publish(scope)
+
+    @overrides(CacheStorage.drop_weight)
+    def drop_weight(self) -> Optional[CacheKey]:
+        # Only local resources are reclaimed; the shared storage manages its
+        # own limits
+        return self.__l1.drop_weight()
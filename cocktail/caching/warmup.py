@@ -0,0 +1,434 @@
+"""Rebuilds the most requested cache entries before users ask for them.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, local
+from time import sleep
+from json import load, dump
+
+from cocktail.styled import styled
+from cocktail.asynctask import TaskManager
+from .cachekey import CacheKey, CacheKeySource
+from .scope import whole_cache, normalize_scope, Scope
+
+Replayer = Callable[..., Any]
+
+replayers: Dict[str, Replayer] = {}
+
+_replay_state = local()
+
+
+def replayer(name: str) -> Callable[[Replayer], Replayer]:
+    """A decorator that registers a function used to rebuild cache entries.
+
+    Replayers are referenced by name from `WarmUpRecord` objects, so that
+    records can be saved and restored across restarts. The decorated
+    function receives the `~cocktail.caching.Cache` to warm up, followed by
+    the arguments given to `CacheWarmer.record`; it should produce the entry
+    and store it in the cache.
+
+    :param name: The name that identifies the replayer.
+    """
+    def decorator(function: Replayer) -> Replayer:
+        replayers[name] = function
+        return function
+
+    return decorator
+
+
+@contextmanager
+def replaying():
+    """A context manager that flags the current thread as rebuilding cache
+    entries.
+
+    Requests for cache entries made while the flag is set come from the
+    warmer itself, so they are ignored by `CacheWarmer.record`.
+    """
+    prev_replaying = getattr(_replay_state, "active", False)
+    _replay_state.active = True
+    try:
+        yield
+    finally:
+        _replay_state.active = prev_replaying
+
+
+def is_replaying() -> bool:
+    """Indicates if the current thread is rebuilding cache entries (see
+    `replaying`).
+    """
+    return getattr(_replay_state, "active", False)
+
+
+def scope_matches(scope: Scope, tags: Optional[Set[str]]) -> bool:
+    """Determines if an entry with the given tags is affected by a scope.
+
+    :param scope: The scope to evaluate, normalized with
+        `~cocktail.caching.normalize_scope`.
+    :param tags: The tags of the entry.
+    """
+    if scope is whole_cache:
+        return True
+
+    if not tags:
+        return False
+
+    for selector in scope:
+        if isinstance(selector, str):
+            if selector in tags:
+                return True
+        elif tags.issuperset(selector):
+            return True
+
+    return False
+
+
+class WarmUpRecord:
+    """Describes how to rebuild a cache entry, and how often it is used."""
+
+    __slots__ = ("key", "replayer", "args", "tags", "hits")
+
+    def __init__(
+            self,
+            key: CacheKey,
+            replayer: str,
+            args: Sequence[Any],
+            tags: Optional[Set[str]] = None,
+            hits: int = 0):
+
+        self.key = key
+        self.replayer = replayer
+        self.args = tuple(args)
+        self.tags = tags
+        self.hits = hits
+
+
+class CacheWarmer:
+    """Keeps track of the most requested entries of a cache, and rebuilds
+    them when they are invalidated or after a restart.
+
+    Producers of cached content report each request for an entry using
+    `.record`, along with the name of a `replayer` and the arguments it
+    needs to rebuild the entry. The warmer keeps a bounded table with the
+    most requested entries (see `.max_records`).
+
+    When the cache is cleared (directly or through
+    `~cocktail.caching.Cache.clear_after_commit`) the warmer queues the
+    `.warm_up_limit` most requested entries affected by the invalidation.
+    Queued entries are rebuilt by at most `.worker_count` threads, started
+    through a `~cocktail.asynctask.TaskManager`, which pause for
+    `.pause` seconds after each entry so that they don't compete with
+    regular requests. Entries that are present in the cache by the time
+    their turn comes are skipped, and entries being produced by a regular
+    request at the same time are coalesced by
+    `~cocktail.caching.Cache.retrieve_or_produce`.
+
+    Records can be persisted with `.save` and restored with `.load`, so that
+    a new process can `.warm_up` the entries that were popular before it
+    started.
+
+    .. attribute:: cache
+
+        The `~cocktail.caching.Cache` to warm up.
+
+    .. attribute:: task_manager
+
+        The `~cocktail.asynctask.TaskManager` that runs the warm up workers.
+    """
+
+    max_records: int = 10000
+    warm_up_limit: int = 500
+    worker_count: int = 2
+    pause: float = 0.01
+    warm_up_on_invalidation: bool = True
+    verbose: bool = False
+
+    def __init__(
+            self,
+            cache: "cocktail.caching.Cache",
+            task_manager: Optional[TaskManager] = None,
+            worker_count: Optional[int] = None):
+        """Initializes the warmer.
+
+        :param cache: The cache to warm up. The warmer is set as its
+            `~cocktail.caching.Cache.warmer`.
+        :param task_manager: The task manager used to run warm up workers.
+        :param worker_count: Overrides the `.worker_count` of the warmer.
+        """
+        if worker_count is not None:
+            self.worker_count = worker_count
+
+        self.cache = cache
+        self.task_manager = task_manager or TaskManager()
+        self.__lock = Lock()
+        self.__records = {}
+        self.__queue = deque()
+        self.__queued = set()
+        self.__active_workers = 0
+        self.replayed = 0
+        self.failed = 0
+        cache.warmer = self
+
+    @property
+    def pending(self) -> int:
+        """The number of entries waiting to be rebuilt."""
+        return len(self.__queue)
+
+    @property
+    def busy(self) -> bool:
+        """Indicates if there are entries being rebuilt."""
+        return bool(self.__active_workers)
+
+    def record(
+            self,
+            key: CacheKeySource,
+            replayer: str,
+            args: Sequence[Any] = (),
+            tags: Optional[Iterable[str]] = None):
+        """Records a request for a cache entry.
+
+        :param key: The key of the requested entry.
+        :param replayer: The name of the `replayer` that can rebuild the
+            entry.
+        :param args: The arguments for the replayer. They should be JSON
+            serializable, so that the record can be `saved <.save>`.
+        :param tags: The cache tags of the entry.
+        """
+        # Replayed requests don't count as hits
+        if is_replaying():
+            return
+
+        key = self.cache.normalize_key(key)
+
+        with self.__lock:
+            record = self.__records.get(key)
+
+            if record is None:
+                if len(self.__records) >= self.max_records:
+                    self.__trim()
+                record = WarmUpRecord(key, replayer, args)
+                self.__records[key] = record
+            else:
+                record.replayer = replayer
+                record.args = tuple(args)
+
+            record.tags = set(tags) if tags else None
+            record.hits += 1
+
+    def __trim(self):
+        # Keep the most requested half of the records, and decay their hit
+        # count so that recent requests weigh more than old ones
+        records = sorted(
+            self.__records.values(),
+            key = lambda record: record.hits,
+            reverse = True
+        )
+        self.__records = {}
+        for record in records[:self.max_records // 2]:
+            record.hits //= 2
+            self.__records[record.key] = record
+
+    def forget(self, key: CacheKeySource):
+        """Stops tracking the given key."""
+        key = self.cache.normalize_key(key)
+        with self.__lock:
+            self.__records.pop(key, None)
+
+    def get_records(
+            self,
+            scope: Scope = whole_cache,
+            limit: Optional[int] = None) -> List[WarmUpRecord]:
+        """Obtains the most requested entries.
+
+        :param scope: Only include entries matching this scope.
+        :param limit: The maximum number of entries to return.
+        :return: A list of records, sorted by decreasing number of hits.
+        """
+        scope = normalize_scope(scope)
+
+        with self.__lock:
+            records = [
+                record
+                for record in self.__records.values()
+                if scope_matches(scope, record.tags)
+            ]
+
+        records.sort(key = lambda record: record.hits, reverse = True)
+
+        if limit is not None:
+            records = records[:limit]
+
+        return records
+
+    def invalidated(self, scope: Scope):
+        """Notifies the warmer that the given scope has been cleared from the
+        cache.
+        """
+        if self.warm_up_on_invalidation:
+            self.warm_up(scope)
+
+    def warm_up(self, scope: Scope = whole_cache, limit: Optional[int] = None):
+        """Queues the most requested entries to be rebuilt in the background.
+
+        :param scope: Only rebuild entries matching this scope.
+        :param limit: The maximum number of entries to rebuild. Defaults to
+            `.warm_up_limit`.
+        """
+        records = self.get_records(
+            scope,
+            self.warm_up_limit if limit is None else limit
+        )
+
+        if not records:
+            return
+
+        with self.__lock:
+            for record in records:
+                if record.key not in self.__queued:
+                    self.__queued.add(record.key)
+                    self.__queue.append(record)
+
+            new_workers = min(
+                self.worker_count - self.__active_workers,
+                len(self.__queue)
+            )
+            self.__active_workers += new_workers
+
+        for i in range(new_workers):
+            self.task_manager.task(
+                self.__work,
+                callback = self.__worker_finished
+            )
+
+    def __work(self):
+        finished = False
+        try:
+            while True:
+                with self.__lock:
+                    # Must be decremented while holding the lock, so that
+                    # warm_up() spawns a new worker for entries queued after
+                    # this point
+                    if not self.__queue:
+                        self.__active_workers -= 1
+                        finished = True
+                        return
+                    record = self.__queue.popleft()
+                    self.__queued.discard(record.key)
+
+                try:
+                    if self.cache.exists(record.key):
+                        continue
+                except Exception as error:
+                    self.failed += 1
+                    self.__report_failure(record, error)
+                    continue
+
+                self.replay(record)
+                if self.pause:
+                    sleep(self.pause)
+        finally:
+            if not finished:
+                with self.__lock:
+                    self.__active_workers -= 1
+
+    def __worker_finished(self, task):
+        if task.completed:
+            self.task_manager.remove_task(task)
+
+    def replay(self, record: WarmUpRecord) -> bool:
+        """Rebuilds the entry described by the given record.
+
+        Records whose replayer fails or is unknown are forgotten.
+
+        :param record: The entry to rebuild.
+        :return: True if the entry was rebuilt, False otherwise.
+        """
+        function = replayers.get(record.replayer)
+
+        try:
+            if function is None:
+                raise KeyError("Unknown replayer: %s" % record.replayer)
+            with replaying():
+                function(self.cache, *record.args)
+        except Exception as error:
+            self.failed += 1
+            self.forget(record.key)
+            self.__report_failure(record, error)
+            return False
+
+        self.replayed += 1
+
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Warm up", "slate_blue", style = "bold") + "\n"
+                + styled("  Key:", "light_gray", style = "bold")
+                + " " + record.key + "\n"
+            ))
+
+        return True
+
+    def __report_failure(self, record: WarmUpRecord, error: Exception):
+        if self.verbose:
+            print((
+                styled("CACHE", "white", "dark_gray")
+                + " " + styled("Warm up failed", "red", style = "bold")
+                + "\n"
+                + styled("  Key:", "light_gray", style = "bold")
+                + " " + record.key + "\n"
+                + styled("  Error:", "light_gray", style = "bold")
+                + " " + repr(error) + "\n"
+            ))
+
+    def save(self, path: str, limit: Optional[int] = None):
+        """Writes the most requested entries to a JSON file.
+
+        :param path: The path of the file.
+        :param limit: The maximum number of entries to save. Defaults to
+            `.warm_up_limit`.
+        """
+        records = self.get_records(
+            limit = self.warm_up_limit if limit is None else limit
+        )
+
+        with open(path, "w") as file:
+            dump(
+                [
+                    {
+                        "key": record.key,
+                        "replayer": record.replayer,
+                        "args": list(record.args),
+                        "tags": sorted(record.tags) if record.tags else None,
+                        "hits": record.hits
+                    }
+                    for record in records
+                ],
+                file
+            )
+
+    def load(self, path: str):
+        """Adds the records saved by `.save` to the warmer.
+
+        :param path: The path of the file. Missing files are ignored.
+        """
+        try:
+            with open(path) as file:
+                data = load(file)
+        except FileNotFoundError:
+            return
+
+        with self.__lock:
+            for item in data:
+                record = self.__records.get(item["key"])
+                if record is None:
+                    self.__records[item["key"]] = WarmUpRecord(
+                        item["key"],
+                        item["replayer"],
+                        item["args"],
+                        set(item["tags"]) if item["tags"] else None,
+                        item["hits"]
+                    )
+                else:
+                    record.hits += item["hits"]
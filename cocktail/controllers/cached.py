@@ -5,11 +5,23 @@
 """
 from types import GeneratorType
 from time import time
+from contextlib import nullcontext
+from urllib.request import Request, urlopen
 import cherrypy
 from cherrypy.lib import cptools
 from cocktail.caching import CacheKeyError, Invalidable
+from cocktail.caching.warmup import replayer, replaying
 from cocktail.controllers import request_property, get_request_url
 
+warmup_base_url = None
+"""The base URL (scheme://host[:port]) of the local server, used to replay
+requests when warming up cached responses. Defaults to the address that the
+CherryPy server listens on.
+"""
+
+WARMUP_HEADER = "X-Cocktail-Cache-Warmup"
+"""The header that identifies requests replayed by the warmer of the cache."""
+
 
 class Cached(object):
     """A mixin for controllers with cached responses."""
@@ -58,6 +70,24 @@ class Cached(object):
     def cache_key(self):
         return str(get_request_url())
 
+    @request_property
+    def cache_warmup_url(self):
+        """The path and query string that the warmer of the cache should
+        request to rebuild the cached response.
+
+        Requests are always replayed against the local server (see
+        `warmup_base_url`), forwarding the ``Host`` and
+        ``X-Forwarded-Scheme`` headers of the original request so that they
+        produce the same `cache_key`. Controllers whose `cache_key` depends on
+        anything else should return None, to prevent warming up their
+        responses.
+        """
+        request = cherrypy.request
+        url = request.script_name + request.path_info
+        if request.query_string:
+            url += "?" + request.query_string
+        return url
+
     @request_property
     def caching_context(self):
         return {
@@ -67,65 +97,96 @@ class Cached(object):
 
     def _apply_cache(self, **kwargs):
 
-        response_headers = cherrypy.response.headers
-
         if not self.response_uses_cache:
             return None
 
-        cache_key = self.cache_key
+        if not self.response_uses_server_side_cache:
+            return self.__apply_client_side_cache(**kwargs)
 
-        # Look for a cached response
-        try:
-            content, headers, gen_time = self.cache.retrieve(cache_key)
-        except CacheKeyError:
-            content = None
-            headers = None
+        response_headers = cherrypy.response.headers
+        produced = []
+
+        # Concurrent requests for a missing response are coalesced, so that
+        # the response is produced only once
+        def produce():
             gen_time = time()
-        else:
-            if self.response_uses_server_side_cache:
-                if headers:
-                    response_headers.update(headers)
-            else:
-                # Server-side caching disabled, we only care about generation
-                # time to valide the ETag
-                content = None
-                headers = None
+            response_headers["ETag"] = str(gen_time)
+            content = self.__produce_response(**kwargs)
+            produced.append(content)
 
-        response_headers["ETag"] = str(gen_time)
+            # Collect headers that should be included in the cache
+            headers = {}
 
-        if not self.response_uses_server_side_cache:
-            cptools.validate_etags()
+            for header_name in self.cached_headers:
+                header_value = response_headers.get(header_name)
+                if header_value:
+                    headers[header_name] = header_value
 
-        if content is None:
-            content = self.__produce_response(**kwargs)
             invalidation = self.invalidation
+            return (
+                (content, headers, gen_time),
+                invalidation.cache_expiration,
+                invalidation.cache_tags
+            )
 
-            # Store content in the server side cache
-            if self.response_uses_server_side_cache:
+        # Requests replayed by the warmer are served by another thread, which
+        # must be flagged too, so that neither the response nor the elements
+        # it renders are recorded as hits again
+        replayed = bool(cherrypy.request.headers.get(WARMUP_HEADER))
+
+        with replaying() if replayed else nullcontext():
+            (content, headers, gen_time), expiration, tags = \
+                self.cache.retrieve_or_produce(self.cache_key, produce)
+
+        warmer = self.cache.warmer
+        if warmer is not None and not replayed:
+            warmup_url = self.cache_warmup_url
+            if warmup_url:
+                request_headers = cherrypy.request.headers
+                warmer.record(
+                    self.cache_key,
+                    "cocktail.controllers.cached",
+                    (
+                        warmup_url,
+                        request_headers.get("Host"),
+                        request_headers.get("X-Forwarded-Scheme")
+                    ),
+                    tags
+                )
+
+        if produced:
+            content = produced[0]
+        elif headers:
+            response_headers.update(headers)
 
-                cache_entry_content = content
+        response_headers["ETag"] = str(gen_time)
+        cptools.validate_etags()
+        return content
 
-                # Collect headers that should be included in the cache
-                cache_entry_headers = {}
+    def __apply_client_side_cache(self, **kwargs):
 
-                for header_name in self.cached_headers:
-                    header_value = response_headers.get(header_name)
-                    if header_value:
-                        cache_entry_headers[header_name] = header_value
-            else:
-                cache_entry_headers = None
-                cache_entry_content = None
+        cache_key = self.cache_key
 
-            # Store the response in the cache
-            self.cache.store(
-                cache_key,
-                (cache_entry_content, cache_entry_headers, gen_time),
-                expiration = invalidation.cache_expiration,
-                tags = invalidation.cache_tags
-            )
+        # Server-side caching disabled, we only care about generation time to
+        # validate the ETag
+        try:
+            content, headers, gen_time = self.cache.retrieve(cache_key)
+        except CacheKeyError:
+            gen_time = time()
 
-        if self.response_uses_server_side_cache:
-            cptools.validate_etags()
+        cherrypy.response.headers["ETag"] = str(gen_time)
+        cptools.validate_etags()
+
+        content = self.__produce_response(**kwargs)
+        invalidation = self.invalidation
+
+        # Store the generation time in the cache
+        self.cache.store(
+            cache_key,
+            (None, None, gen_time),
+            expiration = invalidation.cache_expiration,
+            tags = invalidation.cache_tags
+        )
 
         return content
 
@@ -152,3 +213,46 @@ class Cached(object):
             % self
         )
 
+
+def get_warmup_base_url():
+    """Obtains the base URL used to replay requests when warming up cached
+    responses (see `warmup_base_url`).
+    """
+    if warmup_base_url:
+        return warmup_base_url.rstrip("/")
+
+    server = cherrypy.server
+    host = server.socket_host
+
+    # Wildcard addresses can't be requested; use the loopback interface
+    if host in ("", "0.0.0.0"):
+        host = "127.0.0.1"
+    elif host == "::":
+        host = "::1"
+
+    if ":" in host:
+        host = "[%s]" % host
+
+    scheme = "https" if server.ssl_certificate else "http"
+    return "%s://%s:%d" % (scheme, host, server.socket_port)
+
+@replayer("cocktail.controllers.cached")
+def _replay_request(cache, path, host = None, scheme = None):
+
+    # Records only provide the path; requests are never sent to a host taken
+    # from a client request
+    if not path.startswith("/"):
+        raise ValueError("Can't replay a request for %r" % path)
+
+    headers = {WARMUP_HEADER: "1"}
+    if host:
+        headers["Host"] = host
+    if scheme:
+        headers["X-Forwarded-Scheme"] = scheme
+
+    # Requesting the URL makes the controller produce and store the response
+    with urlopen(
+        Request(get_warmup_base_url() + path, headers = headers),
+        timeout = 60
+    ) as response:
+        response.read()
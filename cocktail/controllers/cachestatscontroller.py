@@ -0,0 +1,37 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Dict
+
+import cherrypy
+from cocktail.caching import Cache
+from cocktail.caching.cachestats import (
+    PROMETHEUS_CONTENT_TYPE,
+    format_prometheus_metrics
+)
+from cocktail.controllers import Controller
+
+
+class CacheStatsController(Controller):
+    """Exposes the usage statistics of a set of caches, using the
+    Prometheus text exposition format.
+
+    .. attribute:: caches
+
+        A mapping of names to the `~cocktail.caching.Cache` instances to
+        report on. Names are exported as the ``cache`` label of each metric.
+    """
+
+    caches: Dict[str, Cache] = {}
+    metrics_prefix: str = "cocktail_cache"
+
+    def __call__(self, action = None, **kwargs):
+
+        if action == "reset" and cherrypy.request.method == "POST":
+            for cache in self.caches.values():
+                cache.reset_stats()
+
+        cherrypy.response.headers["Content-Type"] = PROMETHEUS_CONTENT_TYPE
+        return format_prometheus_metrics(self.caches, self.metrics_prefix)
@@ -24,6 +24,8 @@ class Pagination(schema.SchemaObject):
         default = 10
     )
 
+    cursor = schema.String()
+
     items = None
 
     def _get_item_count(self):
@@ -79,15 +81,54 @@ class Pagination(schema.SchemaObject):
 
     @property
     def current_page_items(self):
-        """The items in the selected page."""
+        """The items in the selected page.
+
+        If `cursor` is set, the page starts right after the position it
+        points to, instead of at the position given by `page`. This requires
+        `items` to be a `~cocktail.persistence.Query` that supports cursors
+        (see `~cocktail.persistence.Query.after`).
+        """
         if self.items is None:
             raise ValueError(
                 "Can't retrieve Pagination.page_items if the 'items' "
                 "property has not been set"
             )
 
+        if self.cursor is not None:
+            items = self.items.after(self.cursor)
+            if self.page_size:
+                items = items.select(range = (0, self.page_size))
+            return items
+
         return self.items[self.start:self.end]
 
+    @property
+    def next_cursor(self):
+        """A cursor pointing to the end of the selected page, to retrieve the
+        following page by setting it as the `cursor` of another pagination.
+
+        Requires `items` to be a `~cocktail.persistence.Query` that supports
+        cursors. Will be None if there are no further items.
+        """
+        if not self.page_size:
+            return None
+
+        if self.cursor is None and self.at_last_page:
+            return None
+
+        page_items = list(self.current_page_items)
+
+        if len(page_items) < self.page_size:
+            return None
+
+        cursor = self.items.cursor_for(page_items[-1])
+
+        # The page may end exactly at the last item
+        if not self.items.after(cursor):
+            return None
+
+        return cursor
+
     @property
     def current_page_size(self):
         """The number of items in the selected page."""
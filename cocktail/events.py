@@ -5,12 +5,15 @@
 from typing import Any, Callable, Iterable, Mapping, Tuple, Type
 from types import MethodType
 from weakref import ref, WeakKeyDictionary
+from itertools import count
 from cocktail.modeling import SynchronizedList
 from threading import Lock, current_thread
 from contextlib import contextmanager
 
 EventHandler = Callable[["EventInfo"], Any]
 
+_versions = count(1)
+
 
 def when(event: "EventSlot") -> Callable[[EventHandler], EventHandler]:
     """A decorator factory that attaches decorated functions as event handlers
@@ -71,7 +74,12 @@ class Event:
     `event slots <EventSlot>` on the class, its subclasses or its instances, in
     a thread-safe manner. Each object that the event is requested on spawns a
     new slot, which will remain assigned to that object throughout the object's
-    life cycle.
+    life cycle. Slots that already exist are obtained without locking.
+
+    The event also keeps a version number, which changes whenever the handlers
+    or the chaining of any of its slots change. Slots use it to cache the
+    flattened sequence of handlers they invoke (see
+    `EventSlot.get_dispatch_plan`).
     """
 
     def __init__(
@@ -89,18 +97,61 @@ class Event:
         self.__slots = WeakKeyDictionary()
         self.__lock = Lock()
         self.event_info_class = event_info_class or EventInfo
+        self.version = next(_versions)
+        self.__any_handlers = (None, False)
 
     def __get__(self, instance, type=None):
 
-        self.__lock.acquire()
+        # Fast path: reading an existing slot doesn't require the lock
+        slot = self.__slots.get(type if instance is None else instance)
 
-        try:
-            if instance is None:
-                return self.__get_slot(type)
-            else:
-                return self.__get_slot(instance, True)
-        finally:
-            self.__lock.release()
+        if slot is None:
+            with self.__lock:
+                if instance is None:
+                    slot = self.__get_slot(type)
+                else:
+                    slot = self.__get_slot(instance, True)
+
+        return slot
+
+    def has_handlers(self, instance: Any, type: Type = None) -> bool:
+        """Indicates if triggering the event on the given object would invoke
+        any handler.
+
+        Unlike requesting the slot for the object, this doesn't create a new
+        slot for instances that don't have one yet, which makes it a cheap
+        way to skip triggering events that nobody listens to.
+
+        :param instance: The instance to check, or None to check a class.
+        :param type: The class to check, when ``instance`` is None.
+        :return: True if the slot for the object, or any of the slots chained
+            to it, has at least one handler.
+        """
+        # Near zero cost check for events without handlers on any slot
+        version, any_handlers = self.__any_handlers
+
+        if version != self.version:
+            version = self.version
+            with self.__lock:
+                any_handlers = any(
+                    len(slot) for slot in list(self.__slots.values())
+                )
+            self.__any_handlers = (version, any_handlers)
+
+        if not any_handlers:
+            return False
+
+        if instance is None:
+            slot = self.__get__(None, type)
+        else:
+            slot = self.__slots.get(instance)
+            if slot is None:
+                slot = self.__get__(None, instance.__class__)
+
+        return bool(slot.get_dispatch_plan())
+
+    def _handlers_changed(self):
+        self.version = next(_versions)
 
     def __get_slot(self, target, is_instance=False):
 
@@ -113,10 +164,12 @@ class Event:
             slot.target = ref(target)
             self.__slots[target] = slot
 
+            # A new slot doesn't alter the handlers of existing slots, so
+            # there's no need to change the version of the event
             if is_instance:
-                slot.next = self.__get_slot(target.__class__),
+                slot._next = self.__get_slot(target.__class__),
             else:
-                slot.next = list(map(self.__get_slot, target.__bases__))
+                slot._next = list(map(self.__get_slot, target.__bases__))
 
         return slot
 
@@ -148,7 +201,56 @@ class EventSlot(SynchronizedList):
     """
     event = None
     target = None
-    next = ()
+    _next = ()
+    _dispatch_plan = (None, ())
+
+    def _get_next(self) -> Iterable["EventSlot"]:
+        return self._next
+
+    def _set_next(self, next: Iterable["EventSlot"]):
+        self._next = next
+        self._handlers_changed()
+
+    next = property(_get_next, _set_next, doc = """
+        Gets or sets the event slots chained up to the slot.
+        """)
+
+    def _handlers_changed(self):
+        if self.event is not None:
+            self.event._handlers_changed()
+
+    def get_dispatch_plan(self) -> Tuple[Tuple["EventSlot", Tuple], ...]:
+        """Obtains the flattened sequence of handlers invoked when the slot
+        is triggered.
+
+        The sequence follows the same order as the recursive traversal of
+        the slot and its `chained slots <next>`, leaving out slots without
+        handlers. It is computed once and reused until the `version
+        <Event.version>` of the event changes.
+
+        :return: A tuple of (slot, handlers) tuples.
+        """
+        version, plan = self._dispatch_plan
+
+        if version != self.event.version:
+            # Read the version before the handlers, so that changes made
+            # while the plan is being built invalidate it
+            version = self.event.version
+            plan = []
+            self._collect_dispatch_plan(plan)
+            plan = tuple(plan)
+            self._dispatch_plan = (version, plan)
+
+        return plan
+
+    def _collect_dispatch_plan(self, plan):
+
+        callbacks = tuple(self)
+        if callbacks:
+            plan.append((self, callbacks))
+
+        for next_slot in self._next:
+            next_slot._collect_dispatch_plan(plan)
 
     def __call__(
             self,
@@ -171,14 +273,21 @@ class EventSlot(SynchronizedList):
         event_info.target = target
         event_info.consumed = False
 
-        for callback in self:
-            callback(event_info)
+        for slot, callbacks in self.get_dispatch_plan():
 
-            if event_info.consumed:
-                break
+            if slot is not self:
+                slot_target = slot.target()
+                if slot_target is None:
+                    continue
+                event_info.slot = slot
+                event_info.target = slot_target
+                event_info.consumed = False
 
-        for next_slot in self.next:
-            next_slot(_event_info = event_info)
+            for callback in callbacks:
+                callback(event_info)
+
+                if event_info.consumed:
+                    break
 
         return event_info
 
@@ -188,6 +297,7 @@ class EventSlot(SynchronizedList):
         :param callback: The handler to append.
         """
         SynchronizedList.append(self, self.wrap_callback(callback))
+        self._handlers_changed()
 
     def insert(self, position: int, callback: EventHandler):
         """Inserts an event handler as the given ordinal position of the slot.
@@ -196,6 +306,7 @@ class EventSlot(SynchronizedList):
         :param callback: The handler to append.
         """
         SynchronizedList.insert(self, position, self.wrap_callback(callback))
+        self._handlers_changed()
 
     def __setitem__(self, position: int, callback: EventHandler):
         """Replaces the event handler at the given index with a new event
@@ -209,6 +320,7 @@ class EventSlot(SynchronizedList):
             position,
             self.wrap_callback(callback)
         )
+        self._handlers_changed()
 
     def extend(self, callback_sequence: Iterable[EventHandler]):
         """Extends all the event handlers in the given sequence at the end of
@@ -221,6 +333,34 @@ class EventSlot(SynchronizedList):
             self,
             (self.wrap_callback(callback) for callback in callback_sequence)
         )
+        self._handlers_changed()
+
+    def remove(self, callback: EventHandler):
+        """Removes the first occurrence of the given event handler.
+
+        :param callback: The handler to remove.
+        :raises ValueError: Raised if the handler is not in the slot.
+        """
+        SynchronizedList.remove(self, callback)
+        self._handlers_changed()
+
+    def pop(self, position: int = -1) -> EventHandler:
+        """Removes and returns the event handler at the given index.
+
+        :param position: The index to remove.
+        :return: The removed handler.
+        """
+        callback = SynchronizedList.pop(self, position)
+        self._handlers_changed()
+        return callback
+
+    def __delitem__(self, position: int):
+        """Removes the event handler at the given index.
+
+        :param position: The index to remove.
+        """
+        SynchronizedList.__delitem__(self, position)
+        self._handlers_changed()
 
     def wrap_callback(self, callback: EventHandler):
 
@@ -606,6 +606,13 @@ class Element(Invalidable, metaclass=ElementMetaClass):
     # Cached content
     #--------------------------------------------------------------------------
     cached = False
+
+    # A dictionary of attributes that allows the warmer of the rendering cache
+    # to rebuild the element after it is invalidated: the element's view is
+    # instantiated and given these attributes. Values should be JSON
+    # serializable.
+    warmup_arguments = None
+
     __cache_key = None
     __cache_key_qualifiers = None
     class_provides_cache_tag = False
@@ -5,9 +5,11 @@
 """
 from time import time
 from threading import local
-from cocktail.translations import get_language
+from cocktail.translations import get_language, language_context
 from cocktail.modeling import OrderedSet
+from cocktail.pkgutils import get_full_name, import_object
 from cocktail.caching import Cache, CacheKeyError
+from cocktail.caching.warmup import replayer
 from cocktail.html.documentmetadata import DocumentMetadata
 
 rendering_cache = Cache()
@@ -111,45 +113,29 @@ class Rendering(object):
             else:
                 rendering = self
 
-            # Possibly render the element from the cache
-            rendered_from_cache = False
-
             if rendering.cache is not None and element.cached:
                 cache_key = (rendering.get_cache_key(), element.cache_key)
             else:
                 cache_key = None
 
+            # Cached elements are rendered using a separate rendering buffer,
+            # which is stored in the rendering cache first and then
+            # replicated to the main rendering buffer. Concurrent renderings
+            # of the same missing element are coalesced by the cache, so that
+            # only one of them renders it.
             if cache_key:
-                try:
-                    cached_value, cached_expiration, cached_tags = \
-                        rendering.cache.retrieve_with_metadata(cache_key)
-                except CacheKeyError:
-                    pass
-                else:
-                    cached_content, cached_metadata = cached_value
-                    rendering.__content.extend(cached_content)
-                    rendering.document_metadata.update(cached_metadata)
-                    rendered_from_cache = True
+                cache_rendering = None
 
-                    if cached_tags:
-                        element.cache_tags.update(cached_tags)
+                def produce():
+                    nonlocal cache_rendering
 
-                    element.update_cache_expiration(cached_expiration)
+                    # Bring the element to the 'ready' stage
+                    element.ready()
 
-            # Otherwise, render the element from scratch
-            if not rendered_from_cache:
+                    # Skip hidden elements
+                    if not element.rendered:
+                        raise _ElementNotRendered()
 
-                # Bring the element to the 'ready' stage
-                element.ready()
-
-                # Skip hidden elements
-                if not element.rendered:
-                    return
-
-                # Cached elements are rendered using a separate rendering
-                # buffer, which is stored in the rendering cache first and then
-                # replicated to the main rendering buffer.
-                if cache_key:
                     cache_rendering = rendering.__class__(
                         renderer = rendering.renderer,
                         collect_metadata = rendering.collect_metadata,
@@ -170,27 +156,64 @@ class Rendering(object):
                     if language:
                         tags.add("lang-" + language)
 
-                    rendering.cache.store(
-                        cache_key,
+                    return (
                         (
                             cache_rendering.__content,
                             cache_rendering.document_metadata
                         ),
-                        expiration = element.cache_expiration,
-                        tags = tags
+                        element.cache_expiration,
+                        tags
                     )
-                    rendering.update(cache_rendering)
 
-                # Non cached elements are rendered directly onto the main
-                # rendering buffer.
+                try:
+                    cached_value, cached_expiration, cached_tags = \
+                        rendering.cache.retrieve_or_produce(cache_key, produce)
+                except _ElementNotRendered:
+                    return
+
+                warmer = rendering.cache.warmer
+                if warmer is not None and element.warmup_arguments is not None:
+                    warmer.record(
+                        cache_key,
+                        "cocktail.html.element",
+                        (
+                            element.view_name,
+                            element.warmup_arguments,
+                            get_language(),
+                            get_full_name(rendering.renderer.__class__)
+                        ),
+                        cached_tags
+                    )
+
+                if cache_rendering is not None:
+                    rendering.update(cache_rendering)
                 else:
-                    element._render(rendering)
+                    cached_content, cached_metadata = cached_value
+                    rendering.__content.extend(cached_content)
+                    rendering.document_metadata.update(cached_metadata)
 
-                    if rendering.collect_metadata:
-                        rendering.document_metadata.collect(
-                            element,
-                            self.rendered_client_model is not None
-                        )
+                    if cached_tags:
+                        element.cache_tags.update(cached_tags)
+
+                    element.update_cache_expiration(cached_expiration)
+
+            # Non cached elements are rendered directly onto the main
+            # rendering buffer.
+            else:
+                # Bring the element to the 'ready' stage
+                element.ready()
+
+                # Skip hidden elements
+                if not element.rendered:
+                    return
+
+                element._render(rendering)
+
+                if rendering.collect_metadata:
+                    rendering.document_metadata.collect(
+                        element,
+                        self.rendered_client_model is not None
+                    )
 
             # Store the markup and metadata for client models, they will be
             # included in the document by the HTMLDocument class
@@ -245,3 +268,22 @@ class IdGenerationError(Exception):
     def __str__(self):
         return "Element identifiers can only be generated while rendering"
 
+
+@replayer("cocktail.html.element")
+def _replay_element(cache, view_name, arguments, language, renderer_name):
+    from cocktail.html import templates
+
+    element = templates.new(view_name)
+    element.cached = True
+
+    for key, value in arguments.items():
+        setattr(element, key, value)
+
+    with language_context(language):
+        element.render(renderer = import_object(renderer_name)(), cache = cache)
+
+
+class _ElementNotRendered(Exception):
+    """Aborts the production of a cached element that turns out not to be
+    rendered.
+    """
@@ -20,7 +20,7 @@ from cocktail.translations import (
     language_context,
     translate_locale
 )
-from cocktail.schema import Collection, Mapping, get
+from cocktail.schema import Collection, Mapping, Reference, get
 from cocktail.schema.expressions import (
     TranslationExpression,
     PositiveExpression,
@@ -158,7 +158,7 @@ class Table(Element, CollectionDisplay):
         else:
             get_group = None
 
-        for i, item in enumerate(self.data):
+        for i, item in enumerate(self._get_rendered_items()):
 
             if get_group:
                 group = get_group(item)
@@ -172,6 +172,25 @@ class Table(Element, CollectionDisplay):
             self._add_split_rows(item, row)
             self._row_added(i, item, row)
 
+    def _get_rendered_items(self):
+
+        items = self.data
+
+        # Load persistent queries in batches, along with the objects they
+        # reference in displayed columns, instead of one object at a time
+        if getattr(items, "prefetch", None) is False \
+        and not items.prefetch_related:
+            items = items.select(
+                prefetch = True,
+                prefetch_related = [
+                    member
+                    for member in self.displayed_members
+                    if isinstance(member, Reference)
+                ]
+            )
+
+        return items
+
     def _add_split_rows(self, item, row):
 
         if not self.__split_rows:
@@ -50,10 +50,13 @@ from .index import Index
 from .singlevalueindex import SingleValueIndex
 from .multiplevaluesindex import MultipleValuesIndex
 from . import indexing
+from .compositeindex import CompositeIndex
 from . import fulltextsearch
 from .fulltextsearch import full_text_indexing_disabled
 from .maxvalue import MaxValue
+from .idset import IdSet
 from .query import Query
+from . import querycache
 from .pickling import dumps, loads
 from .deletedryrun import delete_dry_run
 
@@ -0,0 +1,566 @@
+#-*- coding: utf-8 -*-
+"""Defines indexes over the values of several members of a persistent class.
+
+Composite indexes are declared using the ``indexes`` attribute of a
+`PersistentObject` subclass. Each entry lists the members covered by an
+index, optionally prefixed with a '-' sign to store them in descending
+order::
+
+    class Article(PersistentObject):
+        status = schema.String(indexed = True)
+        date = schema.DateTime(indexed = True)
+        indexes = [("status", "-date")]
+
+Queries use composite indexes to resolve equality filters on a prefix of
+their members (optionally followed by a range filter on the next member) in
+a single index lookup, and to sort the matching objects without scanning the
+full index for the sorting member.
+
+Indexes are maintained as objects are inserted, modified or deleted. Objects
+that were inserted before an index was declared can be indexed using
+`PersistentClass.rebuild_indexes`.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from functools import total_ordering
+from cocktail.events import when
+from cocktail import schema
+from cocktail.schema import expressions
+from .datastore import datastore
+from .multiplevaluesindex import MultipleValuesIndex, _cmp_key
+from .persistentobject import PersistentObject, PersistentClass
+
+
+class CompositeIndex(object):
+    """Describes an index over the values of several members of a persistent
+    class.
+
+    The index itself is a `MultipleValuesIndex` stored in the datastore, that
+    maps tuples containing the (normalized) values of the indexed members to
+    object ids.
+    """
+
+    def __init__(self, cls, components):
+
+        self.persistent_class = cls
+        self.members = []
+        self.descending = []
+
+        if isinstance(components, (str, expressions.Expression)):
+            components = (components,)
+
+        for component in components:
+
+            desc = False
+
+            if isinstance(component, str):
+                if component[:1] in ("+", "-"):
+                    desc = (component[0] == "-")
+                    component = component[1:]
+                member = cls.get_member(component)
+            elif isinstance(component, (
+                expressions.PositiveExpression,
+                expressions.NegativeExpression
+            )):
+                desc = isinstance(component, expressions.NegativeExpression)
+                member = component.operands[0]
+            else:
+                member = component
+
+            if not isinstance(member, schema.Member) \
+            or member.schema is None \
+            or not issubclass(cls, member.schema):
+                raise ValueError(
+                    "Can't declare a composite index on %r: %r is not one "
+                    "of its members" % (cls, component)
+                )
+
+            if member.translated or isinstance(member, schema.Collection):
+                raise ValueError(
+                    "Can't include %r in a composite index: translated "
+                    "members and collections are not supported" % member
+                )
+
+            self.members.append(member)
+            self.descending.append(desc)
+
+        if len(self.members) < 2:
+            raise ValueError(
+                "Composite indexes must cover at least two members"
+            )
+
+        self.name = ",".join(
+            ("-" if desc else "") + member.name
+            for member, desc in zip(self.members, self.descending)
+        )
+        self.index_key = cls.full_name + "-index(" + self.name + ")"
+
+    def __repr__(self):
+        return "%s(%s, %r)" % (
+            self.__class__.__name__,
+            self.persistent_class.full_name,
+            self.name
+        )
+
+    def _get_index(self):
+
+        index = datastore.root.get(self.index_key)
+
+        if index is None:
+            index = self.create_index()
+
+        return index
+
+    def _set_index(self, index):
+        datastore.root[self.index_key] = index
+
+    index = property(_get_index, _set_index, doc = """
+        Gets or sets the `MultipleValuesIndex` holding the entries of the
+        composite index.
+        """)
+
+    def create_index(self):
+        """Creates a new, empty index, replacing the existing one.
+
+        :return: The new index.
+        :rtype: `MultipleValuesIndex`
+        """
+        index = MultipleValuesIndex()
+        datastore.root[self.index_key] = index
+        return index
+
+    def rebuild_index(self):
+        """Recreates the index from scratch, indexing all the instances of its
+        persistent class.
+        """
+        index = self.create_index()
+        for obj in self.persistent_class.select():
+            if obj.indexed:
+                index.add(self.get_key(obj), obj.id)
+
+    def covers(self, member):
+        """Indicates if the given member is one of the indexed members."""
+        return any(member is m for m in self.members)
+
+    def normalize_value(self, position, value):
+        """Transforms a member value into the value used by the index keys.
+
+        :param position: The position of the member in the index.
+        :type position: int
+
+        :param value: The value to transform.
+
+        :return: The value of the key component.
+        """
+        value = self.members[position].get_index_value(value)
+
+        if self.descending[position]:
+            value = DescendingKey(value)
+
+        return value
+
+    def get_key(self, obj, values = None):
+        """Obtains the index key for the given object.
+
+        :param obj: The object to obtain the key for.
+        :type obj: `PersistentObject`
+
+        :param values: A mapping of member names to values, overriding the
+            current values of the object.
+        :type values: dict
+
+        :return: The key for the object.
+        :rtype: tuple
+        """
+        return tuple(
+            self.normalize_value(
+                i,
+                values[member.name]
+                if values and member.name in values
+                else obj.get(member)
+            )
+            for i, member in enumerate(self.members)
+        )
+
+    def get_bounds(self, prefix, lower = None, upper = None):
+        """Obtains the range of index entries matching the given criteria.
+
+        :param prefix: The values for the first members of the index.
+        :type prefix: sequence
+
+        :param lower: A (value, exclusive) tuple giving the lower bound for
+            the member that follows the prefix.
+        :type lower: tuple
+
+        :param upper: A (value, exclusive) tuple giving the upper bound for
+            the member that follows the prefix.
+        :type upper: tuple
+
+        :return: The keyword arguments to pass to `MultipleValuesIndex.items`
+            or `MultipleValuesIndex.values` to obtain the matching entries.
+        :rtype: dict
+        """
+        prefix = tuple(
+            self.normalize_value(i, value)
+            for i, value in enumerate(prefix)
+        )
+        bounds = {"min": prefix, "max": prefix}
+
+        if lower is not None or upper is not None:
+            pos = len(prefix)
+
+            # Descending members invert their bounds
+            if self.descending[pos]:
+                lower, upper = upper, lower
+
+            if lower is not None:
+                value, exclusive = lower
+                bounds["min"] = prefix + (self.normalize_value(pos, value),)
+                bounds["exclude_min"] = exclusive
+
+            if upper is not None:
+                value, exclusive = upper
+                bounds["max"] = prefix + (self.normalize_value(pos, value),)
+                bounds["exclude_max"] = exclusive
+
+        return bounds
+
+
+@total_ordering
+class DescendingKey(object):
+    """A component of a composite index key, sorted in descending order.
+
+    Unlike regular keys, None values are placed after any other value.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return "DescendingKey(%r)" % (self.value,)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, DescendingKey)
+            and not _cmp_key(self.value, other.value)
+        )
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __lt__(self, other):
+        return _cmp_key(self.value, other.value) > 0
+
+
+def _get_composite_indexes(cls, recursive = True):
+    """Obtains the composite indexes that cover the instances of the class.
+
+    :param recursive: If set, indexes declared by base classes are included.
+    :type recursive: bool
+
+    :return: The list of composite indexes.
+    :rtype: `CompositeIndex` list
+    """
+    if not recursive:
+        return list(cls.__dict__.get("_composite_indexes", ()))
+
+    return [
+        composite_index
+        for base in cls.ascend_inheritance(True)
+        for composite_index in base.__dict__.get("_composite_indexes", ())
+    ]
+
+PersistentClass.get_composite_indexes = _get_composite_indexes
+
+@when(PersistentObject.declared)
+def _handle_declared(event):
+    cls = event.source
+    declarations = cls.__dict__.get("indexes")
+    if declarations:
+        cls._composite_indexes = [
+            CompositeIndex(cls, components)
+            for components in declarations
+        ]
+
+@when(PersistentClass.rebuilding_indexes)
+def _handle_rebuilding_indexes(event):
+    for composite_index in event.source.get_composite_indexes(False):
+        composite_index.rebuild_index()
+
+@when(PersistentObject.inserting)
+def _handle_inserting(event):
+    obj = event.source
+    if obj.indexed:
+        for composite_index in obj.__class__.get_composite_indexes():
+            composite_index.index.add(composite_index.get_key(obj), obj.id)
+
+@when(PersistentObject.deleting)
+def _handle_deleting(event):
+    obj = event.source
+    if obj.indexed:
+        for composite_index in obj.__class__.get_composite_indexes():
+            composite_index.index.remove(
+                composite_index.get_key(obj),
+                obj.id
+            )
+
+@when(PersistentObject.changed)
+def _handle_changed(event):
+    obj = event.source
+    if (
+        event.batch is None
+        and obj.indexed
+        and obj.is_inserted
+        and event.previous_value != event.value
+    ):
+        for composite_index in obj.__class__.get_composite_indexes():
+            if composite_index.covers(event.member):
+                index = composite_index.index
+                index.remove(
+                    composite_index.get_key(
+                        obj,
+                        {event.member.name: event.previous_value}
+                    ),
+                    obj.id
+                )
+                index.add(composite_index.get_key(obj), obj.id)
+
+@when(PersistentObject.batch_changed)
+def _handle_batch_changed(event):
+    obj = event.source
+    if obj.indexed and obj.is_inserted:
+        for composite_index in obj.__class__.get_composite_indexes():
+
+            # Update each index once, no matter how many of its members
+            # changed
+            previous_values = dict(
+                (change.member.name, change.previous_value)
+                for change in event.changes
+                if composite_index.covers(change.member)
+            )
+
+            if previous_values:
+                index = composite_index.index
+                index.remove(
+                    composite_index.get_key(obj, previous_values),
+                    obj.id
+                )
+                index.add(composite_index.get_key(obj), obj.id)
+
+
+class CompositeIndexExpression(expressions.Expression):
+    """A query filter resolved using a composite index.
+
+    The expression groups equality filters on a prefix of the members of the
+    index, and up to two range filters (a lower and an upper bound) on the
+    member that follows them.
+    """
+
+    def __init__(self, composite_index, prefix_filters, range_filters = ()):
+        self.prefix_filters = list(prefix_filters)
+        self.range_filters = list(range_filters)
+        expressions.Expression.__init__(
+            self,
+            *(self.prefix_filters + self.range_filters)
+        )
+        self.composite_index = composite_index
+
+    def __repr__(self):
+        return "%s(%s, %r)" % (
+            self.__class__.__name__,
+            self.composite_index.name,
+            list(self.operands)
+        )
+
+    @property
+    def covered_members(self):
+        """The number of members of the index constrained by the expression.
+        """
+        return len(self.prefix_filters) + (1 if self.range_filters else 0)
+
+    def op(self, *values):
+        return all(values)
+
+    def get_bounds(self):
+        """Obtains the range of index entries matched by the expression.
+
+        :return: The keyword arguments to pass to `MultipleValuesIndex.items`
+            or `MultipleValuesIndex.values`.
+        :rtype: dict
+        """
+        lower = None
+        upper = None
+
+        for expr in self.range_filters:
+            bound = (
+                expr.operands[1].value,
+                isinstance(expr, (
+                    expressions.GreaterExpression,
+                    expressions.LowerExpression
+                ))
+            )
+            if isinstance(expr, range_lower_bound_expressions):
+                lower = bound
+            else:
+                upper = bound
+
+        return self.composite_index.get_bounds(
+            [expr.operands[1].value for expr in self.prefix_filters],
+            lower,
+            upper
+        )
+
+    def resolve_filter(self, query):
+
+        def impl(dataset):
+            dataset.intersection_update(
+                self.composite_index.index.values(**self.get_bounds())
+            )
+            return dataset
+
+        return ((-2, 0), impl)
+
+    def estimate_filter(self, query):
+        from .indexstatistics import get_index_statistics
+        stats = get_index_statistics(self.composite_index.index)
+        return stats and stats.estimate_range(**self.get_bounds())
+
+
+range_lower_bound_expressions = (
+    expressions.GreaterExpression,
+    expressions.GreaterEqualExpression
+)
+
+range_upper_bound_expressions = (
+    expressions.LowerExpression,
+    expressions.LowerEqualExpression
+)
+
+def _iter_composite_index_matches(cls, filters):
+
+    equalities = []
+    ranges = []
+
+    for expr in filters:
+        if (
+            len(expr.operands) == 2
+            and isinstance(expr.operands[0], schema.Member)
+            and isinstance(expr.operands[1], expressions.Constant)
+        ):
+            if isinstance(expr, expressions.EqualExpression):
+                equalities.append(expr)
+            elif isinstance(expr, (
+                range_lower_bound_expressions
+                + range_upper_bound_expressions
+            )):
+                ranges.append(expr)
+
+    for composite_index in cls.get_composite_indexes():
+
+        prefix_filters = []
+
+        for member in composite_index.members:
+            for expr in equalities:
+                if expr.operands[0] is member:
+                    prefix_filters.append(expr)
+                    break
+            else:
+                break
+
+        range_filters = []
+        pos = len(prefix_filters)
+
+        if pos < len(composite_index.members):
+            member = composite_index.members[pos]
+            for bound_types in (
+                range_lower_bound_expressions,
+                range_upper_bound_expressions
+            ):
+                for expr in ranges:
+                    if isinstance(expr, bound_types) \
+                    and expr.operands[0] is member:
+                        range_filters.append(expr)
+                        break
+
+        yield CompositeIndexExpression(
+            composite_index,
+            prefix_filters,
+            range_filters
+        )
+
+def get_composite_index_filter(cls, filters):
+    """Finds the composite index that can resolve the largest number of the
+    given filters.
+
+    :param cls: The persistent class that the filters apply to.
+    :type cls: `PersistentClass`
+
+    :param filters: The filters to resolve. Nested filters joined by a logical
+        'and' should be given separately.
+    :type filters: `~cocktail.schema.expressions.Expression` sequence
+
+    :return: An expression that resolves a subset of the given filters, or
+        None if no composite index covers more than one of them.
+    :rtype: `CompositeIndexExpression`
+    """
+    best_match = None
+
+    for match in _iter_composite_index_matches(cls, filters):
+        if match.covered_members >= 2 and (
+            best_match is None
+            or match.covered_members > best_match.covered_members
+        ):
+            best_match = match
+
+    return best_match
+
+def get_composite_index_order(cls, filters, order):
+    """Finds a composite index that can sort the results of a query.
+
+    The index must start with members constrained by equality filters,
+    followed by the members in the sorting criteria, in the same order. The
+    direction of all the sorting criteria must either match the direction of
+    their members in the index or be the opposite for all of them.
+
+    :param cls: The persistent class that the query applies to.
+    :type cls: `PersistentClass`
+
+    :param filters: The filters of the query.
+    :type filters: `~cocktail.schema.expressions.Expression` sequence
+
+    :param order: The sorting criteria of the query.
+    :type order: sequence of `~cocktail.schema.expressions.PositiveExpression`
+        and `~cocktail.schema.expressions.NegativeExpression`
+
+    :return: A tuple containing an expression giving the range of index
+        entries to traverse and a boolean indicating if they should be
+        traversed in descending order, or None if no composite index can
+        sort the results.
+    """
+    for match in _iter_composite_index_matches(cls, filters):
+
+        members = match.composite_index.members
+        descending = match.composite_index.descending
+        pos = len(match.prefix_filters)
+
+        if not order \
+        or pos + len(order) > len(members) \
+        or (pos == 0 and len(order) == 1):
+            continue
+
+        reverse = None
+
+        for i, criteria in enumerate(order):
+            criteria_desc = isinstance(
+                criteria,
+                expressions.NegativeExpression
+            )
+            criteria_reverse = (criteria_desc != descending[pos + i])
+            if criteria.operands[0] is not members[pos + i] \
+            or (reverse is not None and criteria_reverse != reverse):
+                break
+            reverse = criteria_reverse
+        else:
+            return match, reverse
+
+    return None
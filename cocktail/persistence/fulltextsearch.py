@@ -147,7 +147,7 @@ def _create_full_text_index(self, language):
 PersistentClass.create_full_text_index = _create_full_text_index
 schema.String.create_full_text_index = _create_full_text_index
 
-def _persistent_class_index_text(self, obj, language = None):
+def _persistent_class_get_full_text(self, obj, language = None):
 
     languages = None if language is None else (language,)
 
@@ -165,7 +165,12 @@ def _persistent_class_index_text(self, obj, language = None):
                 for language in descend_language_tree(language):
                     text_by_language[language] = ""
 
-    for language, text in text_by_language.items():
+    return text_by_language
+
+PersistentClass.get_full_text = _persistent_class_get_full_text
+
+def _persistent_class_index_text(self, obj, language = None):
+    for language, text in self.get_full_text(obj, language).items():
         index = self.get_full_text_index(language)
         index.unindex_doc(obj.id)
         if text:
@@ -173,7 +178,7 @@ def _persistent_class_index_text(self, obj, language = None):
 
 PersistentClass.index_text = _persistent_class_index_text
 
-def _string_index_text(self, obj, language = None):
+def _string_get_full_text(self, obj, language = None):
 
     if self.translated:
         if language is None:
@@ -183,12 +188,21 @@ def _string_index_text(self, obj, language = None):
     else:
         languages = (None,)
 
+    text_by_language = {}
+
     for language in languages:
+        text = obj.get(self, language)
+        text_by_language[language] = normalize(text) if text else ""
+
+    return text_by_language
+
+schema.String.get_full_text = _string_get_full_text
+
+def _string_index_text(self, obj, language = None):
+    for language, text in self.get_full_text(obj, language).items():
         index = self.get_full_text_index(language)
         index.unindex_doc(obj.id)
-        text = obj.get(self, language)
         if text:
-            text = normalize(text)
             index.index_doc(obj.id, text)
 
 schema.String.index_text = _string_index_text
@@ -196,7 +210,8 @@ schema.String.index_text = _string_index_text
 @when(PersistentObject.changed)
 def _handle_changed(event):
 
-    if not indexing_enabled:
+    # Batched changes are handled by _handle_batch_changed
+    if not indexing_enabled or event.batch is not None:
         return
 
     obj = event.source
@@ -212,6 +227,31 @@ def _handle_changed(event):
         if event.member.text_search:
             _cascade_index(obj, event.language, set())
 
+@when(PersistentObject.batch_changed)
+def _handle_batch_changed(event):
+
+    if not indexing_enabled:
+        return
+
+    obj = event.source
+
+    if not obj.is_inserted:
+        return
+
+    cascade_languages = []
+
+    for change in event.changes:
+        if obj._should_index_member_full_text(change.member):
+            change.member.index_text(obj, change.language)
+
+        if change.member.text_search \
+        and change.language not in cascade_languages:
+            cascade_languages.append(change.language)
+
+    # Reindex the whole object (and related objects) once per language
+    for language in cascade_languages:
+        _cascade_index(obj, language, set())
+
 def _cascade_index(obj, language, visited):
 
     if obj in visited:
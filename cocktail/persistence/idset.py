@@ -0,0 +1,213 @@
+#-*- coding: utf-8 -*-
+"""Defines the `IdSet` class.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from collections.abc import MutableSet, Set
+from BTrees.IIBTree import (
+    IISet,
+    IITreeSet,
+    intersection,
+    union,
+    difference,
+    multiunion
+)
+from BTrees.IOBTree import IOTreeSet, IOSet, IOBTree, IOBucket
+
+# Integer keys in the BTrees "I" family are 32 bit signed integers
+MIN_ID = -2 ** 31
+MAX_ID = 2 ** 31 - 1
+
+compatible_set_types = (IISet, IITreeSet)
+sorted_integer_collection_types = (IOTreeSet, IOSet, IOBTree, IOBucket)
+
+
+class IdSet(MutableSet):
+    """A compact set of integer identifiers.
+
+    Queries use id sets to hold their intermediate results when filtering
+    objects with an integer primary member. The set is backed by an
+    `~BTrees.IIBTree.IISet`: a sorted array of machine integers, which takes a
+    fraction of the memory of a regular `set` of Python integers, and that
+    supports fast intersection, union and difference operations implemented
+    in C.
+
+    The class implements the interface of regular sets, so it can be used as a
+    drop-in replacement by `filter implementations <Query._apply_filters>`.
+    Identifiers that can't be represented by the set (non integer values, or
+    integers out of its range) never match its contents: they are ignored by
+    membership tests, intersections and differences, and raise a `TypeError`
+    if added to the set.
+
+    Updating the set in place is efficient when done in bulk (using
+    `intersection_update`, `difference_update` or `update`). Adding or
+    discarding items one by one has a linear cost.
+    """
+
+    __slots__ = ("_ids",)
+    __hash__ = None
+
+    def __init__(self, items = None):
+        if items is None:
+            self._ids = IISet()
+        else:
+            ids = _coerce(items, True)
+            # Don't share storage with other sets
+            if isinstance(items, (IdSet,) + compatible_set_types):
+                ids = IISet(ids)
+            self._ids = ids
+
+    @classmethod
+    def _from_iterable(cls, items):
+        return cls(items)
+
+    @classmethod
+    def _wrap(cls, ids):
+        id_set = cls.__new__(cls)
+        id_set._ids = ids
+        return id_set
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, item):
+        return _is_valid_id(item) and self._ids.has_key(item)
+
+    def __bool__(self):
+        return bool(self._ids)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self._ids),))
+
+    def copy(self):
+        return self._wrap(IISet(self._ids))
+
+    # Set operations
+    #--------------------------------------------------------------------------
+    def intersection(self, *others):
+        ids = self._ids
+        for other in others:
+            ids = intersection(ids, _coerce(other))
+        return self._wrap(ids if others else IISet(ids))
+
+    def union(self, *others):
+        ids = self._ids
+        for other in others:
+            ids = union(ids, _coerce(other, True))
+        return self._wrap(ids if others else IISet(ids))
+
+    def difference(self, *others):
+        ids = self._ids
+        for other in others:
+            ids = difference(ids, _coerce(other))
+        return self._wrap(ids if others else IISet(ids))
+
+    def intersection_update(self, *others):
+        for other in others:
+            self._ids = intersection(self._ids, _coerce(other))
+
+    def update(self, *others):
+        for other in others:
+            self._ids = union(self._ids, _coerce(other, True))
+
+    def difference_update(self, *others):
+        for other in others:
+            self._ids = difference(self._ids, _coerce(other))
+
+    def issubset(self, other):
+        return len(intersection(self._ids, _coerce(other))) == len(self._ids)
+
+    def issuperset(self, other):
+        other = _coerce(other, True)
+        return len(intersection(self._ids, other)) == len(other)
+
+    def isdisjoint(self, other):
+        return not intersection(self._ids, _coerce(other))
+
+    def __and__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.intersection(other)
+
+    __rand__ = __and__
+
+    def __or__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.union(other)
+
+    __ror__ = __or__
+
+    def __sub__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        return self.difference(other)
+
+    def __rsub__(self, other):
+        if not isinstance(other, Set):
+            return NotImplemented
+        # The other set may hold values that can't be stored in an id set
+        return set(item for item in other if item not in self)
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    # Item operations
+    #--------------------------------------------------------------------------
+    def add(self, item):
+        self._ids.insert(item)
+
+    def discard(self, item):
+        if item in self:
+            self._ids.remove(item)
+
+    def clear(self):
+        self._ids = IISet()
+
+
+def _is_valid_id(item):
+    return isinstance(item, int) and MIN_ID <= item <= MAX_ID
+
+def _coerce(items, strict = False):
+    """Obtain a set of the "II" BTree family with the given identifiers.
+
+    Identifiers that can't be stored in the set are dropped, unless `strict`
+    is set, in which case a `TypeError` is raised.
+    """
+    if isinstance(items, IdSet):
+        return items._ids
+
+    if isinstance(items, compatible_set_types):
+        return items
+
+    # Already sorted, so they can be copied in linear time
+    if isinstance(items, sorted_integer_collection_types):
+        return IISet(items)
+
+    if not isinstance(items, (list, tuple)):
+        items = list(items)
+
+    try:
+        return multiunion(items)
+    except (TypeError, OverflowError):
+        if strict:
+            raise TypeError(
+                "IdSet can only contain integers between %d and %d"
+                % (MIN_ID, MAX_ID)
+            )
+        return multiunion([item for item in items if _is_valid_id(item)])
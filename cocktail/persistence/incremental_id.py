@@ -55,7 +55,7 @@ def incremental_id_slice_size_context(size, key = None):
 @when(datastore.connection_opened)
 def create_container(event):
     root = event.source.root
-    if ID_CONTAINER_KEY not in root:
+    if ID_CONTAINER_KEY not in root and not datastore.storage.isReadOnly():
         root[ID_CONTAINER_KEY] = PersistentMapping()
         datastore.commit()
 
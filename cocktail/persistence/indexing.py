@@ -7,6 +7,7 @@
 @since:			March 2009
 """
 
+import datetime
 from BTrees.IOBTree import IOBTree, IOTreeSet
 from BTrees.OOBTree import OOBTree, OOTreeSet
 from cocktail.stringutils import normalize
@@ -138,36 +139,65 @@ schema.Member.create_index = _create_index
 
 def _rebuild_index(self):
 
-    self.create_index()
+    index = self.create_index()
 
     for obj in self.schema.select():
-        if obj.indexed and obj._should_index_member(self):
-            if self.translated:
-                indexed_languages = set()
-                for language in obj.translations:
-                    for lang in descend_language_tree(language):
-                        if lang in indexed_languages:
-                            continue
-                        indexed_languages.add(lang)
-                        value = obj.get(self, lang)
-                        add_index_entry(obj, self, value, lang)
-            else:
-                add_index_entry(obj, self, obj.get(self))
+        for key, value in iter_index_entries(obj, self):
+            index.add(key, value)
 
 schema.Member.rebuild_index = _rebuild_index
 
-def _rebuild_collection_index(self):
+def iter_index_entries(obj, member):
+    """Produces the entries that should be added to the index of a member in
+    order to index the given object.
 
-    self.create_index()
+    :param obj: The object to index.
+    :type obj: `PersistentObject`
 
-    for obj in self.schema.select():
-        if obj.indexed and obj._should_index_member(self):
-            value = obj.get(self)
-            if value is not None:
-                for item in value:
-                    add_index_entry(obj, self, item)
+    :param member: The indexed member.
+    :type member: `~cocktail.schema.Member`
+
+    :return: An iterable sequence of key, value pairs.
+    """
+    if not obj.indexed or not obj._should_index_member(member):
+        return
+
+    if member.translated:
+        indexed_languages = set()
+        for language in obj.translations:
+            for lang in descend_language_tree(language):
+                if lang in indexed_languages:
+                    continue
+                indexed_languages.add(lang)
+                yield from _iter_value_index_entries(
+                    obj,
+                    member,
+                    obj.get(member, lang),
+                    lang
+                )
+    elif isinstance(member, schema.Collection):
+        items = obj.get(member)
+        if items is not None:
+            for item in items:
+                yield from _iter_value_index_entries(obj, member, item)
+    else:
+        yield from _iter_value_index_entries(obj, member, obj.get(member))
+
+def _iter_value_index_entries(obj, member, value, language = None):
+
+    # Single value indexes (see _create_index) can't hold None
+    if value is None and member.unique and member.required:
+        return
+
+    if is_broken(obj) or is_broken(value):
+        return
+
+    key = member.get_index_value(value)
+
+    if language:
+        key = (language, key)
 
-schema.Collection.rebuild_index = _rebuild_collection_index
+    yield key, (obj if member.primary else obj.id)
 
 def _rebuild_indexes(cls, recursive = False, verbose = True):
 
@@ -215,37 +245,48 @@ def _handle_declared(event):
 
 @when(PersistentObject.changed)
 def _handle_changed(event):
+    # Batched changes are handled by _handle_batch_changed
+    if event.batch is None:
+        _update_member_index(event.source, event)
+
+@when(PersistentObject.batch_changed)
+def _handle_batch_changed(event):
     obj = event.source
+    if obj.is_inserted:
+        for change in event.changes:
+            _update_member_index(obj, change)
+
+def _update_member_index(obj, change):
     if (
-        obj._should_index_member(event.member)
+        obj._should_index_member(change.member)
         and obj.is_inserted
-        and not isinstance(event.member, schema.Collection)
-        and event.previous_value != event.value
+        and not isinstance(change.member, schema.Collection)
+        and change.previous_value != change.value
     ):
-        if event.member.translated:
-            for lang, previous_value in event.translation_changes.items():
+        if change.member.translated:
+            for lang, previous_value in change.translation_changes.items():
                 remove_index_entry(
-                    event.source,
-                    event.member,
+                    obj,
+                    change.member,
                     previous_value,
                     lang
                 )
                 add_index_entry(
-                    event.source,
-                    event.member,
-                    event.value,
+                    obj,
+                    change.member,
+                    change.value,
                     lang
                 )
         else:
             remove_index_entry(
-                event.source,
-                event.member,
-                event.previous_value
+                obj,
+                change.member,
+                change.previous_value
             )
             add_index_entry(
-                event.source,
-                event.member,
-                event.value
+                obj,
+                change.member,
+                change.value
             )
 
 @when(PersistentObject.collection_item_added)
@@ -504,6 +545,50 @@ def _collection_get_index_value(self, value):
 
 schema.Collection.get_index_value = _collection_get_index_value
 
+# Restoring values from their index keys. Used by projection queries (see
+# `Query.values`) to read member values straight from indexes, without loading
+# the indexed objects. Members whose index keys can't be mapped back to their
+# values (or that can hold more than one value) should set
+# `restorable_index_values` to False.
+schema.Member.restorable_index_values = True
+schema.String.restorable_index_values = property(
+    lambda self: not self.normalized_index
+)
+schema.Collection.restorable_index_values = False
+
+def _member_restore_index_value(self, key):
+    return key
+
+schema.Member.restore_index_value = _member_restore_index_value
+
+def _datetime_restore_index_value(self, key):
+    if key is not None:
+        key = datetime.datetime(*key)
+    return key
+
+schema.DateTime.restore_index_value = _datetime_restore_index_value
+
+def _date_restore_index_value(self, key):
+    if key is not None:
+        key = datetime.date(*key)
+    return key
+
+schema.Date.restore_index_value = _date_restore_index_value
+
+def _time_restore_index_value(self, key):
+    if key is not None:
+        key = datetime.time(*key)
+    return key
+
+schema.Time.restore_index_value = _time_restore_index_value
+
+def _reference_restore_index_value(self, key):
+    if key is not None:
+        key = self.type.index.get(key)
+    return key
+
+schema.Reference.restore_index_value = _reference_restore_index_value
+
 
 class IdCollisionError(Exception):
     """An exception raised when trying to insert an object into the datastore
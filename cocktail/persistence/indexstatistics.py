@@ -0,0 +1,246 @@
+#-*- coding: utf-8 -*-
+"""Defines the `IndexStatistics` class.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from time import time
+from threading import Lock, Thread
+from .index import Index, undefined
+from .multiplevaluesindex import _cmp_key
+
+_statistics = {}
+_pending = set()
+_pending_lock = Lock()
+
+
+class IndexStatistics(object):
+    """Describes the distribution of the keys in an `index <Index>`.
+
+    Statistics are used by `queries <Query>` to estimate the number of entries
+    matched by each filter, so that the most selective filters can be applied
+    first.
+
+    They are gathered using a single ordered pass over the keys of the index,
+    which produces its cardinality and an equi-depth histogram: a list of keys
+    sampled at regular intervals, so that each pair of consecutive boundaries
+    delimits roughly the same number of entries. Since the pass is linear on
+    the size of the index, statistics for stored indexes are gathered in the
+    background (see `get_index_statistics`).
+    """
+
+    histogram_size = 100
+    """The maximum number of boundaries in the histogram."""
+
+    max_age = 300
+    """The number of seconds before the statistics are considered stale and
+    are gathered again.
+    """
+
+    def __init__(self, index, histogram_size = None):
+
+        if histogram_size is not None:
+            self.histogram_size = histogram_size
+
+        self.timestamp = time()
+        self.entries = len(index)
+        self.distinct_keys = 0
+        self.boundaries = []
+        self.positions = []
+
+        step = max(1, self.entries // self.histogram_size)
+        prev_key = undefined
+        pos = -1
+
+        for pos, key in enumerate(index.keys()):
+            if key != prev_key:
+                self.distinct_keys += 1
+                prev_key = key
+
+            if not pos % step:
+                self.boundaries.append(key)
+                self.positions.append(pos)
+
+        # Always include the last key, to know the upper bound of the index
+        if pos >= 0 and self.positions[-1] != pos:
+            self.boundaries.append(prev_key)
+            self.positions.append(pos)
+
+    def __repr__(self):
+        return "%s(entries = %d, distinct_keys = %d)" % (
+            self.__class__.__name__,
+            self.entries,
+            self.distinct_keys
+        )
+
+    @property
+    def expired(self):
+        """Indicates if the statistics should be gathered again."""
+        return time() - self.timestamp > self.max_age
+
+    def estimate_equal(self, key):
+        """Estimates the number of entries defined for the given key.
+
+        :param key: The key to evaluate.
+        :return: The estimated number of entries.
+        :rtype: float
+        """
+        if not self.boundaries \
+        or _cmp_key(key, self.boundaries[0]) < 0 \
+        or _cmp_key(key, self.boundaries[-1]) > 0:
+            return 0
+
+        # Frequent keys span several histogram buckets; the rest are assumed
+        # to follow a uniform distribution
+        return max(
+            self._rank(key, True) - self._rank(key, False),
+            self.entries / self.distinct_keys
+        )
+
+    def estimate_range(
+        self,
+        min = undefined,
+        max = undefined,
+        exclude_min = False,
+        exclude_max = False
+    ):
+        """Estimates the number of entries that fall within the given range of
+        keys.
+
+        Parameters follow the same semantics as those of `Index.items`.
+
+        :return: The estimated number of entries.
+        :rtype: float
+        """
+        lower = 0 if min is undefined else self._rank(min, exclude_min)
+        upper = (
+            self.entries
+            if max is undefined
+            else self._rank(max, not exclude_max)
+        )
+        return upper - lower if upper > lower else 0
+
+    def _rank(self, key, inclusive):
+        """Estimates the number of entries whose key is lower than the given
+        key (or lower or equal, if `inclusive` is set).
+        """
+        boundaries = self.boundaries
+        lo = 0
+        hi = len(boundaries)
+
+        # Find the number of boundaries that precede the key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            comp = _cmp_key(boundaries[mid], key)
+            if comp < 0 or (inclusive and comp == 0):
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == 0:
+            return 0
+        elif lo == len(boundaries):
+            return self.entries
+        else:
+            return (self.positions[lo - 1] + 1 + self.positions[lo]) / 2
+
+
+def get_index_statistics(index):
+    """Obtains the statistics for the given index.
+
+    Statistics are kept in memory, and shared by all the connections to the
+    same database. To keep queries from stalling on large indexes, statistics
+    for stored indexes are gathered by a background thread, using its own
+    connection: the function returns None until they are first available,
+    and keeps returning the previous statistics while they are refreshed
+    after `IndexStatistics.max_age` seconds. Statistics for indexes that
+    haven't been stored yet are gathered right away.
+
+    :param index: The index to obtain the statistics for.
+    :type index: `Index`
+
+    :return: The statistics for the index, or None if the given object is not
+        an `Index` or its statistics are not available yet.
+    :rtype: `IndexStatistics`
+    """
+    if not isinstance(index, Index):
+        return None
+
+    key = _get_statistics_key(index)
+
+    if key is None:
+        stats = getattr(index, "_v_statistics", None)
+        if stats is None or stats.expired:
+            stats = index._v_statistics = IndexStatistics(index)
+        return stats
+
+    stats = _statistics.get(key)
+
+    if stats is None or stats.expired:
+        with _pending_lock:
+            if key in _pending:
+                return stats
+            _pending.add(key)
+
+        Thread(
+            target = _gather_statistics,
+            args = (index._p_jar.db(), key),
+            name = "IndexStatistics(%r)" % (key,),
+            daemon = True
+        ).start()
+
+    return stats
+
+def refresh_index_statistics(index):
+    """Gathers the statistics for the given index right away.
+
+    Useful to prepare statistics outside of the processing of requests (ie.
+    after rebuilding indexes, or when starting an application).
+
+    :param index: The index to gather the statistics for.
+    :type index: `Index`
+
+    :return: The new statistics for the index.
+    :rtype: `IndexStatistics`
+    """
+    stats = IndexStatistics(index)
+    key = _get_statistics_key(index)
+
+    if key is None:
+        index._v_statistics = stats
+    else:
+        _statistics[key] = stats
+
+    return stats
+
+def _gather_statistics(db, key):
+    try:
+        connection = db.open()
+        try:
+            _statistics[key] = IndexStatistics(connection.get(key[1]))
+        finally:
+            connection.close()
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+def clear_index_statistics(index = None):
+    """Discards the statistics for the given index, or for all indexes.
+
+    :param index: The index whose statistics should be discarded. If not
+        given, all statistics are discarded.
+    :type index: `Index`
+    """
+    if index is None:
+        _statistics.clear()
+    else:
+        key = _get_statistics_key(index)
+        if key is None:
+            index._v_statistics = None
+        else:
+            _statistics.pop(key, None)
+
+def _get_statistics_key(index):
+    # Indexes that haven't been stored yet have no OID
+    if index._p_oid is None or index._p_jar is None:
+        return None
+    return (index._p_jar.db().database_name, index._p_oid)
@@ -0,0 +1,348 @@
+#-*- coding: utf-8 -*-
+"""Rebuild the indexes of persistent classes using a pool of processes.
+
+Rebuilding indexes with `~PersistentClass.rebuild_indexes` walks every
+instance of a class serially, which can take a very long time on large
+databases. `rebuild_indexes_in_parallel` splits the identifiers of the
+indexed objects in partitions and computes their index entries in a pool of
+worker processes, each with its own read only connection to the database.
+The main process collects the entries for each class, and as soon as all of
+its partitions have been processed it loads them into new indexes, in key
+order, flushing changes to the storage at regular intervals::
+
+    from cocktail.persistence.parallelrebuild import (
+        rebuild_indexes_in_parallel
+    )
+
+    rebuild_indexes_in_parallel(
+        Publishable,
+        recursive = True,
+        full_text = True,
+        workers = 8
+    )
+
+Worker processes are forked from the calling process, and read the last
+committed state of the database: changes pending in the current transaction
+are not taken into account.
+
+Memory usage is not constant: the main process keeps all the index entries
+computed for a class until they are loaded, so the peak is proportional to
+the number of instances of the largest class being processed (plus any
+partitions of the following classes completed in the meantime).
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from typing import Any, Callable, Sequence, Tuple
+from functools import partial
+from multiprocessing import get_context
+from threading import local
+import transaction
+from ZODB.FileStorage import FileStorage
+from cocktail import schema
+from .datastore import datastore
+from .persistentmapping import PersistentMapping
+from .persistentobject import PersistentClass
+from .singlevalueindex import SingleValueIndex
+from .multiplevaluesindex import Entry
+from .indexing import iter_index_entries
+
+Target = Tuple[str, Any]
+
+
+def rebuild_indexes_in_parallel(
+        cls: PersistentClass,
+        recursive: bool = False,
+        full_text: bool = False,
+        workers: int = None,
+        partition_size: int = 1000,
+        chunk_size: int = 10000,
+        storage_factory: Callable = None,
+        commit: bool = True,
+        verbose: bool = True,
+        progress: Callable[[int, int], None] = None):
+    """Rebuilds the indexes of a persistent class using a pool of processes.
+
+    :param cls: The class to rebuild the indexes for. Includes member indexes
+        and `composite indexes <CompositeIndex>`.
+
+    :param recursive: If set, the indexes of derived classes are rebuilt too.
+
+    :param full_text: If set, full text indexes are rebuilt too.
+
+    :param workers: The number of worker processes. Defaults to the number of
+        CPUs in the system.
+
+    :param partition_size: The number of objects processed by each task sent
+        to a worker.
+
+    :param chunk_size: The number of index entries to load before flushing
+        changes to the storage (using a savepoint), to bound the size of the
+        pending changes held by the transaction.
+
+    :param storage_factory: A callable that opens a read only storage for
+        the database, used by worker processes. Defaults to the value returned
+        by `get_read_only_storage_factory` for the current storage.
+
+    :param commit: If set, the transaction is committed once all indexes have
+        been loaded.
+
+    :param verbose: If set, progress is printed to the standard output.
+
+    :param progress: A callable that will be invoked after processing each
+        partition, receiving the number of processed objects and the total
+        number of objects.
+    """
+    if storage_factory is None:
+        storage_factory = get_read_only_storage_factory(datastore.storage)
+
+    classes = [cls]
+    if recursive:
+        classes.extend(cls.derived_schemas())
+
+    jobs = []
+    for job_class in classes:
+        targets = get_rebuild_targets(job_class, full_text)
+        if targets:
+            jobs.append((job_class, targets))
+
+    # Partition the id space of each class
+    tasks = []
+    pending_tasks = {}
+    for job_class, targets in jobs:
+        ids = list(job_class.keys)
+        pending_tasks[job_class.full_name] = 0
+        for i in range(0, len(ids), partition_size):
+            tasks.append(
+                (job_class.full_name, targets, ids[i:i + partition_size])
+            )
+            pending_tasks[job_class.full_name] += 1
+
+    empty_jobs = [
+        (job_class, targets)
+        for job_class, targets in jobs
+        if not pending_tasks[job_class.full_name]
+    ]
+    total = sum(len(task[2]) for task in tasks)
+    done = 0
+    entries = {}
+
+    def load_class(job_class, targets):
+        for target in targets:
+            _load_entries(
+                job_class,
+                target,
+                entries.pop((job_class.full_name, target), []),
+                chunk_size,
+                verbose
+            )
+
+    # Compute index entries in worker processes. The entries for each class
+    # are loaded as soon as all of its partitions have been processed, so
+    # that only the entries for the classes in progress are kept in memory.
+    if tasks:
+        job_targets = dict(
+            (job_class.full_name, (job_class, targets))
+            for job_class, targets in jobs
+        )
+        pool = get_context("fork").Pool(
+            workers,
+            initializer = _init_worker,
+            initargs = (storage_factory,)
+        )
+        try:
+            for class_name, count, task_entries in pool.imap_unordered(
+                _compute_entries,
+                tasks
+            ):
+                for target, target_entries in task_entries.items():
+                    entries.setdefault((class_name, target), []) \
+                        .extend(target_entries)
+
+                done += count
+
+                if progress is not None:
+                    progress(done, total)
+
+                if verbose:
+                    print("Processed %d/%d objects" % (done, total))
+
+                pending_tasks[class_name] -= 1
+                if not pending_tasks[class_name]:
+                    load_class(*job_targets[class_name])
+        finally:
+            pool.close()
+            pool.join()
+
+    # Create empty indexes for classes without instances
+    for job_class, targets in empty_jobs:
+        load_class(job_class, targets)
+
+    if commit:
+        datastore.commit()
+
+def get_rebuild_targets(
+        cls: PersistentClass,
+        full_text: bool = False) -> Sequence[Target]:
+    """Determines the indexes declared by a class that should be rebuilt.
+
+    :param cls: The class to inspect. Indexes declared by its base classes
+        are not included.
+
+    :param full_text: If set, include full text indexes.
+
+    :return: A list of (kind, name) tuples, describing each index.
+    """
+    targets = []
+
+    if not cls.indexed:
+        return targets
+
+    for member in cls.members(False).values():
+        if member.indexed and not member.primary:
+            targets.append(("member", member.name))
+
+    for i, composite_index in enumerate(cls.get_composite_indexes(False)):
+        targets.append(("composite", i))
+
+    # Mirrors the criteria used by PersistentClass.rebuild_full_text_indexes
+    if full_text and cls.translation_source is None:
+
+        if cls.full_text_indexed and not any(
+            isinstance(base, PersistentClass) and base.full_text_indexed
+            for base in cls.bases
+        ):
+            targets.append(("full_text", None))
+
+        for member in cls.iter_members(recursive = False):
+            if member.full_text_indexed:
+                targets.append(("full_text", member.name))
+
+    return targets
+
+def get_read_only_storage_factory(storage) -> Callable:
+    """Obtains a callable that opens a read only copy of the given storage.
+
+    Supports file storages and ZEO client storages.
+
+    :param storage: The storage to open.
+
+    :return: A callable that takes no arguments and returns a new storage.
+
+    :raise ValueError: Raised for unsupported storage types.
+    """
+    if isinstance(storage, FileStorage):
+        return partial(FileStorage, storage._file_name, read_only = True)
+
+    try:
+        from ZEO.ClientStorage import ClientStorage
+    except ImportError:
+        pass
+    else:
+        if isinstance(storage, ClientStorage):
+            return partial(
+                ClientStorage,
+                storage._addr,
+                storage = storage._storage,
+                read_only = True
+            )
+
+    raise ValueError(
+        "Can't open %r in read only mode; supply a storage factory"
+        % storage
+    )
+
+# State inherited from the parent process, kept alive by worker processes
+_inherited_state = []
+
+def _init_worker(storage_factory):
+    # Abandon the connection and storage inherited from the parent process
+    # without closing them: closing them would flush buffered writes to files
+    # shared with the parent, and move their offsets
+    _inherited_state.append((datastore._thread_data, datastore.storage))
+    datastore._thread_data = local()
+    datastore.storage = storage_factory()
+
+def _compute_entries(task):
+
+    class_name, targets, ids = task
+    cls = schema.get_schema(class_name)
+    composite_indexes = cls.get_composite_indexes(False)
+    instances = cls.index
+
+    resolved_targets = []
+    for target in targets:
+        kind, name = target
+        if kind == "composite":
+            source = composite_indexes[name]
+        elif name is None:
+            source = cls
+        else:
+            source = cls[name]
+        resolved_targets.append((target, kind, source))
+
+    entries = dict((target, []) for target in targets)
+
+    for id in ids:
+
+        obj = instances.get(id)
+        if obj is None:
+            continue
+
+        for target, kind, source in resolved_targets:
+            target_entries = entries[target]
+            if kind == "member":
+                target_entries.extend(iter_index_entries(obj, source))
+            elif kind == "composite":
+                if obj.indexed:
+                    target_entries.append((source.get_key(obj), obj.id))
+            else:
+                for language, text in source.get_full_text(obj).items():
+                    if text:
+                        target_entries.append((obj.id, language, text))
+
+        obj._p_deactivate()
+
+    datastore.connection.cacheGC()
+    return class_name, len(ids), entries
+
+def _load_entries(cls, target, entries, chunk_size, verbose):
+
+    kind, name = target
+
+    if kind == "full_text":
+        source = cls if name is None else cls[name]
+        if verbose:
+            print("Rebuilding full text index for %s" % source)
+
+        datastore.root[source.full_text_index_key] = PersistentMapping()
+        entries.sort(key = lambda entry: entry[0])
+
+        for i, (id, language, text) in enumerate(entries):
+            source.get_full_text_index(language).index_doc(id, text)
+            if (i + 1) % chunk_size == 0:
+                transaction.savepoint(True)
+        return
+
+    if kind == "composite":
+        source = cls.get_composite_indexes(False)[name]
+    else:
+        source = cls[name]
+
+    if verbose:
+        print("Rebuilding index for %s" % source)
+
+    index = source.create_index()
+
+    # Inserting keys in order fills BTree buckets sequentially
+    if isinstance(index, SingleValueIndex):
+        try:
+            entries.sort(key = lambda entry: entry[0])
+        except TypeError:
+            pass
+    else:
+        entries.sort(key = lambda entry: Entry(*entry))
+
+    for i, (key, value) in enumerate(entries):
+        index.add(key, value)
+        if (i + 1) % chunk_size == 0:
+            transaction.savepoint(True)
@@ -6,11 +6,16 @@
 @organization:	Whads/Accent SL
 @since:			July 2008
 """
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from decimal import Decimal
 from typing import Iterable
 from time import time
 from warnings import warn
 from itertools import chain, islice
-from collections import deque
+from heapq import nsmallest
+from collections import deque, namedtuple
+from collections.abc import Set
 from BTrees.IIBTree import IIBTree
 from BTrees.OIBTree import OIBTree
 from BTrees.IOBTree import IOTreeSet, IOSet
@@ -32,14 +37,51 @@ from cocktail.schema import (
     RelationMember
 )
 from cocktail.schema.expressions import TranslationExpression
+from cocktail.caching import CacheKeyError
+from .index import Index
+from .indexstatistics import get_index_statistics
+from .utils import iter_descending_items, prefetch_objects
+from .idset import IdSet
 
 inherit = object()
 
 class Query(object):
-    """A query over a set of persistent objects."""
+    """A query over a set of persistent objects.
+
+    .. attribute:: result_cache
+
+        A `cache <cocktail.caching.Cache>` used to share the results of the
+        query with other queries with the same parameters. Defaults to
+        `~cocktail.persistence.querycache.query_result_cache`; set to None to
+        disable shared results for the query.
+
+    .. attribute:: prefetch
+
+        When set, iterating over the query loads its objects in batches of
+        `prefetch_size` objects (see
+        `~cocktail.persistence.utils.prefetch_objects`), instead of loading
+        them one by one as they are accessed.
+
+    .. attribute:: prefetch_related
+
+        A collection of relations (members or member names, optionally
+        dotted) to load along with each batch of objects. Setting it implies
+        `prefetch`.
+
+    .. attribute:: projection_scan_ratio
+
+        The maximum number of index entries that `values` is willing to scan
+        per selected row in order to read a member from its index, instead
+        of loading the objects that hold its values.
+    """
 
     verbose = False
     watch = None
+    result_cache = None
+    prefetch = False
+    prefetch_size = 100
+    prefetch_related = ()
+    projection_scan_ratio = 50
 
     styles = {
         "header":
@@ -54,6 +96,8 @@ class Query(object):
             ),
         "cached":
             (lambda t: " " * 4 + styled(t, "black", "bright_green")),
+        "shared":
+            (lambda t: " " * 4 + styled(t, "black", "pink")),
         "phase":
             (lambda t: " " * 4 + styled(t, "white", "black", "underline")),
         "eval":
@@ -89,7 +133,9 @@ class Query(object):
         base_collection = None,
         cached = True,
         verbose = None,
-        description = None
+        description = None,
+        prefetch = None,
+        prefetch_related = None
     ):
         self.__type = type
         self.__filters = None
@@ -100,6 +146,8 @@ class Query(object):
         self.__cached_results_sorted = False
         self.__cached_results_sliced = False
         self.__cached_length = None
+        self.__cursor = None
+        self.__cursor_position = None
 
         self.filters = filters or []
         self.order = order or []
@@ -112,6 +160,12 @@ class Query(object):
         if verbose is not None:
             self.verbose = verbose
 
+        if prefetch is not None:
+            self.prefetch = prefetch
+
+        if prefetch_related is not None:
+            self.prefetch_related = prefetch_related
+
     def __repr__(self):
         return (
             "Query("
@@ -318,6 +372,157 @@ class Query(object):
         @type: (int, int) tuple
         """)
 
+    @property
+    def cursor(self):
+        """The cursor that the query resumes from, as given to `after`.
+        @type: str
+        """
+        return self.__cursor
+
+    def after(self, cursor):
+        """Produces a copy of the query that resumes after the given position.
+
+        This provides keyset pagination: instead of skipping a number of
+        results (as `range` does), the query seeks the position of the last
+        seen object directly on the index used to sort the results, so the
+        cost of retrieving a page doesn't depend on its depth.
+
+        Keyset pagination requires the query to be sorted using the fast path
+        for indexed members: the first sorting criteria must be an indexed,
+        non translated member, and further criteria are only allowed if its
+        index doesn't contain duplicate keys. Queries without an explicit
+        order are sorted by their primary member.
+
+        :param cursor: A cursor obtained from `cursor_for`. If None, the
+            query starts from the first result.
+        :type cursor: str
+
+        :return: The new query. Its `range`, if given, is applied relative to
+            the cursor.
+        :rtype: `Query`
+
+        :raise ValueError: Raised if the cursor is not valid, or if the
+            query can't be paginated using cursors.
+        """
+        signature = self._get_keyset_info()[0]
+        child_query = self.select()
+
+        if cursor is not None:
+            try:
+                cursor_signature, key, id = json.loads(
+                    urlsafe_b64decode(
+                        cursor + "=" * (-len(cursor) % 4)
+                    ).decode("utf-8"),
+                    object_hook = _decode_cursor_value
+                )
+            except (TypeError, ValueError) as error:
+                raise ValueError("Invalid query cursor: %r" % cursor) \
+                    from error
+
+            if cursor_signature != signature:
+                raise ValueError(
+                    "Cursor %r was produced by a query with a different "
+                    "order" % cursor
+                )
+
+            child_query.__cursor_position = (key, id)
+
+        child_query.__cursor = cursor
+        child_query.__cached_results_sorted = False
+        child_query.__cached_results_sliced = False
+        return child_query
+
+    def cursor_for(self, item):
+        """Obtains a cursor for the position of the given object in the
+        results of the query.
+
+        :param item: The last seen object.
+        :type item: `~cocktail.persistence.PersistentObject`
+
+        :return: An opaque, URL safe token that can be passed to `after` to
+            obtain the results that follow the object.
+        :rtype: str
+
+        :raise ValueError: Raised if the query can't be paginated using
+            cursors.
+        """
+        signature, expr = self._get_keyset_info()
+
+        if expr.primary:
+            key = item.id
+        else:
+            key = expr.get_index_value(item.get(expr))
+
+        cursor = json.dumps(
+            [signature, _encode_cursor_value(key), item.id],
+            separators = (",", ":")
+        )
+        return urlsafe_b64encode(cursor.encode("utf-8")) \
+            .decode("ascii").rstrip("=")
+
+    def iter_pages(self, page_size = 100, cursor = None):
+        """Iterates over the results of the query in pages, using cursors to
+        resume each page from the end of the previous one.
+
+        Filters are only resolved once; each page costs work proportional to
+        its size, which makes this method appropiate to traverse large
+        result sets (ie. exports).
+
+        :param page_size: The maximum number of objects in each page.
+        :type page_size: int
+
+        :param cursor: An optional cursor to start from, as produced by
+            `cursor_for`.
+        :type cursor: str
+
+        :return: An iterable sequence of lists of objects.
+        """
+        self._get_keyset_info()
+
+        base_query = self.select(range = None)
+        base_query.cached = True
+        base_query.execute(_sorted = False, _sliced = False)
+
+        while True:
+            page_query = base_query.after(cursor)
+            page_query.range = (0, page_size)
+            page = list(page_query)
+
+            if page:
+                yield page
+
+            if len(page) < page_size:
+                break
+
+            cursor = base_query.cursor_for(page[-1])
+
+    def _get_keyset_info(self):
+
+        order = self.order or [self.type.primary_member.positive()]
+        criteria = order[0]
+        expr = criteria.operands[0]
+
+        if isinstance(expr, Member) and not expr.translated:
+            index = self._get_expression_index(expr)[0]
+        else:
+            index = None
+
+        if index is None \
+        or index.accepts_repetition \
+        or (len(order) > 1 and index.accepts_multiple_values):
+            raise ValueError(
+                "Can't use cursors on %r: its results must be sorted by an "
+                "indexed, non translated member, with no further sorting "
+                "criteria unless its index has unique keys" % self
+            )
+
+        signature = (
+            ("-" if isinstance(criteria, expressions.NegativeExpression)
+             else "+")
+            + expr.name
+        )
+        return signature, expr
+
     def _verbose_message(self, style, *args, **kwargs):
         print(" " * 4 * self.nesting + self.styles[style](*args, **kwargs))
 
@@ -325,6 +530,11 @@ class Query(object):
     #--------------------------------------------------------------------------
     def execute(self, _sorted = True, _sliced = True):
 
+        # The position of a cursor is defined by the order of the query, so
+        # it can only be applied to sorted results
+        if self.__cursor_position is not None:
+            _sorted = True
+
         verbose = self.verbose or self.watch
 
         if verbose:
@@ -369,12 +579,24 @@ class Query(object):
             and _sorted
         ):
             dataset = self.__cached_results
+            shared = False
 
             if verbose:
                 self._verbose_message("cached", "cached")
 
+        # Try to make use of results shared by other queries
+        elif self._retrieve_shared_results(_sorted, _sliced):
+            dataset = self.__cached_results
+
+            if verbose:
+                self._verbose_message("shared", "shared")
+
+            return dataset
+
         # New data set
         else:
+            shared = True
+
             # Discard cached results
             self.discard_results()
 
@@ -422,7 +644,10 @@ class Query(object):
                            for obj in self.__base_collection
                            if obj.id in subset)
             else:
-                dataset = self._apply_order(dataset)
+                dataset = self._apply_order(
+                    dataset,
+                    limit = self.range[1] if _sliced and self.range else None
+                )
 
             if verbose:
                 self._verbose_message("timing", time() - start)
@@ -449,11 +674,110 @@ class Query(object):
             self.__cached_results_sorted = _sorted
             self.__cached_results_sliced = _sliced
 
+        if shared:
+            dataset = self._store_shared_results(dataset, _sorted, _sliced)
+
         if verbose:
             print()
 
         return dataset
 
+    def _get_shared_results_info(self, _sorted, _sliced):
+
+        cache = self.result_cache
+
+        if (
+            cache is None
+            or not cache.enabled
+            or cache.storage is None
+            or self.__base_collection is not None
+            # Not worth sharing
+            or not (self.__filters or (_sorted and self.__order))
+        ):
+            return None
+
+        from .querycache import (
+            get_query_cache_info,
+            has_pending_invalidations,
+            UncacheableQueryError
+        )
+
+        try:
+            key, tags = get_query_cache_info(self, _sorted, _sliced)
+        except UncacheableQueryError:
+            return None
+
+        # Changes made by the current transaction aren't visible to others
+        if has_pending_invalidations(tags, cache):
+            return None
+
+        return key, tags
+
+    def _retrieve_shared_results(self, _sorted, _sliced):
+
+        info = self._get_shared_results_info(_sorted, _sliced)
+        if info is None:
+            return False
+
+        from .querycache import get_snapshot_tid
+
+        try:
+            tid, results = self.result_cache.retrieve(info[0])
+        except CacheKeyError:
+            return False
+
+        # Ignore results computed from a different state of the database,
+        # which may have been modified by other processes
+        if tid is None or tid != get_snapshot_tid():
+            return False
+
+        # Work on a copy, since results can be modified by their consumers
+        self.discard_results()
+        if isinstance(results, IdSet):
+            results = results.copy()
+        elif isinstance(results, frozenset):
+            results = set(results)
+        else:
+            results = list(results)
+        self.__cached_results = results
+        self.__cached_results_sorted = _sorted
+        self.__cached_results_sliced = _sliced
+        return True
+
+    def _store_shared_results(self, dataset, _sorted, _sliced):
+
+        info = self._get_shared_results_info(_sorted, _sliced)
+        if info is None:
+            return dataset
+
+        from .querycache import get_snapshot_tid, get_last_tid, expiration
+
+        # Results obtained from an outdated snapshot are of no use to new
+        # transactions
+        tid = get_snapshot_tid()
+        if tid is None or tid != get_last_tid():
+            return dataset
+
+        if not hasattr(dataset, "__len__"):
+            dataset = list(dataset)
+
+        # Keep a copy, since results can be modified by their consumers
+        if isinstance(dataset, IdSet):
+            results = dataset.copy()
+        elif isinstance(dataset, Set):
+            results = frozenset(dataset)
+        else:
+            results = tuple(dataset)
+
+        key, tags = info
+        self.result_cache.store(
+            key,
+            (tid, results),
+            expiration = expiration,
+            tags = tags
+        )
+        return dataset
+
     def _describe_collection(
             self,
             collection: Iterable,
@@ -469,7 +793,28 @@ class Query(object):
         else:
             return collection.__class__.__name__
 
-    def _apply_filters(self, dataset):
+    def explain(self):
+        """Executes the filters of the query, describing how they were
+        resolved.
+
+        :return: An object listing the steps of the execution plan, in the
+            order they were applied, along with their estimated and actual
+            number of matches.
+        :rtype: `QueryExplanation`
+        """
+        if self.__base_collection is None:
+            dataset = self.type.keys
+        else:
+            dataset = set(obj.id for obj in self.__base_collection)
+
+        explanation = QueryExplanation(self, len(dataset))
+
+        if self.__filters:
+            self._apply_filters(dataset, explanation)
+
+        return explanation
+
+    def _apply_filters(self, dataset, explanation = None):
 
         type_index = self.type.index
 
@@ -484,20 +829,32 @@ class Query(object):
         verbose = self.verbose or watched_id
 
         if verbose:
-            if not isinstance(dataset, set):
-                dataset = set(dataset)
+            dataset = _get_mutable_dataset(dataset)
             self._verbose_message("initial_dataset", dataset)
 
-        for expr, custom_impl in self._get_execution_plan(self.__filters):
+        plan = self._get_execution_plan(
+            self.__filters,
+            estimate = True if explanation is not None else None
+        )
 
-            if not isinstance(dataset, set):
-                dataset = set(dataset)
+        if explanation is not None:
+            explanation.steps = plan
+
+        for step in plan:
+
+            expr = step.expr
+            custom_impl = step.impl
+
+            dataset = _get_mutable_dataset(dataset)
 
             # As soon as the matching set is reduced to an empty set
             # there's no point in applying any further filter
             if not dataset:
                 break
 
+            if explanation is not None:
+                start = time()
+
             # Default filter implementation. Used when no custom transformation
             # function is provided, or if the dataset has been reduced to a
             # single item (to spare the intersection between the results for
@@ -521,6 +878,10 @@ class Query(object):
 
                 dataset = custom_impl(dataset)
 
+            if explanation is not None:
+                step.duration = time() - start
+                step.actual_rows = len(dataset)
+
             if verbose:
                 if watched_id:
                     if watched_id in dataset:
@@ -532,27 +893,66 @@ class Query(object):
 
         return dataset
 
-    def _get_execution_plan(self, filters):
-        """Create an optimized execution plan for the given set of filters."""
+    def _get_execution_plan(self, filters, estimate = None):
+        """Create an optimized execution plan for the given set of filters.
+
+        Filters that can be resolved using an index provide an estimate of the
+        number of objects they match (see `IndexStatistics`). These are
+        applied first, from the most selective to the least. The remaining
+        filters are sorted using the static priority and cost given by their
+        `resolve_filter` method.
+
+        :param estimate: Indicates if the cost of each filter should be
+            estimated. By default, estimates are only computed for plans with
+            more than one step.
+        :type estimate: bool
+
+        :return: The list of steps in the plan, in their order of execution.
+        :rtype: `QueryPlanStep` list
+        """
+        from .compositeindex import get_composite_index_filter
 
         plan = []
+        exprs = list(self._iter_filter_expressions(filters))
+
+        # Resolve equality and range filters using a composite index
+        composite_filter = get_composite_index_filter(self.type, exprs)
+        if composite_filter is not None:
+            exprs = [
+                expr
+                for expr in exprs
+                if not any(expr is operand
+                           for operand in composite_filter.operands)
+            ]
+            exprs.append(composite_filter)
 
-        def _descend_expressions(expr):
-            for child_expr in expr.iter_filter_expressions(self):
-                if child_expr is expr:
-                    yield expr
-                else:
-                    for descendant_expr in _descend_expressions(child_expr):
-                        yield descendant_expr
+        for expr in exprs:
+            (priority, cost), impl = expr.resolve_filter(self)
+            plan.append(QueryPlanStep(expr, impl, priority, cost))
 
-        for filter in filters:
-            for expr in _descend_expressions(filter):
-                plan.append((expr.resolve_filter(self), expr))
+        if estimate is None:
+            estimate = len(plan) > 1
 
-        plan.sort(key = lambda resolution: resolution[0][0])
+        if estimate:
+            for step in plan:
+                if step.impl is not None:
+                    step.estimated_rows = step.expr.estimate_filter(self)
 
-        for resolution, expr in plan:
-            yield (expr, resolution[1])
+        plan.sort(key = lambda step: step.sorting_key)
+        return plan
+
+    def _iter_filter_expressions(self, filters):
+        """Iterates over the given filters, descending into the expressions
+        that they are composed of (ie. those joined by a logical 'and').
+        """
+        for filter in filters:
+            for child_expr in filter.iter_filter_expressions(self):
+                if child_expr is filter:
+                    yield filter
+                else:
+                    for descendant_expr \
+                    in self._iter_filter_expressions([child_expr]):
+                        yield descendant_expr
 
     def _get_expression_index(self, expr, member = None):
 
@@ -581,7 +981,7 @@ class Query(object):
 
         return None
 
-    def _apply_order(self, dataset):
+    def _apply_order(self, dataset, limit = None):
 
         order = []
 
@@ -598,11 +998,37 @@ class Query(object):
         # Force a default order on queries that don't specify one, but request
         # a dataset range
         if not order:
-            if self.range:
+            if self.range or self.__cursor_position is not None:
                 order = [self.__type.primary_member.positive()]
             else:
                 return dataset
 
+        # Optimized case: a composite index covering members with equality
+        # filters followed by the sorting members
+        if self.__cursor_position is None:
+            from .compositeindex import get_composite_index_order
+
+            composite_order = get_composite_index_order(
+                self.type,
+                list(self._iter_filter_expressions(self.__filters)),
+                order
+            )
+
+            if composite_order is not None:
+                composite_filter, desc = composite_order
+
+                if not isinstance(
+                    dataset,
+                    fast_membership_test_sequence_types
+                ):
+                    dataset = set(dataset)
+
+                sequence = composite_filter.composite_index.index.values(
+                    descending = desc,
+                    **composite_filter.get_bounds()
+                )
+                return (id for id in sequence if id in dataset)
+
         # Optimized case: single indexed member, or a member that is both
         # required and unique followed by other members
         expr = order[0].operands[0]
@@ -628,26 +1054,56 @@ class Query(object):
             desc = isinstance(order[0], expressions.NegativeExpression)
             is_btree = isinstance(index, (IIBTree, OIBTree))
 
-            # BTrees don't provide a means for efficient reverse iteration
-            if not (desc and is_btree):
-
-                if not isinstance(dataset, fast_membership_test_sequence_types):
-                    dataset = set(dataset)
+            if not isinstance(dataset, fast_membership_test_sequence_types):
+                dataset = set(dataset)
 
-                if isinstance(expr, Member) and expr.primary:
-                    sequence = index.keys(descending = desc, **index_kw)
-                elif is_btree:
-                    sequence = index.values(**index_kw)
+            if self.__cursor_position is not None:
+                sequence = self._resume_index_sequence(
+                    expr,
+                    index,
+                    index_kw,
+                    desc
+                )
+            elif isinstance(expr, Member) and expr.primary:
+                sequence = index.keys(descending = desc, **index_kw)
+            elif is_btree:
+                # BTrees don't provide a means for reverse iteration; walk
+                # their structure backwards instead
+                if desc:
+                    sequence = (
+                        value
+                        for key, value in iter_descending_items(
+                            index,
+                            **index_kw
+                        )
+                    )
                 else:
-                    sequence = index.values(descending = desc, **index_kw)
+                    sequence = index.values(**index_kw)
+            else:
+                sequence = index.values(descending = desc, **index_kw)
 
-                ordered_dataset = (id
-                           for id in sequence
-                           if id in dataset)
+            ordered_dataset = (id
+                       for id in sequence
+                       if id in dataset)
 
-                return ordered_dataset
+            return ordered_dataset
+
+        if self.__cursor_position is not None:
+            raise ValueError(
+                "Can't resume %r from a cursor: its order can't be resolved "
+                "using an index" % self
+            )
 
         # General case: mix indexes and brute force sorting as needed
+
+        # When only the first items of the dataset are requested, discard
+        # those that can't make it to the top positions before evaluating
+        # sorting keys
+        if limit is not None:
+            candidates = self._get_top_candidates(order[0], dataset, limit)
+            if candidates is not None:
+                dataset = candidates
+
         sorting_keys = {}
 
         def add_sorting_key(c, item_id, key):
@@ -683,7 +1139,7 @@ class Query(object):
             if index is not None:
 
                 # Normalize the dataset to a set, to speed up lookups
-                if not isinstance(dataset, set):
+                if not isinstance(dataset, (set, IdSet)):
                     dataset = set(dataset)
 
                 # Index with duplicates
@@ -732,11 +1188,115 @@ class Query(object):
 
                     add_sorting_key(c, id, Comparator(value, desc))
 
-        return sorted(
-            dataset,
-            key=(lambda value: sorting_keys.get(value, minus_infinite))
+        sorting_key = lambda value: sorting_keys.get(value, minus_infinite)
+
+        # Partial sort, keeping only the first N items
+        if limit is not None and limit < len(dataset):
+            return nsmallest(limit, dataset, key = sorting_key)
+
+        return sorted(dataset, key = sorting_key)
+
+    def _resume_index_sequence(self, expr, index, index_kw, desc):
+        """Iterates over the ids in an index, starting after the position
+        given by the query's cursor.
+        """
+        key, last_id = self.__cursor_position
+
+        if desc:
+            bounds = {"max": key}
+        else:
+            bounds = {"min": key}
+
+        # Primary index: keys are unique ids
+        if isinstance(expr, Member) and expr.primary:
+            bounds["exclude_max" if desc else "exclude_min"] = True
+            return index.keys(descending = desc, **bounds, **index_kw)
+
+        # Regular BTrees: unique keys, no descending iteration
+        if not isinstance(index, Index):
+            if desc:
+                items = iter_descending_items(
+                    index,
+                    excludemax = True,
+                    **bounds,
+                    **index_kw
+                )
+            else:
+                items = index.items(excludemin = True, **bounds, **index_kw)
+            return (id for k, id in items)
+
+        # Unique keys
+        if not index.accepts_multiple_values:
+            bounds["exclude_max" if desc else "exclude_min"] = True
+            return index.values(descending = desc, **bounds, **index_kw)
+
+        # Entries with duplicate keys are sorted by id
+        return (
+            id
+            for k, id in index.items(descending = desc, **bounds, **index_kw)
+            if k != key or (id < last_id if desc else id > last_id)
         )
 
+    def _get_top_candidates(self, criteria, dataset, limit):
+        """Obtain the subset of the dataset that can take the first positions
+        when sorting it.
+
+        Candidates are found by traversing the index for the first sorting
+        criteria, until the requested number of items has been found. Items
+        that tie with the last of them are included too, since further
+        criteria could move them to the top positions.
+
+        :return: The set of candidates, or None if the first criteria can't
+            be resolved using an index that covers the whole dataset.
+        """
+        expr = criteria.operands[0]
+
+        if not isinstance(expr, Member) or expr.translated:
+            return None
+
+        index, index_kw = self._get_expression_index(expr)
+
+        # The index must hold entries for all the objects, including those
+        # with no value (which sort first)
+        if not isinstance(index, Index) or not (
+            expr.primary
+            or (index.accepts_multiple_values and not index_kw)
+        ):
+            return None
+
+        if not isinstance(dataset, (set, IdSet)):
+            dataset = set(dataset)
+
+        if len(dataset) <= limit:
+            return None
+
+        desc = isinstance(criteria, expressions.NegativeExpression)
+
+        if expr.primary:
+            sequence = (
+                (id, id)
+                for id in index.keys(descending = desc, **index_kw)
+            )
+        else:
+            sequence = index.items(descending = desc)
+
+        candidates = set()
+        last_key = None
+
+        for key, id in sequence:
+            if id in dataset and id not in candidates:
+                if len(candidates) >= limit and key != last_key:
+                    break
+                candidates.add(id)
+                last_key = key
+
+        # Some items in the dataset are missing from the index; only a full
+        # sort can place them
+        if len(candidates) < limit:
+            return None
+
+        return candidates
+
     def _apply_range(self, dataset):
 
         r = self.range
@@ -748,8 +1308,136 @@ class Query(object):
 
     def __iter__(self):
         type_index = self.type.index
-        for id in self.execute():
-            yield type_index[id]
+        ids = self.execute()
+
+        if self.prefetch or self.prefetch_related:
+            ids = iter(ids)
+            while True:
+                batch = [
+                    type_index[id]
+                    for id in islice(ids, self.prefetch_size)
+                ]
+                if not batch:
+                    break
+                prefetch_objects(batch, self.prefetch_related)
+                for obj in batch:
+                    yield obj
+        else:
+            for id in ids:
+                yield type_index[id]
+
+    def values(self, *members):
+        """Obtains the values of the given members for each selected object.
+
+        Values are read from the indexes of the requested members whenever
+        possible, so that large result sets (ie. exports) can be processed
+        without loading every object in the query into memory. Members that
+        are not indexed, translated members and members whose index keys
+        can't be mapped back to their values (see
+        `~cocktail.schema.Member.restorable_index_values`) are read from the
+        objects themselves, which are loaded in batches of `prefetch_size`
+        objects.
+
+        :param members: The members to obtain, given as members of the
+            queried type or as their names.
+
+        :return: An iterable sequence of named tuples, one for each object
+            matched by the query (following its order and range), holding the
+            values of the requested members.
+        """
+        members = [
+            self.__type[member] if isinstance(member, str) else member
+            for member in members
+        ]
+        row_type = _get_row_type(tuple(member.name for member in members))
+        ids = self.execute()
+
+        if not isinstance(ids, (list, tuple)):
+            ids = list(ids)
+
+        # Read as many values as possible from indexes
+        index_values = {}
+        load_members = []
+        id_set = None
+
+        for member in members:
+
+            if member.primary or member in index_values:
+                continue
+
+            index = self._get_projection_index(member, len(ids))
+
+            if index is None:
+                if member not in load_members:
+                    load_members.append(member)
+                continue
+
+            if id_set is None:
+                id_set = IdSet(ids) if ids and isinstance(ids[0], int) \
+                    else set(ids)
+
+            restore = member.restore_index_value
+            values = {}
+
+            for key, id in index.items():
+                if id in id_set:
+                    values[id] = restore(key)
+
+            index_values[member] = values
+
+        # Produce rows, loading objects when some values can't be obtained
+        # from indexes
+        type_index = self.__type.index
+        ids = iter(ids)
+
+        while True:
+            batch = list(islice(ids, self.prefetch_size))
+            if not batch:
+                break
+
+            objects = {}
+
+            for id in batch:
+                if load_members or any(
+                    id not in values
+                    for values in index_values.values()
+                ):
+                    objects[id] = type_index[id]
+
+            if objects:
+                prefetch_objects(list(objects.values()))
+
+            for id in batch:
+                obj = objects.get(id)
+                row = []
+                for member in members:
+                    if member.primary:
+                        value = id
+                    else:
+                        values = index_values.get(member)
+                        if values is not None and id in values:
+                            value = values[id]
+                        else:
+                            value = obj.get(member)
+                    row.append(value)
+                yield row_type._make(row)
+
+    def _get_projection_index(self, member, rows):
+
+        if (
+            not member.indexed
+            or member.translated
+            or not member.restorable_index_values
+        ):
+            return None
+
+        index = self._get_member_index(member)
+
+        if not isinstance(index, Index) \
+        or len(index) > rows * self.projection_scan_ratio:
+            return None
+
+        return index
 
     def __len__(self):
         if self.cached:
@@ -812,7 +1500,9 @@ class Query(object):
         order = inherit,
         range = inherit,
         verbose = inherit,
-        description = inherit
+        description = inherit,
+        prefetch = inherit,
+        prefetch_related = inherit
     ):
         child_query = self.__class__(
             self.__type,
@@ -824,9 +1514,18 @@ class Query(object):
             self.__base_collection,
             verbose = self.verbose if verbose is inherit else verbose,
             description =
-                self.description if description is inherit else description
+                self.description if description is inherit else description,
+            prefetch = self.prefetch if prefetch is inherit else prefetch,
+            prefetch_related =
+                self.prefetch_related
+                if prefetch_related is inherit
+                else prefetch_related
         )
 
+        if order is inherit:
+            child_query.__cursor = self.__cursor
+            child_query.__cursor_position = self.__cursor_position
+
         if filters is inherit:
             child_query.__cached_results = self.__cached_results
             child_query.__cached_results_sorted = \
@@ -845,6 +1544,88 @@ class Query(object):
                 item.delete()
 
 
+_row_types = {}
+
+def _get_row_type(names):
+    row_type = _row_types.get(names)
+    if row_type is None:
+        row_type = namedtuple("Row", names, rename = True)
+        _row_types[names] = row_type
+    return row_type
+
+
+class QueryPlanStep(object):
+    """A step in the execution plan of a `Query`."""
+
+    estimated_rows = None
+    actual_rows = None
+    duration = None
+
+    def __init__(self, expr, impl, priority, cost = 0):
+        self.expr = expr
+        self.impl = impl
+        self.priority = priority
+        self.cost = cost
+
+    def __repr__(self):
+        return "%s(%s, estimated_rows = %r, actual_rows = %r)" % (
+            self.__class__.__name__,
+            self.expr,
+            self.estimated_rows,
+            self.actual_rows
+        )
+
+    @property
+    def strategy(self):
+        """Indicates how the step is resolved: either using a custom
+        implementation ("resolve") or by evaluating the filter on each object
+        ("eval").
+        """
+        return "eval" if self.impl is None else "resolve"
+
+    @property
+    def sorting_key(self):
+        if self.estimated_rows is None:
+            return (1, self.priority, self.cost)
+        else:
+            return (0, self.estimated_rows)
+
+
+class QueryExplanation(object):
+    """Describes the execution of the filters of a `Query`, as produced by
+    `Query.explain`.
+    """
+
+    def __init__(self, query, initial_rows):
+        self.query = query
+        self.initial_rows = initial_rows
+        self.steps = []
+
+    def __str__(self):
+
+        lines = [
+            repr(self.query),
+            "Initial dataset: %d" % self.initial_rows
+        ]
+
+        for n, step in enumerate(self.steps):
+            lines.append(
+                "%d. %s %s (estimated: %s, actual: %s%s)" % (
+                    n + 1,
+                    step.strategy,
+                    step.expr,
+                    "?" if step.estimated_rows is None
+                        else "%d" % step.estimated_rows,
+                    "skipped" if step.actual_rows is None
+                        else step.actual_rows,
+                    "" if step.duration is None
+                        else ", %.4fs" % step.duration
+                )
+            )
+
+        return "\n".join(lines)
+
+
 class MinusInfinite:
 
     def __eq__(self, other):
@@ -927,6 +1708,37 @@ class Comparator(object):
 
 # Custom expression resolution
 #------------------------------------------------------------------------------
+def _encode_cursor_value(value):
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, (tuple, list)):
+        return {"t": [_encode_cursor_value(item) for item in value]}
+    elif isinstance(value, Decimal):
+        return {"d": str(value)}
+
+    raise TypeError("Can't encode %r into a query cursor" % (value,))
+
+def _decode_cursor_value(value):
+
+    if "t" in value:
+        return tuple(value["t"])
+    elif "d" in value:
+        return Decimal(value["d"])
+
+    raise ValueError("Invalid query cursor value: %r" % value)
+
+def _get_mutable_dataset(dataset):
+
+    if isinstance(dataset, (set, IdSet)):
+        return dataset
+
+    # Integer keys are held in a compact set
+    if isinstance(dataset, (IOTreeSet, IOSet)):
+        return IdSet(dataset)
+
+    return set(dataset)
+
 def _get_filter_info(filter):
 
     if isinstance(filter, Member):
@@ -970,6 +1782,27 @@ def _expression_resolution(self, query):
 
 expressions.Expression.resolve_filter = _expression_resolution
 
+def _expression_estimate(self, query):
+    return None
+
+expressions.Expression.estimate_filter = _expression_estimate
+
+def _get_filter_statistics(filter):
+
+    member, index, language = _get_filter_info(filter)
+
+    if member is None \
+    or not isinstance(filter.operands[1], expressions.Constant):
+        return None, None
+
+    stats = get_index_statistics(index)
+
+    if stats is None:
+        return None, None
+
+    value = _get_index_value(member, filter.operands[1].value, language)
+    return stats, value
+
 def _constant_resolution(self, query):
 
     def impl(dataset):
@@ -979,6 +1812,9 @@ def _constant_resolution(self, query):
 
 expressions.Constant.resolve_filter = _constant_resolution
 
+expressions.Constant.estimate_filter = \
+    lambda self, query: None if self.value else 0
+
 def _or_resolution(self, query):
 
     def impl(dataset):
@@ -1047,6 +1883,17 @@ def _equal_resolution(self, query):
 
 expressions.EqualExpression.resolve_filter = _equal_resolution
 
+def _equal_estimate(self, query):
+
+    stats, value = _get_filter_statistics(self)
+
+    if stats is None:
+        return None
+
+    return stats.estimate_equal(value)
+
+expressions.EqualExpression.estimate_filter = _equal_estimate
+
 def _not_equal_resolution(self, query):
 
     member, index, language = _get_filter_info(self)
@@ -1108,6 +1955,21 @@ def _greater_resolution(self, query):
 expressions.GreaterExpression.resolve_filter = _greater_resolution
 expressions.GreaterEqualExpression.resolve_filter = _greater_resolution
 
+def _greater_estimate(self, query):
+
+    stats, value = _get_filter_statistics(self)
+
+    if stats is None:
+        return None
+
+    return stats.estimate_range(
+        min = value,
+        exclude_min = isinstance(self, expressions.GreaterExpression)
+    )
+
+expressions.GreaterExpression.estimate_filter = _greater_estimate
+expressions.GreaterEqualExpression.estimate_filter = _greater_estimate
+
 def _lower_resolution(self, query):
 
     member, index, language = _get_filter_info(self)
@@ -1128,6 +1990,21 @@ def _lower_resolution(self, query):
 expressions.LowerExpression.resolve_filter = _lower_resolution
 expressions.LowerEqualExpression.resolve_filter = _lower_resolution
 
+def _lower_estimate(self, query):
+
+    stats, value = _get_filter_statistics(self)
+
+    if stats is None:
+        return None
+
+    return stats.estimate_range(
+        max = value,
+        exclude_max = isinstance(self, expressions.LowerExpression)
+    )
+
+expressions.LowerExpression.estimate_filter = _lower_estimate
+expressions.LowerEqualExpression.estimate_filter = _lower_estimate
+
 def ids_from_subset(subset, is_id_collection = False, query = None):
 
     from cocktail.persistence import PersistentObject
@@ -1184,6 +2061,17 @@ def _inclusion_resolution(self, query):
 
 expressions.InclusionExpression.resolve_filter = _inclusion_resolution
 
+def _inclusion_estimate(self, query):
+
+    if self.operands[0] is expressions.Self:
+        subset = self.operands[1].eval()
+        if hasattr(subset, "__len__") and not isinstance(subset, Query):
+            return len(subset)
+
+    return None
+
+expressions.InclusionExpression.estimate_filter = _inclusion_estimate
+
 def _exclusion_resolution(self, query):
 
     subject = self.operands[0]
@@ -1245,6 +2133,28 @@ def _contains_resolution(self, query):
 
 expressions.ContainsExpression.resolve_filter = _contains_resolution
 
+def _iter_collection_estimates(self, query, items):
+
+    subject = self.operands[0]
+    index, index_kw = query._get_expression_index(self, subject)
+    stats = None if index_kw else get_index_statistics(index)
+
+    if stats is None:
+        yield None
+    else:
+        for item in items:
+            yield stats.estimate_equal(subject.get_index_value(item))
+
+def _contains_estimate(self, query):
+    for estimate in _iter_collection_estimates(
+        self,
+        query,
+        [self.operands[1].eval()]
+    ):
+        return estimate
+
+expressions.ContainsExpression.estimate_filter = _contains_estimate
+
 def _contains_any_resolution(self, query):
 
     subject = self.operands[0]
@@ -1268,6 +2178,14 @@ def _contains_any_resolution(self, query):
 
 expressions.ContainsAnyExpression.resolve_filter = _contains_any_resolution
 
+def _contains_any_estimate(self, query):
+    estimates = list(
+        _iter_collection_estimates(self, query, self.operands[1].eval())
+    )
+    return None if None in estimates else sum(estimates)
+
+expressions.ContainsAnyExpression.estimate_filter = _contains_any_estimate
+
 def _contains_all_resolution(self, query):
 
     subject = self.operands[0]
@@ -1295,6 +2213,14 @@ def _contains_all_resolution(self, query):
 
 expressions.ContainsAllExpression.resolve_filter = _contains_all_resolution
 
+def _contains_all_estimate(self, query):
+    estimates = list(
+        _iter_collection_estimates(self, query, self.operands[1].eval())
+    )
+    return None if not estimates or None in estimates else min(estimates)
+
+expressions.ContainsAllExpression.estimate_filter = _contains_all_estimate
+
 def _lacks_resolution(self, query):
 
     subject = self.operands[0]
@@ -1429,7 +2355,7 @@ expressions.RangeIntersectionExpression.resolve_filter = \
 
 def _isinstance_subset(expression):
 
-    subset = set()
+    subset = None
 
     if isinstance(expression.operands[1], expressions.Constant):
         operand = expression.operands[1].eval()
@@ -1443,16 +2369,18 @@ def _isinstance_subset(expression):
         models.append(operand)
 
     for cls in models:
-        if expression.is_inherited:
-            subset.update(cls.keys)
+        cls_subset = _get_mutable_dataset(cls.keys)
+
+        if not expression.is_inherited:
+            for child in cls.derived_schemas(recursive = False):
+                cls_subset.difference_update(child.keys)
+
+        if subset is None:
+            subset = cls_subset
         else:
-            children = cls.derived_schemas(recursive = False)
-            children_subset = set()
-            for child in children:
-                children_subset.update(child.keys)
-            subset.update(set(cls.keys).difference(children_subset))
+            subset.update(cls_subset)
 
-    return subset
+    return set() if subset is None else subset
 
 def _isinstance_resolution(self, query):
     # TODO: Implement the resolution for the queries that its first operand is
@@ -1681,6 +2609,7 @@ ordered_collection_types = (list, tuple, ListWrapper, Query)
 
 fast_membership_test_sequence_types = (
     set,
+    IdSet,
     IOTreeSet, IOSet,
     OOTreeSet, OOSet,
     Query
@@ -0,0 +1,343 @@
+#-*- coding: utf-8 -*-
+"""Shares the results of `queries <Query>` across requests.
+
+The results of a query are stored in `query_result_cache`, keyed by a
+normalized representation of the query (its type, filters, order, range,
+cursor and the active language), and tagged with the types and members that
+the query depends on. Inserting, modifying or deleting persistent objects
+schedules the invalidation of the matching tags once the current transaction
+is committed.
+
+Each entry records the id of the database transaction its results were
+computed from (its snapshot), and is only used by transactions that read
+from that same snapshot. This keeps the cache consistent when several
+processes (f. ex. ZEO clients or web server workers) write to the same
+database: a commit made by any process moves new transactions to a new
+snapshot, and their queries are computed again. Tag invalidation discards
+the entries affected by local commits as soon as they are committed. Storages
+that don't expose the snapshot read by each transaction don't share results.
+
+`query_result_cache` is the default value of `Query.result_cache`; assigning
+a different cache to that attribute moves shared results (and their
+invalidation) to it.
+
+The cache is disabled until a storage is assigned to it::
+
+    from cocktail.caching import MemoryCacheStorage
+    from cocktail.persistence.querycache import query_result_cache
+    query_result_cache.storage = MemoryCacheStorage("50M")
+
+Only queries whose dependencies can be determined are cached: filters must
+be composed of members of the queried type, constants, and the expressions
+listed in `cacheable_expressions`.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from decimal import Decimal
+from datetime import date, time, datetime
+from ZODB.utils import u64
+from cocktail.events import when
+from cocktail.translations import get_language
+from cocktail.caching import Cache
+from cocktail import schema
+from cocktail.schema import expressions
+from .datastore import datastore
+from .persistentobject import PersistentObject, PersistentClass
+from .query import Query
+
+query_result_cache = Cache()
+Query.result_cache = query_result_cache
+
+expiration = None
+"""An optional expiration for cached query results. See
+`cocktail.caching.utils.normalize_expiration` for details on its format.
+"""
+
+cacheable_expressions = (
+    expressions.EqualExpression,
+    expressions.NotEqualExpression,
+    expressions.GreaterExpression,
+    expressions.GreaterEqualExpression,
+    expressions.LowerExpression,
+    expressions.LowerEqualExpression,
+    expressions.StartsWithExpression,
+    expressions.EndsWithExpression,
+    expressions.ContainsExpression,
+    expressions.ContainsAnyExpression,
+    expressions.ContainsAllExpression,
+    expressions.LacksExpression,
+    expressions.MatchExpression,
+    expressions.AndExpression,
+    expressions.OrExpression,
+    expressions.NotExpression,
+    expressions.NegativeExpression,
+    expressions.PositiveExpression,
+    expressions.InclusionExpression,
+    expressions.ExclusionExpression,
+    expressions.RangeIntersectionExpression,
+    expressions.IsInstanceExpression,
+    expressions.SearchExpression,
+    expressions.TranslationExpression
+)
+
+plain_value_types = (
+    type(None),
+    bool,
+    int,
+    float,
+    str,
+    bytes,
+    Decimal,
+    date,
+    time,
+    datetime
+)
+
+TRANSACTION_KEY = "cocktail.persistence.querycache.snapshot"
+
+
+class UncacheableQueryError(Exception):
+    """An exception raised when trying to obtain the cache key for a query
+    whose dependencies can't be determined.
+    """
+
+
+def get_instances_tag(cls):
+    """Gets the cache tag invalidated when instances of the given class are
+    inserted or deleted.
+    """
+    return cls.full_name + "-instances"
+
+def get_member_tag(cls, member):
+    """Gets the cache tag invalidated when the given member changes on any
+    instance of the given class.
+    """
+    return cls.full_name + "." + member.name
+
+def get_query_cache_info(query, _sorted = True, _sliced = True):
+    """Obtains the key and tags used to store the results of a query.
+
+    :param query: The query to describe. Queries with a custom
+        `~Query.base_collection` can't be described.
+    :type query: `Query`
+
+    :return: A tuple containing the cache key and tags for the query.
+
+    :raise UncacheableQueryError: Raised if the results of the query can't be
+        shared.
+    """
+    tags = set([get_instances_tag(query.type)])
+
+    key = (
+        "cocktail.persistence.query",
+        query.type.full_name,
+        tuple(_get_expression_key(query, f, tags) for f in query.filters),
+        tuple(
+            _get_expression_key(query, criteria, tags, True)
+            for criteria in query.order
+        ) if _sorted else None,
+        query.range if _sliced else None,
+        query.cursor if _sorted else None,
+        get_language()
+    )
+
+    return repr(key), tags
+
+def _get_expression_key(query, expr, tags, ordering = False):
+
+    if isinstance(expr, schema.Member):
+        if expr.schema is None \
+        or not isinstance(query.type, type) \
+        or not isinstance(expr.schema, type) \
+        or not issubclass(query.type, expr.schema):
+            raise UncacheableQueryError(
+                "%r is not a member of %r" % (expr, query.type)
+            )
+
+        # Ordering by related objects depends on their own state
+        if ordering and isinstance(expr, schema.RelationMember):
+            raise UncacheableQueryError(
+                "Can't cache queries ordered by %r" % expr
+            )
+
+        tags.add(get_member_tag(query.type, expr))
+        return ("member", expr.schema.full_name, expr.name)
+
+    elif isinstance(expr, expressions.Constant):
+        return ("constant", _get_value_key(expr.value))
+
+    elif expr is expressions.Self:
+        return ("self",)
+
+    elif isinstance(expr, cacheable_expressions):
+
+        if isinstance(expr, expressions.IsInstanceExpression):
+            models = expr.operands[1].eval()
+            if not isinstance(models, (list, tuple)):
+                models = [models]
+            for model in models:
+                tags.add(get_instances_tag(model))
+
+        elif isinstance(expr, expressions.SearchExpression) \
+        and not isinstance(expr.subject, schema.Member):
+            raise UncacheableQueryError(
+                "Can't cache full text searches on %r" % expr.subject
+            )
+
+        return (
+            expr.__class__.__name__,
+            tuple(
+                _get_expression_key(query, operand, tags, ordering)
+                for operand in expr.operands
+            ),
+            tuple(
+                (name, _get_value_key(value))
+                for name, value in sorted(expr.__dict__.items())
+                if name not in ("operands", "subject", "query")
+            )
+        )
+
+    raise UncacheableQueryError("Can't cache expression %r" % expr)
+
+def _get_value_key(value):
+
+    if isinstance(value, plain_value_types):
+        return value
+    elif isinstance(value, PersistentObject):
+        return ("object", value.__class__.full_name, value.id)
+    elif isinstance(value, PersistentClass):
+        return ("class", value.full_name)
+    elif isinstance(value, (list, tuple)):
+        return tuple(_get_value_key(item) for item in value)
+    elif isinstance(value, (set, frozenset)):
+        return ("set",) + tuple(
+            sorted((_get_value_key(item) for item in value), key = repr)
+        )
+
+    raise UncacheableQueryError("Can't cache value %r" % (value,))
+
+def get_snapshot_tid():
+    """Gets the id of the last committed transaction visible to the current
+    transaction.
+
+    Cached results are only shared between transactions that read from the
+    same snapshot of the database.
+
+    :return: The id of the transaction, or None if the storage doesn't
+        expose the snapshot read by the current transaction (in which case
+        results shouldn't be shared).
+    """
+    tid = datastore.get_transaction_value(TRANSACTION_KEY)
+
+    if tid is None:
+        # ZODB has no public API for the snapshot of a connection: MVCC
+        # adapters (ZODB 5) read objects from before the start of the
+        # transaction, which they keep in their '_start' attribute
+        start = getattr(datastore.connection._storage, "_start", None)
+        if start is None:
+            return None
+
+        tid = u64(start) - 1
+        datastore.set_transaction_value(TRANSACTION_KEY, tid)
+
+    return tid
+
+def get_last_tid():
+    """Gets the id of the last transaction committed to the database, by any
+    process.
+    """
+    return u64(datastore.db.lastTransaction())
+
+def has_pending_invalidations(tags, cache = None):
+    """Indicates if the current transaction will invalidate any of the given
+    tags once committed.
+
+    :param cache: The cache to check. Defaults to `Query.result_cache`.
+    """
+    if cache is None:
+        cache = Query.result_cache
+
+    if cache is None:
+        return False
+
+    scope = cache.get_clear_after_commit_scope()
+    return scope is not None and (
+        not isinstance(scope, set)
+        or not scope.isdisjoint(tags)
+    )
+
+def invalidate_after_commit(obj, member = None, members = None):
+    """Schedules the invalidation of the query results affected by a change
+    in the given object.
+
+    :param obj: The inserted, modified or deleted object.
+    :type obj: `PersistentObject`
+
+    :param member: The modified member. If neither this nor ``members`` are
+        given, the object is assumed to have been inserted or deleted.
+    :type member: `cocktail.schema.Member`
+
+    :param members: Several modified members, invalidated at once.
+    :type members: `cocktail.schema.Member` collection
+    """
+    cache = Query.result_cache
+
+    if cache is None or not cache.enabled or cache.storage is None:
+        return
+
+    if member is not None:
+        members = [member] if members is None else [member] + list(members)
+
+    tags = set()
+
+    for cls in obj.__class__.ascend_inheritance(True):
+        if cls.indexed and cls is not PersistentObject:
+            if members is None:
+                tags.add(get_instances_tag(cls))
+            else:
+                for changed_member in members:
+                    tags.add(get_member_tag(cls, changed_member))
+
+    cache.clear_after_commit(tags)
+
+@when(PersistentObject.inserted)
+def _handle_inserted(event):
+    invalidate_after_commit(event.source)
+
+@when(PersistentObject.deleted)
+def _handle_deleted(event):
+    invalidate_after_commit(event.source)
+
+@when(PersistentObject.changed)
+def _handle_changed(event):
+    if (
+        event.batch is None
+        and event.source.is_inserted
+        and event.previous_value != event.value
+    ):
+        invalidate_after_commit(event.source, event.member)
+
+@when(PersistentObject.batch_changed)
+def _handle_batch_changed(event):
+    if event.source.is_inserted:
+        invalidate_after_commit(
+            event.source,
+            members = [change.member for change in event.changes]
+        )
+
+@when(PersistentObject.collection_item_added)
+def _handle_collection_item_added(event):
+    if event.source.is_inserted:
+        invalidate_after_commit(event.source, event.member)
+
+@when(PersistentObject.collection_item_removed)
+def _handle_collection_item_removed(event):
+    if event.source.is_inserted:
+        invalidate_after_commit(event.source, event.member)
+
+@when(PersistentObject.removing_translation)
+def _handle_removing_translation(event):
+    if event.source.is_inserted:
+        for member in event.source.__class__.iter_members():
+            if member.translated:
+                invalidate_after_commit(event.source, member)
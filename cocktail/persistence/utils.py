@@ -120,3 +120,145 @@ def remove_broken_type(
         if key.startswith(full_name + ".") or key.startswith(full_name + "-"):
             del datastore.root[key]
 
+
+def iter_descending_items(
+    tree,
+    min = None,
+    max = None,
+    excludemin = False,
+    excludemax = False
+):
+    """Iterates over the items of a BTree mapping in descending key order.
+
+    BTrees only support forward iteration. This function walks the internal
+    structure of the tree starting from its rightmost branch, so that only
+    the nodes and buckets holding the produced items need to be loaded.
+
+    :param tree: The BTree to iterate over (an `~BTrees.OOBTree.OOBTree`,
+        `~BTrees.IIBTree.IIBTree`, etc).
+
+    :param min: If given, only keys greater than or equal to this value
+        will be produced.
+
+    :param max: If given, only keys lower than or equal to this value will be
+        produced.
+
+    :param excludemin: Exclude keys equal to `min`.
+    :type excludemin: bool
+
+    :param excludemax: Exclude keys equal to `max`.
+    :type excludemax: bool
+
+    :return: An iterable sequence of (key, value) tuples.
+    """
+    tree_type = type(tree)
+    pending_nodes = [tree]
+
+    while pending_nodes:
+
+        node = pending_nodes.pop()
+        state = node.__getstate__()
+
+        if state is None:
+            continue
+
+        if isinstance(node, tree_type):
+
+            # Small trees embed the state of their only bucket
+            if len(state) == 1:
+                items = state[0][0][0]
+
+            # Inner nodes alternate children and separator keys. Children are
+            # stacked in ascending order, so that they are visited in reverse;
+            # those holding only keys above the upper bound are skipped.
+            else:
+                children = state[0]
+                for i in range(0, len(children), 2):
+                    if i and max is not None:
+                        lower_key = children[i - 1]
+                        if lower_key > max \
+                        or (excludemax and lower_key == max):
+                            break
+                    pending_nodes.append(children[i])
+                continue
+        else:
+            items = state[0]
+
+        for i in range(len(items) - 2, -1, -2):
+            key = items[i]
+
+            if max is not None \
+            and (key > max or (excludemax and key == max)):
+                continue
+
+            if min is not None \
+            and (key < min or (excludemin and key == min)):
+                return
+
+            yield key, items[i + 1]
+
+def prefetch_objects(objects, relations = ()):
+    """Loads the state of a group of persistent objects in a single batch.
+
+    The objects that haven't been loaded yet are requested to the storage all
+    at once (for storages that support it, such as ZEO, this fetches all the
+    objects in a single round trip), and then activated.
+
+    :param objects: The persistent objects to load.
+
+    :param relations: An optional collection of relations to load along the
+        given objects. Relations can be given as members or member names; dotted
+        names (ie. "author.company") load relations of related objects.
+
+    :return: The list of given objects.
+    :rtype: list
+    """
+    objects = [obj for obj in objects if obj is not None]
+    ghosts_by_jar = {}
+
+    for obj in objects:
+        jar = getattr(obj, "_p_jar", None)
+        if jar is not None and obj._p_changed is None and not is_broken(obj):
+            ghosts_by_jar.setdefault(jar, []).append(obj)
+
+    for jar, ghosts in ghosts_by_jar.items():
+        jar.prefetch(ghosts)
+        for ghost in ghosts:
+            ghost._p_activate()
+
+    if relations:
+
+        # Group nested relations by their first step
+        nested_relations = {}
+
+        for relation in relations:
+            if isinstance(relation, schema.Member):
+                relation = relation.name
+            name, dot, rest = relation.partition(".")
+            nested = nested_relations.setdefault(name, [])
+            if rest:
+                nested.append(rest)
+
+        for name, nested in nested_relations.items():
+            related_objects = []
+
+            for obj in objects:
+                member = obj.__class__.get_member(name)
+
+                if not isinstance(member, schema.RelationMember):
+                    continue
+
+                value = obj.get(member)
+
+                if value is None:
+                    continue
+                elif isinstance(member, schema.Mapping):
+                    related_objects.extend(value.values())
+                elif isinstance(member, schema.Collection):
+                    related_objects.extend(value)
+                else:
+                    related_objects.append(value)
+
+            prefetch_objects(related_objects, nested)
+
+    return objects
@@ -90,6 +90,9 @@ from cocktail.schema.schemaobject import (
     SchemaObject,
     SchemaClass,
     SchemaObjectAccessor,
+    ChangedEventInfo,
+    MemberChange,
+    ChangeBatch,
     TranslatedValues,
     TranslationMapping,
     translate_schema_object,
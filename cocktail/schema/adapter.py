@@ -558,6 +558,7 @@ class RuleSet(object):
                         ordered_members.add(target_member)
 
             target_schema.members_order = members_order
+            target_schema.invalidate_validation_plan()
 
             # Preserve group order
             target_groups = set(
@@ -22,7 +22,6 @@ NOT_EDITABLE = 0
 EDITABLE = 1
 READ_ONLY = 2
 
-
 class Member(Variable):
     """A member describes the properties and metadata of a unit of data.
 
@@ -116,6 +115,9 @@ class Member(Variable):
 
     # Wether the member is included in full text searches
     text_search = False
+
+    # Changes every time the validation plan of the member is invalidated
+    _validation_plan_version = 0
     __language_dependant = None
 
     # Attributes that deserve special treatment when performing a deep copy
@@ -128,7 +130,8 @@ class Member(Variable):
         "translation",
         "translation_source",
         "original_member",
-        "source_member"
+        "source_member",
+        "_validation_plan"
     ])
 
     def __init__(self, name = None, doc = None, **kwargs):
@@ -377,6 +380,7 @@ class Member(Variable):
         :rtype: callable
         """
         self._validations.append(validation)
+        self.invalidate_validation_plan()
         return validation
 
     def remove_validation(self, validation):
@@ -390,6 +394,7 @@ class Member(Variable):
             validation.
         """
         self._validations.remove(validation)
+        self.invalidate_validation_plan()
 
     def validations(self, recursive = True, **validation_parameters):
         """Iterates over all the validation rules that apply to the member.
@@ -442,13 +447,48 @@ class Member(Variable):
         """
         context = ValidationContext(self, value, **validation_parameters)
 
-        for error in self._default_validation(context):
-            yield error
-
-        for validation in self.validations(**validation_parameters):
-            for error in validation(context):
+        for rule in self.get_validation_plan():
+            for error in rule(context):
                 yield error
 
+    def get_validation_plan(self):
+        """Obtains the sequence of validation rules applied by `get_errors`.
+
+        The plan is compiled by `_compile_validation_plan` the first time it is
+        requested, and reused until it is invalidated (see
+        `invalidate_validation_plan`).
+
+        :return: The sequence of validation rules for the member, starting
+            with its `_default_validation`.
+        :rtype: callable tuple
+        """
+        # Read from the instance dictionary, so that schema classes don't
+        # pick up the plan of their bases
+        plan = self.__dict__.get("_validation_plan")
+        version = self._validation_plan_version
+
+        if plan is None or plan[0] != version:
+            plan = (version, self._compile_validation_plan())
+            self._validation_plan = plan
+
+        return plan[1]
+
+    def invalidate_validation_plan(self):
+        """Discards the validation plan compiled by the member (see
+        `get_validation_plan`).
+
+        Plans are discarded automatically when validation rules are added or
+        removed (and, for schemas, when their members or bases change). This
+        method should be called after changing other aspects of a member that
+        affect the rules it applies, such as the
+        `~cocktail.schema.Schema.members_order` of a schema, once it has been
+        validated.
+        """
+        self._validation_plan_version += 1
+
+    def _compile_validation_plan(self):
+        return (self._default_validation,) + tuple(self.validations())
+
     def coerce(
             self,
             value: Any,
@@ -505,6 +545,10 @@ class Member(Variable):
 
         :return: The normalized expression value.
         """
+        # Fast path for the most common constant values
+        if expr is None or expr is False or expr is True:
+            return expr
+
         if not isinstance(expr, type):
             if isinstance(expr, Expression):
                 return expr.eval(
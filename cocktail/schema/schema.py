@@ -8,8 +8,11 @@ Provides a member that handles compound values.
 @since:			March 2008
 """
 from copy import deepcopy
-from collections import Mapping
-from typing import Any
+from weakref import WeakSet
+from collections import Mapping, deque
+from itertools import islice
+from multiprocessing import get_context
+from typing import Any, Iterable, Iterator, Tuple
 
 from cocktail.pkgutils import get_full_name
 from cocktail.modeling import (
@@ -23,6 +26,7 @@ from cocktail.events import Event
 from cocktail.translations import translations, get_language
 from cocktail.schema.member import Member, DynamicDefault
 from cocktail.schema.accessors import get_accessor, get, undefined
+from cocktail.schema.errorlist import ErrorList
 from .coercion import Coercion
 from .exceptions import SchemaIntegrityError, InputError
 
@@ -75,13 +79,16 @@ class Schema(Member):
     _special_copy_keys = Member._special_copy_keys | set([
         "_Schema__bases",
         "_Schema__members",
-        "_declared"
+        "_declared",
+        "_validated_members",
+        "_Schema__derived_schemas"
     ])
 
     def __init__(self, *args, **kwargs):
 
         members = kwargs.pop("members", None)
         bases = kwargs.pop("bases", None)
+        self.__derived_schemas = WeakSet()
         Member.__init__(self, *args, **kwargs)
 
         self.__bases = None
@@ -183,10 +190,13 @@ class Schema(Member):
 
         for base in bases:
             self.__bases.append(base)
+            base.__derived_schemas.add(self)
 
             for ancestor in reversed(list(base.ascend_inheritance(True))):
                 ancestor.inherited(schema = self)
 
+        self.invalidate_validation_plan()
+
     def ascend_inheritance(self, include_self = False):
 
         if include_self:
@@ -265,6 +275,7 @@ class Schema(Member):
 
         self.__members[member.name] = member
         member._schema = self
+        self.invalidate_validation_plan()
 
     def expand(self, members):
         """Adds several members to the schema.
@@ -319,6 +330,7 @@ class Schema(Member):
 
         member._schema = None
         del self.__members[member.name]
+        self.invalidate_validation_plan()
 
     def members(self, recursive = True):
         """A dictionary with all the members defined by the schema and its
@@ -473,7 +485,7 @@ class Schema(Member):
         )
         languages = context.get("languages")
 
-        for member in self.ordered_members():
+        for member in self._get_validated_members():
             key = member.name
 
             if member.translated:
@@ -504,6 +516,149 @@ class Schema(Member):
                 ):
                     yield error
 
+    def invalidate_validation_plan(self):
+        """Discards the validation plan compiled by the schema, and those of
+        the schemas that derive from it.
+        """
+        Member.invalidate_validation_plan(self)
+        for derived_schema in list(self.__derived_schemas):
+            derived_schema.invalidate_validation_plan()
+
+    def _get_validated_members(self):
+        # The ordered list of members is costly to obtain; keep it along with
+        # the validation plan for the schema
+        validated_members = self.__dict__.get("_validated_members")
+        version = self._validation_plan_version
+
+        if validated_members is None or validated_members[0] != version:
+            validated_members = (
+                version,
+                tuple(self.ordered_members())
+            )
+            self._validated_members = validated_members
+
+        return validated_members[1]
+
+    def validate_many(
+            self,
+            items: Iterable[Any],
+            workers: int = None,
+            chunk_size: int = 100,
+            **validation_parameters) -> bool:
+        """Indicates if all the given values fulfill the validation rules
+        imposed by the schema.
+
+        Takes the same parameters as L{iter_errors_many}, and stops as soon as
+        an invalid value is found.
+
+        @return: True if all the values are valid, False otherwise.
+        @rtype: bool
+        """
+        for index, errors in self.iter_errors_many(
+            items,
+            workers = workers,
+            chunk_size = chunk_size,
+            **validation_parameters
+        ):
+            return False
+
+        return True
+
+    def iter_errors_many(
+            self,
+            items: Iterable[Any],
+            workers: int = None,
+            chunk_size: int = 100,
+            **validation_parameters) -> Iterator[Tuple[int, ErrorList]]:
+        """Validates a stream of values, iterating over those that contain
+        errors.
+
+        Values are read from the given iterable as they are needed, so that
+        arbitrarily long streams (f. ex. the records of an import feed) can be
+        validated without loading them all in memory.
+
+        If C{workers} is greater than 1, values are sent in chunks to a pool of
+        worker processes forked from the calling process, which screen them
+        with L{validate<member.Member.validate>}. At most two chunks per
+        worker are in flight at any time. The values that fail validation are
+        then checked again with L{get_errors<member.Member.get_errors>} in the
+        calling process, so that the produced errors reference the members of
+        the schema and the values given by the caller. Values must be
+        picklable to be sent to workers; validation parameters aren't
+        pickled.
+
+        @param items: The values to validate (dictionaries,
+            L{SchemaObject<schemaobject.SchemaObject>} instances, etc).
+        @type items: iterable
+
+        @param workers: The number of worker processes. If not set or set to
+            1, values are validated serially in the calling process.
+        @type workers: int
+
+        @param chunk_size: The number of values sent to a worker on each
+            task.
+        @type chunk_size: int
+
+        @param validation_parameters: Additional parameters used to initialize
+            the L{ValidationContext<validationcontext.ValidationContext>} for
+            each value.
+
+        @return: An iterable sequence of (index, errors) tuples, with the
+            position of each invalid value in the stream and the
+            L{list of errors<errorlist.ErrorList>} it produced, in stream
+            order.
+        @rtype: (int, L{ErrorList<errorlist.ErrorList>}) iterable
+        """
+        if not workers or workers <= 1:
+            for index, item in enumerate(items):
+                errors = ErrorList(
+                    self.get_errors(item, **validation_parameters)
+                )
+                if errors:
+                    yield index, errors
+            return
+
+        items = iter(items)
+        chunks = iter(lambda: list(islice(items, chunk_size)), [])
+        pending = deque()
+        offset = 0
+
+        pool = get_context("fork").Pool(
+            workers,
+            initializer = _init_validation_worker,
+            initargs = (self, validation_parameters)
+        )
+        try:
+            while True:
+                while len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append((
+                        offset,
+                        chunk,
+                        pool.apply_async(_screen_values, (chunk,))
+                    ))
+                    offset += len(chunk)
+
+                if not pending:
+                    break
+
+                offset_base, chunk, result = pending.popleft()
+
+                for position in result.get():
+                    errors = ErrorList(
+                        self.get_errors(
+                            chunk[position],
+                            **validation_parameters
+                        )
+                    )
+                    if errors:
+                        yield offset_base + position, errors
+        finally:
+            pool.terminate()
+            pool.join()
+
     def coerce(
             self,
             value: Any,
@@ -904,6 +1059,23 @@ class Schema(Member):
         return record
 
 
+# State inherited by bulk validation workers from the parent process
+_validation_worker_state = {}
+
+def _init_validation_worker(schema, validation_parameters):
+    _validation_worker_state["schema"] = schema
+    _validation_worker_state["parameters"] = validation_parameters
+
+def _screen_values(values):
+    schema = _validation_worker_state["schema"]
+    parameters = _validation_worker_state["parameters"]
+    return [
+        position
+        for position, value in enumerate(values)
+        if not schema.validate(value, **parameters)
+    ]
+
+
 @translations.instances_of(Schema)
 def translate_schema(
     schema,
@@ -9,7 +9,8 @@
 import sys
 from collections import Counter
 from cocktail.modeling import refine, OrderedSet, InstrumentedDict, DictWrapper
-from cocktail.events import Event
+from contextlib import contextmanager
+from cocktail.events import Event, EventInfo
 from cocktail.pkgutils import get_full_name
 from cocktail.translations import (
     translations,
@@ -399,21 +400,25 @@ class SchemaClass(type, Schema):
                 except TypeError:
                     changed = True
 
-                # Trigger the 'changing' event
+                # Trigger the 'changing' event. Events without handlers are
+                # skipped, to avoid creating slots and event objects for
+                # each modified instance.
                 if changed:
                     change_context = {}
-                    event = instance.changing(
-                        member = member.translation_source or member,
-                        language = language,
-                        value = value,
-                        previous_value = previous_value,
-                        translation_changes = translation_changes,
-                        change_context = change_context
-                    )
 
-                    value = event.value
+                    if _changing.has_handlers(instance):
+                        event = instance.changing(
+                            member = member.translation_source or member,
+                            language = language,
+                            value = value,
+                            previous_value = previous_value,
+                            translation_changes = translation_changes,
+                            change_context = change_context
+                        )
+                        value = event.value
 
-                    if member.translation_source:
+                    if member.translation_source \
+                    and _changing.has_handlers(instance.translated_object):
                         event = instance.translated_object.changing(
                             member = member.translation_source,
                             language = instance.language,
@@ -422,8 +427,7 @@ class SchemaClass(type, Schema):
                             translation_changes = translation_changes,
                             change_context = change_context
                         )
-
-                    value = event.value
+                        value = event.value
 
                 setattr(target, self.__priv_key, value)
 
@@ -446,27 +450,25 @@ class SchemaClass(type, Schema):
                     changed = True
 
                 if changed:
-                    instance.changed(
-                        member = member.translation_source or member,
-                        language = language,
-                        value = value,
-                        previous_value = previous_value,
-                        translation_changes = translation_changes,
-                        added = None,
-                        removed = None,
-                        change_context = change_context
+                    _notify_change(
+                        instance,
+                        member.translation_source or member,
+                        language,
+                        value,
+                        previous_value,
+                        translation_changes,
+                        change_context
                     )
 
                     if member.translation_source:
-                        instance.translated_object.changed(
-                            member = member.translation_source,
-                            language = instance.language,
-                            value = value,
-                            previous_value = previous_value,
-                            translation_changes = translation_changes,
-                            added = None,
-                            removed = None,
-                            change_context = change_context
+                        _notify_change(
+                            instance.translated_object,
+                            member.translation_source,
+                            instance.language,
+                            value,
+                            previous_value,
+                            translation_changes,
+                            change_context
                         )
 
         def get_instrumented_collection_type(self, collection):
@@ -552,10 +554,184 @@ def _init_translation(cls,
     Schema.init_instance(cls, instance, values, accessor, excluded_members)
 
 
+class ChangedEventInfo(EventInfo):
+    """The information supplied to handlers of the
+    L{changed<SchemaObject.changed>} event.
+
+    @ivar batch: The list of L{MemberChange} objects of the batch the change
+        belongs to, or None if the change was not part of a batch. See
+        L{SchemaObject.batch_changes}.
+    @type batch: list
+    """
+    batch = None
+
+
+class MemberChange(object):
+    """Describes a change to a member of an object, as recorded by
+    L{SchemaObject.batch_changes}.
+
+    Changes expose the same attributes as the L{changed<SchemaObject.changed>}
+    event: C{member}, C{language}, C{value}, C{previous_value},
+    C{translation_changes} and C{change_context}. If a member is modified
+    several times within the same batch, C{previous_value} holds the value
+    before the first change, and C{value} the value after the last one.
+    """
+    __slots__ = (
+        "member",
+        "language",
+        "value",
+        "previous_value",
+        "translation_changes",
+        "change_context"
+    )
+
+    def __init__(
+        self,
+        member,
+        language,
+        value,
+        previous_value,
+        translation_changes,
+        change_context
+    ):
+        self.member = member
+        self.language = language
+        self.value = value
+        self.previous_value = previous_value
+        self.translation_changes = translation_changes
+        self.change_context = change_context
+
+    @property
+    def is_effective(self):
+        """Indicates if the value after the change differs from the value
+        before it."""
+        try:
+            return self.value != self.previous_value
+        except TypeError:
+            return True
+
+
+class ChangeBatch(object):
+    """Accumulates the changes to an object within a
+    L{SchemaObject.batch_changes} block."""
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.depth = 0
+        self.__changes = {}
+
+    def add(
+        self,
+        member,
+        language,
+        value,
+        previous_value,
+        translation_changes,
+        change_context
+    ):
+        key = (member, language)
+        change = self.__changes.get(key)
+
+        if change is None:
+            self.__changes[key] = MemberChange(
+                member,
+                language,
+                value,
+                previous_value,
+                translation_changes,
+                change_context
+            )
+        else:
+            # Coalesce successive changes to the same member, keeping the
+            # state recorded by the earliest ones
+            change.value = value
+            if translation_changes:
+                if change.translation_changes is None:
+                    change.translation_changes = dict(translation_changes)
+                else:
+                    for lang, lang_value in translation_changes.items():
+                        change.translation_changes.setdefault(
+                            lang,
+                            lang_value
+                        )
+            for context_key, context_value in change_context.items():
+                change.change_context.setdefault(context_key, context_value)
+
+    @property
+    def changes(self):
+        """The list of L{MemberChange} objects that modified the object."""
+        return [
+            change
+            for change in self.__changes.values()
+            if change.is_effective
+        ]
+
+    def flush(self):
+        """Triggers the events for the changes accumulated by the batch."""
+
+        obj = self.obj
+        changes = self.changes
+        self.__changes = {}
+
+        if not changes:
+            return
+
+        if _batch_changed.has_handlers(obj):
+            obj.batch_changed(changes = changes)
+
+        if _changed.has_handlers(obj):
+            for change in changes:
+                obj.changed(
+                    member = change.member,
+                    language = change.language,
+                    value = change.value,
+                    previous_value = change.previous_value,
+                    translation_changes = change.translation_changes,
+                    added = None,
+                    removed = None,
+                    change_context = change.change_context,
+                    batch = changes
+                )
+
+
+def _notify_change(
+    obj,
+    member,
+    language,
+    value,
+    previous_value,
+    translation_changes,
+    change_context
+):
+    batch = obj._v_change_batch
+
+    if batch is not None:
+        batch.add(
+            member,
+            language,
+            value,
+            previous_value,
+            translation_changes,
+            change_context
+        )
+    elif _changed.has_handlers(obj):
+        obj.changed(
+            member = member,
+            language = language,
+            value = value,
+            previous_value = previous_value,
+            translation_changes = translation_changes,
+            added = None,
+            removed = None,
+            change_context = change_context
+        )
+
+
 class SchemaObject(object, metaclass=SchemaClass):
 
     _generates_translation_schema = False
     _translation_schema_base = None
+    _v_change_batch = None
     bidirectional = True
 
     declared = Event(doc = """
@@ -640,6 +816,24 @@ class SchemaObject(object, metaclass=SchemaClass):
             possible to pass information between both events; the typical use
             case for this involves storing object state during the L{changing}
             event so it can be read by L{changed} event handlers.
+
+        @ivar batch: If the change was made within a L{batch_changes} block,
+            the list of L{MemberChange} objects for the whole batch. Handlers
+            that deal with the L{batch_changed} event can use it to ignore
+            changes they have already processed. None otherwise.
+        @type batch: list
+        """,
+        event_info_class = ChangedEventInfo
+    )
+
+    batch_changed = Event(doc = """
+        An event triggered once at the end of a L{batch_changes} block, before
+        the L{changed} events for each modified member.
+
+        @ivar changes: The changes made during the batch. Successive changes
+            to the same member and language are coalesced, and changes that
+            restored the original value of a member are left out.
+        @type changes: L{MemberChange} list
         """)
 
     collection_item_added = Event(doc = """
@@ -769,6 +963,53 @@ class SchemaObject(object, metaclass=SchemaClass):
         setter = member.schema.__dict__[member.name].__set__
         setter(self, value, language)
 
+    @contextmanager
+    def batch_changes(self):
+        """A context manager that coalesces the changes to the object's
+        members.
+
+        Within the block, member assignments are normalized and trigger the
+        L{changing} event as usual, but their L{changed} events are deferred
+        until the block ends. Then the L{batch_changed} event is triggered
+        once for all the changes, followed by the L{changed} event for each
+        modified member (with its C{batch} attribute set). Blocks can be
+        nested; events are triggered when the outermost block ends, even if
+        it raises an exception.
+
+        Batches are bound to the object, and shouldn't be used while other
+        threads modify it.
+        """
+        batch = self._v_change_batch
+
+        if batch is None:
+            batch = ChangeBatch(self)
+            self._v_change_batch = batch
+
+        batch.depth += 1
+
+        try:
+            yield batch
+        finally:
+            batch.depth -= 1
+            if not batch.depth:
+                self._v_change_batch = None
+                batch.flush()
+
+    def update_many(self, values, language = None):
+        """Sets the value of several members at once, within a
+        L{batch_changes} block.
+
+        @param values: A mapping of members (or member names) to their new
+            values.
+        @type values: dict
+
+        @param language: The language to assign translated members in.
+        @type language: str
+        """
+        with self.batch_changes():
+            for member, value in values.items():
+                self.set(member, value, language)
+
     def new_translation(self, language):
         return self.translation(
             translated_object = self,
@@ -1076,6 +1317,10 @@ class SchemaObject(object, metaclass=SchemaClass):
 SchemaObject._translation_schema_metaclass = SchemaClass
 SchemaObject._translation_schema_base = SchemaObject
 
+_changing = SchemaObject.__dict__["changing"]
+_changed = SchemaObject.__dict__["changed"]
+_batch_changed = SchemaObject.__dict__["batch_changed"]
+
 
 class RelationObserver(object):
 
@@ -56,7 +56,10 @@ class ValidationContext(DictWrapper):
     def __trigger_validating_event(self, event_target):
         if event_target.source_member:
             self.__trigger_validating_event(event_target.source_member)
-        event_target.validating(context = self)
+
+        # Avoid creating event slots for members that nobody listens to
+        if type(event_target).validating.event.has_handlers(event_target):
+            event_target.validating(context = self)
 
     @property
     def member(self):
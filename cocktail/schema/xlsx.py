@@ -180,6 +180,10 @@ class Exporter:
 
         sheet.append(header)
 
+        # Load persistent queries in batches, instead of one object at a time
+        if getattr(objects, "prefetch", None) is False:
+            objects = objects.select(prefetch = True)
+
         # Cells
         for obj in objects:
             row = []
@@ -0,0 +1,7 @@
+#-*- coding: utf-8 -*-
+"""
+Test suite for the 'caching' package of the Cocktail web development toolkit.
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+
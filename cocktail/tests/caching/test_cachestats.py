@@ -0,0 +1,158 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+
+from cocktail.caching import CacheKeyError
+
+
+class CacheStatsTestCase(TestCase):
+
+    def get_cache(self, **kwargs):
+        from cocktail.caching import Cache, MemoryCacheStorage
+        return Cache(MemoryCacheStorage(**kwargs))
+
+    def test_counts_hits_and_misses_by_key_prefix(self):
+
+        cache = self.get_cache()
+        cache.store("page:home:en", "Home")
+        cache.store("page:about:en", "About")
+        cache.store("query:products:1", [1, 2, 3])
+
+        cache.retrieve("page:home:en")
+        cache.retrieve_with_metadata("page:home:en")
+        self.assertRaises(CacheKeyError, cache.retrieve, "page:home:es")
+        cache.retrieve_many(["query:products:1", "query:products:2"])
+
+        stats = cache.stats()
+        home = stats["prefixes"]["page:home"]
+        assert home["hits"] == 2
+        assert home["misses"] == 1
+        assert home["stores"] == 1
+        assert home["bytes_stored"] > 0
+        assert stats["prefixes"]["page:about"]["hits"] == 0
+        assert stats["prefixes"]["query:products"]["hits"] == 1
+        assert stats["prefixes"]["query:products"]["misses"] == 1
+
+        totals = stats["totals"]
+        assert totals["hits"] == 3
+        assert totals["misses"] == 2
+        assert totals["stores"] == 3
+        assert totals["hit_ratio"] == 0.6
+        assert stats["storage"]["entry_count"] == 3
+
+        cache.reset_stats()
+        assert cache.stats()["totals"]["hits"] == 0
+
+    def test_counts_entries_by_tag(self):
+
+        cache = self.get_cache()
+        cache.store("a", 1, tags = {"x", "y"})
+        cache.store_many({"b": 2, "c": 3}, tags = {"y"})
+        cache.retrieve_with_metadata("a")
+        cache.retrieve_with_metadata("b")
+
+        tags = cache.stats()["tags"]
+        assert tags["x"]["stores"] == 1
+        assert tags["x"]["hits"] == 1
+        assert tags["y"]["stores"] == 3
+        assert tags["y"]["hits"] == 2
+
+    def test_counts_productions_and_saved_time(self):
+
+        cache = self.get_cache()
+        producer = lambda: ("value", None, {"x"})
+
+        for i in range(3):
+            cache.retrieve_or_produce("item:1", producer)
+
+        stats = cache.stats()
+        item = stats["prefixes"]["item:1"]
+        assert item["productions"] == 1
+        assert item["misses"] == 1
+        assert item["hits"] == 2
+        assert item["compute_time"] >= 0
+        assert item["saved_time"] == 2 * item["compute_time"]
+        assert stats["tags"]["x"]["productions"] == 1
+
+    def test_counts_evictions(self):
+
+        cache = self.get_cache(memory_limit = "20K")
+
+        for i in range(10):
+            cache.store("big:%d" % i, "x" * 5000, tags = {"big"})
+
+        stats = cache.stats()
+        evictions = stats["prefixes"]["big:0"]["evictions"]
+        assert evictions == 1
+        assert stats["tags"]["big"]["evictions"] >= 5
+        assert stats["tags"]["big"]["bytes_evicted"] > 5 * 5000
+        assert stats["totals"]["evictions"] \
+            == stats["storage"]["counters"]["evictions"]
+
+    def test_reuses_the_size_measured_by_the_storage(self):
+
+        cache = self.get_cache()
+        cache.store("a:1", "x" * 5000, tags = {"x"})
+
+        stats = cache.stats()
+        size = stats["prefixes"]["a:1"]["bytes_stored"]
+        assert size > 5000
+        assert stats["tags"]["x"]["bytes_stored"] == size
+        assert size == cache.storage._get_entry_memory_usage(
+            cache.storage._MemoryCacheStorage__dict["a:1"]
+        )
+
+        cache.collect_stats = False
+        cache.store("a:1", "y")
+        assert cache.stats()["totals"]["bytes_stored"] == size
+
+    def test_stats_can_be_disabled(self):
+        cache = self.get_cache()
+        cache.collect_stats = False
+        cache.store("foo", 1)
+        cache.retrieve("foo")
+        assert cache.stats()["totals"]["hits"] == 0
+
+    def test_bounds_the_number_of_labels(self):
+
+        from cocktail.caching.cachestats import OTHER_LABEL
+
+        cache = self.get_cache()
+        cache._Cache__stats.max_labels = 5
+
+        for i in range(10):
+            cache.store("key%d" % i, i)
+
+        prefixes = cache.stats()["prefixes"]
+        assert len(prefixes) == 6
+        assert prefixes[OTHER_LABEL]["stores"] == 5
+
+
+class PrometheusMetricsTestCase(TestCase):
+
+    def test_formats_metrics(self):
+
+        from cocktail.caching import (
+            Cache,
+            MemoryCacheStorage,
+            format_prometheus_metrics
+        )
+
+        cache = Cache(MemoryCacheStorage())
+        cache.store("page:home", "Home", tags = {'with "quotes"'})
+        cache.retrieve("page:home")
+
+        metrics = format_prometheus_metrics({"main": cache})
+        lines = metrics.splitlines()
+
+        assert "# TYPE cocktail_cache_hits_total counter" in lines
+        assert 'cocktail_cache_hits_total{cache="main",prefix="page:home"} 1' \
+            in lines
+        assert (
+            'cocktail_cache_tag_stores_total'
+            '{cache="main",tag="with \\"quotes\\""} 1'
+        ) in lines
+        assert 'cocktail_cache_entries{cache="main"} 1' in lines
+        assert metrics.endswith("\n")
@@ -0,0 +1,241 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from tempfile import mkdtemp
+from shutil import rmtree
+from time import time
+import os
+
+from cocktail.caching import CacheKeyError, whole_cache
+
+
+class DiskCacheStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.temp_dir = mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cache")
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def open_storage(self, **kwargs):
+        from cocktail.caching import DiskCacheStorage
+        storage = DiskCacheStorage(self.path, **kwargs)
+        self.addCleanup(storage.close)
+        return storage
+
+    def reopen(self, storage, **kwargs):
+        storage.close()
+        return self.open_storage(**kwargs)
+
+    def test_stores_and_retrieves_values(self):
+
+        storage = self.open_storage()
+        expiration = int(time()) + 60
+
+        storage.store("foo", {"a": [1, 2]}, expiration = expiration,
+                      tags = {"x", "y"})
+        storage.store("bar", "bar")
+
+        assert storage.exists("foo")
+        assert storage.retrieve("foo") == {"a": [1, 2]}
+        assert storage.retrieve_with_metadata("foo") == \
+            ({"a": [1, 2]}, expiration, {"x", "y"})
+        assert storage.retrieve_with_metadata("bar") == ("bar", None, None)
+        assert storage.get_expiration("foo") == expiration
+
+        storage.store("foo", 3)
+        assert storage.retrieve_with_metadata("foo") == (3, None, None)
+
+        assert storage.discard("foo")
+        assert not storage.discard("foo")
+        assert not storage.exists("foo")
+        self.assertRaises(CacheKeyError, storage.retrieve, "foo")
+
+    def test_entries_survive_restarts(self):
+
+        storage = self.open_storage()
+        expiration = int(time()) + 60
+
+        storage.store("a", 1, tags = {"x"})
+        storage.store_many({"b": 2, "c": 3}, tags = {"y"})
+        storage.store("d", 4)
+        storage.set_expiration("d", expiration)
+        storage.store("a", 5, tags = {"z"})
+        storage.discard("c")
+
+        storage = self.reopen(storage)
+
+        assert storage.entry_count == 3
+        assert storage.retrieve_with_metadata("a") == (5, None, {"z"})
+        assert storage.retrieve_with_metadata("b") == (2, None, {"y"})
+        assert storage.retrieve_with_metadata("d") == (4, expiration, None)
+        assert not storage.exists("c")
+
+        # The tag index is restored as well
+        storage.clear(["z"])
+        assert not storage.exists("a")
+        assert storage.exists("b")
+
+    def test_respects_expiration(self):
+
+        storage = self.open_storage()
+        storage.store("a", 1, expiration = int(time()) - 1)
+        storage.store("b", 2, expiration = int(time()) + 60)
+        storage.store("c", 3)
+        storage.set_expiration("c", int(time()) - 1)
+
+        assert not storage.exists("a")
+        self.assertRaises(CacheKeyError, storage.retrieve, "c")
+        assert storage.retrieve("b") == 2
+
+        storage = self.reopen(storage)
+        assert storage.entry_count == 1
+        assert storage.retrieve("b") == 2
+
+    def test_clears_scopes(self):
+
+        storage = self.open_storage()
+        storage.store("a", 1, tags = {"x", "y"})
+        storage.store("b", 2, tags = {"x"})
+        storage.store("c", 3, tags = {"y", "z"})
+        storage.store("d", 4, tags = {"w"})
+        storage.store("e", 5)
+
+        storage.clear([("x", "y")])
+        assert storage.retrieve_many(["a", "b", "c", "d", "e"]) == \
+            {"b": 2, "c": 3, "d": 4, "e": 5}
+
+        storage.clear(["z", ("x", "w")])
+        assert storage.retrieve_many(["a", "b", "c", "d", "e"]) == \
+            {"b": 2, "d": 4, "e": 5}
+
+        storage = self.reopen(storage)
+        assert storage.retrieve_many(["a", "b", "c", "d", "e"]) == \
+            {"b": 2, "d": 4, "e": 5}
+
+        storage.clear(whole_cache)
+        assert storage.entry_count == 0
+
+        storage.store("f", 6)
+        storage = self.reopen(storage)
+        assert storage.retrieve_many(["b", "f"]) == {"f": 6}
+
+    def test_compacts_the_file(self):
+
+        storage = self.open_storage()
+        storage.background_compaction = False
+        storage.min_compaction_size = 10 * 1024
+
+        payload = "x" * 1000
+        for i in range(100):
+            storage.store("key%d" % (i % 5), payload + str(i), tags = {"t"})
+
+        assert storage.file_size < 20 * 1024
+        assert storage.garbage_size < storage.file_size
+
+        expiration = int(time()) + 60
+        storage.set_expiration("key0", expiration)
+        storage.compact()
+        assert storage.garbage_size == 0
+        assert storage.file_size == os.path.getsize(self.path)
+
+        storage = self.reopen(storage)
+        assert storage.retrieve_many(
+            ["key%d" % i for i in range(5)]
+        ) == dict(
+            ("key%d" % i, payload + str(95 + i))
+            for i in range(5)
+        )
+        assert storage.get_expiration("key0") == expiration
+
+        storage.clear(["t"])
+        assert storage.entry_count == 0
+
+    def test_keeps_writes_made_while_compacting(self):
+
+        storage = self.open_storage()
+        for i in range(10):
+            storage.store("key%d" % i, i)
+        storage.discard("key0")
+
+        # Interleave writes with the copy of the snapshot
+        original_pwrite = os.pwrite
+        writes = []
+
+        def pwrite(fd, data, offset):
+            result = original_pwrite(fd, data, offset)
+            if not writes and data[:1] == b"\x01" and fd != storage_fd():
+                writes.append(None)
+                storage.store("key1", "new")
+                storage.discard("key2")
+                storage.store("key10", 10)
+            return result
+
+        def storage_fd():
+            return storage._DiskCacheStorage__fd
+
+        os.pwrite = pwrite
+        try:
+            storage.compact()
+        finally:
+            os.pwrite = original_pwrite
+
+        assert writes
+
+        expected = dict(
+            [("key1", "new"), ("key10", 10)]
+            + [("key%d" % i, i) for i in range(3, 10)]
+        )
+        keys = ["key%d" % i for i in range(11)]
+        assert storage.retrieve_many(keys) == expected
+
+        storage = self.reopen(storage)
+        assert storage.retrieve_many(keys) == expected
+
+    def test_evicts_entries_beyond_max_size(self):
+
+        storage = self.open_storage(max_size = "10K")
+
+        for i in range(20):
+            storage.store("key%d" % i, "x" * 1000)
+            storage.retrieve("key0")
+
+        assert 5 < storage.entry_count < 11
+        assert storage.exists("key0")
+        assert not storage.exists("key1")
+        assert storage.exists("key19")
+
+    def test_drops_incomplete_records(self):
+
+        storage = self.open_storage()
+        storage.store("a", 1)
+        storage.store("b", "x" * 100)
+        storage.close()
+
+        size = os.path.getsize(self.path)
+        with open(self.path, "r+b") as file:
+            file.truncate(size - 10)
+
+        storage = self.open_storage()
+        assert storage.retrieve_many(["a", "b"]) == {"a": 1}
+
+        storage.store("c", 3)
+        storage = self.reopen(storage)
+        assert storage.retrieve_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+    def test_locks_the_file(self):
+        from cocktail.caching import DiskCacheStorage
+        self.open_storage()
+        self.assertRaises(IOError, DiskCacheStorage, self.path)
+
+    def test_rejects_foreign_files(self):
+
+        from cocktail.caching import DiskCacheStorage
+
+        with open(self.path, "wb") as file:
+            file.write(b"Not a cache file")
+
+        self.assertRaises(IOError, DiskCacheStorage, self.path)
@@ -0,0 +1,142 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from cocktail.caching import MemoryCacheStorage, CacheKeyError
+
+
+class CappedStorage(MemoryCacheStorage):
+    """A storage limited by its number of entries, to make tests
+    predictable.
+    """
+
+    capacity = 20
+
+    def _exceeds_memory_limit(self):
+        return self.entry_count > self.capacity
+
+
+class EvictionPolicyTestCase(TestCase):
+
+    def request(self, storage, key, value = "value"):
+        try:
+            return storage.retrieve(key)
+        except CacheKeyError:
+            storage.store(key, value)
+            return value
+
+    def run_scan(self, policy):
+
+        storage = CappedStorage(eviction_policy = policy)
+        hot_keys = ["hot%d" % i for i in range(10)]
+
+        for i in range(3):
+            for key in hot_keys:
+                self.request(storage, key)
+
+        for i in range(200):
+            self.request(storage, "scan%d" % i)
+
+        assert storage.entry_count == storage.capacity
+        return [key for key in hot_keys if storage.exists(key)]
+
+    def test_lru_policy_is_the_default(self):
+        from cocktail.caching import LRUPolicy
+        storage = CappedStorage()
+        assert isinstance(storage.eviction_policy, LRUPolicy)
+        assert self.run_scan(storage.eviction_policy) == []
+
+    def test_segmented_lru_policy_resists_scans(self):
+        from cocktail.caching import SegmentedLRUPolicy
+        assert len(self.run_scan(SegmentedLRUPolicy())) == 10
+
+    def test_arc_policy_resists_scans(self):
+        from cocktail.caching import ARCPolicy
+        assert len(self.run_scan(ARCPolicy())) == 10
+
+    def test_tinylfu_policy_resists_scans(self):
+        from cocktail.caching import WTinyLFUPolicy
+        assert len(self.run_scan(WTinyLFUPolicy())) >= 9
+
+    def test_cost_aware_policy_evicts_large_entries_first(self):
+
+        from cocktail.caching import CostAwarePolicy
+
+        storage = CappedStorage(eviction_policy = CostAwarePolicy())
+        storage.capacity = 4
+
+        storage.store("small1", "x")
+        storage.store("large", "x" * 10000)
+        storage.store("small2", "x")
+        storage.store("small3", "x")
+        storage.store("small4", "x")
+
+        assert not storage.exists("large")
+        assert storage.eviction_policy.evictions == 1
+
+    def test_cost_aware_policy_measures_recompute_time(self):
+
+        from cocktail.caching import CostAwarePolicy
+
+        storage = CappedStorage(eviction_policy = CostAwarePolicy())
+        storage.capacity = 2
+
+        with patch(
+            "cocktail.caching.evictionpolicies.time",
+            side_effect = [0.0, 5.0, 10.0, 10.001, 20.0, 21.0]
+        ):
+            self.request(storage, "slow")
+            self.request(storage, "fast")
+            self.request(storage, "other")
+
+        assert storage.exists("slow")
+        assert not storage.exists("fast")
+
+    def test_policies_count_hits_misses_and_evictions(self):
+
+        from cocktail.caching import (
+            LRUPolicy,
+            SegmentedLRUPolicy,
+            ARCPolicy,
+            WTinyLFUPolicy,
+            CostAwarePolicy
+        )
+
+        for policy_type in (
+            LRUPolicy,
+            SegmentedLRUPolicy,
+            ARCPolicy,
+            WTinyLFUPolicy,
+            CostAwarePolicy
+        ):
+            storage = CappedStorage(eviction_policy = policy_type())
+            storage.capacity = 5
+
+            for i in range(8):
+                self.request(storage, "key%d" % i)
+                self.request(storage, "key%d" % i)
+
+            # Every miss stores a new entry, so once the storage is full
+            # each miss causes an eviction
+            counters = storage.eviction_policy.get_counters()
+            assert counters["hits"] + counters["misses"] == 16
+            assert counters["evictions"] == counters["misses"] - 5
+            assert storage.eviction_policy.hit_ratio == \
+                counters["hits"] / 16
+
+    def test_clearing_the_storage_resets_the_policy(self):
+
+        from cocktail.caching import SegmentedLRUPolicy
+
+        storage = CappedStorage(eviction_policy = SegmentedLRUPolicy())
+        storage.store("a", 1)
+        storage.store("b", 2)
+        storage.clear()
+
+        assert storage.entry_count == 0
+        assert storage.drop_weight() is None
+        storage.store("c", 3)
+        assert storage.drop_weight() == "c"
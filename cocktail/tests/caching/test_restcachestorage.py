@@ -0,0 +1,219 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+
+
+class RESTCacheProtocolTestCase(TestCase):
+
+    def test_encodes_and_decodes_records(self):
+
+        from cocktail.caching.restcacheprotocol import (
+            encode_records,
+            decode_records
+        )
+
+        records = [
+            ("foo", b"\x00\x01binary", 1500000000, {"a", "b"}),
+            ("b\xe0r", None, None, None),
+            ("baz", b"", None, set()),
+            ("qux", b"value", -1, None)
+        ]
+
+        decoded, flags = decode_records(encode_records(records))
+        assert decoded == records
+        assert flags == 0
+
+    def test_compresses_large_messages(self):
+
+        from cocktail.caching.restcacheprotocol import (
+            encode_records,
+            decode_records,
+            COMPRESSED,
+            ACCEPTS_COMPRESSION
+        )
+
+        records = [("key%d" % i, b"x" * 1000, None, None) for i in range(20)]
+        plain = encode_records(records)
+        compressed = encode_records(
+            records,
+            compression_threshold = 1024,
+            accepts_compression = True
+        )
+        assert len(compressed) < len(plain) / 10
+
+        decoded, flags = decode_records(compressed)
+        assert decoded == records
+        assert flags & COMPRESSED
+        assert flags & ACCEPTS_COMPRESSION
+
+        small = encode_records(records[:1], compression_threshold = 4096)
+        assert not decode_records(small)[1] & COMPRESSED
+
+    def test_rejects_malformed_messages(self):
+
+        from cocktail.caching.restcacheprotocol import (
+            encode_records,
+            decode_records
+        )
+
+        data = encode_records([("foo", b"value", 10, {"tag"})])
+        self.assertRaises(ValueError, decode_records, b"XXXX\x00")
+        self.assertRaises(ValueError, decode_records, data[:-3])
+        self.assertRaises(ValueError, decode_records, data[:9])
+
+
+class RESTCacheStorageTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        import socket
+        import cherrypy
+        from cocktail.controllers import Dispatcher
+        from cocktail.controllers.csrfprotection import (
+            get_csrf_protection,
+            set_csrf_protection
+        )
+        from cocktail.caching.restcacheserver import CacheController
+
+        # Requests to the cache server don't carry CSRF tokens
+        cls.csrf_protection = get_csrf_protection(None)
+        set_csrf_protection(None)
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            cls.port = sock.getsockname()[1]
+
+        cls.server = CacheController()
+        cherrypy.tree.mount(cls.server, "/", {
+            "/": {
+                "request.dispatch": Dispatcher()
+            }
+        })
+        cherrypy.config.update({
+            "server.socket_host": "127.0.0.1",
+            "server.socket_port": cls.port,
+            "engine.autoreload.on": False,
+            "log.screen": False
+        })
+        cherrypy.engine.start()
+        cherrypy.engine.wait(cherrypy.engine.states.STARTED)
+
+    @classmethod
+    def tearDownClass(cls):
+        import cherrypy
+        from cocktail.controllers.csrfprotection import set_csrf_protection
+        cherrypy.engine.exit()
+        set_csrf_protection(cls.csrf_protection)
+
+    def setUp(self):
+        from cocktail.caching import RESTCacheStorage
+        self.server.cache.clear()
+        self.storage = RESTCacheStorage("http://127.0.0.1:%d" % self.port)
+
+    def test_stores_and_retrieves_values(self):
+
+        from cocktail.caching import CacheKeyError
+
+        value = {"title": "àbc", "data": bytes(range(256))}
+        self.storage.store("foo", value, expiration = 2000000000, tags = {"x"})
+
+        assert self.storage.exists("foo")
+        assert self.storage.retrieve("foo") == value
+        assert self.storage.retrieve_with_metadata("foo") == (
+            value,
+            2000000000,
+            {"x"}
+        )
+        assert self.storage.get_expiration("foo") == 2000000000
+
+        self.storage.set_expiration("foo", 2100000000)
+        assert self.storage.get_expiration("foo") == 2100000000
+
+        assert not self.storage.exists("bar")
+        self.assertRaises(CacheKeyError, self.storage.retrieve, "bar")
+
+        assert self.storage.discard("foo")
+        assert not self.storage.discard("foo")
+        assert not self.storage.exists("foo")
+
+    def test_retrieves_and_stores_many_values(self):
+
+        values = dict(("key%d" % i, list(range(i))) for i in range(50))
+        self.storage.store_many(values, tags = {"many"})
+
+        keys = list(values) + ["missing1", "missing2"]
+        assert self.storage.retrieve_many(keys) == values
+        assert self.storage.retrieve_many([]) == {}
+
+        self.storage.clear({"many"})
+        assert self.storage.retrieve_many(keys) == {}
+
+    def test_compresses_large_batches(self):
+
+        values = dict(("key%d" % i, "x" * 5000) for i in range(10))
+
+        self.storage.compression_threshold = 1024
+        self.storage.store_many(values)
+        assert self.storage.retrieve_many(values) == values
+
+        self.storage.compression_threshold = None
+        assert self.storage.retrieve_many(values) == values
+
+    def test_clears_tag_intersections(self):
+
+        self.storage.store("a", 1, tags = {"x", "y"})
+        self.storage.store("b", 2, tags = {"x"})
+        self.storage.clear({("x", "y")})
+
+        assert self.storage.retrieve_many(["a", "b"]) == {"b": 2}
+
+    def test_reuses_connections(self):
+
+        created = []
+        create_connection = self.storage._create_connection
+
+        def counting_create_connection():
+            http = create_connection()
+            created.append(http)
+            return http
+
+        self.storage._create_connection = counting_create_connection
+
+        for i in range(10):
+            self.storage.store("key", i)
+            assert self.storage.retrieve("key") == i
+
+        assert len(created) == 1
+
+    def test_propagates_invalidations_between_tiered_nodes(self):
+
+        from cocktail.caching import (
+            RESTCacheStorage,
+            RESTInvalidationLog,
+            TieredCacheStorage
+        )
+
+        nodes = []
+        for i in range(2):
+            storage = RESTCacheStorage("http://127.0.0.1:%d" % self.port)
+            node = TieredCacheStorage(
+                storage,
+                invalidation_log = RESTInvalidationLog(storage),
+                poll_interval = 0
+            )
+            self.addCleanup(node.close)
+            nodes.append(node)
+
+        nodes[0].store("a", 1, tags = {"x"})
+        nodes[0].store("b", 2, tags = {"y"})
+        assert nodes[1].retrieve_many(["a", "b"]) == {"a": 1, "b": 2}
+        assert nodes[1].l1.entry_count == 2
+
+        nodes[0].clear(["x"])
+        assert nodes[1].retrieve_many(["a", "b"]) == {"b": 2}
+
+        nodes[1].clear()
+        assert nodes[0].retrieve_many(["a", "b"]) == {}
@@ -0,0 +1,125 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail.caching import CacheKeyError
+
+
+class ShardedMemoryCacheStorageTestCase(TestCase):
+
+    def get_storage(self, **kwargs):
+        from cocktail.caching import ShardedMemoryCacheStorage
+        return ShardedMemoryCacheStorage(shard_count = 4, **kwargs)
+
+    def test_stores_and_retrieves_keys(self):
+
+        storage = self.get_storage()
+
+        for i in range(50):
+            storage.store("key%d" % i, i, tags = {"tag%d" % (i % 3)})
+
+        assert storage.entry_count == 50
+        assert all(shard.entry_count for shard in storage.shards)
+
+        for i in range(50):
+            assert storage.retrieve("key%d" % i) == i
+
+        assert storage.retrieve_with_metadata("key4") == (4, None, {"tag1"})
+
+        storage.set_expiration("key1", 1)
+        self.assertRaises(CacheKeyError, storage.retrieve, "key1")
+        assert storage.discard("key2")
+        assert not storage.exists("key2")
+
+        counters = storage.get_counters()
+        assert counters["hits"] == 51
+        assert counters["misses"] == 1
+
+    def test_clears_tags_across_shards(self):
+
+        storage = self.get_storage()
+
+        for i in range(30):
+            storage.store(
+                "key%d" % i,
+                i,
+                tags = {"tag%d" % (i % 3), "even" if i % 2 else "odd"}
+            )
+
+        storage.clear(["tag0", ("tag1", "odd")])
+
+        remaining = set(
+            i for i in range(30) if storage.exists("key%d" % i)
+        )
+        assert remaining == set(
+            i for i in range(30)
+            if i % 3 != 0 and not (i % 3 == 1 and i % 2 == 0)
+        )
+
+        storage.clear()
+        assert storage.entry_count == 0
+
+    def test_divides_memory_limit_between_shards(self):
+
+        storage = self.get_storage(memory_limit = "40K")
+
+        for shard in storage.shards:
+            assert shard.memory_limit == 10 * 1024
+
+        for i in range(200):
+            storage.store("key%d" % i, "x" * 1000)
+
+        for shard in storage.shards:
+            assert shard.memory_usage <= shard.memory_limit
+
+        assert storage.exists("key199")
+        assert not storage.exists("key0")
+
+    def test_drops_weight_from_the_largest_shard(self):
+
+        storage = self.get_storage()
+
+        # Choose keys that are assigned to different shards
+        small = "small"
+        large = next(
+            key
+            for key in ("large%d" % i for i in range(100))
+            if storage.get_shard(key) is not storage.get_shard(small)
+        )
+
+        storage.store(small, "x")
+        storage.store(large, "x" * 10000)
+
+        assert storage.drop_weight() == large
+        assert storage.drop_weight() == small
+        assert storage.drop_weight() is None
+
+    def test_supports_concurrent_access(self):
+
+        from threading import Thread
+
+        storage = self.get_storage(memory_limit = "1M")
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(500):
+                    key = "key%d" % (i % 50)
+                    storage.store(key, i, tags = {"thread%d" % n})
+                    storage.exists(key)
+                    if i % 100 == 0:
+                        storage.clear(["thread%d" % ((n + 1) % 8)])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [Thread(target = worker, args = (n,)) for n in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert not errors
@@ -0,0 +1,135 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail.caching import CacheKeyError
+
+
+class SharedMemoryCacheStorageTestCase(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        self._temp_dir = mkdtemp()
+        self.storages = []
+
+    def tearDown(self):
+        from shutil import rmtree
+        for storage in self.storages:
+            storage.close()
+        rmtree(self._temp_dir)
+
+    def open_storage(self, **kwargs):
+        from os.path import join
+        from cocktail.caching import SharedMemoryCacheStorage
+        kwargs.setdefault("size", "1M")
+        kwargs.setdefault("page_size", "64K")
+        storage = SharedMemoryCacheStorage(
+            join(self._temp_dir, "cache"),
+            **kwargs
+        )
+        self.storages.append(storage)
+        return storage
+
+    def test_stores_and_retrieves_keys(self):
+
+        storage = self.open_storage()
+        storage.store("foo", {"a": [1, 2, 3]}, tags = {"x", "y"})
+        storage.store("bar", "value", expiration = 2 ** 40)
+
+        assert storage.exists("foo")
+        assert storage.retrieve("foo") == {"a": [1, 2, 3]}
+        assert storage.retrieve_with_metadata("foo") == \
+            ({"a": [1, 2, 3]}, None, {"x", "y"})
+        assert storage.get_expiration("bar") == 2 ** 40
+
+        storage.store("foo", "replaced")
+        assert storage.retrieve("foo") == "replaced"
+        assert storage.entry_count == 2
+
+        assert storage.discard("foo")
+        assert not storage.discard("foo")
+        self.assertRaises(CacheKeyError, storage.retrieve, "foo")
+
+    def test_expires_keys(self):
+        storage = self.open_storage()
+        storage.store("foo", 1, expiration = 1)
+        assert not storage.exists("foo")
+        storage.store("bar", 1)
+        storage.set_expiration("bar", 1)
+        self.assertRaises(CacheKeyError, storage.retrieve, "bar")
+
+    def test_clears_scopes(self):
+
+        storage = self.open_storage()
+
+        for i in range(30):
+            storage.store(
+                "key%d" % i,
+                i,
+                tags = {"tag%d" % (i % 3), "even" if i % 2 else "odd"}
+            )
+
+        storage.clear(["tag0", ("tag1", "odd")])
+
+        remaining = set(
+            i for i in range(30) if storage.exists("key%d" % i)
+        )
+        assert remaining == set(
+            i for i in range(30)
+            if i % 3 != 0 and not (i % 3 == 1 and i % 2 == 0)
+        )
+
+        storage.clear()
+        assert storage.entry_count == 0
+        assert not storage.exists("key2")
+
+        storage.store("key2", 2)
+        assert storage.retrieve("key2") == 2
+
+    def test_evicts_least_recently_used_records(self):
+
+        storage = self.open_storage(size = "128K", page_size = "64K")
+        value = "x" * 20000
+
+        # Two pages with three chunks each
+        for i in range(8):
+            storage.store("key%d" % i, value)
+            storage.retrieve("key0")
+
+        assert storage.entry_count == 6
+        assert storage.exists("key0")
+        assert not storage.exists("key1")
+        assert not storage.exists("key2")
+        assert storage.exists("key7")
+        assert storage.drop_weight() == "key3"
+
+    def test_ignores_values_larger_than_a_page(self):
+        storage = self.open_storage()
+        storage.store("foo", "x" * 100000)
+        assert not storage.exists("foo")
+
+    def test_shares_entries_and_invalidations_between_processes(self):
+
+        from multiprocessing import get_context
+
+        storage = self.open_storage()
+        storage.store("local", "value", tags = {"shared"})
+
+        def child():
+            storage.store("remote", "from child", tags = {"other"})
+            storage.clear(["shared"])
+
+        process = get_context("fork").Process(target = child)
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+        assert storage.retrieve("remote") == "from child"
+        assert not storage.exists("local")
+
+        other = self.open_storage()
+        assert other.retrieve("remote") == "from child"
+        other.clear(["other"])
+        assert not storage.exists("remote")
@@ -0,0 +1,265 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from tempfile import mkdtemp
+from shutil import rmtree
+from threading import Thread, Event
+from time import time, sleep
+import os
+
+from cocktail.caching import Cache, CacheKeyError, MemoryCacheStorage
+
+
+class SingleFlightTestCase(TestCase):
+
+    def get_cache(self, **kwargs):
+        cache = Cache(MemoryCacheStorage())
+        for key, value in kwargs.items():
+            setattr(cache, key, value)
+        return cache
+
+    def test_coalesces_concurrent_misses(self):
+
+        cache = self.get_cache()
+        productions = []
+        results = []
+
+        def producer():
+            productions.append(None)
+            sleep(0.2)
+            return "value", None, {"tag"}
+
+        def worker():
+            results.append(cache.retrieve_or_produce("key", producer))
+
+        threads = [Thread(target = worker) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(productions) == 1
+        assert results == [("value", None, {"tag"})] * 20
+        assert cache.retrieve("key") == "value"
+
+    def test_serves_stale_values_while_revalidating(self):
+
+        cache = self.get_cache(grace_period = 60)
+        cache.store("key", "old", expiration = int(time()) - 1)
+
+        self.assertRaises(CacheKeyError, cache.retrieve, "key")
+        self.assertRaises(CacheKeyError, cache.retrieve_with_metadata, "key")
+        assert cache.retrieve_many(["key"]) == {}
+
+        # Another caller is revalidating the entry
+        producing = Event()
+        proceed = Event()
+
+        def slow_producer():
+            producing.set()
+            proceed.wait()
+            return "new", int(time()) + 60, None
+
+        thread = Thread(
+            target = cache.retrieve_or_produce,
+            args = ("key", slow_producer)
+        )
+        thread.start()
+        producing.wait()
+
+        def failing_producer():
+            raise AssertionError("Shouldn't produce the value again")
+
+        value, expiration, tags = \
+            cache.retrieve_or_produce("key", failing_producer)
+        assert value == "old"
+
+        proceed.set()
+        thread.join()
+
+        assert cache.retrieve("key") == "new"
+        assert cache.retrieve_or_produce("key", failing_producer)[0] == "new"
+        assert cache.storage.get_expiration("key") == \
+            cache.retrieve_with_metadata("key")[1] + 60
+
+    def test_stale_values_are_treated_as_missing(self):
+
+        cache = self.get_cache(grace_period = 60)
+        cache.store("key", "old", expiration = int(time()) - 1, tags = {"x"})
+
+        assert not cache.exists("key")
+        self.assertRaises(CacheKeyError, cache.get_expiration, "key")
+        self.assertRaises(
+            CacheKeyError,
+            cache.set_expiration,
+            "key",
+            int(time()) + 50
+        )
+
+        expiration = int(time()) + 50
+        cache.store("key", "value", expiration = expiration, tags = {"x"})
+        assert cache.exists("key")
+        assert cache.get_expiration("key") == expiration
+
+        # Extending the expiration updates the freshness of the entry
+        cache.set_expiration("key", expiration + 10)
+        assert cache.get_expiration("key") == expiration + 10
+        assert cache.storage.get_expiration("key") == expiration + 70
+        assert cache.retrieve_with_metadata("key") == \
+            ("value", expiration + 10, {"x"})
+
+        cache.set_expiration("key", int(time()) - 1)
+        assert not cache.exists("key")
+        self.assertRaises(CacheKeyError, cache.retrieve, "key")
+
+        cache.store("key", "value", expiration = expiration)
+        cache.set_expiration("key", None)
+        assert cache.retrieve("key") == "value"
+        assert cache.get_expiration("key") is None
+
+    def test_doesnt_store_failed_productions(self):
+
+        cache = self.get_cache()
+
+        def producer():
+            raise ValueError()
+
+        self.assertRaises(
+            ValueError,
+            cache.retrieve_or_produce,
+            "key",
+            producer
+        )
+        assert not cache.exists("key")
+
+        # The lock has been released
+        assert cache.retrieve_or_produce(
+            "key",
+            lambda: ("value", None, None)
+        ) == ("value", None, None)
+
+    def test_produces_without_storage(self):
+        cache = Cache()
+        assert cache.retrieve_or_produce(
+            "key",
+            lambda: ("value", 1500000000.5, {"tag"})
+        ) == ("value", 1500000000, {"tag"})
+
+    def test_coalesces_misses_across_processes(self):
+
+        from multiprocessing import get_context
+        from cocktail.caching import SharedMemoryCacheStorage
+        from cocktail.caching.singleflight import FileFlightLocks
+
+        temp_dir = mkdtemp()
+        self.addCleanup(rmtree, temp_dir)
+        log_path = os.path.join(temp_dir, "productions")
+
+        storage = SharedMemoryCacheStorage(
+            os.path.join(temp_dir, "cache"),
+            size = "4M",
+            page_size = "64K"
+        )
+        self.addCleanup(storage.close)
+        cache = Cache(storage)
+        cache.flight_locks = FileFlightLocks(os.path.join(temp_dir, "locks"))
+
+        def producer():
+            with open(log_path, "a") as log:
+                log.write("%d\n" % os.getpid())
+            sleep(0.3)
+            return "value", None, None
+
+        def child():
+            os._exit(
+                0 if cache.retrieve_or_produce("key", producer)[0] == "value"
+                else 1
+            )
+
+        context = get_context("fork")
+        processes = [context.Process(target = child) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert [process.exitcode for process in processes] == [0] * 4
+
+        with open(log_path) as log:
+            assert len(log.read().splitlines()) == 1
+
+    def test_nested_productions_share_lock_files(self):
+
+        from cocktail.caching.singleflight import FileFlightLocks
+
+        temp_dir = mkdtemp()
+        self.addCleanup(rmtree, temp_dir)
+
+        cache = self.get_cache(flight_timeout = 5)
+        cache.flight_locks = FileFlightLocks(temp_dir, slot_count = 1)
+
+        def produce_inner():
+            return "inner", None, None
+
+        def produce_outer():
+            inner = cache.retrieve_or_produce("inner", produce_inner)[0]
+            return "outer+" + inner, None, None
+
+        start = time()
+        assert cache.retrieve_or_produce("outer", produce_outer)[0] == \
+            "outer+inner"
+        assert time() - start < 1
+
+        # The lock file is released once the outermost production ends; a
+        # different set of locks acts like another process
+        other_locks = FileFlightLocks(temp_dir, slot_count = 1)
+        assert other_locks.acquire("foo", blocking = False)
+        assert not cache.flight_locks.acquire("bar", blocking = False)
+        other_locks.release("foo")
+        assert cache.flight_locks.acquire("bar", blocking = False)
+        cache.flight_locks.release("bar")
+
+    def test_crossed_lock_files_dont_deadlock(self):
+
+        from cocktail.caching.singleflight import FileFlightLocks
+
+        temp_dir = mkdtemp()
+        self.addCleanup(rmtree, temp_dir)
+
+        locks = FileFlightLocks(temp_dir, slot_count = 64)
+        other_locks = FileFlightLocks(temp_dir, slot_count = 64)
+
+        key_a = "a"
+        key_b = next(
+            key
+            for key in ("b%d" % i for i in range(1000))
+            if locks.get_lock_path(key) != locks.get_lock_path(key_a)
+        )
+
+        holding = Event()
+        proceed = Event()
+
+        def other_process():
+            other_locks.acquire(key_b)
+            holding.set()
+            proceed.wait()
+            other_locks.release(key_b)
+
+        thread = Thread(target = other_process)
+        thread.start()
+        holding.wait()
+
+        try:
+            assert locks.acquire(key_a)
+            start = time()
+            assert not locks.acquire(key_b, timeout = 5)
+            assert time() - start < 1
+            locks.release(key_a)
+        finally:
+            proceed.set()
+            thread.join()
+
+        assert locks.acquire(key_b, timeout = 5)
+        locks.release(key_b)
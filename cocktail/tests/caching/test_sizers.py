@@ -0,0 +1,198 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from sys import getsizeof
+
+
+class Node:
+
+    def __init__(self, value, next = None):
+        self.value = value
+        self.next = next
+
+
+class SlottedNode:
+
+    __slots__ = ("value", "next")
+
+    def __init__(self, value, next = None):
+        self.value = value
+        self.next = next
+
+
+class DeepSizerTestCase(TestCase):
+
+    def get_sizer(self):
+        from cocktail.caching import DeepSizer
+        return DeepSizer()
+
+    def test_measures_nested_containers(self):
+
+        sizer = self.get_sizer()
+        a = "a" * 1000
+        b = "b" * 2000
+        value = [a, (b, {"key": a + b})]
+
+        assert sizer.get_size(value) == (
+            getsizeof(value)
+            + getsizeof(a)
+            + getsizeof(value[1])
+            + getsizeof(b)
+            + getsizeof(value[1][1])
+            + getsizeof("key")
+            + getsizeof(a + b)
+        )
+
+    def test_counts_shared_objects_once(self):
+        sizer = self.get_sizer()
+        chunk = "x" * 10000
+        value = [chunk] * 100
+        assert sizer.get_size(value) == getsizeof(value) + getsizeof(chunk)
+
+    def test_supports_cycles(self):
+
+        sizer = self.get_sizer()
+
+        value = []
+        value.append(value)
+        assert sizer.get_size(value) == getsizeof(value)
+
+        a = Node("a")
+        b = Node("b", a)
+        a.next = b
+        assert sizer.get_size(a) == sizer.get_size(b)
+
+    def test_traverses_object_attributes(self):
+
+        sizer = self.get_sizer()
+        payload = "x" * 10000
+
+        for node_type in (Node, SlottedNode):
+            node = node_type(payload)
+            assert sizer.get_size(node) > getsizeof(payload)
+            assert sizer.get_size(node_type(payload, node)) \
+                > sizer.get_size(node)
+
+    def test_doesnt_count_shared_objects(self):
+        sizer = self.get_sizer()
+        value = (len, Node, TestCase.setUp)
+        assert sizer.get_size(value) == getsizeof(value)
+
+    def test_supports_deeply_nested_values(self):
+        sizer = self.get_sizer()
+        node = None
+        for i in range(10000):
+            node = SlottedNode(i, node)
+        assert sizer.get_size(node) > getsizeof(node) * 10000
+
+    def test_referents_can_be_customized_by_type(self):
+
+        from cocktail.caching import DeepSizer, SHARED
+
+        payload = "x" * 10000
+        value = [Node(payload)]
+
+        referents = DeepSizer.referents.copy()
+        referents[Node] = SHARED
+        sizer = DeepSizer(referents)
+        assert sizer.get_size(value) == getsizeof(value)
+
+        referents[Node] = None
+        assert sizer.get_size(value) == getsizeof(value) + getsizeof(value[0])
+
+        # Other sizers are unaffected
+        assert self.get_sizer().get_size(value) > getsizeof(payload)
+
+
+class SampledSizerTestCase(TestCase):
+
+    def test_measures_small_values_exactly(self):
+
+        from cocktail.caching import DeepSizer, SampledSizer
+
+        value = [str(i) * i for i in range(50)]
+        assert SampledSizer().get_size(value) == DeepSizer().get_size(value)
+
+    def test_estimates_the_size_of_large_containers(self):
+
+        from cocktail.caching import DeepSizer, SampledSizer
+
+        value = ["x" * (500 + i % 100) for i in range(5000)]
+        exact = DeepSizer().get_size(value)
+        estimate = SampledSizer(sample_size = 100).get_size(value)
+        assert abs(estimate - exact) / exact < 0.1
+
+        value = dict((str(i), "x" * (i % 100)) for i in range(5000))
+        exact = DeepSizer().get_size(value)
+        estimate = SampledSizer(sample_size = 100).get_size(value)
+        assert abs(estimate - exact) / exact < 0.1
+
+    def test_estimates_are_stable(self):
+
+        from cocktail.caching import SampledSizer
+
+        sizer = SampledSizer()
+        value = [str(i) * (i % 50) for i in range(5000)]
+        size = sizer.get_size(value)
+
+        for i in range(3):
+            assert sizer.get_size(value) == size
+            assert sizer.get_size([str(i)] * (100 + i)) > 0
+
+
+class SerializedSizerTestCase(TestCase):
+
+    def test_measures_serialized_values(self):
+
+        from pickle import dumps
+        from cocktail.caching import SerializedSizer
+
+        value = {"a": ["x" * 1000, 2], "b": None}
+        assert SerializedSizer().get_size(value) == len(dumps(value))
+
+    def test_falls_back_for_values_that_cant_be_serialized(self):
+
+        from cocktail.caching import SerializedSizer, ShallowSizer
+
+        value = [lambda: None]
+        sizer = SerializedSizer(fallback = ShallowSizer())
+        assert sizer.get_size(value) == getsizeof(value)
+
+
+class MemoryCacheStorageSizersTestCase(TestCase):
+
+    def test_sizers_are_chosen_by_value_type(self):
+
+        from cocktail.typemapping import TypeMapping
+        from cocktail.caching import (
+            MemoryCacheStorage,
+            ShallowSizer,
+            DeepSizer
+        )
+
+        payload = "x" * 10000
+        sizers = TypeMapping((
+            (object, ShallowSizer()),
+            (list, DeepSizer())
+        ))
+        shallow = MemoryCacheStorage(sizers = sizers)
+        shallow.store("foo", (payload,))
+        assert shallow.memory_usage < getsizeof(payload)
+
+        deep = MemoryCacheStorage(sizers = sizers)
+        deep.store("foo", [payload])
+        assert deep.memory_usage - shallow.memory_usage > getsizeof(payload)
+
+    def test_memory_limit_accounts_for_nested_content(self):
+
+        from cocktail.caching import MemoryCacheStorage
+
+        storage = MemoryCacheStorage(memory_limit = "100K")
+
+        for i in range(20):
+            storage.store(str(i), ["x" * 10000])
+
+        assert storage.memory_usage <= 100 * 1024
+        assert 0 < storage.entry_count < 10
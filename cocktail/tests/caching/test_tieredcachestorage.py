@@ -0,0 +1,228 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from tempfile import mkdtemp
+from shutil import rmtree
+import os
+
+from cocktail.caching import (
+    CacheKeyError,
+    MemoryCacheStorage,
+    whole_cache
+)
+
+
+class CountingStorage(MemoryCacheStorage):
+
+    def __init__(self, *args, **kwargs):
+        MemoryCacheStorage.__init__(self, *args, **kwargs)
+        self.retrievals = 0
+
+    def retrieve_with_metadata(self, key):
+        self.retrievals += 1
+        return MemoryCacheStorage.retrieve_with_metadata(self, key)
+
+
+class TieredCacheStorageTestCase(TestCase):
+
+    def get_node(self, l2, invalidation_log, **kwargs):
+        from cocktail.caching import TieredCacheStorage
+        node = TieredCacheStorage(
+            l2,
+            invalidation_log = invalidation_log,
+            **kwargs
+        )
+        self.addCleanup(node.close)
+        return node
+
+    def test_serves_reads_from_the_local_storage(self):
+
+        from cocktail.caching import MemoryInvalidationLog
+
+        l2 = CountingStorage()
+        l2.store("foo", 1, tags = {"x"})
+
+        node = self.get_node(l2, MemoryInvalidationLog())
+
+        for i in range(5):
+            assert node.retrieve("foo") == 1
+            assert node.retrieve_with_metadata("foo") == (1, None, {"x"})
+
+        assert l2.retrievals == 1
+        assert node.l1.retrieve_with_metadata("foo") == (1, None, {"x"})
+
+        self.assertRaises(CacheKeyError, node.retrieve, "bar")
+        assert not node.exists("bar")
+
+    def test_retrieves_many_keys_from_both_tiers(self):
+
+        from cocktail.caching import MemoryInvalidationLog
+
+        l2 = MemoryCacheStorage()
+        node = self.get_node(l2, MemoryInvalidationLog())
+
+        node.store("a", 1, tags = {"x"})
+        l2.store("b", 2, tags = {"y"})
+
+        assert node.retrieve_many(["a", "b", "c"]) == {"a": 1, "b": 2}
+        assert node.l1.retrieve_with_metadata("b") == (2, None, {"y"})
+
+    def test_writes_to_both_tiers(self):
+
+        from cocktail.caching import MemoryInvalidationLog
+
+        l2 = MemoryCacheStorage()
+        node = self.get_node(l2, MemoryInvalidationLog())
+
+        node.store("foo", 1, tags = {"x"})
+        node.store_many({"bar": 2, "baz": 3}, tags = {"y"})
+
+        for storage in (node.l1, l2):
+            assert storage.retrieve_many(["foo", "bar", "baz"]) == \
+                {"foo": 1, "bar": 2, "baz": 3}
+
+        assert node.discard("foo")
+        assert not node.l1.exists("foo")
+        assert not l2.exists("foo")
+
+    def test_pushes_invalidations_to_local_nodes(self):
+
+        from cocktail.caching import Cache, MemoryInvalidationLog
+
+        l2 = MemoryCacheStorage()
+        log = MemoryInvalidationLog()
+        node1 = self.get_node(l2, log, poll_interval = 3600)
+        node2 = self.get_node(l2, log, poll_interval = 3600)
+
+        node1.store("a", 1, tags = {"x", "y"})
+        node1.store("b", 2, tags = {"x"})
+        node1.store("c", 3, tags = {"z"})
+        node2.retrieve_many(["a", "b", "c"])
+
+        Cache(node1).clear(("x", "y"))
+        assert node2.retrieve_many(["a", "b", "c"]) == {"b": 2, "c": 3}
+
+        Cache(node2).clear(["z"])
+        assert not node1.l1.exists("c")
+        assert node1.retrieve_many(["a", "b", "c"]) == {"b": 2}
+
+        Cache(node1).clear()
+        assert node2.l1.entry_count == 0
+
+    def test_polls_invalidations_from_other_processes(self):
+
+        from cocktail.caching import FileInvalidationLog
+
+        path = os.path.join(self.get_temp_dir(), "invalidations")
+        l2 = MemoryCacheStorage()
+
+        # Separate log instances don't notify each other's subscribers, as if
+        # the nodes lived in different processes
+        node1 = self.get_node(l2, FileInvalidationLog(path), poll_interval = 0)
+        node2 = self.get_node(
+            l2,
+            FileInvalidationLog(path),
+            poll_interval = 3600
+        )
+
+        node1.store("a", 1, tags = {"x"})
+        node1.store("b", 2, tags = {"y"})
+        assert node2.retrieve_many(["a", "b"]) == {"a": 1, "b": 2}
+
+        node1.clear(["x"])
+        assert not node1.exists("a")
+
+        # node2 serves stale entries until it polls the log
+        assert node2.retrieve("a") == 1
+        node2.sync()
+        self.assertRaises(CacheKeyError, node2.retrieve, "a")
+        assert node2.retrieve("b") == 2
+
+        node2.retrieve_many(["b"])
+        node2.clear()
+        assert node1.retrieve_many(["a", "b"]) == {}
+
+    def test_doesnt_cache_entries_invalidated_while_being_fetched(self):
+
+        from cocktail.caching import MemoryInvalidationLog
+
+        log = MemoryInvalidationLog()
+
+        class InterruptedStorage(MemoryCacheStorage):
+
+            def retrieve_with_metadata(self, key):
+                entry = MemoryCacheStorage.retrieve_with_metadata(self, key)
+                log.publish(["x"])
+                return entry
+
+        l2 = InterruptedStorage()
+        l2.store("foo", 1, tags = {"x"})
+
+        node = self.get_node(l2, log)
+        assert node.retrieve("foo") == 1
+        assert not node.l1.exists("foo")
+
+    def get_temp_dir(self):
+        path = mkdtemp()
+        self.addCleanup(rmtree, path)
+        return path
+
+
+class InvalidationLogTestCase(TestCase):
+
+    def test_memory_log_returns_published_scopes(self):
+
+        from cocktail.caching import MemoryInvalidationLog
+
+        log = MemoryInvalidationLog(max_size = 3)
+        start = log.get_position()
+
+        position, scopes = log.read(start)
+        assert position == start
+        assert scopes == []
+
+        log.publish({"a"})
+        log.publish({("b", "c")})
+        position, scopes = log.read(start)
+        assert scopes == [{"a"}, {("b", "c")}]
+        assert log.read(position) == (position, [])
+
+        # Readers falling behind the retained entries clear everything
+        for i in range(3):
+            log.publish({"d"})
+
+        assert log.read(start)[1] == [whole_cache]
+        assert log.read(position)[1] == [{"d"}, {"d"}, {"d"}]
+
+        # Positions from another log are invalid
+        other_position = MemoryInvalidationLog().get_position()
+        assert log.read(other_position)[1] == [whole_cache]
+
+    def test_file_log_returns_published_scopes(self):
+
+        from cocktail.caching import FileInvalidationLog
+
+        temp_dir = mkdtemp()
+        self.addCleanup(rmtree, temp_dir)
+        path = os.path.join(temp_dir, "invalidations")
+
+        writer = FileInvalidationLog(path, max_size = 200)
+        reader = FileInvalidationLog(path)
+        start = reader.get_position()
+
+        writer.publish({"a"})
+        writer.publish({("b", "c"), "d"})
+        writer.publish(whole_cache)
+
+        position, scopes = reader.read(start)
+        assert scopes == [{"a"}, {("b", "c"), "d"}, whole_cache]
+        assert reader.read(position) == (position, [])
+
+        # Truncating the log starts a new epoch
+        for i in range(20):
+            writer.publish({"tag%d" % i})
+
+        assert reader.read(position)[1] == [whole_cache]
+        assert os.path.getsize(path) <= 250
@@ -0,0 +1,225 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from tempfile import mkdtemp
+from shutil import rmtree
+from threading import Lock
+from time import time, sleep
+import os
+
+from cocktail.caching import whole_cache
+
+
+class CacheWarmerTestCase(TestCase):
+
+    def setUp(self):
+
+        from cocktail.caching import (
+            Cache,
+            CacheWarmer,
+            MemoryCacheStorage,
+            replayer
+        )
+
+        self.cache = Cache(MemoryCacheStorage())
+        self.warmer = CacheWarmer(self.cache)
+        self.warmer.pause = 0
+        self.replays = []
+
+        @replayer("test.value")
+        def replay_value(cache, key, value, tags):
+            self.replays.append(key)
+            cache.store(key, value, tags = tags)
+
+        @replayer("test.error")
+        def replay_error(cache, key):
+            raise ValueError()
+
+    def tearDown(self):
+        from cocktail.caching.warmup import replayers
+        replayers.pop("test.value", None)
+        replayers.pop("test.error", None)
+
+    def wait(self):
+        start = time()
+        while self.warmer.busy or self.warmer.task_manager:
+            assert time() - start < 5
+            sleep(0.01)
+
+    def store(self, key, value, tags = None):
+        self.cache.store(key, value, tags = tags)
+        self.warmer.record(key, "test.value", (key, value, tags), tags)
+
+    def test_ranks_entries_by_requests(self):
+
+        for i in range(3):
+            self.store("a", 1, ["x"])
+        self.store("b", 2, ["y"])
+        for i in range(2):
+            self.store("c", 3, ["x", "y"])
+
+        assert self.cache.warmer is self.warmer
+        assert [r.key for r in self.warmer.get_records()] == ["a", "c", "b"]
+        assert [r.key for r in self.warmer.get_records(limit = 2)] == \
+            ["a", "c"]
+        assert [r.key for r in self.warmer.get_records(["y"])] == ["c", "b"]
+        assert [r.key for r in self.warmer.get_records([("x", "y")])] == \
+            ["c"]
+
+    def test_keeps_a_bounded_number_of_records(self):
+
+        self.warmer.max_records = 10
+
+        for i in range(10):
+            for j in range(i + 1):
+                self.store("key%d" % i, i)
+
+        self.store("new", None)
+
+        keys = [r.key for r in self.warmer.get_records()]
+        assert keys == ["key9", "key8", "key7", "key6", "key5", "new"]
+
+    def test_rebuilds_invalidated_entries(self):
+
+        self.store("a", 1, ["x"])
+        self.store("b", 2, ["y"])
+        self.store("c", 3)
+
+        self.cache.clear(["x"])
+        self.wait()
+        assert self.replays == ["a"]
+        assert self.cache.retrieve("a") == 1
+
+        self.cache.clear()
+        self.wait()
+        assert sorted(self.replays) == ["a", "a", "b", "c"]
+        assert self.cache.retrieve_many(["a", "b", "c"]) == \
+            {"a": 1, "b": 2, "c": 3}
+
+    def test_replays_dont_count_as_hits(self):
+
+        from cocktail.caching import replayer
+
+        # Rebuilding an entry requests it again, like the original request
+        @replayer("test.value")
+        def replay_value(cache, key, value, tags):
+            self.replays.append(key)
+            self.store(key, value, tags)
+
+        for i in range(3):
+            self.store("a", 1)
+        self.store("b", 2)
+
+        self.cache.clear()
+        self.wait()
+        assert sorted(self.replays) == ["a", "b"]
+        assert self.cache.retrieve_many(["a", "b"]) == {"a": 1, "b": 2}
+        assert [(r.key, r.hits) for r in self.warmer.get_records()] == \
+            [("a", 3), ("b", 1)]
+
+    def test_skips_entries_already_present(self):
+        self.store("a", 1)
+        self.warmer.warm_up()
+        self.wait()
+        assert not self.replays
+
+    def test_limits_concurrency(self):
+
+        from cocktail.caching import replayer
+
+        lock = Lock()
+        active = []
+        peak = []
+
+        @replayer("test.value")
+        def replay_value(cache, key, value, tags):
+            with lock:
+                active.append(key)
+                peak.append(len(active))
+            sleep(0.02)
+            with lock:
+                active.remove(key)
+            cache.store(key, value)
+
+        self.warmer.worker_count = 2
+        for i in range(10):
+            self.warmer.record("key%d" % i, "test.value", ("key%d" % i, i, None))
+
+        self.warmer.warm_up()
+        self.wait()
+
+        assert max(peak) == 2
+        assert self.cache.retrieve_many(["key%d" % i for i in range(10)]) == \
+            dict(("key%d" % i, i) for i in range(10))
+        assert not self.warmer.task_manager
+
+    def test_forgets_entries_that_cant_be_rebuilt(self):
+
+        self.warmer.record("a", "test.error", ("a",))
+        self.warmer.record("b", "test.missing", ())
+        self.warmer.warm_up()
+        self.wait()
+
+        assert self.warmer.failed == 2
+        assert not self.warmer.get_records()
+
+    def test_survives_storage_errors(self):
+
+        self.warmer.warm_up_on_invalidation = False
+        self.store("a", 1)
+        self.store("b", 2)
+        self.cache.clear()
+
+        exists = self.cache.exists
+        failures = []
+
+        def failing_exists(key):
+            if not failures:
+                failures.append(key)
+                raise IOError("Storage unavailable")
+            return exists(key)
+
+        self.cache.exists = failing_exists
+        self.warmer.worker_count = 1
+        self.warmer.warm_up()
+        self.wait()
+
+        assert self.warmer.failed == 1
+        assert len(self.replays) == 1
+        assert len(self.warmer.get_records()) == 2
+
+        # The worker count was restored, so later invalidations are handled
+        self.warmer.warm_up_on_invalidation = True
+        self.cache.clear()
+        self.wait()
+        assert len(self.replays) == 3
+
+    def test_records_survive_restarts(self):
+
+        from cocktail.caching import Cache, CacheWarmer, MemoryCacheStorage
+
+        temp_dir = mkdtemp()
+        self.addCleanup(rmtree, temp_dir)
+        path = os.path.join(temp_dir, "warmup.json")
+
+        self.store("a", 1, ["x"])
+        self.store("a", 1, ["x"])
+        self.store("b", [2], None)
+        self.warmer.save(path)
+
+        cache = Cache(MemoryCacheStorage())
+        warmer = CacheWarmer(cache)
+        warmer.load(path)
+        warmer.load(os.path.join(temp_dir, "missing.json"))
+        assert [(r.key, r.hits, r.tags) for r in warmer.get_records()] == \
+            [("a", 2, {"x"}), ("b", 1, None)]
+
+        warmer.warm_up()
+        start = time()
+        while warmer.busy:
+            assert time() - start < 5
+            sleep(0.01)
+
+        assert cache.retrieve_many(["a", "b"]) == {"a": 1, "b": [2]}
@@ -0,0 +1,97 @@
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+
+class CachedWarmUpTestCase(TestCase):
+
+    def replay(self, *args):
+        from cocktail.controllers import cached
+        with patch.object(cached, "urlopen", MagicMock()) as urlopen:
+            cached._replay_request(None, *args)
+        return urlopen.call_args[0][0]
+
+    def test_replays_requests_against_the_local_server(self):
+
+        from cocktail.controllers import cached
+
+        with patch.object(cached, "warmup_base_url", "http://127.0.0.1:8080/"):
+            request = self.replay(
+                "/products?page=2",
+                "www.example.com",
+                "https"
+            )
+
+        assert request.full_url == "http://127.0.0.1:8080/products?page=2"
+        assert request.get_header("Host") == "www.example.com"
+        assert request.get_header("X-forwarded-scheme") == "https"
+
+        with patch.object(cached, "warmup_base_url", "http://127.0.0.1:8080"):
+            request = self.replay("//evil.example.com/")
+
+        assert request.host == "127.0.0.1:8080"
+
+    def test_defaults_to_the_address_of_the_server(self):
+
+        import cherrypy
+        from cocktail.controllers.cached import get_warmup_base_url
+
+        server = cherrypy.server
+        prev_address = server.socket_host, server.socket_port
+        server.socket_host = "0.0.0.0"
+        server.socket_port = 8081
+        try:
+            assert get_warmup_base_url() == "http://127.0.0.1:8081"
+        finally:
+            server.socket_host, server.socket_port = prev_address
+
+    def test_rejects_absolute_urls(self):
+        with self.assertRaises(ValueError):
+            self.replay("http://169.254.169.254/latest/meta-data/")
+
+    def test_replayed_requests_dont_count_as_hits(self):
+
+        import cherrypy
+        from cherrypy._cprequest import Request, Response
+        from cocktail.caching import Cache, CacheWarmer, MemoryCacheStorage
+        from cocktail.controllers.cached import Cached, WARMUP_HEADER
+
+        cache = Cache(MemoryCacheStorage())
+        warmer = CacheWarmer(cache)
+        warmer.warm_up_on_invalidation = False
+
+        class Controller(Cached):
+
+            def _produce_content(self, **kwargs):
+                return "content"
+
+        Controller.cache = cache
+
+        def request(headers):
+            prev_request = cherrypy.serving.request
+            prev_response = cherrypy.serving.response
+            cherrypy.serving.load(
+                Request(("127.0.0.1", 80), ("127.0.0.1", 1234)),
+                Response()
+            )
+            try:
+                cherrypy.request.method = "GET"
+                cherrypy.request.path_info = "/products"
+                cherrypy.request.headers.update(headers)
+                return Controller()._apply_cache()
+            finally:
+                cherrypy.serving.load(prev_request, prev_response)
+
+        assert request({"Host": "www.example.com"}) == b"content"
+        hits = [record.hits for record in warmer.get_records()]
+        assert hits == [1]
+
+        cache.clear()
+        assert request({
+            "Host": "www.example.com",
+            WARMUP_HEADER: "1"
+        }) == b"content"
+        assert [record.hits for record in warmer.get_records()] == hits
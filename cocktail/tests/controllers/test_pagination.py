@@ -0,0 +1,63 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail import schema
+from cocktail.persistence import PersistentObject
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class PaginatedItem(PersistentObject):
+    position = schema.Integer(indexed = True, unique = True)
+
+
+class CursorPaginationTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        self.items = []
+        for i in range(10):
+            item = PaginatedItem(position = i)
+            item.insert()
+            self.items.append(item)
+
+    def paginate(self, page_size, cursor = None):
+        from cocktail.controllers.pagination import Pagination
+        pagination = Pagination()
+        pagination.items = PaginatedItem.select(order = "position")
+        pagination.page_size = page_size
+        pagination.cursor = cursor
+        return pagination
+
+    def test_walks_pages_using_cursors(self):
+
+        pagination = self.paginate(4)
+        assert list(pagination.current_page_items) == self.items[:4]
+
+        pagination = self.paginate(4, pagination.next_cursor)
+        assert list(pagination.current_page_items) == self.items[4:8]
+
+        pagination = self.paginate(4, pagination.next_cursor)
+        assert len(pagination.current_page_items) == 2
+        assert list(pagination.current_page_items) == self.items[8:]
+        assert pagination.next_cursor is None
+
+    def test_last_page_ending_at_a_page_boundary(self):
+
+        pagination = self.paginate(5)
+        pagination = self.paginate(5, pagination.next_cursor)
+        assert len(pagination.current_page_items) == 5
+        assert list(pagination.current_page_items) == self.items[5:]
+        assert pagination.next_cursor is None
+
+    def test_cursor_past_the_last_item(self):
+
+        query = PaginatedItem.select(order = "position")
+        pagination = self.paginate(5, query.cursor_for(self.items[-1]))
+        assert len(pagination.current_page_items) == 0
+        assert not list(pagination.current_page_items)
+        assert pagination.next_cursor is None
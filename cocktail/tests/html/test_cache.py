@@ -224,3 +224,67 @@ class CacheTestCase(TestCase):
         html = e.render(cache = self.cache)
         assert "foo" in html
 
+
+    def test_concurrent_renderings_produce_cached_content_once(self):
+
+        from threading import Thread
+        from time import sleep
+        from cocktail.html.element import Element
+
+        productions = []
+
+        class SlowElement(Element):
+
+            def _ready(self):
+                Element._ready(self)
+                productions.append(None)
+                sleep(0.2)
+                self.append("Hello")
+
+        results = []
+
+        def render():
+            e = SlowElement()
+            e.cached = True
+            e.cache_key = "slow"
+            results.append(e.render(cache = self.cache))
+
+        threads = [Thread(target = render) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(productions) == 1
+        assert results == ["<div class=\"SlowElement\">Hello</div>"] * 10
+
+    def test_warmer_rebuilds_invalidated_elements(self):
+
+        from time import time, sleep
+        from cocktail.caching import CacheWarmer
+        from cocktail.html.element import Element
+
+        warmer = CacheWarmer(self.cache)
+        warmer.pause = 0
+
+        e = Element()
+        e.cached = True
+        e.cache_key = "warm"
+        e.cache_tags.add("foo")
+        e.warmup_arguments = {"cache_key": "warm"}
+        e.render(cache = self.cache)
+
+        records = warmer.get_records()
+        assert len(records) == 1
+        key = records[0].key
+        assert self.cache.exists(key)
+
+        self.cache.clear(scope = ["foo"])
+
+        start = time()
+        while warmer.busy:
+            assert time() - start < 5
+            sleep(0.01)
+
+        assert warmer.replayed == 1
+        assert "".join(self.cache.retrieve(key)[0]) == "<div></div>"
@@ -0,0 +1,199 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class CompositeIndexTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail import schema
+        from cocktail.persistence import PersistentObject
+
+        class Article(PersistentObject):
+            status = schema.String(indexed = True)
+            priority = schema.Integer(indexed = True)
+            score = schema.Integer()
+            indexes = [("status", "-priority")]
+
+        self.Article = Article
+        self.composite_index = Article.get_composite_indexes()[0]
+        self.articles = []
+
+        for i in range(30):
+            article = Article(
+                status = ("draft", "published", "archived")[i % 3],
+                priority = None if i == 4 else (i * 7) % 10,
+                score = i
+            )
+            article.insert()
+            self.articles.append(article)
+
+    def sort_entries(self, entries):
+        return sorted(
+            entries,
+            key = lambda entry: (
+                entry[0][0],
+                entry[0][1] is not None,
+                entry[0][1] or 0,
+                entry[1]
+            )
+        )
+
+    def get_entries(self):
+        return self.sort_entries(
+            ((status, priority.value), id)
+            for (status, priority), id in self.composite_index.index.items()
+        )
+
+    def expected_entries(self):
+        return self.sort_entries(
+            ((article.status, article.priority), article.id)
+            for article in self.articles
+        )
+
+    def test_validates_declarations(self):
+
+        from cocktail import schema
+        from cocktail.persistence import PersistentObject, CompositeIndex
+
+        class Document(PersistentObject):
+            title = schema.String(translated = True)
+            status = schema.String()
+            date = schema.Date()
+
+        self.assertRaises(ValueError, CompositeIndex, Document, ("status",))
+        self.assertRaises(
+            ValueError,
+            CompositeIndex,
+            Document,
+            ("status", "foo")
+        )
+        self.assertRaises(
+            ValueError,
+            CompositeIndex,
+            Document,
+            ("status", "title")
+        )
+
+        index = CompositeIndex(Document, ("status", "-date"))
+        assert index.members == [Document.status, Document.date]
+        assert index.descending == [False, True]
+
+    def test_is_maintained_on_insert_change_and_delete(self):
+
+        assert self.get_entries() == self.expected_entries()
+
+        self.articles[0].status = "archived"
+        self.articles[1].priority = 100
+        self.articles[2].delete()
+        del self.articles[2]
+
+        assert self.get_entries() == self.expected_entries()
+
+    def test_is_maintained_on_batched_changes(self):
+
+        article = self.articles[0]
+        article.update_many({"status": "archived", "priority": 100})
+
+        with self.articles[1].batch_changes():
+            self.articles[1].priority = 50
+            self.articles[1].status = "draft"
+            self.articles[1].priority = 60
+
+        assert self.get_entries() == self.expected_entries()
+        assert list(
+            self.Article.select(self.Article.priority.equal(100))
+        ) == [article]
+        assert list(
+            self.Article.select(self.Article.priority.equal(60))
+        ) == [self.articles[1]]
+
+    def test_resolves_filters(self):
+
+        Article = self.Article
+        query = Article.select([
+            Article.status.equal("published"),
+            Article.priority.greater(3),
+            Article.priority.lower_equal(8)
+        ])
+
+        steps = query.explain().steps
+        assert len(steps) == 1
+        assert steps[0].expr.composite_index is self.composite_index
+
+        assert set(query) == set(
+            article
+            for article in self.articles
+            if article.status == "published"
+            and article.priority is not None
+            and 3 < article.priority <= 8
+        )
+
+        query = Article.select([
+            Article.status.equal("archived"),
+            Article.priority.lower(5)
+        ])
+        assert set(query) == set(
+            article
+            for article in self.articles
+            if article.status == "archived"
+            and (article.priority is None or article.priority < 5)
+        )
+
+    def test_sorts_results(self):
+
+        Article = self.Article
+
+        def expected(status, desc):
+            articles = [a for a in self.articles if a.status == status]
+            if desc:
+                key = lambda a: (a.priority is None, -(a.priority or 0))
+            else:
+                key = lambda a: (a.priority is not None, a.priority or 0)
+            return sorted(articles, key = key)
+
+        for order, desc in (("-priority", True), ("priority", False)):
+            query = Article.select(
+                Article.status.equal("published"),
+                order = order
+            )
+            results = list(query)
+            assert [a.priority for a in results] == \
+                [a.priority for a in expected("published", desc)]
+
+            query = Article.select(
+                Article.status.equal("published"),
+                order = order,
+                range = (0, 3)
+            )
+            assert [a.priority for a in query] == \
+                [a.priority for a in expected("published", desc)[:3]]
+
+    def test_sorts_by_multiple_members(self):
+
+        Article = self.Article
+        query = Article.select(order = ["status", "-priority"])
+        results = [(a.status, a.priority) for a in query]
+
+        assert [status for status, priority in results] == \
+            sorted(a.status for a in self.articles)
+
+        for status in ("draft", "published", "archived"):
+            priorities = [p for s, p in results if s == status]
+            assert priorities == sorted(
+                priorities,
+                key = lambda p: (p is None, -(p or 0))
+            )
+
+    def test_can_be_rebuilt(self):
+        from cocktail.persistence import datastore
+        del datastore.root[self.composite_index.index_key]
+        self.Article.rebuild_indexes(verbose = False)
+        assert self.get_entries() == self.expected_entries()
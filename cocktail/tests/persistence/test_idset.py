@@ -0,0 +1,121 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class IdSetTestCase(TestCase):
+
+    def test_behaves_like_a_set(self):
+
+        from cocktail.persistence.idset import IdSet
+
+        ids = IdSet([5, 3, 1, 3])
+        assert len(ids) == 3
+        assert list(ids) == [1, 3, 5]
+        assert ids == set([1, 3, 5])
+        assert 3 in ids
+        assert 4 not in ids
+        assert "foo" not in ids
+        assert 2 ** 40 not in ids
+
+        ids.add(4)
+        ids.discard(1)
+        ids.discard(100)
+        assert ids == set([3, 4, 5])
+
+        ids.clear()
+        assert not ids
+
+    def test_supports_set_operations(self):
+
+        from cocktail.persistence.idset import IdSet
+
+        a = IdSet(range(10))
+        b = IdSet(range(5, 15))
+
+        assert a & b == set(range(5, 10))
+        assert a | b == set(range(15))
+        assert a - b == set(range(5))
+        assert a.intersection(set([1, 2, "foo"])) == set([1, 2])
+        assert a.difference([1, 2, None]) == set([0]) | set(range(3, 10))
+        assert IdSet([1, 2]).issubset(a)
+        assert a.isdisjoint(IdSet([20, 21]))
+
+        a.intersection_update(x for x in range(20) if x % 2)
+        assert a == set([1, 3, 5, 7, 9])
+
+        a.difference_update(b)
+        assert a == set([1, 3])
+
+        a.update([100, 2])
+        assert a == set([1, 2, 3, 100])
+
+        self.assertRaises(TypeError, a.update, ["foo"])
+
+    def test_supports_reflected_set_operations(self):
+
+        from cocktail.persistence.idset import IdSet
+
+        ids = IdSet([1, 2, 3])
+
+        result = set([2, 3, 4, "foo"]) - ids
+        assert result == set([4, "foo"])
+        assert type(result) is set
+
+        assert set([2, 3, 4, "foo"]) & ids == set([2, 3])
+        assert frozenset([3, 4]) | ids == set([1, 2, 3, 4])
+
+    def test_copies_dont_share_state(self):
+
+        from cocktail.persistence.idset import IdSet
+
+        a = IdSet([1, 2, 3])
+        b = IdSet(a)
+        c = a.copy()
+        a.add(4)
+        assert b == c == set([1, 2, 3])
+
+    def test_can_be_created_from_integer_tree_sets(self):
+
+        from BTrees.IOBTree import IOTreeSet
+        from cocktail.persistence.idset import IdSet
+
+        keys = IOTreeSet(range(1000))
+        ids = IdSet(keys)
+        ids.discard(0)
+        assert len(ids) == 999
+        assert 0 in keys
+
+
+class IdSetQueryTestCase(TempStorageMixin, TestCase):
+
+    def test_filters_integer_keys_using_id_sets(self):
+
+        from cocktail import schema
+        from cocktail.persistence import PersistentObject
+        from cocktail.persistence.idset import IdSet
+
+        class Product(PersistentObject):
+            category = schema.String(indexed = True)
+            price = schema.Integer(indexed = True)
+
+        products = [
+            Product(category = "a" if i % 2 else "b", price = i)
+            for i in range(20)
+        ]
+
+        for product in products:
+            product.insert()
+
+        query = Product.select([
+            Product.category.equal("a"),
+            Product.price.greater(10)
+        ])
+
+        results = query.execute(_sorted = False)
+        assert isinstance(results, IdSet)
+        assert set(query) == set(products[11::2])
@@ -271,6 +271,140 @@ class SingleValueIndexTestCase(TestCase):
         assert self.values[0] not in list(self.index.values())
 
 
+class IndexStatisticsTestCase(TestCase):
+
+    def setUp(self):
+        from cocktail.persistence import MultipleValuesIndex
+        self.index = MultipleValuesIndex()
+        for i in range(1000):
+            self.index.add(i % 100, i)
+        for i in range(500):
+            self.index.add(1000, 1000 + i)
+
+    def get_statistics(self):
+        from cocktail.persistence.indexstatistics import IndexStatistics
+        return IndexStatistics(self.index, histogram_size = 50)
+
+    def test_reports_cardinality(self):
+        stats = self.get_statistics()
+        assert stats.entries == 1500
+        assert stats.distinct_keys == 101
+
+    def test_estimates_missing_keys(self):
+        stats = self.get_statistics()
+        assert stats.estimate_equal(-1) == 0
+        assert stats.estimate_equal(2000) == 0
+
+    def test_estimates_frequent_keys(self):
+        stats = self.get_statistics()
+        assert 400 <= stats.estimate_equal(1000) <= 600
+        assert stats.estimate_equal(50) <= 30
+
+    def test_estimates_ranges(self):
+        stats = self.get_statistics()
+        assert stats.estimate_range() == 1500
+        assert 150 <= stats.estimate_range(min = 40, max = 59) <= 250
+        assert stats.estimate_range(max = 1000, exclude_max = True) <= 1050
+        assert stats.estimate_range(min = 2000) == 0
+
+
+class StoredIndexStatisticsTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.persistence import datastore, SingleValueIndex
+        from cocktail.persistence.indexstatistics import clear_index_statistics
+
+        self.index = SingleValueIndex()
+        for i in range(200):
+            self.index.add(i, i)
+
+        datastore.root["index"] = self.index
+        datastore.commit()
+
+        clear_index_statistics()
+        self.addCleanup(clear_index_statistics)
+
+    def wait_for_statistics(self, prev_stats = None):
+
+        from time import time, sleep
+        from cocktail.persistence.indexstatistics import get_index_statistics
+
+        start = time()
+        while True:
+            stats = get_index_statistics(self.index)
+            if stats is not None and stats is not prev_stats:
+                return stats
+            assert time() - start < 5
+            sleep(0.01)
+
+    def test_gathers_statistics_in_background(self):
+
+        from cocktail.persistence.indexstatistics import get_index_statistics
+
+        assert get_index_statistics(self.index) is None
+        stats = self.wait_for_statistics()
+        assert stats.entries == 200
+
+        # Expired statistics are used while they are refreshed
+        stats.timestamp = 0
+        assert get_index_statistics(self.index) is stats
+        assert self.wait_for_statistics(stats).entries == 200
+
+    def test_statistics_can_be_gathered_right_away(self):
+
+        from cocktail.persistence.indexstatistics import (
+            get_index_statistics,
+            refresh_index_statistics
+        )
+
+        stats = refresh_index_statistics(self.index)
+        assert stats.entries == 200
+        assert get_index_statistics(self.index) is stats
+
+
+class DescendingBTreeIterationTestCase(TestCase):
+
+    def assert_descending_items(self, tree, **kwargs):
+        from cocktail.persistence.utils import iter_descending_items
+        expected_items = list(tree.items(**kwargs))
+        expected_items.reverse()
+        assert list(iter_descending_items(tree, **kwargs)) == expected_items
+
+    def test_empty_trees(self):
+        from BTrees.OIBTree import OIBTree
+        self.assert_descending_items(OIBTree())
+
+    def test_single_bucket_trees(self):
+        from BTrees.IIBTree import IIBTree
+        tree = IIBTree()
+        for i in range(10):
+            tree[i] = i * 2
+        self.assert_descending_items(tree)
+        self.assert_descending_items(tree, min = 3, max = 6)
+        self.assert_descending_items(
+            tree,
+            min = 3,
+            max = 6,
+            excludemin = True,
+            excludemax = True
+        )
+
+    def test_multiple_level_trees(self):
+        from BTrees.OIBTree import OIBTree
+        tree = OIBTree()
+        for i in range(40000):
+            tree["%05d" % i] = i
+        self.assert_descending_items(tree)
+        self.assert_descending_items(tree, max = "20000")
+        self.assert_descending_items(tree, max = "20000", excludemax = True)
+        self.assert_descending_items(tree, min = "39990")
+        self.assert_descending_items(tree, min = "00010", excludemin = True)
+        self.assert_descending_items(tree, min = "15000", max = "15500")
+
+
 class TranslationInheritanceIndexingTestCase(TempStorageMixin, TestCase):
 
     def test_indexing_works_across_derived_translations(self):
@@ -0,0 +1,136 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail import schema
+from cocktail.persistence import PersistentObject
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class RebuiltDocument(PersistentObject):
+    full_text_indexed = True
+    title = schema.String(indexed = True, full_text_indexed = True)
+    code = schema.Integer(indexed = True, unique = True, required = True)
+    tags = schema.Collection(items = schema.String(), indexed = True)
+    weight = schema.Integer()
+    indexes = [("title", "-weight")]
+
+
+class RebuiltReport(RebuiltDocument):
+    pages = schema.Integer(indexed = True)
+
+
+class ParallelRebuildTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.persistence import datastore
+
+        for i in range(40):
+            cls = RebuiltReport if i % 4 == 0 else RebuiltDocument
+            obj = cls(
+                title = "Document %d" % (i % 7) if i != 3 else None,
+                code = i * 3,
+                tags = ["tag%d" % (i % 3), "common"],
+                weight = i % 5
+            )
+            if cls is RebuiltReport:
+                obj.pages = i % 6
+            obj.insert()
+
+        datastore.commit()
+
+    def get_index_contents(self):
+        members = [
+            RebuiltDocument.title,
+            RebuiltDocument.code,
+            RebuiltDocument.tags,
+            RebuiltReport.pages
+        ]
+        contents = dict(
+            (member.name, list(member.index.items()))
+            for member in members
+        )
+        contents["composite"] = list(
+            RebuiltDocument.get_composite_indexes()[0].index.items()
+        )
+        return contents
+
+    def clear_indexes(self):
+        from cocktail.persistence import datastore
+        for member in (
+            RebuiltDocument.title,
+            RebuiltDocument.code,
+            RebuiltDocument.tags,
+            RebuiltReport.pages
+        ):
+            member.create_index()
+        RebuiltDocument.get_composite_indexes()[0].create_index()
+        datastore.root[RebuiltDocument.full_text_index_key].clear()
+        datastore.commit()
+
+    def test_produces_the_same_indexes_as_a_serial_rebuild(self):
+
+        from cocktail.persistence.parallelrebuild import (
+            rebuild_indexes_in_parallel
+        )
+
+        expected = self.get_index_contents()
+        self.clear_indexes()
+        assert not self.get_index_contents()["title"]
+
+        progress = []
+        rebuild_indexes_in_parallel(
+            RebuiltDocument,
+            recursive = True,
+            full_text = True,
+            workers = 2,
+            partition_size = 7,
+            chunk_size = 5,
+            verbose = False,
+            progress = lambda done, total: progress.append((done, total))
+        )
+
+        assert self.get_index_contents() == expected
+        assert progress[-1] == (40 + 10, 40 + 10)
+
+        results = RebuiltDocument.select(
+            RebuiltDocument.title.search("Document")
+        )
+        assert len(results) == 39
+
+    def test_loads_each_class_once_its_partitions_are_done(self):
+
+        from unittest.mock import patch
+        from cocktail.persistence import parallelrebuild
+
+        load_entries = parallelrebuild._load_entries
+        progress = []
+        loads = []
+
+        def record_load(cls, target, entries, chunk_size, verbose):
+            loads.append((cls, len(progress)))
+            return load_entries(cls, target, entries, chunk_size, verbose)
+
+        expected = self.get_index_contents()
+        self.clear_indexes()
+
+        with patch.object(parallelrebuild, "_load_entries", record_load):
+            parallelrebuild.rebuild_indexes_in_parallel(
+                RebuiltDocument,
+                recursive = True,
+                workers = 1,
+                partition_size = 7,
+                verbose = False,
+                progress = lambda done, total: progress.append(done)
+            )
+
+        assert self.get_index_contents() == expected
+        assert set(loads) == set([
+            (RebuiltDocument, 6),
+            (RebuiltReport, 8)
+        ])
@@ -0,0 +1,87 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail import schema
+from cocktail.persistence import PersistentObject
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class Author(PersistentObject):
+    author_name = schema.String()
+    books = schema.Collection(bidirectional = True)
+
+
+class Book(PersistentObject):
+    title = schema.String()
+    author = schema.Reference(bidirectional = True)
+
+
+Author.books.items = schema.Reference(type = Book)
+Book.author.type = Author
+
+
+class PrefetchTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.persistence import datastore
+
+        datastore.root.clear()
+
+        for i in range(3):
+            author = Author(author_name = "Author %d" % i)
+            author.insert()
+            for j in range(2):
+                book = Book(title = "Book %d.%d" % (i, j), author = author)
+                book.insert()
+
+        datastore.commit()
+        datastore.connection.cacheMinimize()
+
+    def is_ghost(self, obj):
+        return obj._p_changed is None
+
+    def test_loads_objects_in_batches(self):
+
+        query = Author.select(order = "id", prefetch = True)
+        query.prefetch_size = 2
+        index = Author.index
+
+        for i, author in enumerate(query):
+            assert not self.is_ghost(author)
+            if i == 0:
+                ids = list(Author.keys)
+                assert not self.is_ghost(index[ids[1]])
+                assert self.is_ghost(index[ids[2]])
+
+    def test_loads_related_objects(self):
+
+        books = list(Book.select(order = "id", prefetch_related = ["author"]))
+        assert len(books) == 6
+        for book in books:
+            assert not self.is_ghost(book._author)
+
+    def test_loads_nested_relations(self):
+
+        from cocktail.persistence.utils import prefetch_objects
+
+        authors = list(Author.index.values())
+        for author in authors:
+            assert self.is_ghost(author)
+
+        prefetch_objects(authors, [Author.books, "books.author"])
+
+        for author in authors:
+            assert not self.is_ghost(author)
+            for book in author.books:
+                assert not self.is_ghost(book)
+
+    def test_propagates_prefetch_options_to_subqueries(self):
+        query = Book.select(prefetch_related = ["author"])
+        subquery = query.select(order = "title")
+        assert subquery.prefetch_related == ["author"]
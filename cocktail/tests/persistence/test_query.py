@@ -665,6 +665,61 @@ class OrderTestCase(TempStorageMixin, TestCase):
                        order = ("-color", "-price"))]
         self.assertEqual([e, a, d, b, f, c], results)
 
+    def test_ranges_over_multiple_members(self):
+
+        products = []
+
+        for i in range(30):
+            product = self.Product()
+            product.category = "abc"[i % 3]
+            product.price = i % 7
+            product.color = "color%d" % (i % 5)
+            product.insert()
+            products.append(product)
+
+        for order in (
+            ("category", "price"),
+            ("-category", "-price"),
+            ("price", "color"),
+            ("-price", "-color"),
+            ("color", "price"),
+            ("price", "-category", "-id")
+        ):
+            full_results = list(self.Product.select(order = order))
+
+            for start, end in ((0, 1), (0, 5), (3, 11), (20, 40)):
+                results = list(
+                    self.Product.select(order = order, range = (start, end))
+                )
+                self.assertEqual(full_results[start:end], results)
+
+    def test_ranges_over_partially_indexed_members(self):
+
+        products = []
+
+        for i in range(10):
+            product = self.Product()
+            product.price = i
+            product.category = "abc"[i % 3]
+            product.insert()
+            products.append(product)
+
+        # Bypass events, so that some objects are left out of the indexes
+        for product in products[:4]:
+            self.Product.price.index.remove(product.price, product.id)
+            self.Product.category.index.remove(product.category, product.id)
+
+        for order in (("price", "category"), ("-price", "category")):
+            full_results = list(self.Product.select(order = order))
+            assert len(full_results) == 10
+
+            # The index holds fewer entries than requested
+            for start, end in ((0, 8), (2, 9), (5, 12)):
+                results = list(
+                    self.Product.select(order = order, range = (start, end))
+                )
+                self.assertEqual(full_results[start:end], results)
+
     def test_normalized_index(self):
 
         self.Product.product_name.normalized_index = True
@@ -761,6 +816,30 @@ class OrderTestCase(TempStorageMixin, TestCase):
         sorted_projects = list(Project.select(order = Project.review))
         assert sorted_projects == [p3, p1, p2]
 
+    def test_descending_order_on_btree_index(self):
+
+        from BTrees.IIBTree import IIBTree
+
+        class PriceIndex(IIBTree):
+            accepts_repetition = False
+            accepts_multiple_values = False
+
+            def add(self, key, value):
+                self[key] = value
+
+        self.Product.price.index = PriceIndex()
+
+        products = [self.Product(price = i * 10) for i in range(500)]
+        for product in products:
+            product.insert()
+
+        products.reverse()
+        results = list(self.Product.select(order = "-price"))
+        assert results == products
+
+        results = list(self.Product.select(order = "-price", range = (0, 5)))
+        assert results == products[:5]
+
 class TranslatedOrderTestCase(TempStorageMixin, TestCase):
 
     def setUp(self):
@@ -2260,6 +2339,97 @@ class RelationalQueriesTestCase(TempStorageMixin, TestCase):
         ) == set([a, b, c, d])
 
 
+class ExecutionPlanTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.schema import String, Integer
+        from cocktail.persistence import PersistentObject
+
+        class Product(PersistentObject):
+            category = String(indexed = True)
+            price = Integer(indexed = True)
+
+        self.Product = Product
+
+        for i in range(200):
+            Product(
+                category = "common" if i % 2 else "rare" if i < 10 else "other",
+                price = i
+            ).insert()
+
+    def test_applies_the_most_selective_filters_first(self):
+
+        query = self.Product.select([
+            self.Product.category.equal("common"),
+            self.Product.price.greater(190)
+        ])
+
+        plan = query._get_execution_plan(query.filters)
+        assert [step.expr for step in plan] == [
+            query.filters[1],
+            query.filters[0]
+        ]
+
+        query = self.Product.select([
+            self.Product.price.greater(20),
+            self.Product.category.equal("rare")
+        ])
+
+        plan = query._get_execution_plan(query.filters)
+        assert [step.expr for step in plan] == [
+            query.filters[1],
+            query.filters[0]
+        ]
+
+    def test_unresolvable_filters_are_applied_last(self):
+
+        from cocktail.schema.expressions import Self
+
+        query = self.Product.select([
+            Self.search("foo"),
+            self.Product.price.greater(20)
+        ])
+
+        plan = query._get_execution_plan(query.filters)
+        assert plan[0].expr is query.filters[1]
+        assert plan[1].expr is query.filters[0]
+        assert plan[1].estimated_rows is None
+
+    def test_steps_without_estimates_are_sorted_by_priority_and_cost(self):
+
+        from cocktail.persistence.query import QueryPlanStep
+
+        steps = [
+            QueryPlanStep("a", None, 0, 0),
+            QueryPlanStep("b", None, 0, -3),
+            QueryPlanStep("c", None, -1, 1),
+            QueryPlanStep("d", None, -1, 0)
+        ]
+        steps.sort(key = lambda step: step.sorting_key)
+        assert [step.expr for step in steps] == ["d", "c", "b", "a"]
+
+    def test_explain_reports_estimated_and_actual_rows(self):
+
+        query = self.Product.select([
+            self.Product.category.equal("common"),
+            self.Product.price.lower(5)
+        ])
+
+        explanation = query.explain()
+        assert explanation.initial_rows == 200
+        assert len(explanation.steps) == 2
+
+        price_step, category_step = explanation.steps
+        assert price_step.expr is query.filters[1]
+        assert price_step.estimated_rows is not None
+        assert price_step.actual_rows == 5
+        assert category_step.actual_rows == 2
+        assert "estimated" in str(explanation)
+
+
 class DescendsFromTestCase(TempStorageMixin, TestCase):
 
     def setUp(self):
@@ -2464,3 +2634,209 @@ class DescendsFromTestCase(TempStorageMixin, TestCase):
             )
         )) == set([])
 
+
+
+class CursorTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.schema import String, Integer
+        from cocktail.persistence import PersistentObject
+
+        class Product(PersistentObject):
+            product_name = String(
+                unique = True,
+                indexed = True,
+                required = True
+            )
+            price = Integer(indexed = True)
+            category = String(indexed = True)
+            color = String()
+
+        self.Product = Product
+        self.products = []
+
+        for i in range(20):
+            product = Product(
+                product_name = "Product %02d" % i,
+                price = (i * 7) % 5,
+                category = "a" if i % 3 else "b"
+            )
+            product.insert()
+            self.products.append(product)
+
+    def assert_pages(self, query, page_size):
+        expected = list(query)
+        pages = list(query.iter_pages(page_size))
+        assert [len(page) for page in pages[:-1]] == \
+            [page_size] * (len(pages) - 1)
+        assert sum(pages, []) == expected
+
+        cursor = None
+        results = []
+        while True:
+            page = list(query.after(cursor).select(range = (0, page_size)))
+            results.extend(page)
+            if len(page) < page_size:
+                break
+            cursor = query.cursor_for(page[-1])
+
+        assert results == expected
+
+    def test_paginates_by_primary_member(self):
+        self.assert_pages(self.Product.select(), 6)
+        self.assert_pages(self.Product.select(order = "-id"), 6)
+
+    def test_paginates_by_unique_member(self):
+        self.assert_pages(self.Product.select(order = "product_name"), 7)
+        self.assert_pages(self.Product.select(order = "-product_name"), 7)
+
+    def test_paginates_by_member_with_duplicate_keys(self):
+        for order in ("price", "-price"):
+            self.assert_pages(self.Product.select(order = order), 3)
+            self.assert_pages(
+                self.Product.select(
+                    self.Product.category.equal("a"),
+                    order = order
+                ),
+                4
+            )
+
+    def test_cursors_apply_to_unsorted_executions(self):
+
+        query = self.Product.select(order = "product_name")
+        cursor = query.cursor_for(self.products[14])
+
+        remaining = query.after(cursor)
+        assert len(remaining) == 5
+        assert set(remaining.execute(_sorted = False)) == \
+            set(product.id for product in self.products[15:])
+
+        page = remaining.select(range = (0, 10))
+        assert len(page) == 5
+        assert list(page) == self.products[15:]
+
+        last = query.after(query.cursor_for(self.products[-1]))
+        assert len(last) == 0
+        assert not last
+
+    def test_cursors_are_url_safe(self):
+        from urllib.parse import quote
+        query = self.Product.select(order = "price")
+        cursor = query.cursor_for(self.products[3])
+        assert quote(cursor) == cursor
+
+    def test_rejects_invalid_cursors(self):
+        query = self.Product.select(order = "price")
+        cursor = query.cursor_for(self.products[3])
+        self.assertRaises(ValueError, query.after, "foo")
+        self.assertRaises(
+            ValueError,
+            self.Product.select(order = "-price").after,
+            cursor
+        )
+
+    def test_requires_an_indexed_order(self):
+        query = self.Product.select(order = "color")
+        self.assertRaises(ValueError, query.cursor_for, self.products[0])
+        self.assertRaises(ValueError, query.after, None)
+
+
+
+from cocktail import schema
+from cocktail.persistence import PersistentObject
+
+
+class ProjectedCategory(PersistentObject):
+    pass
+
+
+class ProjectedProduct(PersistentObject):
+    product_name = schema.String(indexed = True, normalized_index = True)
+    price = schema.Integer(indexed = True)
+    release = schema.Date(indexed = True)
+    color = schema.String()
+    category = schema.Reference(type = ProjectedCategory, indexed = True)
+
+
+class ProjectionTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from datetime import date
+        from cocktail.persistence import datastore
+
+        datastore.root.clear()
+
+        self.Product = Product = ProjectedProduct
+        self.categories = [ProjectedCategory(), ProjectedCategory()]
+
+        for category in self.categories:
+            category.insert()
+
+        self.products = []
+
+        for i in range(10):
+            product = Product(
+                product_name = "Product %d" % i,
+                price = None if i == 5 else i * 10,
+                release = date(2020, 1, i + 1),
+                color = "red" if i % 2 else "blue",
+                category = self.categories[i % 2]
+            )
+            product.insert()
+            self.products.append(product)
+
+    def test_returns_member_values(self):
+
+        Product = self.Product
+        rows = list(
+            Product.select(
+                Product.price.greater_equal(30),
+                order = "-id"
+            ).values("id", "price", "release", "category")
+        )
+
+        assert rows == [
+            (p.id, p.price, p.release, p.category)
+            for p in reversed(self.products)
+            if p.price is not None and p.price >= 30
+        ]
+        assert rows[0].price == self.products[-1].price
+
+    def test_combines_indexes_and_object_values(self):
+
+        Product = self.Product
+        query = Product.select(order = "price", range = (0, 4))
+        rows = list(query.values(Product.product_name, "color", "price"))
+
+        assert rows == [
+            (p.product_name, p.color, p.price)
+            for p in query
+        ]
+        assert [row.color for row in rows] == [p.color for p in query]
+
+    def test_reads_indexed_values_without_loading_objects(self):
+
+        from cocktail.persistence import datastore
+
+        Product = self.Product
+        expected = [
+            (p.price, p.release)
+            for p in sorted(
+                self.products,
+                key = lambda p: (p.price is not None, p.price or 0)
+            )
+        ]
+        datastore.commit()
+        datastore.connection.cacheMinimize()
+
+        rows = list(Product.select(order = "price").values("price", "release"))
+        assert rows == expected
+
+        for product in Product.index.values():
+            assert product._p_changed is None
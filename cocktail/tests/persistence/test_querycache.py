@@ -0,0 +1,224 @@
+#-*- coding: utf-8 -*-
+"""
+
+.. moduleauthor:: Martí Congost <marti.congost@whads.com>
+"""
+from unittest import TestCase
+from cocktail import schema
+from cocktail.persistence import PersistentObject
+from cocktail.tests.persistence.tempstoragemixin import TempStorageMixin
+
+
+class Product(PersistentObject):
+    category = schema.String(indexed = True)
+    price = schema.Integer(indexed = True)
+    color = schema.String()
+
+
+class QueryResultCacheTestCase(TempStorageMixin, TestCase):
+
+    def setUp(self):
+
+        TempStorageMixin.setUp(self)
+
+        from cocktail.caching import MemoryCacheStorage
+        from cocktail.persistence import datastore
+        from cocktail.persistence.querycache import query_result_cache
+
+        datastore.root.clear()
+        self.cache = query_result_cache
+        self.cache.storage = MemoryCacheStorage()
+        self.Product = Product
+
+        self.products = [
+            Product(category = "a", price = 10, color = "red"),
+            Product(category = "b", price = 20, color = "red"),
+            Product(category = "a", price = 30, color = "blue")
+        ]
+
+        for product in self.products:
+            product.insert()
+
+        datastore.commit()
+
+    def tearDown(self):
+        self.cache.storage = None
+        TempStorageMixin.tearDown(self)
+
+    def test_shares_results_between_queries(self):
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert list(query) == [self.products[0], self.products[2]]
+
+        # Bypass events, so that the cache isn't invalidated
+        self.Product.category.index.remove("a", self.products[0].id)
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert list(query) == [self.products[0], self.products[2]]
+
+        query = self.Product.select(
+            self.Product.category.equal("a"),
+            order = "-price"
+        )
+        assert list(query) == [self.products[2]]
+
+    def test_results_can_be_modified_by_consumers(self):
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        results = query.execute(_sorted = False)
+        results.clear()
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+
+    def test_preserves_id_sets(self):
+
+        from cocktail.persistence.idset import IdSet
+
+        ids = set(product.id for product in self.products[:2])
+        query = self.Product.select(self.Product.color.equal("red"))
+        results = query.execute(_sorted = False)
+        assert isinstance(results, IdSet)
+        assert results == ids
+
+        query = self.Product.select(self.Product.color.equal("red"))
+        results = query.execute(_sorted = False)
+        assert isinstance(results, IdSet)
+        assert results == ids
+
+    def test_inserting_objects_invalidates_results(self):
+
+        from cocktail.persistence import datastore
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+
+        product = self.Product(category = "a")
+        product.insert()
+
+        # Changes made by the current transaction are taken into account
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 3
+
+        datastore.commit()
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 3
+
+        product.delete()
+        datastore.commit()
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+
+    def test_invalidates_results_in_custom_caches(self):
+
+        from cocktail.caching import Cache, MemoryCacheStorage
+        from cocktail.persistence import datastore, Query
+
+        cache = Cache(MemoryCacheStorage())
+        prev_cache = Query.result_cache
+        Query.result_cache = cache
+        self.addCleanup(setattr, Query, "result_cache", prev_cache)
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+        assert cache.storage.entry_count == 1
+
+        self.Product(category = "a").insert()
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 3
+
+        datastore.commit()
+        assert cache.storage.entry_count == 0
+
+    def test_results_are_not_shared_without_snapshot_information(self):
+
+        from unittest.mock import patch
+        from cocktail.persistence import datastore
+
+        datastore.abort()
+        storage = datastore.connection._storage
+
+        with patch.object(storage, "_start", None):
+            query = self.Product.select(self.Product.category.equal("a"))
+            assert len(query) == 2
+
+        assert not self.cache.storage.entry_count
+
+    def test_changing_members_invalidates_dependent_results(self):
+
+        from cocktail.persistence import datastore
+
+        category_query = self.Product.select(
+            self.Product.category.equal("a")
+        )
+        color_query = self.Product.select(self.Product.color.equal("red"))
+        assert len(category_query) == 2
+        assert len(color_query) == 2
+
+        self.products[1].category = "a"
+        datastore.commit()
+
+        assert self.cache.exists(
+            self.Product.select(self.Product.color.equal("red"))
+            ._get_shared_results_info(False, True)[0]
+        )
+
+        category_query = self.Product.select(
+            self.Product.category.equal("a")
+        )
+        assert len(category_query) == 3
+
+    def test_aborted_changes_dont_invalidate_results(self):
+
+        from cocktail.persistence import datastore
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+        key = query._get_shared_results_info(False, True)[0]
+
+        self.products[1].category = "a"
+        datastore.abort()
+
+        assert self.cache.exists(key)
+
+    def test_ignores_uncacheable_queries(self):
+
+        query = self.Product.select(
+            self.Product.category.equal("a"),
+            base_collection = self.products
+        )
+        assert query._get_shared_results_info(True, True) is None
+
+        subquery = self.Product.select(self.Product.price.greater(15))
+        query = self.Product.select(
+            self.Product.category.equal("a").and_(
+                self.Product.id.one_of(subquery)
+            )
+        )
+        assert query._get_shared_results_info(True, True) is None
+
+    def test_commits_from_other_processes_invalidate_results(self):
+
+        import transaction
+        from cocktail.persistence import datastore
+
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 2
+
+        # Modify the database through another connection, bypassing the
+        # events that invalidate the cache, like another process would
+        manager = transaction.TransactionManager()
+        connection = datastore.db.open(transaction_manager = manager)
+        try:
+            index = connection.root()[self.Product.category.index_key]
+            index.remove("a", self.products[0].id)
+            manager.commit()
+        finally:
+            connection.close()
+
+        datastore.abort()
+        query = self.Product.select(self.Product.category.equal("a"))
+        assert len(query) == 1
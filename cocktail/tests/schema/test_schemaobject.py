@@ -787,3 +787,110 @@ class CollectionChangeEventsTestCase(TestCase):
         assert event.member is TestClass.member1
         assert event.value == [1, 0, 2, 3]
 
+
+
+class BatchChangesTestCase(TestCase):
+
+    def test_update_many_triggers_a_single_batch_event(self):
+
+        from cocktail.schema import SchemaObject, String, Integer
+
+        class TestClass(SchemaObject):
+            foo = String()
+            bar = Integer()
+            spam = Integer()
+
+        obj = TestClass(spam = 3)
+
+        events = EventLog()
+        events.listen(
+            obj.changing,
+            obj.batch_changed,
+            obj.changed
+        )
+
+        obj.update_many({"foo": "hello", "bar": 1, "spam": 3})
+
+        event = events.pop(0)
+        assert event.slot is obj.changing
+        assert event.member is TestClass.foo
+
+        event = events.pop(0)
+        assert event.slot is obj.changing
+        assert event.member is TestClass.bar
+
+        event = events.pop(0)
+        assert event.slot is obj.batch_changed
+        assert [change.member for change in event.changes] \
+            == [TestClass.foo, TestClass.bar]
+        assert [change.value for change in event.changes] == ["hello", 1]
+        changes = event.changes
+
+        for member, value in ((TestClass.foo, "hello"), (TestClass.bar, 1)):
+            event = events.pop(0)
+            assert event.slot is obj.changed
+            assert event.member is member
+            assert event.value == value
+            assert event.previous_value is None
+            assert event.batch is changes
+
+        assert not events
+        assert obj.foo == "hello"
+        assert obj.bar == 1
+
+    def test_batches_coalesce_changes_to_the_same_member(self):
+
+        from cocktail.schema import SchemaObject, Integer
+
+        class TestClass(SchemaObject):
+            foo = Integer()
+            bar = Integer()
+
+        obj = TestClass(foo = 1, bar = 1)
+
+        events = EventLog()
+        events.listen(obj.batch_changed)
+
+        with obj.batch_changes():
+            obj.foo = 2
+            obj.foo = 3
+            obj.bar = 2
+            with obj.batch_changes():
+                obj.bar = 1
+            assert not events
+
+        event = events.pop(0)
+        assert len(event.changes) == 1
+        change = event.changes[0]
+        assert change.member is TestClass.foo
+        assert change.previous_value == 1
+        assert change.value == 3
+        assert not events
+
+    def test_changes_outside_batches_are_not_batched(self):
+
+        from cocktail.schema import SchemaObject, Integer
+
+        class TestClass(SchemaObject):
+            foo = Integer()
+
+        obj = TestClass()
+
+        events = EventLog()
+        events.listen(obj.batch_changed, obj.changed)
+
+        try:
+            with obj.batch_changes():
+                obj.foo = 1
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert events.pop(0).slot is obj.batch_changed
+        assert events.pop(0).batch is not None
+
+        obj.foo = 2
+        event = events.pop(0)
+        assert event.slot is obj.changed
+        assert event.batch is None
+        assert not events
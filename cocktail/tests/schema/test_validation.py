@@ -243,6 +243,88 @@ class InheritedValidationsTestCase(TestCase):
         assert errors[2].error_id == "s3_error"
 
 
+class ValidationPlanTestCase(TestCase):
+
+    def test_validations_added_after_validating(self):
+
+        from cocktail.schema import Schema
+        from cocktail.schema.exceptions import ValidationError
+
+        base = Schema()
+        derived = Schema()
+        derived.inherit(base)
+        assert not list(derived.get_errors({}))
+
+        def validation(context):
+            yield ValidationError(context)
+
+        base.add_validation(validation)
+        assert len(list(derived.get_errors({}))) == 1
+
+        base.remove_validation(validation)
+        assert not list(derived.get_errors({}))
+
+    def test_members_added_after_validating(self):
+
+        from cocktail.schema import Schema, String, exceptions
+
+        base = Schema()
+        derived = Schema()
+        derived.inherit(base)
+        assert derived.validate({})
+
+        base.add_member(String("title", required = True))
+        errors = list(derived.get_errors({}))
+        assert len(errors) == 1
+        assert isinstance(errors[0], exceptions.ValueRequiredError)
+
+        base.remove_member("title")
+        assert derived.validate({})
+
+    def test_unrelated_changes_preserve_plans(self):
+
+        from cocktail.schema import Schema, String
+
+        base = Schema()
+        derived = Schema(bases = [base])
+        other = Schema()
+
+        base_plan = base.get_validation_plan()
+        derived_plan = derived.get_validation_plan()
+
+        other.add_member(String("title"))
+        other.add_validation(lambda context: ())
+        assert base.get_validation_plan() is base_plan
+        assert derived.get_validation_plan() is derived_plan
+
+        derived.add_validation(lambda context: ())
+        assert base.get_validation_plan() is base_plan
+        assert derived.get_validation_plan() is not derived_plan
+
+    def test_validating_event(self):
+
+        from cocktail.schema import String
+        from cocktail.schema.exceptions import ValidationError
+
+        member = String()
+
+        def validation(context):
+            if context.get("strict"):
+                yield ValidationError(context)
+
+        member.add_validation(validation)
+        assert member.validate("foo")
+
+        def handler(e):
+            e.context["strict"] = True
+
+        member.validating.append(handler)
+        assert not member.validate("foo")
+
+        member.validating.remove(handler)
+        assert member.validate("foo")
+
+
 class StringValidationTestCase(ValidationTestCase):
 
     def test_min(self):
@@ -632,3 +714,71 @@ class DynamicConstraintsTestCase(TestCase):
         error = errors[0]
         assert isinstance(error, ValueRequiredError)
 
+
+
+class BulkValidationTestCase(TestCase):
+
+    def _get_schema(self):
+
+        from cocktail.schema import Schema, String, Integer
+
+        return Schema("BulkValidationTestCase.Record", members = [
+            String("title", required = True),
+            Integer("count", min = 0)
+        ])
+
+    def _get_items(self):
+        for i in range(250):
+            if i % 50 == 7:
+                yield {"title": None, "count": -1}
+            elif i % 50 == 21:
+                yield {"title": "Item %d" % i, "count": -i}
+            else:
+                yield {"title": "Item %d" % i, "count": i}
+
+    def _test_iter_errors_many(self, **kwargs):
+
+        from cocktail.schema import ErrorList, exceptions
+
+        schema = self._get_schema()
+        results = list(schema.iter_errors_many(self._get_items(), **kwargs))
+
+        self.assertEqual(
+            [index for index, errors in results],
+            [
+                i
+                for i in range(250)
+                if i % 50 in (7, 21)
+            ]
+        )
+
+        for index, errors in results:
+            assert isinstance(errors, ErrorList)
+            if index % 50 == 7:
+                self.assertEqual(len(errors), 2)
+                assert errors.in_member("title")
+                assert isinstance(
+                    errors.in_member("title")[0],
+                    exceptions.ValueRequiredError
+                )
+                assert errors[0].member is schema["title"]
+            else:
+                self.assertEqual(len(errors), 1)
+                assert isinstance(errors[0], exceptions.MinValueError)
+
+    def test_iter_errors_many(self):
+        self._test_iter_errors_many()
+
+    def test_iter_errors_many_with_workers(self):
+        self._test_iter_errors_many(workers = 2, chunk_size = 20)
+
+    def test_validate_many(self):
+
+        schema = self._get_schema()
+        valid_items = [{"title": "foo", "count": 1}] * 10
+
+        assert schema.validate_many(valid_items)
+        assert schema.validate_many(valid_items, workers = 2, chunk_size = 3)
+        assert schema.validate_many([])
+        assert not schema.validate_many(self._get_items())
+        assert not schema.validate_many(self._get_items(), workers = 2)
@@ -432,3 +432,73 @@ class EventTestCase(TestCase):
         foo = Foo()
         foo.spammed(x = 1)
 
+
+    def test_dispatch_reflects_handler_changes(self):
+
+        from cocktail.events import Event
+
+        class Foo(object):
+            spammed = Event()
+
+        class Bar(Foo):
+            pass
+
+        bar = Bar()
+        executed = []
+        bar.spammed()
+
+        def base_callback(event):
+            executed.append(base_callback)
+
+        def derived_callback(event):
+            executed.append(derived_callback)
+
+        Foo.spammed.append(base_callback)
+        bar.spammed()
+        self.assertEqual(executed, [base_callback])
+
+        del executed[:]
+        Bar.spammed.insert(0, derived_callback)
+        bar.spammed()
+        self.assertEqual(executed, [derived_callback, base_callback])
+
+        del executed[:]
+        Foo.spammed.remove(base_callback)
+        Bar.spammed.pop(0)
+        bar.spammed()
+        self.assertEqual(executed, [])
+
+        del executed[:]
+        Foo.spammed.extend([base_callback])
+        Bar.spammed.next = ()
+        bar.spammed()
+        self.assertEqual(executed, [])
+
+    def test_has_handlers(self):
+
+        from cocktail.events import Event
+
+        class Foo(object):
+            spammed = Event()
+
+        class Bar(Foo):
+            pass
+
+        event = Foo.__dict__["spammed"]
+        foo = Foo()
+        bar = Bar()
+
+        self.assertFalse(event.has_handlers(foo))
+        self.assertFalse(event.has_handlers(None, Bar))
+
+        foo.spammed.append(lambda e: None)
+        self.assertTrue(event.has_handlers(foo))
+        self.assertFalse(event.has_handlers(bar))
+        self.assertFalse(event.has_handlers(None, Foo))
+
+        Foo.spammed.append(lambda e: None)
+        self.assertTrue(event.has_handlers(bar))
+        self.assertTrue(event.has_handlers(None, Bar))
+
+        Foo.spammed.pop()
+        self.assertFalse(event.has_handlers(bar))
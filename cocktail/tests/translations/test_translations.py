@@ -66,3 +66,84 @@ class TranslationsTestCase(TestCase):
 
         assert_raises(NoActiveLanguageError, translations, "parrot")
 
+
+
+class TranslationsCacheTestCase(TestCase):
+
+    def setUp(self):
+        from cocktail.translations import set_language
+        set_language(None)
+
+    def tearDown(self):
+        from cocktail.translations import set_language
+        set_language(None)
+
+    def test_definitions_invalidate_cached_lookups(self):
+
+        from cocktail.translations.translation import Translations
+
+        translations = Translations()
+        assert translations("parrot", "en") == ""
+
+        translations.define("parrot", en = "Parrot")
+        assert translations("parrot", "en") == "Parrot"
+
+        translations.set("parrot", "en", "Polly")
+        assert translations("parrot", "en") == "Polly"
+
+        translations.define("parrot", en = "%(name)s the parrot")
+        assert translations("parrot", "en", name = "Polly") \
+            == "Polly the parrot"
+        assert translations("parrot", "en", name = "Jack") \
+            == "Jack the parrot"
+
+    def test_fallback_languages_invalidate_cached_lookups(self):
+
+        from cocktail.translations import fallback_languages_context
+        from cocktail.translations.translation import Translations
+
+        translations = Translations()
+        translations.define("parrot", es = "Loro")
+        assert translations("parrot", "ca") == ""
+
+        with fallback_languages_context({"ca": ["es"]}):
+            assert translations("parrot", "ca") == "Loro"
+
+        assert translations("parrot", "ca") == ""
+
+    def test_functions_are_invoked_on_every_lookup(self):
+
+        from cocktail.translations.translation import Translations
+
+        translations = Translations()
+        calls = []
+
+        def translate_parrot(**kwargs):
+            calls.append(kwargs)
+            return "Parrot #%d" % len(calls)
+
+        translations.define("parrot", en = translate_parrot)
+        assert translations("parrot", "en") == "Parrot #1"
+        assert translations("parrot", "en") == "Parrot #2"
+
+    def test_instances_of_invalidates_cached_lookups(self):
+
+        from cocktail.translations.translation import Translations
+
+        class Parrot:
+            pass
+
+        class NorwegianBlue(Parrot):
+            pass
+
+        translations = Translations()
+        parrot = NorwegianBlue()
+        assert translations(parrot, "en") == ""
+
+        translations.instances_of(Parrot)(lambda obj, **kwargs: "Parrot")
+        assert translations(parrot, "en") == "Parrot"
+
+        translations.instances_of(NorwegianBlue)(
+            lambda obj, **kwargs: "Norwegian Blue"
+        )
+        assert translations(parrot, "en") == "Norwegian Blue"
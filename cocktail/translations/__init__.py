@@ -16,6 +16,7 @@ from .translation import (
     get_root_language,
     language_has_fallback,
     iter_language_chain,
+    get_language_chain,
     iter_derived_languages,
     descend_language_tree,
     fallback_languages_context,
@@ -41,6 +41,8 @@ def translate_locale_component(locale, component, index, language = None):
     if index == 0:
         return translations("cocktail.locales." + component, language)
 
-translations.definitions["cocktail.locale_component"] = \
+translations.define(
+    "cocktail.locale_component",
     translate_locale_component
+)
 
@@ -22,6 +22,7 @@ from cocktail.pkgutils import get_full_name
 from .parser import TranslationsFileParser
 
 _thread_data = local()
+_undefined = object()
 
 @contextmanager
 def language_context(language):
@@ -77,6 +78,31 @@ def iter_language_chain(language = None, include_self = True):
                 for ancestor in iter_language_chain(base):
                     yield ancestor
 
+def get_language_chain(language = None):
+    """Obtains the fallback chain for the given language (or the active
+    language) as a tuple, including the language itself.
+
+    Chains are memoized for each thread, until its fallback languages are
+    modified. Returns an empty tuple if no language is given or active.
+    """
+    language = language or get_language()
+    if not language:
+        return ()
+
+    chains = getattr(_thread_data, "language_chains", None)
+    if chains is None:
+        _thread_data.language_chains = chains = {}
+
+    chain = chains.get(language)
+    if chain is None:
+        chain = tuple(iter_language_chain(language))
+        chains[language] = chain
+
+    return chain
+
+def _fallback_languages_changed():
+    _thread_data.language_chains = {}
+
 def descend_language_tree(language = None, include_self = True):
     language = require_language(language)
     if include_self:
@@ -104,12 +130,14 @@ def fallback_languages_context(fallback_chains):
     try:
         _thread_data.fallback = {}
         _thread_data.derived = {}
+        _fallback_languages_changed()
         for language, chain in fallback_chains.items():
             set_fallback_languages(language, chain)
         yield None
     finally:
         _thread_data.fallback = prev_fallback
         _thread_data.derived = prev_derived
+        _fallback_languages_changed()
 
 def set_fallback_languages(language, fallback_languages):
 
@@ -137,6 +165,8 @@ def set_fallback_languages(language, fallback_languages):
         else:
             derived_languages.append(language)
 
+    _fallback_languages_changed()
+
 def add_fallback_language(language, fallback_language):
     fallback_languages = []
     language_chain = iter_language_chain(language)
@@ -148,18 +178,40 @@ def add_fallback_language(language, fallback_language):
 def clear_fallback_languages():
     _thread_data.fallback = {}
     _thread_data.derived = {}
+    _fallback_languages_changed()
 
 
 
 class Translations(object):
-
+    """A catalog of translations.
+
+    Resolving a translation involves finding its definition (walking the
+    class hierarchy of objects), selecting a value for the requested language
+    or its fallbacks and, possibly, calling a function. Lookups that don't
+    depend on any function or formatting parameter are memoized, keyed by the
+    requested key (or the class of the translated instance) and the fallback
+    chain of the language. The memo is cleared whenever definitions change
+    through the methods of the catalog (`define`, `set`, `instances_of`,
+    `load_bundle`, `override_bundle`); code that modifies `definitions`
+    directly should call `clear_cache`.
+    """
     bundle_loaded = Event()
     verbose = False
+    max_cache_size = 50000
 
     def __init__(self, *args, **kwargs):
         self.definitions = {}
         self.__loaded_bundles = set()
         self.__bundle_overrides = defaultdict(list)
+        self.__cache = {}
+        self.__instance_definitions = {}
+
+    def clear_cache(self):
+        """Discards all memoized lookups."""
+        # Replace the dictionaries rather than clearing them, so that lookups
+        # that were in progress don't store outdated results
+        self.__cache = {}
+        self.__instance_definitions = {}
 
     def _get_key(self, key, verbose):
 
@@ -176,6 +228,7 @@ class Translations(object):
             )
 
         self.definitions[key] = per_language_values or value
+        self.clear_cache()
 
     def set(self, key, language, value):
         per_language_values = self.definitions.get(key)
@@ -183,6 +236,7 @@ class Translations(object):
             per_language_values = {}
             self.definitions[key] = per_language_values
         per_language_values[language] = value
+        self.clear_cache()
 
     def instances_of(self, cls):
 
@@ -193,6 +247,7 @@ class Translations(object):
                 class_name = cls.__name__
 
             self.definitions[class_name + ".instance"] = func
+            self.clear_cache()
             return func
 
         return decorator
@@ -225,6 +280,8 @@ class Translations(object):
                 file_error = e
             else:
                 self.bundle_loaded(file_path = file_path)
+            finally:
+                self.clear_cache()
 
             overrides = self.__bundle_overrides.get(bundle_path)
             if overrides:
@@ -292,15 +349,62 @@ class Translations(object):
         if verbose:
             kwargs["verbose"] = verbose + 1
 
+        # Memoized lookups. Class references are resolved through the
+        # translations of their class names, which are memoized themselves.
+        cache = self.__cache
+        instance_definitions = self.__instance_definitions
+        cache_key = None
+        language_chain = get_language_chain(language)
+
+        if not verbose and not isinstance(obj, type):
+            cache_key = (
+                obj if isinstance(obj, str) else obj.__class__,
+                language_chain
+            )
+            translation = cache.get(cache_key, _undefined)
+
+            if translation is not _undefined:
+                if translation and kwargs:
+                    translation = translation % kwargs
+                return self.__apply_fallbacks(
+                    translation,
+                    language,
+                    default,
+                    chain,
+                    kwargs
+                )
+
+            translation = None
+
+        # The resolved value, before formatting; it can be memoized as long
+        # as it didn't involve calling a function
+        resolved = None
+        memoizable = True
+
         # Look for a explicit definition for the given value
         if isinstance(obj, str):
             translation = self._get_key(obj, verbose)
         else:
             # Translation of class instances
-            for class_name in self.__iter_class_names(obj.__class__):
-                translation = self._get_key(class_name + ".instance", verbose)
-                if translation:
-                    break
+            cls = obj.__class__
+            translation = (
+                _undefined
+                if verbose
+                else instance_definitions.get(cls, _undefined)
+            )
+
+            if translation is _undefined:
+                translation = None
+                for class_name in self.__iter_class_names(cls):
+                    translation = self._get_key(
+                        class_name + ".instance",
+                        verbose
+                    )
+                    if translation:
+                        break
+
+                if not verbose:
+                    instance_definitions[cls] = translation
 
             # Translation of class references
             if not translation and isinstance(obj, type):
@@ -316,6 +420,7 @@ class Translations(object):
         # Resolve the obtained translation
         if translation:
             if callable(translation):
+                memoizable = False
                 with language_context(language):
 
                     if verbose:
@@ -331,10 +436,11 @@ class Translations(object):
                 definitions = translation
                 translation = None
                 prev_lang = language or get_language()
-                for lang in iter_language_chain(language):
+                for lang in language_chain or iter_language_chain(language):
                     translation = definitions.get(lang)
                     if translation:
                         if callable(translation):
+                            memoizable = False
                             with language_context(prev_lang):
                                 if isinstance(obj, str):
                                     translation = translation(**kwargs)
@@ -343,11 +449,29 @@ class Translations(object):
                             if translation:
                                 break
                         else:
+                            resolved = translation
                             if kwargs:
                                 translation = translation % kwargs
                             break
-            elif kwargs:
-                translation = translation % kwargs
+            else:
+                resolved = translation
+                if kwargs:
+                    translation = translation % kwargs
+
+        if memoizable and cache_key is not None:
+            if len(cache) >= self.max_cache_size:
+                cache.clear()
+            cache[cache_key] = resolved
+
+        return self.__apply_fallbacks(
+            translation,
+            language,
+            default,
+            chain,
+            kwargs
+        )
+
+    def __apply_fallbacks(self, translation, language, default, chain, kwargs):
 
         # Custom translation chain
         if not translation and chain is not None: